@@ -1,12 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, status
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Query, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
 
-from app.db.session import get_db
-from app.models.job import Job, JobCreate, JobResponse, JobStatus
-from app.services.job_service import create_job, get_job_by_id, get_jobs, update_job_status
+from app.db.session import get_async_db, get_db
+from app.models.job import Job, JobBatchCreate, JobBatchResponse, JobCreate, JobProfileResponse, JobResponse, JobStageResponse, JobStatus
+from app.services.job_service import (
+    create_job, create_jobs_batch, get_job_by_id_async, get_job_profiles_async, get_job_stages_async, get_jobs_page_async, group_features_by_scene,
+    update_job_status, update_jobs_status
+)
 from app.core.celery_app import celery_app
+from app.core.config import settings
+from app.core.minio import get_presigned_url
 
 router = APIRouter()
 
@@ -18,9 +24,21 @@ def create_analysis_job(
 ):
     """
     Create a new analysis job with the provided region and date range.
+    
+    Set `region_id` to rerun an existing region with the same geometry, so
+    the job adds a point to its time series. Set `parent_job_id` to rerun a
+    completed job of the same region over an extended date range: only
+    scenes acquired after the prior job's end date are ingested and
+    processed.
     """
     # Create job in database
-    job = create_job(db=db, job_data=job_data)
+    try:
+        job = create_job(db=db, job_data=job_data)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     
     # Start Celery task
     task = celery_app.send_task(
@@ -29,7 +47,9 @@ def create_analysis_job(
             "job_id": job.id,
             "region_geojson": job_data.region_geojson,
             "start_date": job_data.start_date.isoformat(),
-            "end_date": job_data.end_date.isoformat()
+            "end_date": job_data.end_date.isoformat(),
+            "profile": job_data.profile,
+            "parent_job_id": job_data.parent_job_id
         }
     )
     
@@ -43,12 +63,67 @@ def create_analysis_job(
     
     return job
 
+@router.post("/batch", response_model=JobBatchResponse, status_code=status.HTTP_201_CREATED)
+def create_analysis_jobs_batch(
+    batch_data: JobBatchCreate,
+    db: Session = Depends(get_db)
+):
+    """
+    Create one analysis job per feature of a GeoJSON FeatureCollection.
+    
+    Fields whose footprints fall on the same scenes are grouped into a single
+    Celery task so ingest and preprocessing run once per group. A feature
+    with a `region_id` property reruns that existing region.
+    """
+    # Create all regions and jobs in one transaction
+    try:
+        jobs = create_jobs_batch(db=db, batch_data=batch_data)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    features = batch_data.regions_geojson["features"]
+    groups = group_features_by_scene(features)
+    
+    # Publish one task per scene group over a single broker connection
+    task_ids = {}
+    with celery_app.producer_or_acquire() as producer:
+        for group in groups:
+            task = celery_app.send_task(
+                "app.tasks.task_batch_analysis",
+                kwargs={
+                    "job_ids": [jobs[i].id for i in group],
+                    "regions_geojson": [features[i] for i in group],
+                    "start_date": batch_data.start_date.isoformat(),
+                    "end_date": batch_data.end_date.isoformat(),
+                    "profile": batch_data.profile
+                },
+                producer=producer
+            )
+            for i in group:
+                task_ids[jobs[i].id] = task.id
+    
+    # Record task IDs for all jobs with one bulk update
+    jobs = update_jobs_status(
+        db=db,
+        job_ids=[job.id for job in jobs],
+        status=JobStatus.QUEUED,
+        task_ids=task_ids
+    )
+    
+    return {
+        "jobs": jobs,
+        "groups": [[jobs[i].id for i in group] for group in groups]
+    }
+
 @router.get("/{job_id}", response_model=JobResponse)
-def get_job(job_id: int, db: Session = Depends(get_db)):
+async def get_job(job_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     Get job details by ID.
     """
-    job = get_job_by_id(db=db, job_id=job_id)
+    job = await get_job_by_id_async(db=db, job_id=job_id)
     if not job:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -56,14 +131,71 @@ def get_job(job_id: int, db: Session = Depends(get_db)):
         )
     return job
 
+@router.get("/{job_id}/stages", response_model=List[JobStageResponse])
+async def get_job_stages(job_id: int, db: AsyncSession = Depends(get_async_db)):
+    """
+    Get the timed stages of a job: wall and CPU time, peak RSS, bytes read
+    and written and pixels produced per task and service call.
+    """
+    job = await get_job_by_id_async(db=db, job_id=job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Job with ID {job_id} not found"
+        )
+    return await get_job_stages_async(db=db, job_id=job_id)
+
+@router.get("/{job_id}/profiles", response_model=List[JobProfileResponse])
+async def get_job_profiles(job_id: int, db: AsyncSession = Depends(get_async_db)):
+    """
+    Get the CPU and memory profiles of a job submitted with `profile` set.
+    
+    Each stage task stores a pstats file (`cpu`), the functions with the
+    highest cumulative time (`cpu_summary`) and its allocation peak and
+    top allocation sites (`memory`).
+    """
+    job = await get_job_by_id_async(db=db, job_id=job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Job with ID {job_id} not found"
+        )
+    
+    profiles = await get_job_profiles_async(db=db, job_id=job_id)
+    
+    # Presigned URLs are local signing, no I/O
+    for profile in profiles:
+        profile.url = get_presigned_url(
+            bucket_name=settings.BUCKET_PROFILES,
+            object_name=profile.object_name,
+            expires=3600
+        )
+    
+    return profiles
+
 @router.get("/", response_model=List[JobResponse])
-def list_jobs(
-    skip: int = 0, 
-    limit: int = 100, 
+async def list_jobs(
+    response: Response,
+    skip: int = Query(0, deprecated=True),
+    limit: int = Query(100, ge=1, le=1000),
     status: Optional[str] = None,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     List all jobs with optional filtering by status.
+    
+    Pages are newest-first; pass the `X-Next-Cursor` response header back as
+    `cursor` to fetch the next page. `skip` is kept for older clients.
     """
-    return get_jobs(db=db, skip=skip, limit=limit, status=status)
+    try:
+        jobs, next_cursor = await get_jobs_page_async(db=db, limit=limit, status=status, cursor=cursor, skip=skip)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=str(e)
+        )
+    
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return jobs
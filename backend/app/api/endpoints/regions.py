@@ -1,10 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+from datetime import datetime
 
-from app.db.session import get_db
-from app.models.region import Region, RegionCreate, RegionResponse
-from app.services.region_service import create_region, get_region_by_id, get_regions
+from app.db.session import get_async_db, get_db
+from app.models.region import Region, RegionCreate, RegionResponse, RegionSummary
+from app.models.result import RegionTimeseriesResponse
+from app.services.region_service import create_region, get_region_response_async, get_regions_page_async, region_exists_async
+from app.services.result_raster_service import RESULT_LAYERS
+from app.services.result_service import get_region_timeseries_async
 
 router = APIRouter()
 
@@ -19,11 +24,11 @@ def create_new_region(
     return create_region(db=db, region_data=region_data)
 
 @router.get("/{region_id}", response_model=RegionResponse)
-def get_region(region_id: int, db: Session = Depends(get_db)):
+async def get_region(region_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     Get region details by ID.
     """
-    region = get_region_by_id(db=db, region_id=region_id)
+    region = await get_region_response_async(db=db, region_id=region_id)
     if not region:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -31,13 +36,60 @@ def get_region(region_id: int, db: Session = Depends(get_db)):
         )
     return region
 
-@router.get("/", response_model=List[RegionResponse])
-def list_regions(
-    skip: int = 0, 
-    limit: int = 100, 
-    db: Session = Depends(get_db)
+@router.get("/{region_id}/timeseries", response_model=RegionTimeseriesResponse)
+async def get_region_timeseries(
+    region_id: int,
+    layer: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    List all regions.
+    Get the SOC and moisture history of a region.
+    
+    One point per analysis date (the end date of the job) with count, mean,
+    min, max, std and the 10th to 90th percentiles. Filter by `layer` and
+    by a `start`/`end` date range.
     """
-    return get_regions(db=db, skip=skip, limit=limit)
+    if layer is not None and layer not in RESULT_LAYERS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown layer '{layer}', expected one of {sorted(RESULT_LAYERS)}"
+        )
+    
+    points = await get_region_timeseries_async(db=db, region_id=region_id, layer=layer, start=start, end=end)
+    
+    # Only an empty series needs the extra lookup
+    if not points and not await region_exists_async(db=db, region_id=region_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Region with ID {region_id} not found"
+        )
+    
+    return {"region_id": region_id, "points": points}
+
+@router.get("/", response_model=List[RegionSummary])
+async def list_regions(
+    response: Response,
+    skip: int = Query(0, deprecated=True),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    List all regions without their geometries.
+    
+    Pages are newest-first; pass the `X-Next-Cursor` response header back as
+    `cursor` to fetch the next page. `skip` is kept for older clients.
+    """
+    try:
+        regions, next_cursor = await get_regions_page_async(db=db, limit=limit, cursor=cursor, skip=skip)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return regions
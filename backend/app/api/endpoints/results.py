@@ -1,27 +1,155 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+import os
+import tempfile
 
-from app.db.session import get_db
-from app.models.result import Result, ResultResponse
-from app.services.result_service import get_result_by_job_id, get_result_by_id
-from app.core.minio import get_presigned_url
+from app.db.session import get_async_db, get_db
+from app.models.result import (
+    Result, ResultDiffRequest, ResultDiffResponse, ResultResponse, ResultSummary, SampleRequest, SampleResponse,
+    ZonalStatsRequest, ZonalStatsResponse
+)
+from app.services.job_service import get_job_by_id
+from app.services.result_service import (
+    check_diff_jobs, get_result_by_job_id, get_result_by_job_id_async, get_result_diff, get_results_page_async,
+    save_result_diff
+)
+from app.services.result_raster_service import diff_result_layers, get_zonal_stats, sample_result_layers
+from app.core.config import settings
+from app.core.minio import get_presigned_url, upload_file
 
 router = APIRouter()
 
+@router.get("/", response_model=List[ResultSummary])
+async def list_results(
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    List result summary statistics, newest first.
+    
+    Pass the `X-Next-Cursor` response header back as `cursor` to fetch the
+    next page.
+    """
+    try:
+        results, next_cursor = await get_results_page_async(db=db, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return results
+
+@router.post("/diff", response_model=ResultDiffResponse)
+def diff_job_results(
+    request: ResultDiffRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    Compute the per-pixel change of a layer between the results of two jobs.
+    
+    Both jobs must cover the same region, and job a must not end after job
+    b. The later result is aligned onto the grid of the earlier one and the
+    difference (b - a) is stored as a Cloud Optimized GeoTIFF. Results are
+    cached by job pair and layer, so repeated comparisons return at once.
+    Runs on the threadpool because raster reads are blocking.
+    """
+    if request.job_id_a == request.job_id_b:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="job_id_a and job_id_b must be different jobs"
+        )
+    
+    jobs = []
+    for job_id in (request.job_id_a, request.job_id_b):
+        job = get_job_by_id(db=db, job_id=job_id)
+        if not job:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Job with ID {job_id} not found"
+            )
+        jobs.append(job)
+    try:
+        check_diff_jobs(*jobs)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    diff = get_result_diff(db=db, job_id_a=request.job_id_a, job_id_b=request.job_id_b, layer=request.layer)
+    cached = diff is not None
+    
+    if not cached:
+        results = {}
+        for job_id in (request.job_id_a, request.job_id_b):
+            results[job_id] = get_result_by_job_id(db=db, job_id=job_id)
+            if not results[job_id]:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"Results for job with ID {job_id} not found"
+                )
+        
+        object_name = f"diffs/job_{request.job_id_a}_job_{request.job_id_b}_{request.layer}.tif"
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output_path = os.path.join(tmpdir, os.path.basename(object_name))
+            try:
+                stats = diff_result_layers(results[request.job_id_a], results[request.job_id_b], request.layer, output_path)
+            except ValueError as e:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=str(e)
+                )
+            except FileNotFoundError as e:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=str(e)
+                )
+            
+            if not upload_file(bucket_name=settings.BUCKET_RESULTS, object_name=object_name, file_path=output_path):
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Could not store the difference raster"
+                )
+        
+        diff = save_result_diff(
+            db=db,
+            job_id_a=request.job_id_a,
+            job_id_b=request.job_id_b,
+            layer=request.layer,
+            object_name=object_name,
+            stats=stats
+        )
+    
+    # Presigned URLs are local signing, no I/O
+    diff.url = get_presigned_url(
+        bucket_name=settings.BUCKET_RESULTS,
+        object_name=diff.object_name,
+        expires=3600
+    )
+    diff.cached = cached
+    
+    return diff
+
 @router.get("/{job_id}", response_model=ResultResponse)
-def get_job_results(job_id: int, db: Session = Depends(get_db)):
+async def get_job_results(job_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     Get results for a specific job.
     """
-    result = get_result_by_job_id(db=db, job_id=job_id)
+    result = await get_result_by_job_id_async(db=db, job_id=job_id)
     if not result:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Results for job with ID {job_id} not found"
         )
     
-    # Generate presigned URLs for result files
+    # Generate presigned URLs for result files (local signing, no I/O)
     if result.soc_map_path:
         result.soc_map_url = get_presigned_url(
             bucket_name="results",
@@ -44,3 +172,99 @@ def get_job_results(job_id: int, db: Session = Depends(get_db)):
         )
     
     return result
+
+@router.post("/{job_id}/zonal-stats", response_model=ZonalStatsResponse)
+def get_job_zonal_stats(
+    job_id: int,
+    request: ZonalStatsRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    Compute SOC/moisture statistics for each zone of a GeoJSON FeatureCollection.
+    
+    Runs on the threadpool because raster reads are blocking. Only the
+    raster windows covering the zones are read.
+    """
+    result = get_result_by_job_id(db=db, job_id=job_id)
+    if not result:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Results for job with ID {job_id} not found"
+        )
+    
+    try:
+        zones = get_zonal_stats(
+            result,
+            request.zones_geojson,
+            layers=request.layers,
+            percentiles=request.percentiles
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except FileNotFoundError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    
+    return {"job_id": job_id, "zones": zones}
+
+
+def _sample_job_results(db, job_id, points, layers):
+    result = get_result_by_job_id(db=db, job_id=job_id)
+    if not result:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Results for job with ID {job_id} not found"
+        )
+    
+    try:
+        values = sample_result_layers(result, points, layers=layers)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except FileNotFoundError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    
+    return {"job_id": job_id, "points": points, "values": values}
+
+@router.get("/{job_id}/sample", response_model=SampleResponse)
+def sample_job_results(
+    job_id: int,
+    lon: List[float] = Query(...),
+    lat: List[float] = Query(...),
+    layers: List[str] = Query(["soc", "moisture"]),
+    db: Session = Depends(get_db)
+):
+    """
+    Get SOC/moisture values at one or more coordinates.
+    
+    Repeat `lon` and `lat` for several points. Values come from a per-process
+    cache of open rasters and decoded tiles.
+    """
+    if len(lon) != len(lat):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="lon and lat must have the same number of values"
+        )
+    
+    return _sample_job_results(db, job_id, [[x, y] for x, y in zip(lon, lat)], layers)
+
+@router.post("/{job_id}/sample", response_model=SampleResponse)
+def sample_job_results_batch(
+    job_id: int,
+    request: SampleRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    Get SOC/moisture values at many coordinates in one request.
+    """
+    return _sample_job_results(db, job_id, request.points, request.layers)
@@ -16,6 +16,17 @@ class Settings(BaseSettings):
     POSTGRES_PASSWORD: str = os.getenv("POSTGRES_PASSWORD", "postgres")
     POSTGRES_DB: str = os.getenv("POSTGRES_DB", "agricarbonx")
     SQLALCHEMY_DATABASE_URI: Optional[str] = None
+    SQLALCHEMY_ASYNC_DATABASE_URI: Optional[str] = None
+    
+    # Connection pool settings, sized per process type ("api" or "worker")
+    PROCESS_TYPE: str = os.getenv("PROCESS_TYPE", "api")
+    DB_POOL_SIZE_API: int = int(os.getenv("DB_POOL_SIZE_API", 10))
+    DB_MAX_OVERFLOW_API: int = int(os.getenv("DB_MAX_OVERFLOW_API", 20))
+    DB_POOL_SIZE_WORKER: int = int(os.getenv("DB_POOL_SIZE_WORKER", 2))
+    DB_MAX_OVERFLOW_WORKER: int = int(os.getenv("DB_MAX_OVERFLOW_WORKER", 2))
+    DB_POOL_TIMEOUT: int = int(os.getenv("DB_POOL_TIMEOUT", 30))  # Seconds to wait for a free connection
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", 1800))  # Seconds before a connection is replaced
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "True").lower() == "true"
     
     # Redis settings
     REDIS_HOST: str = os.getenv("REDIS_HOST", "localhost")
@@ -26,24 +37,104 @@ class Settings(BaseSettings):
     MINIO_ACCESS_KEY: str = os.getenv("MINIO_ACCESS_KEY", "minioadmin")
     MINIO_SECRET_KEY: str = os.getenv("MINIO_SECRET_KEY", "minioadmin")
     MINIO_SECURE: bool = os.getenv("MINIO_SECURE", "False").lower() == "true"
+    MINIO_REGION: str = os.getenv("MINIO_REGION", "us-east-1")  # Known region lets presigning skip a bucket-location lookup
     
     # Bucket names
     BUCKET_RESULTS: str = "results"
     BUCKET_REPORTS: str = "reports"
     BUCKET_CACHE: str = "cache"
+    BUCKET_PROFILES: str = "profiles"
     
     # Processing settings
     MAX_AREA_SQ_KM: int = 1000  # Maximum area in square kilometers
+    MAX_BATCH_FEATURES: int = int(os.getenv("MAX_BATCH_FEATURES", 1000))  # Maximum fields per batch submission
+    ZONAL_MAX_FEATURES: int = int(os.getenv("ZONAL_MAX_FEATURES", 1000))  # Maximum zones per zonal statistics request
+    RASTER_BLOCK_ROWS: int = int(os.getenv("RASTER_BLOCK_ROWS", 512))  # Rows per strip for windowed raster passes
+    SAMPLE_MAX_POINTS: int = int(os.getenv("SAMPLE_MAX_POINTS", 10000))  # Maximum points per sample request
+    RASTER_HANDLE_CACHE_SIZE: int = int(os.getenv("RASTER_HANDLE_CACHE_SIZE", 64))  # Open result rasters kept per API process
+    RASTER_BLOCK_CACHE_MB: int = int(os.getenv("RASTER_BLOCK_CACHE_MB", 256))  # Decoded raster tiles kept per API process
+    RASTER_URL_EXPIRES: int = int(os.getenv("RASTER_URL_EXPIRES", 3600))  # Lifetime of the presigned URLs result rasters are read through
+    RASTER_HANDLE_MAX_AGE: int = int(os.getenv("RASTER_HANDLE_MAX_AGE", 3000))  # Seconds before a cached result raster is reopened; keep below RASTER_URL_EXPIRES
+    SCENE_TILE_SIZE_DEG: float = float(os.getenv("SCENE_TILE_SIZE_DEG", 1.0))  # Approximate scene footprint used to group batch jobs
+    
+    # Ingest settings
+    INGEST_PROVIDER: str = os.getenv("INGEST_PROVIDER", "synthetic")  # "synthetic" (generated sample data) or "stac"
+    INGEST_DATA_DIR: str = os.getenv("INGEST_DATA_DIR", "data/sample")  # Downloaded scenes, reused across jobs
+    SCENE_CACHE_QUOTA_MB: int = int(os.getenv("SCENE_CACHE_QUOTA_MB", 20480))  # Space scenes, masked scenes and composites may use in INGEST_DATA_DIR
+    SCENE_CACHE_MAX_AGE_DAYS: float = float(os.getenv("SCENE_CACHE_MAX_AGE_DAYS", 30))  # Days after its last use a file in INGEST_DATA_DIR is deleted
+    SCENE_CACHE_MIN_AGE_SECONDS: int = int(os.getenv("SCENE_CACHE_MIN_AGE_SECONDS", 3600))  # Files used more recently are never evicted, so running jobs keep theirs
+    STAC_API_URL: str = os.getenv("STAC_API_URL", "http://localhost:8900")  # STAC API with range-readable assets and /weather
+    STAC_TIMEOUT: float = float(os.getenv("STAC_TIMEOUT", 30))  # Seconds per HTTP request
+    STAC_MAX_CONCURRENCY: int = int(os.getenv("STAC_MAX_CONCURRENCY", 4))  # Scenes fetched at once per task
+    SYNTHETIC_RASTER_SIZE: int = int(os.getenv("SYNTHETIC_RASTER_SIZE", 100))  # Width and height of generated rasters
+    SENTINEL_REVISIT_DAYS: int = int(os.getenv("SENTINEL_REVISIT_DAYS", 5))  # Days between generated Sentinel-2 scenes
+    LANDSAT_REVISIT_DAYS: int = int(os.getenv("LANDSAT_REVISIT_DAYS", 16))  # Days between generated Landsat scenes
+    WEATHER_STORE_DIR: str = os.getenv("WEATHER_STORE_DIR", "data/weather")  # Parquet weather partitioned by grid cell and year
+    WEATHER_GRID_DEG: float = float(os.getenv("WEATHER_GRID_DEG", 0.5))  # Weather grid cell size; regions in a cell share its weather
+    WEATHER_ANTECEDENT_DAYS: int = int(os.getenv("WEATHER_ANTECEDENT_DAYS", 30))  # Days before a job's range that warm up the antecedent index
+    WEATHER_GDD_BASE_C: float = float(os.getenv("WEATHER_GDD_BASE_C", 10.0))  # Base temperature of growing degree days
+    WEATHER_API_DECAY: float = float(os.getenv("WEATHER_API_DECAY", 0.9))  # Daily decay of the antecedent precipitation index
+    SOILGRIDS_STORE_DIR: str = os.getenv("SOILGRIDS_STORE_DIR", "data/soilgrids")  # Local tile pyramid of SoilGrids layers
+    SOILGRIDS_CACHE_BUCKET: str = os.getenv("SOILGRIDS_CACHE_BUCKET", "cache")  # Bucket sharing tiles between workers ("" = local only)
+    SOILGRIDS_LAYERS: str = os.getenv("SOILGRIDS_LAYERS", "soc,bdod,clay")  # Comma-separated layers extracted for every job
+    SOILGRIDS_RESOLUTION_DEG: float = float(os.getenv("SOILGRIDS_RESOLUTION_DEG", 0.00225))  # Tile pixel size, about 250 m at the equator
+    SOILGRIDS_TILE_PIXELS: int = int(os.getenv("SOILGRIDS_TILE_PIXELS", 512))  # Width and height of a stored tile
+    SOILGRIDS_BLOCK_PIXELS: int = int(os.getenv("SOILGRIDS_BLOCK_PIXELS", 128))  # Internal block size of tiles and their overviews
+    SOILGRIDS_OVERVIEW_LEVELS: int = int(os.getenv("SOILGRIDS_OVERVIEW_LEVELS", 2))  # Overviews per tile, each halving the resolution
+    SOILGRIDS_MAX_WINDOW_PIXELS: int = int(os.getenv("SOILGRIDS_MAX_WINDOW_PIXELS", 4096 * 4096))  # Larger regions read from overviews
+    SOILGRIDS_HANDLE_CACHE_SIZE: int = int(os.getenv("SOILGRIDS_HANDLE_CACHE_SIZE", 64))  # Open tiles kept per worker process
+    SOILGRIDS_BLOCK_CACHE_MB: int = int(os.getenv("SOILGRIDS_BLOCK_CACHE_MB", 128))  # Decoded tile blocks kept per worker process
+
+    # Scratch space settings
+    SCRATCH_DIR: str = os.getenv("SCRATCH_DIR", "data/scratch")  # Per-job workspaces for intermediate files
+    SCRATCH_QUOTA_MB: int = int(os.getenv("SCRATCH_QUOTA_MB", 20480))  # Space all workspaces on a worker may use together
+    SCRATCH_TMPFS_DIR: str = os.getenv("SCRATCH_TMPFS_DIR", "")  # Optional tmpfs root for small jobs (e.g. /dev/shm/agricarbonx)
+    SCRATCH_TMPFS_QUOTA_MB: int = int(os.getenv("SCRATCH_TMPFS_QUOTA_MB", 2048))  # Space all workspaces on tmpfs may use together
+    SCRATCH_TMPFS_MAX_JOB_MB: int = int(os.getenv("SCRATCH_TMPFS_MAX_JOB_MB", 256))  # Largest job estimate placed on tmpfs
+    SCRATCH_MB_PER_KM2: float = float(os.getenv("SCRATCH_MB_PER_KM2", 2.0))  # Scratch reserved per km² of a job's bounding box
+    SCRATCH_MIN_JOB_MB: int = int(os.getenv("SCRATCH_MIN_JOB_MB", 64))  # Smallest reservation per job
+    SCRATCH_WAIT_SECONDS: int = int(os.getenv("SCRATCH_WAIT_SECONDS", 600))  # Time a job waits for scratch space before failing
+    
+    # Preprocessing settings
+    COMPOSITE_METHOD: str = os.getenv("COMPOSITE_METHOD", "median")  # "median" or "best_pixel"
+    COMPOSITE_MEMORY_MB: int = int(os.getenv("COMPOSITE_MEMORY_MB", 256))  # Memory budget for one composite block across all scenes
+    WARP_CACHE_MB: int = int(os.getenv("WARP_CACHE_MB", 128))  # Memory for source-to-target pixel maps and warp plans per worker process
+    WARP_NUM_THREADS: int = int(os.getenv("WARP_NUM_THREADS", 2))  # GDAL warp threads per task
+    WARP_MEMORY_MB: int = int(os.getenv("WARP_MEMORY_MB", 64))  # GDAL warp working memory per task
+    PROCESSING_CRS: str = os.getenv("PROCESSING_CRS", "EPSG:4326")  # CRS of the clipped feature stack
     
     # Model paths
     SOC_MODEL_PATH: str = "models/soil_cnn_scripted.pt"
     MOISTURE_MODEL_PATH: str = "models/moisture_cnn_scripted.pt"
     
+    # Inference settings
+    WORKER_CONCURRENCY: int = int(os.getenv("WORKER_CONCURRENCY", 0))  # Celery worker processes (0 = one per CPU)
+    TORCH_NUM_THREADS: int = int(os.getenv("TORCH_NUM_THREADS", 0))  # Intra-op threads per worker process (0 = CPUs / processes)
+    TORCH_INTEROP_THREADS: int = int(os.getenv("TORCH_INTEROP_THREADS", 1))  # Inter-op threads per worker process
+    SOC_MODEL_VARIANT: str = os.getenv("SOC_MODEL_VARIANT", "eager")  # "eager", "frozen", "int8_dynamic" or "int8_static"
+    MOISTURE_MODEL_VARIANT: str = os.getenv("MOISTURE_MODEL_VARIANT", "eager")  # "eager", "frozen", "int8_dynamic" or "int8_static"
+    MODEL_CHANNELS_LAST: bool = os.getenv("MODEL_CHANNELS_LAST", "False").lower() == "true"  # Run models in channels-last memory format
+    MODEL_MAX_ACCURACY_DELTA: float = float(os.getenv("MODEL_MAX_ACCURACY_DELTA", 0.05))  # Max output difference before falling back to the float model
+    INFERENCE_MODE: str = os.getenv("INFERENCE_MODE", "local")  # "local", "batched" (in-process micro-batching) or "sidecar"
+    INFERENCE_TILE_SIZE: int = int(os.getenv("INFERENCE_TILE_SIZE", 128))  # Output pixels per tile side when batching
+    INFERENCE_MAX_BATCH: int = int(os.getenv("INFERENCE_MAX_BATCH", 32))  # Maximum tiles per batched forward pass
+    INFERENCE_MAX_LATENCY_MS: float = float(os.getenv("INFERENCE_MAX_LATENCY_MS", 10))  # Maximum wait for a batch to fill
+    INFERENCE_SERVER_HOST: str = os.getenv("INFERENCE_SERVER_HOST", "inference")
+    INFERENCE_SERVER_PORT: int = int(os.getenv("INFERENCE_SERVER_PORT", 6100))
+    INFERENCE_AUTHKEY: str = os.getenv("INFERENCE_AUTHKEY", "")  # Shared secret between workers and the sidecar; required in sidecar mode
+    
+    # Monitoring settings
+    SERVER_TIMING_ENABLED: bool = os.getenv("SERVER_TIMING_ENABLED", "False").lower() == "true"  # Add Server-Timing headers to API responses
+    WORKER_METRICS_PORT: int = int(os.getenv("WORKER_METRICS_PORT", 0))  # Port of the worker's Prometheus endpoint (0 = disabled)
+    PROFILE_TASKS: bool = os.getenv("PROFILE_TASKS", "False").lower() == "true"  # Profile the stage tasks of every job, not only flagged ones
+    PROFILE_TRACEMALLOC_FRAMES: int = int(os.getenv("PROFILE_TRACEMALLOC_FRAMES", 1))  # Stack frames kept per allocation when profiling
+    
     class Config:
         case_sensitive = True
         
     def __init__(self, **data):
         super().__init__(**data)
         self.SQLALCHEMY_DATABASE_URI = f"postgresql://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_SERVER}/{self.POSTGRES_DB}"
+        self.SQLALCHEMY_ASYNC_DATABASE_URI = f"postgresql+asyncpg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_SERVER}/{self.POSTGRES_DB}"
 
 settings = Settings()
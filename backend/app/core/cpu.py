@@ -0,0 +1,104 @@
+import os
+from app.core.config import settings
+
+# Thread-count variables read by the OpenMP/BLAS runtimes when they start
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+def available_cpus():
+    """
+    Get the number of CPUs this process may use.
+    
+    Takes the CPU affinity mask and, inside a container, the cgroup CPU
+    quota into account; os.cpu_count() reports all cores of the host.
+    
+    Returns:
+        Number of usable CPUs (at least 1)
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+    
+    return cpus
+
+def get_thread_plan(concurrency=None, cpus=None):
+    """
+    Split the available CPUs between Celery worker processes.
+    
+    Each prefork child gets an equal share of intra-op threads, so N children
+    use the machine's cores instead of each starting one thread per core.
+    
+    Args:
+        concurrency: Number of worker processes (optional, defaults to
+            settings.WORKER_CONCURRENCY or one per CPU)
+        cpus: Number of usable CPUs (optional, detected by default)
+    
+    Returns:
+        Dictionary with cpus, concurrency, intra_op_threads and inter_op_threads
+    """
+    if cpus is None:
+        cpus = available_cpus()
+    if not concurrency:
+        concurrency = settings.WORKER_CONCURRENCY or cpus
+    
+    return {
+        "cpus": cpus,
+        "concurrency": concurrency,
+        "intra_op_threads": settings.TORCH_NUM_THREADS or max(1, cpus // concurrency),
+        "inter_op_threads": settings.TORCH_INTEROP_THREADS
+    }
+
+def pin_thread_env(num_threads):
+    """
+    Set the OpenMP/MKL/BLAS thread-count environment variables.
+    
+    Must run before the runtimes start, i.e. in the parent worker before it
+    forks its children.
+    """
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(num_threads)
+
+def apply_torch_threads(plan):
+    """
+    Apply a thread plan to torch in the current process.
+    
+    Args:
+        plan: Dictionary returned by get_thread_plan
+    
+    Returns:
+        Effective settings (see get_thread_settings)
+    """
+    import torch
+    
+    torch.set_num_threads(plan["intra_op_threads"])
+    try:
+        torch.set_num_interop_threads(plan["inter_op_threads"])
+    except RuntimeError:
+        # Can only be set before the first inter-op parallel work in this process
+        pass
+    
+    return get_thread_settings()
+
+def get_thread_settings():
+    """
+    Get the thread settings in effect in the current process.
+    
+    Returns:
+        Dictionary with the torch thread counts and the thread environment
+    """
+    import torch
+    
+    return {
+        "pid": os.getpid(),
+        "intra_op_threads": torch.get_num_threads(),
+        "inter_op_threads": torch.get_num_interop_threads(),
+        **{name: os.environ.get(name) for name in THREAD_ENV_VARS}
+    }
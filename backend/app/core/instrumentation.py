@@ -0,0 +1,162 @@
+import contextvars
+import functools
+import time
+
+from sqlalchemy import event
+
+from app.core.config import settings
+from app.core.metrics import (
+    DB_QUERIES, DB_QUERY_SECONDS, HTTP_REQUEST_DB_SECONDS, HTTP_REQUEST_DURATION_SECONDS, HTTP_REQUESTS_IN_PROGRESS,
+    MINIO_CALL_SECONDS
+)
+
+# Time spent in each backend while serving the current request, if any
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+class RequestTimings:
+    """
+    Accumulated time and call count per backend ("db", "minio") of one request.
+    """
+    
+    def __init__(self):
+        self.seconds = {}
+        self.calls = {}
+    
+    def add(self, name, seconds):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + 1
+    
+    def server_timing(self, total_seconds):
+        """
+        Format the timings as a Server-Timing header value.
+        """
+        entries = [
+            f'{name};dur={seconds * 1000:.1f};desc="{self.calls[name]} calls"'
+            for name, seconds in self.seconds.items()
+        ]
+        entries.append(f"app;dur={total_seconds * 1000:.1f}")
+        return ", ".join(entries)
+
+def add_request_timing(name, seconds):
+    """
+    Add backend time to the current request; a no-op outside requests.
+    """
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+def timed_call(name, metric, operation=None):
+    """
+    Decorator recording the duration of a backend call.
+    
+    Args:
+        name: Backend name in the request's Server-Timing header
+        metric: Histogram with "operation" and "status" labels
+        operation: Operation label (optional, defaults to the function name)
+    """
+    def decorator(func):
+        label = operation or func.__name__
+        
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            status = "error"
+            try:
+                result = func(*args, **kwargs)
+                status = "ok"
+                return result
+            finally:
+                elapsed = time.perf_counter() - start
+                metric.labels(label, status).observe(elapsed)
+                add_request_timing(name, elapsed)
+        
+        return wrapper
+    
+    return decorator
+
+timed_minio_call = functools.partial(timed_call, "minio", MINIO_CALL_SECONDS)
+
+def _statement_operation(statement):
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return operation if operation in ("SELECT", "INSERT", "UPDATE", "DELETE") else "OTHER"
+
+def instrument_engine(engine):
+    """
+    Count and time every statement executed on a (sync) engine.
+    
+    For an AsyncEngine pass its ``sync_engine``.
+    """
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+    
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        operation = _statement_operation(statement)
+        DB_QUERIES.labels(settings.PROCESS_TYPE, operation).inc()
+        DB_QUERY_SECONDS.labels(settings.PROCESS_TYPE, operation).observe(elapsed)
+        add_request_timing("db", elapsed)
+    
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(exception_context):
+        # Failed statements never reach after_cursor_execute
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_start"):
+            connection.info["query_start"].pop()
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording per-route latency, in-flight requests and the
+    database time of each request.
+    
+    Routes are labelled by their path template (``/api/jobs/{job_id}``), and
+    unmatched paths share one label so scanners cannot blow up the metric
+    cardinality. With ``server_timing`` enabled, a Server-Timing header with
+    the database, MinIO and total time is added to every response.
+    """
+    
+    def __init__(self, app, server_timing=False):
+        self.app = app
+        self.server_timing = server_timing
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        method = scope["method"]
+        timings = RequestTimings()
+        token = _request_timings.set(timings)
+        started = False
+        start = time.perf_counter()
+        
+        async def send_wrapper(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+                elapsed = time.perf_counter() - start
+                HTTP_REQUEST_DURATION_SECONDS.labels(method, self._route(scope), message["status"]).observe(elapsed)
+                if self.server_timing:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", timings.server_timing(elapsed).encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+        
+        HTTP_REQUESTS_IN_PROGRESS.labels(method).inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            # The server error handler outside this middleware answers with a 500
+            if not started:
+                HTTP_REQUEST_DURATION_SECONDS.labels(method, self._route(scope), 500).observe(time.perf_counter() - start)
+            raise
+        finally:
+            HTTP_REQUESTS_IN_PROGRESS.labels(method).dec()
+            HTTP_REQUEST_DB_SECONDS.labels(method, self._route(scope)).observe(timings.seconds.get("db", 0.0))
+            _request_timings.reset(token)
+    
+    @staticmethod
+    def _route(scope):
+        route = scope.get("route")
+        return getattr(route, "path", None) or "unmatched"
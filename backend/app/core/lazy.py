@@ -0,0 +1,42 @@
+import importlib
+
+class LazyModule:
+    """
+    Stand-in for a module that is imported on first attribute access.
+    
+    Lets service modules name heavy dependencies (torch, matplotlib) at the
+    top of the file while processes that never call into them, such as the
+    API or I/O-only workers, never pay their import time and memory.
+    """
+    
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+    
+    def _load(self):
+        if self._module is None:
+            # import_module holds the import lock, so concurrent first uses are safe
+            self.__dict__["_module"] = importlib.import_module(self._name)
+        return self._module
+    
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+    
+    def __dir__(self):
+        return dir(self._load())
+    
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+def lazy_import(name):
+    """
+    Get a module, deferring the import until it is first used.
+    
+    Args:
+        name: Absolute module name, e.g. "torch" or "matplotlib.figure"
+    
+    Returns:
+        LazyModule for the module
+    """
+    return LazyModule(name)
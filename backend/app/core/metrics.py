@@ -0,0 +1,126 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+# Database connection pool metrics
+DB_POOL_CHECKOUTS = Counter(
+    "agricarbonx_db_pool_checkouts_total",
+    "Connections checked out of the SQLAlchemy pool",
+    ["process_type"]
+)
+DB_POOL_WAIT_SECONDS = Histogram(
+    "agricarbonx_db_pool_wait_seconds",
+    "Time spent waiting for a connection from the SQLAlchemy pool",
+    ["process_type"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "agricarbonx_db_pool_checked_out",
+    "Connections currently checked out of the SQLAlchemy pool",
+    ["process_type"],
+    multiprocess_mode="livesum"
+)
+
+# Job stage metrics, recorded by app.core.tracing in the worker processes
+STAGE_RUNS = Counter(
+    "agricarbonx_stage_runs_total",
+    "Job stages run",
+    ["stage", "status"]
+)
+STAGE_WALL_SECONDS = Histogram(
+    "agricarbonx_stage_wall_seconds",
+    "Wall time of a job stage",
+    ["stage"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+)
+STAGE_CPU_SECONDS = Counter(
+    "agricarbonx_stage_cpu_seconds_total",
+    "CPU time of the worker process spent in a job stage",
+    ["stage"]
+)
+STAGE_PEAK_RSS_BYTES = Histogram(
+    "agricarbonx_stage_peak_rss_bytes",
+    "Peak resident set size of the worker process during a job stage",
+    ["stage"],
+    buckets=tuple(2 ** exponent * 2 ** 20 for exponent in range(5, 16))  # 32 MiB to 32 GiB
+)
+STAGE_BYTES_READ = Counter(
+    "agricarbonx_stage_read_bytes_total",
+    "Bytes read by a job stage",
+    ["stage"]
+)
+STAGE_BYTES_WRITTEN = Counter(
+    "agricarbonx_stage_written_bytes_total",
+    "Bytes written by a job stage",
+    ["stage"]
+)
+STAGE_PIXELS = Counter(
+    "agricarbonx_stage_pixels_total",
+    "Raster pixels produced by a job stage",
+    ["stage"]
+)
+
+# HTTP request metrics, recorded by app.core.instrumentation.MetricsMiddleware
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "agricarbonx_http_requests_in_progress",
+    "HTTP requests currently being served",
+    ["method"],
+    multiprocess_mode="livesum"
+)
+HTTP_REQUEST_DURATION_SECONDS = Histogram(
+    "agricarbonx_http_request_duration_seconds",
+    "Time until the response headers were sent, per route template",
+    ["method", "route", "status_code"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+HTTP_REQUEST_DB_SECONDS = Histogram(
+    "agricarbonx_http_request_db_seconds",
+    "Database time spent serving a request, per route template",
+    ["method", "route"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+)
+
+# Database query metrics, recorded by SQLAlchemy cursor events
+DB_QUERIES = Counter(
+    "agricarbonx_db_queries_total",
+    "SQL statements executed",
+    ["process_type", "operation"]
+)
+DB_QUERY_SECONDS = Histogram(
+    "agricarbonx_db_query_seconds",
+    "Execution time of SQL statements",
+    ["process_type", "operation"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+)
+
+# Object storage metrics
+MINIO_CALL_SECONDS = Histogram(
+    "agricarbonx_minio_call_seconds",
+    "Duration of MinIO client calls",
+    ["operation", "status"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0, 120.0)
+)
+
+# Scratch space metrics, recorded by app.core.scratch in the worker processes
+SCRATCH_QUOTA_BYTES = Gauge(
+    "agricarbonx_scratch_quota_bytes",
+    "Disk quota of a scratch area",
+    ["area"],
+    multiprocess_mode="mostrecent"
+)
+SCRATCH_USED_BYTES = Gauge(
+    "agricarbonx_scratch_used_bytes",
+    "Space used by the job workspaces of a scratch area",
+    ["area"],
+    multiprocess_mode="mostrecent"
+)
+SCRATCH_RESERVED_BYTES = Gauge(
+    "agricarbonx_scratch_reserved_bytes",
+    "Space reserved by the job workspaces of a scratch area",
+    ["area"],
+    multiprocess_mode="mostrecent"
+)
+SCRATCH_WORKSPACES = Gauge(
+    "agricarbonx_scratch_workspaces",
+    "Job workspaces in a scratch area",
+    ["area"],
+    multiprocess_mode="mostrecent"
+)
@@ -1,17 +1,24 @@
+from datetime import timedelta
 from minio import Minio
+from minio.error import S3Error
 from app.core.config import settings
+from app.core.instrumentation import timed_minio_call
 
 # Initialize MinIO client
+# With the region set, presigning is pure local signing with no network
+# round-trip, so it is safe to call from async endpoints.
 minio_client = Minio(
     endpoint=settings.MINIO_ENDPOINT,
     access_key=settings.MINIO_ACCESS_KEY,
     secret_key=settings.MINIO_SECRET_KEY,
-    secure=settings.MINIO_SECURE
+    secure=settings.MINIO_SECURE,
+    region=settings.MINIO_REGION
 )
 
 # Create buckets if they don't exist
+@timed_minio_call()
 def create_buckets():
-    buckets = [settings.BUCKET_RESULTS, settings.BUCKET_REPORTS, settings.BUCKET_CACHE]
+    buckets = [settings.BUCKET_RESULTS, settings.BUCKET_REPORTS, settings.BUCKET_CACHE, settings.BUCKET_PROFILES]
     for bucket in buckets:
         if not minio_client.bucket_exists(bucket):
             minio_client.make_bucket(bucket)
@@ -31,6 +38,7 @@ def create_buckets():
                 minio_client.set_bucket_policy(bucket, policy)
 
 # Get presigned URL for object
+@timed_minio_call()
 def get_presigned_url(bucket_name, object_name, expires=3600):
     """
     Generate a presigned URL for an object
@@ -39,13 +47,14 @@ def get_presigned_url(bucket_name, object_name, expires=3600):
         return minio_client.presigned_get_object(
             bucket_name=bucket_name,
             object_name=object_name,
-            expires=expires
+            expires=timedelta(seconds=expires)
         )
     except Exception as e:
         print(f"Error generating presigned URL: {e}")
         return None
 
 # Upload file to MinIO
+@timed_minio_call()
 def upload_file(bucket_name, object_name, file_path):
     """
     Upload a file to MinIO
@@ -60,3 +69,28 @@ def upload_file(bucket_name, object_name, file_path):
     except Exception as e:
         print(f"Error uploading file: {e}")
         return False
+
+# Download file from MinIO
+@timed_minio_call()
+def download_file(bucket_name, object_name, file_path):
+    """
+    Download an object from MinIO to a local file
+    
+    Returns:
+        True if the object was downloaded, False if it does not exist or
+        MinIO could not be reached
+    """
+    try:
+        minio_client.fget_object(
+            bucket_name=bucket_name,
+            object_name=object_name,
+            file_path=file_path
+        )
+        return True
+    except S3Error as e:
+        if e.code != "NoSuchKey":
+            print(f"Error downloading file: {e}")
+        return False
+    except Exception as e:
+        print(f"Error downloading file: {e}")
+        return False
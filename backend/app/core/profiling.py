@@ -0,0 +1,84 @@
+import cProfile
+import os
+import pstats
+import tracemalloc
+
+class TaskProfiler:
+    """
+    Runs a block of code under cProfile and tracemalloc and writes the results
+    to ``output_dir``.
+    
+    cProfile only sees the thread that enters the profiler; tracemalloc sees
+    Python and NumPy allocations of every thread but not memory allocated
+    directly by native libraries such as GDAL or torch.
+    
+    After the block ``artifacts`` maps each kind of output to its file:
+    
+    - "cpu": binary pstats file (snakeviz, ``python -m pstats``)
+    - "cpu_summary": functions with the highest cumulative time
+    - "memory": traced peak and the largest allocation sites still live
+    """
+    
+    def __init__(self, output_dir, name, frames=1, top=50):
+        self.output_dir = output_dir
+        self.name = name
+        self.frames = frames
+        self.top = top
+        self.artifacts = {}
+    
+    def __enter__(self):
+        self._started_tracemalloc = not tracemalloc.is_tracing()
+        if self._started_tracemalloc:
+            tracemalloc.start(self.frames)
+        tracemalloc.reset_peak()
+        
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self._profile.disable()
+        
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+        
+        self.artifacts = {
+            "cpu": self._write_cpu_profile(),
+            "cpu_summary": self._write_cpu_summary(),
+            "memory": self._write_memory_summary(snapshot, current, peak)
+        }
+        return False
+    
+    def _path(self, suffix):
+        return os.path.join(self.output_dir, f"{self.name}{suffix}")
+    
+    def _write_cpu_profile(self):
+        path = self._path(".pstats")
+        self._profile.dump_stats(path)
+        return path
+    
+    def _write_cpu_summary(self):
+        path = self._path(".cpu.txt")
+        with open(path, "w") as f:
+            stats = pstats.Stats(self._profile, stream=f)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top)
+        return path
+    
+    def _write_memory_summary(self, snapshot, current, peak):
+        path = self._path(".memory.txt")
+        key_type = "traceback" if self.frames > 1 else "lineno"
+        with open(path, "w") as f:
+            f.write(f"Traced peak: {peak / 2**20:.1f} MiB\n")
+            f.write(f"Traced at exit: {current / 2**20:.1f} MiB\n\n")
+            f.write(f"Top {self.top} allocation sites at exit:\n")
+            for stat in snapshot.statistics(key_type)[:self.top]:
+                f.write(f"{stat}\n")
+                if key_type == "traceback":
+                    for line in stat.traceback.format():
+                        f.write(f"    {line}\n")
+        return path
@@ -0,0 +1,120 @@
+import resource
+import sys
+import time
+
+def read_peak_rss():
+    """
+    Get the peak resident set size of the current process.
+    
+    Returns:
+        Peak RSS in bytes since the process started or since the last
+        reset_peak_rss()
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS; it cannot be reset
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+def read_rss():
+    """
+    Get the current resident set size of the current process in bytes.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    
+    return read_peak_rss()
+
+def reset_peak_rss():
+    """
+    Reset the peak RSS high-water mark to the current RSS (Linux only).
+    
+    Returns:
+        True if the mark was reset
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def read_io_counters():
+    """
+    Get the I/O counters of the current process.
+    
+    ``rchar``/``wchar`` count bytes passed to read/write system calls,
+    ``read_bytes``/``write_bytes`` bytes that reached the storage layer.
+    
+    Returns:
+        Dictionary of counters, empty where /proc/self/io is unavailable
+    """
+    counters = {}
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                name, value = line.split(":")
+                counters[name] = int(value)
+    except OSError:
+        pass
+    
+    return counters
+
+class ResourceMeter:
+    """
+    Measures wall time, CPU time, peak RSS and I/O of a block of code.
+    
+    Usage:
+        with ResourceMeter() as meter:
+            ...
+        meter.usage["wall_seconds"]
+    
+    The peak RSS high-water mark is process-wide. A meter entered inside
+    another one resets the mark, so pass the outer meter as ``parent`` to
+    carry the peak seen so far over to it; concurrent meters in one process
+    still see each other's peaks.
+    """
+    
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.usage = None
+        self._peak = 0
+    
+    def __enter__(self):
+        if self.parent is not None:
+            self.parent._peak = max(self.parent._peak, read_peak_rss())
+        self.rss_reset = reset_peak_rss()
+        self._io = read_io_counters()
+        self._cpu = time.process_time()
+        self._wall = time.perf_counter()
+        self.usage = None
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+        io = read_io_counters()
+        
+        self._peak = max(self._peak, read_peak_rss())
+        if self.parent is not None:
+            self.parent._peak = max(self.parent._peak, self._peak)
+        
+        self.usage = {
+            "wall_seconds": wall,
+            "cpu_seconds": cpu,
+            "peak_rss_bytes": self._peak,
+            "bytes_read": io.get("rchar", 0) - self._io.get("rchar", 0),
+            "bytes_written": io.get("wchar", 0) - self._io.get("wchar", 0)
+        }
+        return False
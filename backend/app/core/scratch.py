@@ -0,0 +1,404 @@
+import fcntl
+import json
+import logging
+import os
+import shutil
+import socket
+import time
+import uuid
+from contextlib import contextmanager
+from app.core.config import settings
+from app.core.metrics import SCRATCH_QUOTA_BYTES, SCRATCH_RESERVED_BYTES, SCRATCH_USED_BYTES, SCRATCH_WORKSPACES
+
+logger = logging.getLogger(__name__)
+
+# Written into every workspace; holds its reservation and owner
+RESERVATION_FILE = ".reservation"
+
+class ScratchQuotaExceeded(Exception):
+    """Raised when a workspace does not fit in a scratch area's quota in time"""
+
+def directory_size(path):
+    """
+    Get the disk space used by a directory tree.
+    
+    Counts allocated blocks rather than file sizes, so sparse files and
+    tmpfs pages are accounted for as the quota sees them.
+    
+    Returns:
+        Bytes, 0 if the directory does not exist
+    """
+    total = 0
+    try:
+        entries = list(os.scandir(path))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                total += directory_size(entry.path)
+            else:
+                total += entry.stat(follow_symlinks=False).st_blocks * 512
+        except FileNotFoundError:
+            # Deleted while scanning
+            continue
+    return total
+
+def get_host_queue():
+    """
+    Get the Celery queue consumed only by the workers of this host.
+    
+    Workspaces are directories of the container that created them, and the
+    PIDs in their reservations belong to its PID namespace, so the stage
+    tasks of a job are sent to this queue (see JobWorkspace.queue).
+    """
+    return f"scratch.{socket.gethostname()}"
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class JobWorkspace:
+    """
+    Scratch directory holding the intermediate files of one job.
+    
+    The reservation is what the job was admitted with; a workspace that
+    grows past it counts with its actual size. ``cleanup()`` deletes the
+    directory and frees the reservation.
+    
+    A workspace is only valid on the host (container) that created it;
+    tasks using it must be sent to ``queue``.
+    """
+    
+    def __init__(self, path, area, reserved_bytes=0):
+        self.path = path
+        self.area = area
+        self.reserved_bytes = reserved_bytes
+        self.queue = get_host_queue()
+    
+    def file(self, name):
+        """
+        Get a path in the workspace.
+        """
+        return os.path.join(self.path, name)
+    
+    def usage_bytes(self):
+        return directory_size(self.path)
+    
+    def cleanup(self):
+        """
+        Delete the workspace and everything in it.
+        
+        Returns:
+            Bytes the workspace used
+        """
+        used = self.usage_bytes()
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.area.report_usage()
+        return used
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.cleanup()
+        return False
+    
+    def __repr__(self):
+        return f"<JobWorkspace {self.path!r} reserved={self.reserved_bytes}>"
+
+class ScratchArea:
+    """
+    Root directory for job workspaces with a disk quota.
+    
+    Every worker process on a host shares the area; admission is decided
+    under an exclusive file lock on the root, against the sum of the
+    workspaces' reservations and actual sizes. Workspaces whose owning
+    process died are deleted on the next admission. Reservations record
+    the owner's host and PID, and only workspaces of the same host are
+    checked, so a root shared between containers never loses workspaces
+    of another container.
+    
+    Args:
+        root: Directory holding the workspaces
+        quota_bytes: Maximum space used by all workspaces together
+        name: Label of the area in metrics and usage reports
+    """
+    
+    def __init__(self, root, quota_bytes, name="disk"):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.name = name
+    
+    @contextmanager
+    def _locked(self):
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+    
+    def _workspaces(self):
+        """Yield (path, reservation) for every workspace in the area"""
+        try:
+            entries = list(os.scandir(self.root))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if not entry.is_dir(follow_symlinks=False):
+                continue
+            try:
+                with open(os.path.join(entry.path, RESERVATION_FILE)) as f:
+                    reservation = json.load(f)
+            except (FileNotFoundError, ValueError):
+                # Created but not registered yet, or being deleted
+                reservation = {"reserved_bytes": 0, "pid": None, "host": None}
+            yield entry.path, reservation
+    
+    def usage(self):
+        """
+        Get the space used and reserved in the area.
+        
+        Returns:
+            Dictionary with the area's name, root, quota_bytes, used_bytes,
+            reserved_bytes, committed_bytes (what admission counts: the
+            larger of each workspace's reservation and size) and a list of
+            workspaces with their path, used_bytes and reserved_bytes
+        """
+        workspaces = []
+        for path, reservation in self._workspaces():
+            workspaces.append({
+                "path": path,
+                "job_id": reservation.get("job_id"),
+                "used_bytes": directory_size(path),
+                "reserved_bytes": reservation.get("reserved_bytes", 0)
+            })
+        return {
+            "name": self.name,
+            "root": self.root,
+            "quota_bytes": self.quota_bytes,
+            "used_bytes": sum(workspace["used_bytes"] for workspace in workspaces),
+            "reserved_bytes": sum(workspace["reserved_bytes"] for workspace in workspaces),
+            "committed_bytes": sum(max(workspace["used_bytes"], workspace["reserved_bytes"]) for workspace in workspaces),
+            "workspaces": workspaces
+        }
+    
+    def report_usage(self):
+        """
+        Publish the area's usage as Prometheus gauges.
+        
+        Returns:
+            Dictionary returned by usage()
+        """
+        usage = self.usage()
+        SCRATCH_QUOTA_BYTES.labels(area=self.name).set(self.quota_bytes)
+        SCRATCH_USED_BYTES.labels(area=self.name).set(usage["used_bytes"])
+        SCRATCH_RESERVED_BYTES.labels(area=self.name).set(usage["reserved_bytes"])
+        SCRATCH_WORKSPACES.labels(area=self.name).set(len(usage["workspaces"]))
+        return usage
+    
+    def _reap_stale(self):
+        host = socket.gethostname()
+        for path, reservation in self._workspaces():
+            # PIDs of other hosts mean nothing in this PID namespace
+            if reservation.get("host", host) != host:
+                continue
+            pid = reservation.get("pid")
+            if pid is not None and not _process_alive(pid):
+                logger.warning("Deleting scratch workspace %s of exited process %s", path, pid)
+                shutil.rmtree(path, ignore_errors=True)
+    
+    def try_acquire(self, job_id, reserve_bytes):
+        """
+        Create a workspace if the reservation fits in the quota now.
+        
+        Args:
+            job_id: Job the workspace belongs to
+            reserve_bytes: Space to reserve for the job
+        
+        Returns:
+            JobWorkspace, or None if the area is full
+        """
+        with self._locked():
+            self._reap_stale()
+            usage = self.usage()
+            if usage["committed_bytes"] + reserve_bytes > self.quota_bytes:
+                return None
+            
+            path = os.path.join(self.root, f"job_{job_id}_{uuid.uuid4().hex[:8]}")
+            os.makedirs(path)
+            with open(os.path.join(path, RESERVATION_FILE), "w") as f:
+                json.dump({
+                    "job_id": job_id,
+                    "host": socket.gethostname(),
+                    "pid": os.getpid(),
+                    "reserved_bytes": reserve_bytes,
+                    "created_at": time.time()
+                }, f)
+        
+        self.report_usage()
+        return JobWorkspace(path, self, reserve_bytes)
+    
+    def acquire(self, job_id, reserve_bytes, timeout=None, poll_seconds=1.0):
+        """
+        Create a workspace, waiting for other jobs to free space if needed.
+        
+        Args:
+            job_id: Job the workspace belongs to
+            reserve_bytes: Space to reserve for the job
+            timeout: Seconds to wait for space (optional, defaults to
+                settings.SCRATCH_WAIT_SECONDS)
+            poll_seconds: Seconds between admission attempts
+        
+        Returns:
+            JobWorkspace
+        
+        Raises:
+            ScratchQuotaExceeded: If the reservation is larger than the quota
+                or did not fit within ``timeout``
+        """
+        if reserve_bytes > self.quota_bytes:
+            raise ScratchQuotaExceeded(
+                f"Job {job_id} needs {reserve_bytes / 2**20:.0f} MiB of scratch, "
+                f"more than the {self.quota_bytes / 2**20:.0f} MiB quota of {self.root}"
+            )
+        
+        timeout = settings.SCRATCH_WAIT_SECONDS if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            workspace = self.try_acquire(job_id, reserve_bytes)
+            if workspace is not None:
+                return workspace
+            if time.monotonic() >= deadline:
+                raise ScratchQuotaExceeded(
+                    f"No {reserve_bytes / 2**20:.0f} MiB of scratch became free in {self.root} within {timeout} s"
+                )
+            time.sleep(poll_seconds)
+
+def touch_paths(paths):
+    """
+    Mark files of the shared scene directory as used now.
+    
+    prune_scene_cache evicts by modification time, so every job touches
+    the cached files it is about to use.
+    """
+    now = time.time()
+    for path in paths:
+        try:
+            os.utime(path, (now, now))
+        except FileNotFoundError:
+            continue
+
+def prune_scene_cache(directory=None, quota_bytes=None, max_age_seconds=None, min_age_seconds=None):
+    """
+    Evict the least recently used files of the shared scene directory.
+    
+    Ingested scenes, their cloud-masked products and job composites stay in
+    settings.INGEST_DATA_DIR for later jobs, and every one of them can be
+    rebuilt: providers fetch missing scenes again, plan_incremental_run runs
+    a job in full when masked scenes are gone and a missing prior composite
+    is composited again. Files unused for ``max_age_seconds`` are deleted,
+    then the least recently used until the rest fits in ``quota_bytes``.
+    Files used within ``min_age_seconds`` are always kept.
+    
+    Args:
+        directory: Directory to prune (optional, defaults to settings.INGEST_DATA_DIR)
+        quota_bytes: Space the files may use (optional, defaults to
+            settings.SCENE_CACHE_QUOTA_MB)
+        max_age_seconds: Time since last use after which a file is deleted
+            (optional, defaults to settings.SCENE_CACHE_MAX_AGE_DAYS)
+        min_age_seconds: Time since last use before a file may be deleted
+            (optional, defaults to settings.SCENE_CACHE_MIN_AGE_SECONDS)
+    
+    Returns:
+        List of deleted paths
+    """
+    directory = directory or settings.INGEST_DATA_DIR
+    quota_bytes = settings.SCENE_CACHE_QUOTA_MB * 2**20 if quota_bytes is None else quota_bytes
+    max_age_seconds = settings.SCENE_CACHE_MAX_AGE_DAYS * 86400 if max_age_seconds is None else max_age_seconds
+    min_age_seconds = settings.SCENE_CACHE_MIN_AGE_SECONDS if min_age_seconds is None else min_age_seconds
+    
+    files = []
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return []
+    for entry in entries:
+        # Only finished rasters; files being written end in .tmp
+        if not entry.name.endswith(".tif") or not entry.is_file(follow_symlinks=False):
+            continue
+        try:
+            stat = entry.stat(follow_symlinks=False)
+        except FileNotFoundError:
+            continue
+        files.append((stat.st_mtime, stat.st_blocks * 512, entry.path))
+    
+    now = time.time()
+    used = sum(size for _, size, _ in files)
+    deleted = []
+    # Oldest first
+    for mtime, size, path in sorted(files):
+        age = now - mtime
+        if age < min_age_seconds or (age < max_age_seconds and used <= quota_bytes):
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        used -= size
+        deleted.append(path)
+    
+    if deleted:
+        logger.info("Evicted %d files from %s, %d MiB remain", len(deleted), directory, used // 2**20)
+    return deleted
+
+def get_scratch_areas():
+    """
+    Get the configured scratch areas, tmpfs first if enabled.
+    """
+    areas = []
+    if settings.SCRATCH_TMPFS_DIR:
+        areas.append(ScratchArea(settings.SCRATCH_TMPFS_DIR, settings.SCRATCH_TMPFS_QUOTA_MB * 2**20, name="tmpfs"))
+    areas.append(ScratchArea(settings.SCRATCH_DIR, settings.SCRATCH_QUOTA_MB * 2**20, name="disk"))
+    return areas
+
+def create_job_workspace(job_id, reserve_bytes):
+    """
+    Create the scratch workspace of a job.
+    
+    Jobs reserving at most settings.SCRATCH_TMPFS_MAX_JOB_MB go to the tmpfs
+    area when it is enabled and has room; everything else waits for room
+    in the disk area.
+    
+    Args:
+        job_id: Job the workspace belongs to
+        reserve_bytes: Estimated scratch space of the job
+    
+    Returns:
+        JobWorkspace
+    
+    Raises:
+        ScratchQuotaExceeded: If no area had room in time
+    """
+    *tmpfs, disk = get_scratch_areas()
+    if tmpfs and reserve_bytes <= settings.SCRATCH_TMPFS_MAX_JOB_MB * 2**20:
+        workspace = tmpfs[0].try_acquire(job_id, reserve_bytes)
+        if workspace is not None:
+            return workspace
+    return disk.acquire(job_id, reserve_bytes)
+
+def report_scratch_usage():
+    """
+    Publish the usage of every scratch area as Prometheus gauges.
+    
+    Returns:
+        List of usage dictionaries (see ScratchArea.usage)
+    """
+    return [area.report_usage() for area in get_scratch_areas()]
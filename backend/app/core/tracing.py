@@ -0,0 +1,164 @@
+import contextvars
+import functools
+import os
+from datetime import datetime
+
+from app.core.metrics import (
+    STAGE_BYTES_READ, STAGE_BYTES_WRITTEN, STAGE_CPU_SECONDS, STAGE_PEAK_RSS_BYTES, STAGE_PIXELS, STAGE_RUNS,
+    STAGE_WALL_SECONDS
+)
+from app.core.resources import ResourceMeter
+
+RASTER_EXTENSIONS = (".tif", ".tiff")
+
+# Innermost open span of the current task, if it runs inside a job trace
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+class Trace:
+    """
+    Spans recorded for one Celery task of a job.
+    """
+    
+    def __init__(self, job_id=None):
+        self.job_id = job_id
+        self.spans = []
+    
+    def span(self, name):
+        """
+        Open the root span of the trace.
+        """
+        return Span(name, trace=self)
+
+class Span(ResourceMeter):
+    """
+    One timed stage of a job.
+    
+    Spans nest: a span opened while another one is active becomes its child
+    and carries its peak RSS over to it. On exit the span is appended to its
+    trace and exported as Prometheus metrics.
+    """
+    
+    def __init__(self, name, parent=None, trace=None):
+        super().__init__(parent=parent)
+        self.name = name
+        self.trace = trace if trace is not None else parent.trace
+        self.started_at = None
+        self.status = "ok"
+        self.pixels = 0
+    
+    def __enter__(self):
+        self.started_at = datetime.utcnow()
+        super().__enter__()
+        self._token = _current_span.set(self)
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        _current_span.reset(self._token)
+        super().__exit__(exc_type, exc, tb)
+        
+        if exc_type is not None:
+            self.status = "error"
+        
+        self.trace.spans.append(self)
+        record_span_metrics(self)
+        return False
+    
+    def to_dict(self):
+        """
+        Get the span as a dictionary of job_stages columns.
+        """
+        return {
+            "name": self.name,
+            "parent": self.parent.name if self.parent is not None else None,
+            "status": self.status,
+            "started_at": self.started_at,
+            "pixels": self.pixels,
+            **self.usage
+        }
+
+def record_span_metrics(span):
+    """
+    Export a finished span as Prometheus metrics.
+    """
+    usage = span.usage
+    STAGE_RUNS.labels(span.name, span.status).inc()
+    STAGE_WALL_SECONDS.labels(span.name).observe(usage["wall_seconds"])
+    STAGE_CPU_SECONDS.labels(span.name).inc(usage["cpu_seconds"])
+    STAGE_PEAK_RSS_BYTES.labels(span.name).observe(usage["peak_rss_bytes"])
+    STAGE_BYTES_READ.labels(span.name).inc(max(usage["bytes_read"], 0))
+    STAGE_BYTES_WRITTEN.labels(span.name).inc(max(usage["bytes_written"], 0))
+    STAGE_PIXELS.labels(span.name).inc(span.pixels)
+
+def count_pixels(value):
+    """
+    Count the pixels of the rasters referenced by a stage's return value.
+    
+    Paths are looked up in strings, lists, tuples and dictionary values,
+    so ``(map_path, stats)`` or ``{"ndvi": path, ...}`` are both counted.
+    
+    Args:
+        value: Return value of a stage
+    
+    Returns:
+        Sum of width * height over existing GeoTIFFs
+    """
+    if isinstance(value, str):
+        if not value.lower().endswith(RASTER_EXTENSIONS) or not os.path.exists(value):
+            return 0
+        
+        import rasterio
+        
+        try:
+            with rasterio.open(value) as src:
+                return src.width * src.height
+        except rasterio.errors.RasterioError:
+            return 0
+    
+    if isinstance(value, dict):
+        value = value.values()
+    if isinstance(value, (list, tuple, type({}.values()))):
+        return sum(count_pixels(item) for item in value)
+    
+    return 0
+
+def current_span():
+    """
+    Get the innermost open span, or None outside a job trace.
+    """
+    return _current_span.get()
+
+def traced(func=None, *, name=None):
+    """
+    Decorator recording a function as a stage of the current job.
+    
+    Outside a job trace (API processes, tests, benchmarks) the function is
+    called as is.
+    
+    Usage:
+        @traced
+        def compute_indices(...): ...
+        
+        @traced(name="inference")
+        def run_model(...): ...
+    
+    Args:
+        func: Function to wrap
+        name: Stage name (optional, defaults to the function name)
+    """
+    if func is None:
+        return functools.partial(traced, name=name)
+    
+    stage = name or func.__name__
+    
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        parent = _current_span.get()
+        if parent is None:
+            return func(*args, **kwargs)
+        
+        with Span(stage, parent=parent) as span:
+            result = func(*args, **kwargs)
+            span.pixels = count_pixels(result)
+        return result
+    
+    return wrapper
@@ -0,0 +1,84 @@
+import base64
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+from sqlalchemy import Select, tuple_
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """
+    Encode the sort key of the last row of a page as an opaque cursor.
+
+    Args:
+        created_at: Creation timestamp of the row
+        row_id: Primary key of the row
+
+    Returns:
+        URL-safe cursor string
+    """
+    raw = f"{created_at.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Decode a cursor produced by ``encode_cursor``.
+
+    Args:
+        cursor: Cursor string
+
+    Returns:
+        Tuple of (created_at, id)
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+def _keyset_filter(created_at_column, id_column, cursor: str):
+    created_at, row_id = decode_cursor(cursor)
+    return tuple_(created_at_column, id_column) < tuple_(created_at, row_id)
+
+def finish_page(rows: List[Any], limit: int) -> Tuple[List[Any], Optional[str]]:
+    """
+    Trim the look-ahead row from a keyset page and build the next cursor.
+
+    Args:
+        rows: Up to ``limit + 1`` rows, newest first
+        limit: Page size
+
+    Returns:
+        Tuple of (rows, next_cursor); next_cursor is None on the last page
+    """
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+
+    return rows, next_cursor
+
+def keyset_select(statement: Select, created_at_column, id_column, limit: int, cursor: Optional[str] = None) -> Select:
+    """
+    Apply the keyset filter, ordering and look-ahead limit to a select().
+
+    Unlike OFFSET, the cost of fetching a page does not grow with its depth
+    because the database seeks straight to the cursor position on the
+    ``(created_at, id)`` index. Pass the fetched rows to ``finish_page``.
+
+    Args:
+        statement: Select of at least the created_at and id columns
+        created_at_column: Column holding the creation timestamp
+        id_column: Primary key column, used as a tie-breaker
+        limit: Maximum number of rows to return
+        cursor: Cursor returned with the previous page (optional)
+
+    Returns:
+        Paginated select statement
+    """
+    if cursor:
+        statement = statement.where(_keyset_filter(created_at_column, id_column, cursor))
+
+    return statement.order_by(created_at_column.desc(), id_column.desc()).limit(limit + 1)
@@ -1,14 +1,103 @@
-from sqlalchemy import create_engine
+import time
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
 from app.core.config import settings
+from app.core.instrumentation import instrument_engine
+from app.core.metrics import DB_POOL_CHECKOUTS, DB_POOL_WAIT_SECONDS, DB_POOL_CHECKED_OUT
 
-engine = create_engine(settings.SQLALCHEMY_DATABASE_URI)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+class PoolWaitTimeMixin:
+    """Records how long callers wait to obtain a connection from the pool"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT_SECONDS.labels(settings.PROCESS_TYPE).observe(time.perf_counter() - start)
+
+class InstrumentedQueuePool(PoolWaitTimeMixin, QueuePool):
+    """QueuePool for the sync engine with wait-time metrics"""
+
+class InstrumentedAsyncQueuePool(PoolWaitTimeMixin, AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool for the async engine with wait-time metrics"""
+
+def get_pool_options(process_type=None, poolclass=InstrumentedQueuePool):
+    """
+    Get connection pool options for a process type.
+
+    API processes serve many concurrent requests and get a larger pool;
+    Celery worker children run one task at a time and need only a couple
+    of connections each.
+
+    Args:
+        process_type: "api" or "worker" (defaults to settings.PROCESS_TYPE)
+        poolclass: Pool implementation to use
+
+    Returns:
+        Keyword arguments for create_engine
+    """
+    if process_type is None:
+        process_type = settings.PROCESS_TYPE
+
+    if process_type == "worker":
+        pool_size, max_overflow = settings.DB_POOL_SIZE_WORKER, settings.DB_MAX_OVERFLOW_WORKER
+    else:
+        pool_size, max_overflow = settings.DB_POOL_SIZE_API, settings.DB_MAX_OVERFLOW_API
+
+    return {
+        "poolclass": poolclass,
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+engine = create_engine(settings.SQLALCHEMY_DATABASE_URI, **get_pool_options())
+# Objects stay loaded after commit so callers don't pay an extra SELECT per refresh
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 
 Base = declarative_base()
 
+# Async engine for the API's read endpoints. Connections are only opened on
+# first use, so worker processes that never touch it hold none.
+async_engine = create_async_engine(
+    settings.SQLALCHEMY_ASYNC_DATABASE_URI,
+    **get_pool_options(poolclass=InstrumentedAsyncQueuePool)
+)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+@event.listens_for(engine, "checkout")
+@event.listens_for(async_engine.sync_engine, "checkout")
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    DB_POOL_CHECKOUTS.labels(settings.PROCESS_TYPE).inc()
+    DB_POOL_CHECKED_OUT.labels(settings.PROCESS_TYPE).inc()
+
+# Tracked with inc()/dec() rather than a callback gauge, which is never
+# written to the files multiprocess metrics are collected from
+@event.listens_for(engine, "checkin")
+@event.listens_for(async_engine.sync_engine, "checkin")
+def _on_checkin(dbapi_connection, connection_record):
+    DB_POOL_CHECKED_OUT.labels(settings.PROCESS_TYPE).dec()
+
+# Query counts and timings, also added to the current request's Server-Timing
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+
+def reset_engine():
+    """
+    Drop pooled connections inherited from a parent process.
+
+    Must be called in each forked child (e.g. Celery prefork workers) before
+    the first query; the parent's connections are left open for the parent.
+    """
+    engine.dispose(close=False)
+    async_engine.sync_engine.dispose(close=False)
+
 # Dependency to get DB session
 def get_db():
     db = SessionLocal()
@@ -16,3 +105,8 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# Dependency to get an async DB session
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,7 +1,9 @@
 from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from prometheus_client import make_asgi_app
 from app.api.routes import router as api_router
 from app.core.config import settings
+from app.core.instrumentation import MetricsMiddleware
 
 app = FastAPI(
     title="AgricarbonX API",
@@ -16,11 +18,18 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+# Record per-route latency, in-flight requests and DB/MinIO time
+app.add_middleware(MetricsMiddleware, server_timing=settings.SERVER_TIMING_ENABLED)
+
 # Include API routes
 app.include_router(api_router, prefix="/api")
 
+# Expose Prometheus metrics
+app.mount("/metrics", make_asgi_app())
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to AgricarbonX API. See /docs for API documentation."}
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float, Text, Enum
+from sqlalchemy import BigInteger, Boolean, Column, Integer, String, DateTime, ForeignKey, Float, Text, Enum, Index
 from sqlalchemy.orm import relationship
 from geoalchemy2 import Geometry
 from datetime import datetime
@@ -28,18 +28,80 @@ class Job(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     error_message = Column(Text, nullable=True)
+    profile = Column(Boolean, default=False, nullable=False)  # Run the stage tasks under the profiler
+    parent_job_id = Column(Integer, ForeignKey("jobs.id"), nullable=True)  # Prior job whose scene products are reused
+    
+    # Keyset pagination indexes for list views, with and without a status filter
+    __table_args__ = (
+        Index("ix_jobs_created_at_id", "created_at", "id"),
+        Index("ix_jobs_status_created_at_id", "status", "created_at", "id"),
+    )
     
     # Relationships
     region = relationship("Region", back_populates="jobs")
     result = relationship("Result", back_populates="job", uselist=False)
 
+# Timing and resource usage of one stage of a job, recorded by app.core.tracing
+class JobStage(Base):
+    __tablename__ = "job_stages"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(Integer, ForeignKey("jobs.id"), index=True, nullable=False)
+    task_id = Column(String, nullable=True)
+    name = Column(String, nullable=False)
+    parent = Column(String, nullable=True)  # Enclosing stage, None for the task itself
+    status = Column(String, nullable=False)
+    started_at = Column(DateTime, nullable=False)
+    wall_seconds = Column(Float, nullable=False)
+    cpu_seconds = Column(Float, nullable=False)
+    peak_rss_bytes = Column(BigInteger, nullable=False)
+    bytes_read = Column(BigInteger, nullable=False)
+    bytes_written = Column(BigInteger, nullable=False)
+    pixels = Column(BigInteger, nullable=False)
+
+# Scene used by a job, with its cloud-masked product kept for later incremental runs
+class JobScene(Base):
+    __tablename__ = "job_scenes"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(Integer, ForeignKey("jobs.id"), index=True, nullable=False)
+    sensor = Column(String, nullable=False)  # "sentinel2" or "landsat"
+    acquired_at = Column(DateTime, nullable=False)
+    scene_path = Column(String, nullable=False)
+    masked_path = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+# Profiler output of one stage task of a job, stored in the profiles bucket
+class JobProfile(Base):
+    __tablename__ = "job_profiles"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(Integer, ForeignKey("jobs.id"), index=True, nullable=False)
+    task_id = Column(String, nullable=True)
+    task_name = Column(String, nullable=False)
+    kind = Column(String, nullable=False)  # "cpu", "cpu_summary" or "memory"
+    object_name = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+# Columns loaded for job list views, without building ORM instances
+JOB_LIST_COLUMNS = (
+    Job.id, Job.status, Job.task_id, Job.region_id, Job.start_date, Job.end_date,
+    Job.created_at, Job.updated_at, Job.error_message, Job.profile, Job.parent_job_id
+)
+
 # Pydantic models for API
 class JobBase(BaseModel):
     start_date: datetime
     end_date: datetime
+    profile: bool = False  # Profile CPU and memory of every stage task
 
 class JobCreate(JobBase):
     region_geojson: Dict[str, Any]
+    region_id: Optional[int] = None  # Existing region with the same geometry to rerun, extending its time series
+    parent_job_id: Optional[int] = None  # Prior job of the same region to extend incrementally
+
+class JobBatchCreate(JobBase):
+    regions_geojson: Dict[str, Any]  # GeoJSON FeatureCollection, one feature per field; a "region_id" property reruns that region
 
 class JobResponse(JobBase):
     id: int
@@ -49,6 +111,47 @@ class JobResponse(JobBase):
     created_at: datetime
     updated_at: datetime
     error_message: Optional[str] = None
+    parent_job_id: Optional[int] = None
     
     class Config:
         orm_mode = True
+
+class JobStageResponse(BaseModel):
+    id: int
+    job_id: int
+    task_id: Optional[str] = None
+    name: str
+    parent: Optional[str] = None
+    status: str
+    started_at: datetime
+    wall_seconds: float
+    cpu_seconds: float
+    peak_rss_bytes: int
+    bytes_read: int
+    bytes_written: int
+    pixels: int
+    
+    class Config:
+        orm_mode = True
+
+class JobProfileResponse(BaseModel):
+    id: int
+    job_id: int
+    task_id: Optional[str] = None
+    task_name: str
+    kind: str
+    object_name: str
+    created_at: datetime
+    url: Optional[str] = None
+    
+    class Config:
+        orm_mode = True
+
+class JobBatchResponse(BaseModel):
+    jobs: List[JobResponse]
+    groups: List[List[int]]  # Job IDs sharing ingest and preprocessing
+
+# Register the Region and Result mappers so the Job relationships resolve even
+# when only the job model has been imported
+from app.models.region import Region  # noqa: E402,F401
+from app.models.result import Result  # noqa: E402,F401
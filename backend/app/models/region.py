@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text
+from sqlalchemy import Column, Integer, String, DateTime, Text, Index
 from sqlalchemy.orm import relationship
 from geoalchemy2 import Geometry
 from datetime import datetime
@@ -16,9 +16,17 @@ class Region(Base):
     geometry = Column(Geometry('POLYGON'), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     
+    # Keyset pagination index for list views
+    __table_args__ = (
+        Index("ix_regions_created_at_id", "created_at", "id"),
+    )
+    
     # Relationships
     jobs = relationship("Job", back_populates="region")
 
+# Columns loaded for region list views; the geometry is left out
+REGION_LIST_COLUMNS = (Region.id, Region.name, Region.description, Region.created_at)
+
 # Pydantic models for API
 class RegionBase(BaseModel):
     name: Optional[str] = None
@@ -27,6 +35,13 @@ class RegionBase(BaseModel):
 class RegionCreate(RegionBase):
     geojson: Dict[str, Any]
 
+class RegionSummary(RegionBase):
+    id: int
+    created_at: datetime
+    
+    class Config:
+        orm_mode = True
+
 class RegionResponse(RegionBase):
     id: int
     created_at: datetime
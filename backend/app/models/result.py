@@ -1,8 +1,8 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float, Text
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float, Text, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 
 from app.db.session import Base
 
@@ -22,9 +22,77 @@ class Result(Base):
     moisture_mean = Column(Float, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     
+    # Keyset pagination index for list views
+    __table_args__ = (
+        Index("ix_results_created_at_id", "created_at", "id"),
+    )
+    
     # Relationships
     job = relationship("Job", back_populates="result")
 
+# Columns loaded for result list views; file paths and URLs are left out
+RESULT_LIST_COLUMNS = (
+    Result.id, Result.job_id, Result.created_at,
+    Result.soc_min, Result.soc_max, Result.soc_mean,
+    Result.moisture_min, Result.moisture_max, Result.moisture_mean
+)
+
+# Summary statistics of one result layer per region and date, for trend queries
+class RegionTimeseries(Base):
+    __tablename__ = "region_timeseries"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    region_id = Column(Integer, ForeignKey("regions.id"), nullable=False)
+    job_id = Column(Integer, ForeignKey("jobs.id"), nullable=False)
+    layer = Column(String, nullable=False)  # "soc" or "moisture"
+    observed_at = Column(DateTime, nullable=False)  # End date of the job's analysis period
+    count = Column(Integer, nullable=False)
+    mean = Column(Float, nullable=True)
+    min = Column(Float, nullable=True)
+    max = Column(Float, nullable=True)
+    std = Column(Float, nullable=True)
+    p10 = Column(Float, nullable=True)
+    p25 = Column(Float, nullable=True)
+    p50 = Column(Float, nullable=True)
+    p75 = Column(Float, nullable=True)
+    p90 = Column(Float, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # One point per region, layer and date; a later job for the same date replaces it.
+    # Time-series queries are range scans of this index.
+    __table_args__ = (
+        Index("ux_region_timeseries_region_layer_observed_at", "region_id", "layer", "observed_at", unique=True),
+    )
+
+# Change of one layer between the results of two jobs, cached by job pair
+class ResultDiff(Base):
+    __tablename__ = "result_diffs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    job_id_a = Column(Integer, ForeignKey("jobs.id"), nullable=False)  # Earlier job, defines the grid
+    job_id_b = Column(Integer, ForeignKey("jobs.id"), nullable=False)
+    layer = Column(String, nullable=False)
+    object_name = Column(String, nullable=False)  # Difference COG in the results bucket
+    count = Column(Integer, nullable=False)
+    mean = Column(Float, nullable=True)
+    min = Column(Float, nullable=True)
+    max = Column(Float, nullable=True)
+    std = Column(Float, nullable=True)
+    increased = Column(Integer, nullable=False)
+    decreased = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ux_result_diffs_jobs_layer", "job_id_a", "job_id_b", "layer", unique=True),
+    )
+
+# Columns returned by time-series queries
+TIMESERIES_COLUMNS = (
+    RegionTimeseries.layer, RegionTimeseries.observed_at, RegionTimeseries.job_id, RegionTimeseries.count,
+    RegionTimeseries.mean, RegionTimeseries.min, RegionTimeseries.max, RegionTimeseries.std,
+    RegionTimeseries.p10, RegionTimeseries.p25, RegionTimeseries.p50, RegionTimeseries.p75, RegionTimeseries.p90
+)
+
 # Pydantic models for API
 class ResultBase(BaseModel):
     job_id: int
@@ -41,6 +109,20 @@ class ResultBase(BaseModel):
 class ResultCreate(ResultBase):
     pass
 
+class ResultSummary(BaseModel):
+    id: int
+    job_id: int
+    created_at: datetime
+    soc_min: Optional[float] = None
+    soc_max: Optional[float] = None
+    soc_mean: Optional[float] = None
+    moisture_min: Optional[float] = None
+    moisture_max: Optional[float] = None
+    moisture_mean: Optional[float] = None
+    
+    class Config:
+        orm_mode = True
+
 class ResultResponse(ResultBase):
     id: int
     created_at: datetime
@@ -50,3 +132,80 @@ class ResultResponse(ResultBase):
     
     class Config:
         orm_mode = True
+
+class ZonalStatsRequest(BaseModel):
+    zones_geojson: Dict[str, Any]  # GeoJSON FeatureCollection of zones
+    layers: List[str] = ["soc", "moisture"]
+    percentiles: List[float] = [10, 25, 50, 75, 90]
+
+class LayerStats(BaseModel):
+    count: int
+    mean: Optional[float] = None
+    min: Optional[float] = None
+    max: Optional[float] = None
+    std: Optional[float] = None
+    percentiles: Dict[str, float] = {}
+
+class ZoneStats(BaseModel):
+    index: int
+    properties: Dict[str, Any] = {}
+    layers: Dict[str, LayerStats]
+
+class ZonalStatsResponse(BaseModel):
+    job_id: int
+    zones: List[ZoneStats]
+
+class SampleRequest(BaseModel):
+    points: List[List[float]]  # [lon, lat] pairs in WGS84
+    layers: List[str] = ["soc", "moisture"]
+
+class SampleResponse(BaseModel):
+    job_id: int
+    points: List[List[float]]
+    values: Dict[str, List[Optional[float]]]  # Per layer, one value per point
+
+class TimeseriesPoint(BaseModel):
+    layer: str
+    observed_at: datetime
+    job_id: int
+    count: int
+    mean: Optional[float] = None
+    min: Optional[float] = None
+    max: Optional[float] = None
+    std: Optional[float] = None
+    p10: Optional[float] = None
+    p25: Optional[float] = None
+    p50: Optional[float] = None
+    p75: Optional[float] = None
+    p90: Optional[float] = None
+    
+    class Config:
+        orm_mode = True
+
+class RegionTimeseriesResponse(BaseModel):
+    region_id: int
+    points: List[TimeseriesPoint]  # Ordered by layer, then date
+
+class ResultDiffRequest(BaseModel):
+    job_id_a: int  # Earlier job
+    job_id_b: int  # Later job; the difference is b - a
+    layer: str = "soc"
+
+class ResultDiffResponse(BaseModel):
+    job_id_a: int
+    job_id_b: int
+    layer: str
+    count: int  # Pixels valid in both results
+    mean: Optional[float] = None
+    min: Optional[float] = None
+    max: Optional[float] = None
+    std: Optional[float] = None
+    increased: int  # Pixels with a positive change
+    decreased: int  # Pixels with a negative change
+    object_name: str
+    url: Optional[str] = None
+    cached: bool = False
+    created_at: datetime
+    
+    class Config:
+        orm_mode = True
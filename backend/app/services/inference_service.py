@@ -0,0 +1,346 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.lazy import lazy_import
+from app.services.predict_service import MODEL_HALO, load_model, to_model_input
+
+torch = lazy_import("torch")
+
+def split_tiles(features, tile_size, halo=MODEL_HALO):
+    """
+    Split a feature array into equally sized tiles with overlapping context.
+    
+    Every tile has the same shape so tiles from different feature stacks can
+    be batched together. Context outside the array is zero, like the model's
+    own padding; pixels within ``halo`` of the array border can therefore
+    differ slightly from a whole-array forward pass.
+    
+    Args:
+        features: (channels, height, width) array
+        tile_size: Output pixels per tile side
+        halo: Context pixels added on each side of a tile
+    
+    Returns:
+        Tuple of (tiles, origins): a (n, channels, tile_size + 2 * halo,
+        tile_size + 2 * halo) array and the (row, col) of each tile
+    """
+    channels, height, width = features.shape
+    rows = -(-height // tile_size)
+    cols = -(-width // tile_size)
+    
+    padded = np.zeros((channels, rows * tile_size + 2 * halo, cols * tile_size + 2 * halo), dtype=np.float32)
+    padded[:, halo:halo + height, halo:halo + width] = features
+    
+    size = tile_size + 2 * halo
+    origins = [(r * tile_size, c * tile_size) for r in range(rows) for c in range(cols)]
+    tiles = np.stack([padded[:, row:row + size, col:col + size] for row, col in origins])
+    
+    return tiles, origins
+
+def stitch_tiles(outputs, origins, shape, tile_size, halo=MODEL_HALO):
+    """
+    Reassemble per-tile model output into a single map.
+    
+    Args:
+        outputs: Sequence of (tile_size + 2 * halo, tile_size + 2 * halo) arrays
+        origins: (row, col) of each tile, as returned by split_tiles
+        shape: (height, width) of the original array
+        tile_size: Output pixels per tile side
+        halo: Context pixels on each side of a tile
+    
+    Returns:
+        (height, width) float32 array
+    """
+    height, width = shape
+    result = np.empty((height, width), dtype=np.float32)
+    for output, (row, col) in zip(outputs, origins):
+        rows = min(tile_size, height - row)
+        cols = min(tile_size, width - col)
+        result[row:row + rows, col:col + cols] = output[halo:halo + rows, halo:halo + cols]
+    
+    return result
+
+class MicroBatcher:
+    """
+    Collects tiles from concurrent callers into batched forward passes.
+    
+    Each model gets a queue and a thread. The thread takes the first waiting
+    tile, keeps collecting until ``max_batch_size`` tiles are queued or
+    ``max_latency_ms`` has passed, runs them through the cached model in one
+    forward pass and resolves each caller's future with its own output.
+    """
+    
+    def __init__(self, max_batch_size=None, max_latency_ms=None, model_loader=load_model):
+        self.max_batch_size = max_batch_size or settings.INFERENCE_MAX_BATCH
+        self.max_latency = (max_latency_ms if max_latency_ms is not None else settings.INFERENCE_MAX_LATENCY_MS) / 1000.0
+        self.model_loader = model_loader
+        self._queues = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        # Batches run so far and tiles in them, for monitoring
+        self.batches = 0
+        self.tiles = 0
+    
+    def submit(self, model_type, model_path, tile):
+        """
+        Queue one tile for inference.
+        
+        Args:
+            model_type: Type of model ("soc" or "moisture")
+            model_path: Path to the model file
+            tile: (channels, height, width) float32 array
+        
+        Returns:
+            Future resolving to the (height, width) model output
+        """
+        future = Future()
+        self._get_queue(model_type, model_path).put((tile, future))
+        return future
+    
+    def predict(self, model_type, model_path, tiles):
+        """
+        Run tiles through a model, batched with any other queued tiles.
+        
+        Args:
+            model_type: Type of model ("soc" or "moisture")
+            model_path: Path to the model file
+            tiles: (n, channels, height, width) float32 array
+        
+        Returns:
+            List of (height, width) model outputs, in tile order
+        """
+        futures = [self.submit(model_type, model_path, tile) for tile in tiles]
+        return [future.result() for future in futures]
+    
+    def close(self):
+        """
+        Stop the batching threads once their queues are drained.
+        """
+        with self._lock:
+            self._closed = True
+            queues = list(self._queues.values())
+        for q in queues:
+            q.put(None)
+    
+    def _get_queue(self, model_type, model_path):
+        key = (model_type, model_path)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("MicroBatcher is closed")
+            if key not in self._queues:
+                self._queues[key] = queue.Queue()
+                threading.Thread(
+                    target=self._run,
+                    args=(self._queues[key], model_type, model_path),
+                    name=f"microbatch-{model_type}",
+                    daemon=True
+                ).start()
+            return self._queues[key]
+    
+    def _collect(self, requests):
+        first = requests.get()
+        if first is None:
+            return None
+        
+        batch = [first]
+        deadline = time.monotonic() + self.max_latency
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # Finish this batch, then stop
+                requests.put(None)
+                break
+            batch.append(item)
+        
+        return batch
+    
+    def _run(self, requests, model_type, model_path):
+        model = None
+        while True:
+            batch = self._collect(requests)
+            if batch is None:
+                return
+            
+            futures = [future for _, future in batch]
+            try:
+                if model is None:
+                    model = self.model_loader(model_path, model_type=model_type)
+                
+                # Tiles of different shapes (e.g. other tile sizes) are run separately
+                groups = {}
+                for i, (tile, _) in enumerate(batch):
+                    groups.setdefault(tile.shape, []).append(i)
+                
+                for indexes in groups.values():
+                    inputs = to_model_input(torch.from_numpy(np.stack([batch[i][0] for i in indexes])), settings.MODEL_CHANNELS_LAST)
+                    with torch.no_grad():
+                        outputs = model(inputs).numpy()
+                    for i, output in zip(indexes, outputs):
+                        futures[i].set_result(output[0])
+                
+                self.batches += 1
+                self.tiles += len(batch)
+            except Exception as e:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+
+def _get_authkey(authkey=None):
+    """
+    Get the shared secret of the sidecar connection as bytes.
+    
+    Connections unpickle what they receive, so there is no default secret:
+    the sidecar and its clients refuse to start without one.
+    
+    Raises:
+        RuntimeError: If neither ``authkey`` nor settings.INFERENCE_AUTHKEY is set
+    """
+    authkey = authkey or settings.INFERENCE_AUTHKEY
+    if not authkey:
+        raise RuntimeError("INFERENCE_AUTHKEY must be set to use the inference sidecar")
+    return authkey.encode()
+
+class InferenceClient:
+    """
+    Sends tiles to an inference sidecar (see ``serve``).
+    
+    One connection is kept per process and shared between threads.
+    """
+    
+    def __init__(self, address=None, authkey=None):
+        self.address = address or (settings.INFERENCE_SERVER_HOST, settings.INFERENCE_SERVER_PORT)
+        self.authkey = _get_authkey(authkey)
+        self._connection = None
+        self._lock = threading.Lock()
+    
+    def predict(self, model_type, model_path, tiles):
+        """
+        Run tiles through a model on the sidecar.
+        
+        Args:
+            model_type: Type of model ("soc" or "moisture")
+            model_path: Path to the model file, as seen by the sidecar
+            tiles: (n, channels, height, width) float32 array
+        
+        Returns:
+            (n, height, width) array of model outputs
+        """
+        with self._lock:
+            if self._connection is None:
+                self._connection = Client(self.address, authkey=self.authkey)
+            try:
+                self._connection.send((model_type, model_path, tiles))
+                outputs = self._connection.recv()
+            except (EOFError, OSError):
+                # Sidecar restarted; reconnect on the next call
+                self._connection = None
+                raise
+        
+        if isinstance(outputs, Exception):
+            raise outputs
+        return outputs
+
+def _handle_connection(connection, batcher):
+    with connection:
+        while True:
+            try:
+                model_type, model_path, tiles = connection.recv()
+            except EOFError:
+                return
+            
+            try:
+                outputs = np.stack(batcher.predict(model_type, model_path, tiles))
+            except Exception as e:
+                outputs = e
+            connection.send(outputs)
+
+def serve(address=None, authkey=None, batcher=None, on_listen=None):
+    """
+    Run the inference sidecar until the process is stopped.
+    
+    Every worker connection is handled on its own thread and feeds the same
+    MicroBatcher, so tiles from concurrent jobs share forward passes.
+    
+    Args:
+        address: (host, port) to listen on (optional, defaults to
+            (settings.INFERENCE_SERVER_HOST, settings.INFERENCE_SERVER_PORT),
+            i.e. only the sidecar's address on the internal network)
+        authkey: Shared secret (optional, defaults to settings.INFERENCE_AUTHKEY)
+        batcher: MicroBatcher to use (optional)
+        on_listen: Callable receiving the bound address once the server is
+            listening (optional)
+    """
+    address = address or (settings.INFERENCE_SERVER_HOST, settings.INFERENCE_SERVER_PORT)
+    authkey = _get_authkey(authkey)
+    batcher = batcher or MicroBatcher()
+    
+    with Listener(address, authkey=authkey) as listener:
+        if on_listen is not None:
+            on_listen(listener.address)
+        while True:
+            try:
+                connection = listener.accept()
+            except Exception:
+                # Failed handshake (e.g. wrong authkey); keep serving others
+                continue
+            threading.Thread(target=_handle_connection, args=(connection, batcher), daemon=True).start()
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_inference_backend():
+    """
+    Get the per-process MicroBatcher or sidecar client for settings.INFERENCE_MODE.
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if settings.INFERENCE_MODE == "sidecar":
+                _backend = InferenceClient()
+            elif settings.INFERENCE_MODE == "batched":
+                _backend = MicroBatcher()
+            else:
+                raise ValueError(f"Unknown inference mode: {settings.INFERENCE_MODE}")
+        return _backend
+
+def predict_tiled(features, model_type, model_path, backend=None):
+    """
+    Run a model over a feature array tile by tile through a batching backend.
+    
+    Args:
+        features: Normalized (channels, height, width) float32 array
+        model_type: Type of model ("soc" or "moisture")
+        model_path: Path to the model file
+        backend: MicroBatcher or InferenceClient (optional, defaults to
+            get_inference_backend())
+    
+    Returns:
+        (height, width) array of raw model output
+    """
+    if backend is None:
+        backend = get_inference_backend()
+    
+    tile_size = settings.INFERENCE_TILE_SIZE
+    tiles, origins = split_tiles(features, tile_size)
+    outputs = backend.predict(model_type, model_path, tiles)
+    
+    return stitch_tiles(outputs, origins, features.shape[1:], tile_size)
+
+if __name__ == "__main__":
+    from app.core.cpu import apply_torch_threads, available_cpus
+    
+    # The sidecar is the only inference process on its CPUs
+    apply_torch_threads({"intra_op_threads": available_cpus(), "inter_op_threads": 1})
+    serve()
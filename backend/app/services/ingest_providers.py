@@ -0,0 +1,344 @@
+import json
+import os
+import threading
+import uuid
+import zlib
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+import rasterio
+from rasterio.crs import CRS
+from rasterio.merge import merge
+from rasterio.vrt import WarpedVRT
+from rasterio.warp import transform_bounds
+from app.core.config import settings
+from app.services.synthetic_data import write_synthetic_raster, write_synthetic_weather
+
+# Date format of the acquisition date at the end of scene file names
+SCENE_DATE_FORMAT = "%Y%m%d"
+
+# STAC collection of each ingest product
+COLLECTIONS = {
+    "sentinel2": "sentinel-2-l2a",
+    "landsat": "landsat-c2-l2",
+    "soilgrids_soc": "soilgrids-soc",
+    "soilgrids_bdod": "soilgrids-bdod",
+    "soilgrids_clay": "soilgrids-clay",
+    "soilgrids_sand": "soilgrids-sand",
+    "soilgrids_silt": "soilgrids-silt",
+    "soilgrids_phh2o": "soilgrids-phh2o"
+}
+
+WGS84 = CRS.from_epsg(4326)
+
+# A scene found by IngestProvider.search; ``href`` is None for generated scenes
+SceneItem = namedtuple("SceneItem", ["id", "product", "acquired_at", "bbox", "href"])
+
+def _key(*parts):
+    """Short stable key for file names and seeds"""
+    return zlib.crc32("|".join(str(part) for part in parts).encode())
+
+def _round_bbox(bbox):
+    return tuple(round(value, 6) for value in bbox)
+
+class IngestProvider(ABC):
+    """
+    Source of the imagery and ancillary data downloaded by ingest_service.
+    
+    Scenes are written to ``directory`` as GeoTIFFs named
+    ``{product}_{key}_{YYYYMMDD}.tif``, where the key identifies the item
+    and the requested bounding box. Existing files are reused, so repeated
+    and incremental runs over the same region only fetch new scenes.
+    """
+    
+    def __init__(self, directory=None):
+        self.directory = directory or settings.INGEST_DATA_DIR
+    
+    @abstractmethod
+    def search(self, product, bbox, start_date, end_date):
+        """
+        Find the scenes of a product intersecting a bounding box.
+        
+        Args:
+            product: "sentinel2" or "landsat"
+            bbox: (minx, miny, maxx, maxy) in EPSG:4326
+            start_date: Start date (ISO format string)
+            end_date: End date, inclusive (ISO format string)
+        
+        Returns:
+            List of SceneItem, oldest first
+        """
+    
+    @abstractmethod
+    def fetch_scenes(self, items, bbox):
+        """
+        Write the scenes clipped to a bounding box, one file per product and
+        acquisition date.
+        
+        Returns:
+            List of paths, oldest first
+        """
+    
+    @abstractmethod
+    def fetch_soilgrids(self, bbox, layer="soc", resolution=None, output_path=None):
+        """
+        Write a SoilGrids layer clipped to a bounding box.
+        
+        Args:
+            bbox: (minx, miny, maxx, maxy) in EPSG:4326
+            layer: SoilGrids layer, e.g. "soc", "bdod" or "clay"
+            resolution: Pixel size in degrees (optional, defaults to the
+                source's own resolution)
+            output_path: Path for the raster (optional, defaults to a file in
+                ``directory`` shared with other callers for the same request)
+        
+        Returns:
+            Path to the raster
+        """
+    
+    @abstractmethod
+    def fetch_weather(self, lon, lat, start_date, end_date, output_path=None):
+        """
+        Write daily weather at a point as CSV.
+        
+        Args:
+            lon: Longitude
+            lat: Latitude
+            start_date: First day (ISO format string)
+            end_date: Last day, inclusive (ISO format string)
+            output_path: Path for the CSV file (optional, defaults to a file in
+                ``directory`` shared with other callers for the same request)
+        
+        Returns:
+            Path to the CSV file
+        """
+    
+    def scene_path(self, product, acquired_at, bbox, item_ids=()):
+        return os.path.join(
+            self.directory,
+            f"{product}_{_key(*item_ids, *_round_bbox(bbox)):08x}_{acquired_at.strftime(SCENE_DATE_FORMAT)}.tif"
+        )
+    
+    def soilgrids_path(self, bbox, layer="soc", resolution=None):
+        return os.path.join(self.directory, f"soilgrids_{layer}_{_key(*_round_bbox(bbox), resolution):08x}.tif")
+    
+    def weather_path(self, lon, lat, start_date, end_date):
+        return os.path.join(self.directory, f"weather_{_key(round(lon, 4), round(lat, 4), start_date, end_date):08x}.csv")
+
+class SyntheticProvider(IngestProvider):
+    """
+    Generates random scenes at a fixed revisit interval instead of
+    downloading them. Scenes are deterministic per product, date and
+    bounding box, so reruns produce the same files.
+    """
+    
+    def __init__(self, directory=None, raster_size=None, revisit_days=None):
+        super().__init__(directory)
+        self.raster_size = raster_size or settings.SYNTHETIC_RASTER_SIZE
+        self.revisit_days = revisit_days or {
+            "sentinel2": settings.SENTINEL_REVISIT_DAYS,
+            "landsat": settings.LANDSAT_REVISIT_DAYS
+        }
+    
+    def search(self, product, bbox, start_date, end_date):
+        start_dt = datetime.fromisoformat(start_date)
+        end_dt = datetime.fromisoformat(end_date)
+        step = timedelta(days=self.revisit_days[product])
+        
+        items = []
+        acquired_at = start_dt
+        while acquired_at.date() <= end_dt.date():
+            item_id = f"{product}_{acquired_at.strftime(SCENE_DATE_FORMAT)}"
+            items.append(SceneItem(item_id, product, acquired_at, tuple(bbox), None))
+            acquired_at += step
+        return items
+    
+    def fetch_scenes(self, items, bbox):
+        os.makedirs(self.directory, exist_ok=True)
+        paths = []
+        for item in items:
+            path = self.scene_path(item.product, item.acquired_at, bbox)
+            if not os.path.exists(path):
+                write_synthetic_raster(
+                    path, item.product, bbox, self.raster_size, self.raster_size,
+                    seed=_key(item.id, *_round_bbox(bbox)), block_rows=settings.RASTER_BLOCK_ROWS
+                )
+            paths.append(path)
+        return paths
+    
+    def fetch_soilgrids(self, bbox, layer="soc", resolution=None, output_path=None):
+        path = output_path or self.soilgrids_path(bbox, layer, resolution)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if not os.path.exists(path):
+            width = height = self.raster_size
+            if resolution:
+                width = max(1, round((bbox[2] - bbox[0]) / resolution))
+                height = max(1, round((bbox[3] - bbox[1]) / resolution))
+            write_synthetic_raster(
+                path, f"soilgrids_{layer}", bbox, width, height,
+                seed=_key("soilgrids", layer, *_round_bbox(bbox)), block_rows=settings.RASTER_BLOCK_ROWS
+            )
+        return path
+    
+    def fetch_weather(self, lon, lat, start_date, end_date, output_path=None):
+        path = output_path or self.weather_path(lon, lat, start_date, end_date)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if not os.path.exists(path):
+            write_synthetic_weather(path, start_date, end_date, seed=_key(round(lon, 4), round(lat, 4)))
+        return path
+
+class StacProvider(IngestProvider):
+    """
+    Searches a STAC API and reads only the part of each asset covering the
+    requested bounding box, through HTTP range requests on cloud-optimized
+    GeoTIFFs. Weather comes from the API's ``/weather`` CSV endpoint.
+    
+    Items of the same product and date covering different tiles are
+    mosaicked into one scene. Up to ``max_concurrency`` scenes are fetched
+    at once, so request latency overlaps instead of adding up.
+    """
+    
+    def __init__(self, api_url=None, directory=None, timeout=None, page_size=100, max_concurrency=None):
+        super().__init__(directory)
+        self.api_url = (api_url or settings.STAC_API_URL).rstrip("/")
+        self.timeout = timeout or settings.STAC_TIMEOUT
+        self.page_size = page_size
+        self.max_concurrency = max_concurrency or settings.STAC_MAX_CONCURRENCY
+    
+    def _request_json(self, url, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        request = Request(url, data=data, headers={"Content-Type": "application/json", "Accept": "application/geo+json"})
+        with urlopen(request, timeout=self.timeout) as response:
+            return json.load(response)
+    
+    def search(self, product, bbox, start_date, end_date):
+        body = {
+            "collections": [COLLECTIONS[product]],
+            "bbox": list(bbox),
+            "datetime": f"{start_date[:10]}T00:00:00Z/{end_date[:10]}T23:59:59Z",
+            "limit": self.page_size
+        }
+        page = self._request_json(f"{self.api_url}/search", body)
+        
+        items = []
+        while True:
+            for feature in page["features"]:
+                acquired_at = datetime.fromisoformat(feature["properties"]["datetime"].replace("Z", "+00:00")).replace(tzinfo=None)
+                items.append(SceneItem(feature["id"], product, acquired_at, tuple(feature["bbox"]), feature["assets"]["data"]["href"]))
+            next_links = [link for link in page.get("links", []) if link.get("rel") == "next"]
+            if not next_links:
+                break
+            link = next_links[0]
+            page = self._request_json(link["href"], link.get("body") if link.get("method") == "POST" else None)
+        
+        return sorted(items, key=lambda item: (item.acquired_at, item.id))
+    
+    def _read_window(self, items, bbox, path, resolution=None):
+        """
+        Mosaic the part of each item's asset inside ``bbox`` into ``path``.
+        
+        The mosaic is in the CRS of the first item; items in another CRS,
+        such as tiles of the neighbouring UTM zone, are warped onto it.
+        """
+        # Open only the requested file; skip directory listings and sidecar probes
+        with rasterio.Env(GDAL_DISABLE_READDIR_ON_OPEN="EMPTY_DIR", CPL_VSIL_CURL_ALLOWED_EXTENSIONS=".tif", GDAL_HTTP_TIMEOUT=str(int(self.timeout))), \
+                ExitStack() as stack:
+            sources = [stack.enter_context(rasterio.open(f"/vsicurl/{item.href}")) for item in items]
+            profile = sources[0].profile
+            crs = sources[0].crs
+            if resolution and not crs.is_geographic:
+                raise ValueError(f"Resolution {resolution} is in degrees but {items[0].id} is in {crs}")
+            sources = [source if source.crs == crs else stack.enter_context(WarpedVRT(source, crs=crs)) for source in sources]
+            
+            # The bounding box is in EPSG:4326, merge takes the mosaic's CRS
+            bounds = bbox if crs == WGS84 else transform_bounds(WGS84, crs, *bbox, densify_pts=21)
+            data, transform = merge(sources, bounds=bounds, res=resolution)
+        
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with rasterio.open(
+            tmp_path,
+            'w',
+            driver='GTiff',
+            height=data.shape[1],
+            width=data.shape[2],
+            count=data.shape[0],
+            dtype=data.dtype,
+            crs=profile["crs"],
+            transform=transform,
+            nodata=profile.get("nodata")
+        ) as dst:
+            dst.write(data)
+        os.replace(tmp_path, path)
+        
+        return path
+    
+    def fetch_scenes(self, items, bbox):
+        os.makedirs(self.directory, exist_ok=True)
+        by_scene = {}
+        for item in items:
+            by_scene.setdefault((item.product, item.acquired_at.date()), []).append(item)
+        
+        paths = []
+        missing = []
+        for (product, _), scene_items in sorted(by_scene.items(), key=lambda entry: entry[0][1]):
+            path = self.scene_path(product, scene_items[0].acquired_at, bbox, sorted(item.id for item in scene_items))
+            if not os.path.exists(path):
+                missing.append((scene_items, path))
+            paths.append(path)
+        
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            # list() re-raises the first failed fetch
+            list(executor.map(lambda scene: self._read_window(scene[0], bbox, scene[1]), missing))
+        return paths
+    
+    def fetch_soilgrids(self, bbox, layer="soc", resolution=None, output_path=None):
+        product = f"soilgrids_{layer}"
+        if product not in COLLECTIONS:
+            raise ValueError(f"Unknown SoilGrids layer: {layer}")
+        path = output_path or self.soilgrids_path(bbox, layer, resolution)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if not os.path.exists(path):
+            body = {"collections": [COLLECTIONS[product]], "bbox": list(bbox), "limit": self.page_size}
+            features = self._request_json(f"{self.api_url}/search", body)["features"]
+            if not features:
+                raise ValueError(f"No SoilGrids {layer} data covers {bbox}")
+            items = [SceneItem(feature["id"], product, None, tuple(feature["bbox"]), feature["assets"]["data"]["href"]) for feature in features]
+            self._read_window(items, bbox, path, resolution)
+        return path
+    
+    def fetch_weather(self, lon, lat, start_date, end_date, output_path=None):
+        path = output_path or self.weather_path(lon, lat, start_date, end_date)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if not os.path.exists(path):
+            query = urlencode({"lon": lon, "lat": lat, "start": start_date[:10], "end": end_date[:10]})
+            with urlopen(f"{self.api_url}/weather?{query}", timeout=self.timeout) as response:
+                content = response.read()
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        return path
+
+PROVIDERS = {
+    "synthetic": SyntheticProvider,
+    "stac": StacProvider
+}
+
+_provider = None
+_provider_lock = threading.Lock()
+
+def get_ingest_provider():
+    """
+    Get the per-process provider for settings.INGEST_PROVIDER.
+    """
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            if settings.INGEST_PROVIDER not in PROVIDERS:
+                raise ValueError(f"Unknown ingest provider: {settings.INGEST_PROVIDER}")
+            _provider = PROVIDERS[settings.INGEST_PROVIDER]()
+        return _provider
@@ -1,17 +1,34 @@
 import os
-import rasterio
-import numpy as np
+import zlib
 from datetime import datetime
 from shapely.geometry import shape
-import geopandas as gpd
+from app.core.tracing import traced
 from app.core.config import settings
+from app.services.ingest_providers import SCENE_DATE_FORMAT, get_ingest_provider
+from app.services.soilgrids_service import get_job_layers, write_soilgrids_window
+from app.services.weather_service import get_antecedent_start, update_weather_store
 
+def get_acquisition_date(scene_path):
+    """
+    Get the acquisition date of a downloaded scene from its file name.
+    
+    Args:
+        scene_path: Path to a scene returned by download_sentinel_data or
+            download_landsat_data
+    
+    Returns:
+        Acquisition date as a datetime
+    """
+    stem = os.path.splitext(os.path.basename(scene_path))[0]
+    return datetime.strptime(stem.rsplit("_", 1)[-1], SCENE_DATE_FORMAT)
+
+@traced
 def download_sentinel_data(region_geojson, start_date, end_date):
     """
     Download Sentinel-2 L2A scenes for the given region and date range.
     
-    In a real implementation, this would connect to ESA Copernicus or AWS Open Data.
-    For the MVP, we simulate this by loading sample data.
+    Scenes come from the provider selected by settings.INGEST_PROVIDER:
+    generated sample data, or a STAC API read with HTTP range requests.
     
     Args:
         region_geojson: GeoJSON representation of the region of interest
@@ -19,76 +36,17 @@ def download_sentinel_data(region_geojson, start_date, end_date):
         end_date: End date for the search (ISO format string)
         
     Returns:
-        List of paths to downloaded scenes
+        List of paths to downloaded scenes, oldest first
     """
-    # Convert dates from string to datetime objects
-    start_dt = datetime.fromisoformat(start_date)
-    end_dt = datetime.fromisoformat(end_date)
-    
-    # In a real implementation, we would:
-    # 1. Convert the GeoJSON to a bounding box or WKT
-    # 2. Query the Sentinel API for available scenes
-    # 3. Filter by cloud cover, etc.
-    # 4. Download the scenes
-    
-    # For the MVP, we simulate this by returning paths to sample data
-    # In a real implementation, these would be downloaded to a cache directory
-    
-    # Create a directory for sample data if it doesn't exist
-    os.makedirs("data/sample", exist_ok=True)
-    
-    # Create a simple simulated Sentinel-2 scene with basic bands
-    # In a real implementation, we would download actual Sentinel-2 data
-    
-    # Create a simple GeoTIFF with 4 bands (Red, Green, Blue, NIR)
-    # The size is determined by the region's bounding box
-    
-    # Get the bounding box of the region
-    geom = shape(region_geojson["geometry"])
-    gdf = gpd.GeoDataFrame(geometry=[geom], crs="EPSG:4326")
-    minx, miny, maxx, maxy = gdf.total_bounds
-    
-    # Create a simple 100x100 raster with 4 bands
-    width, height = 100, 100
-    
-    # Create a transform from the bounding box
-    transform = rasterio.transform.from_bounds(minx, miny, maxx, maxy, width, height)
-    
-    # Create sample data for each band
-    # In a real implementation, these would be actual Sentinel-2 bands
-    red_band = np.random.randint(0, 10000, (height, width), dtype=np.uint16)
-    green_band = np.random.randint(0, 10000, (height, width), dtype=np.uint16)
-    blue_band = np.random.randint(0, 10000, (height, width), dtype=np.uint16)
-    nir_band = np.random.randint(0, 10000, (height, width), dtype=np.uint16)
-    
-    # Stack the bands
-    data = np.stack([red_band, green_band, blue_band, nir_band])
-    
-    # Create a GeoTIFF
-    output_path = f"data/sample/sentinel2_sample_{start_dt.strftime('%Y%m%d')}.tif"
-    
-    with rasterio.open(
-        output_path,
-        'w',
-        driver='GTiff',
-        height=height,
-        width=width,
-        count=4,
-        dtype=np.uint16,
-        crs='+proj=latlong',
-        transform=transform,
-    ) as dst:
-        dst.write(data)
-    
-    # Return the path to the sample data
-    return [output_path]
+    return _download_scenes("sentinel2", region_geojson, start_date, end_date)
 
+@traced
 def download_landsat_data(region_geojson, start_date, end_date):
     """
     Download Landsat 8/9 L2 scenes for the given region and date range.
     
-    In a real implementation, this would connect to USGS EarthExplorer or AWS.
-    For the MVP, we simulate this by loading sample data.
+    Scenes have 6 reflectance bands (Blue, Green, Red, NIR, SWIR1, SWIR2)
+    followed by a QA band with 1 for cloud and 0 for clear.
     
     Args:
         region_geojson: GeoJSON representation of the region of interest
@@ -96,121 +54,51 @@ def download_landsat_data(region_geojson, start_date, end_date):
         end_date: End date for the search (ISO format string)
         
     Returns:
-        List of paths to downloaded scenes
+        List of paths to downloaded scenes, oldest first
     """
-    # Similar to Sentinel-2, but for Landsat
-    # For the MVP, we simulate this by returning paths to sample data
-    
-    # Create a directory for sample data if it doesn't exist
-    os.makedirs("data/sample", exist_ok=True)
-    
-    # Convert dates from string to datetime objects
-    start_dt = datetime.fromisoformat(start_date)
-    
-    # Get the bounding box of the region
-    geom = shape(region_geojson["geometry"])
-    gdf = gpd.GeoDataFrame(geometry=[geom], crs="EPSG:4326")
-    minx, miny, maxx, maxy = gdf.total_bounds
-    
-    # Create a simple 100x100 raster with 6 bands (including SWIR)
-    width, height = 100, 100
-    
-    # Create a transform from the bounding box
-    transform = rasterio.transform.from_bounds(minx, miny, maxx, maxy, width, height)
-    
-    # Create sample data for each band
-    # In a real implementation, these would be actual Landsat bands
-    blue_band = np.random.randint(0, 10000, (height, width), dtype=np.uint16)
-    green_band = np.random.randint(0, 10000, (height, width), dtype=np.uint16)
-    red_band = np.random.randint(0, 10000, (height, width), dtype=np.uint16)
-    nir_band = np.random.randint(0, 10000, (height, width), dtype=np.uint16)
-    swir1_band = np.random.randint(0, 10000, (height, width), dtype=np.uint16)
-    swir2_band = np.random.randint(0, 10000, (height, width), dtype=np.uint16)
-    
-    # Create a QA band for cloud masking
-    qa_band = np.zeros((height, width), dtype=np.uint16)
-    # Simulate some clouds (value 1 for cloud, 0 for clear)
-    qa_band[np.random.rand(height, width) > 0.8] = 1
-    
-    # Stack the bands
-    data = np.stack([blue_band, green_band, red_band, nir_band, swir1_band, swir2_band, qa_band])
-    
-    # Create a GeoTIFF
-    output_path = f"data/sample/landsat_sample_{start_dt.strftime('%Y%m%d')}.tif"
-    
-    with rasterio.open(
-        output_path,
-        'w',
-        driver='GTiff',
-        height=height,
-        width=width,
-        count=7,
-        dtype=np.uint16,
-        crs='+proj=latlong',
-        transform=transform,
-    ) as dst:
-        dst.write(data)
-    
-    # Return the path to the sample data
-    return [output_path]
+    return _download_scenes("landsat", region_geojson, start_date, end_date)
+
+def _download_scenes(product, region_geojson, start_date, end_date):
+    provider = get_ingest_provider()
+    bbox = shape(region_geojson["geometry"]).bounds
+    items = provider.search(product, bbox, start_date, end_date)
+    return provider.fetch_scenes(items, bbox)
 
-def download_soilgrids_data(region_geojson):
+@traced
+def download_soilgrids_data(region_geojson, output_dir=None):
     """
-    Download SoilGrids data for the given region.
+    Extract SoilGrids data for the given region from the tile store.
     
-    In a real implementation, this would connect to the SoilGrids API.
-    For the MVP, we simulate this by loading sample data.
+    Only tiles not stored yet are fetched (see soilgrids_service), so
+    regions on already stored tiles make no network call.
     
     Args:
         region_geojson: GeoJSON representation of the region of interest
+        output_dir: Directory of the raster (optional, defaults to
+            settings.INGEST_DATA_DIR)
         
     Returns:
-        Path to downloaded SoilGrids data
+        Path to a raster with one band per layer of settings.SOILGRIDS_LAYERS
+        covering the region's bounds
     """
-    # Create a directory for sample data if it doesn't exist
-    os.makedirs("data/sample", exist_ok=True)
-    
-    # Get the bounding box of the region
-    geom = shape(region_geojson["geometry"])
-    gdf = gpd.GeoDataFrame(geometry=[geom], crs="EPSG:4326")
-    minx, miny, maxx, maxy = gdf.total_bounds
-    
-    # Create a simple 100x100 raster with 1 band (SOC)
-    width, height = 100, 100
-    
-    # Create a transform from the bounding box
-    transform = rasterio.transform.from_bounds(minx, miny, maxx, maxy, width, height)
-    
-    # Create sample data for SOC
-    # In a real implementation, this would be actual SoilGrids data
-    # SOC values typically range from 0 to 150 g/kg
-    soc_band = np.random.randint(0, 150, (height, width), dtype=np.uint8)
-    
-    # Create a GeoTIFF
-    output_path = "data/sample/soilgrids_soc_sample.tif"
-    
-    with rasterio.open(
-        output_path,
-        'w',
-        driver='GTiff',
-        height=height,
-        width=width,
-        count=1,
-        dtype=np.uint8,
-        crs='+proj=latlong',
-        transform=transform,
-    ) as dst:
-        dst.write(soc_band, 1)
-    
-    # Return the path to the sample data
-    return output_path
+    output_dir = output_dir or settings.INGEST_DATA_DIR
+    os.makedirs(output_dir, exist_ok=True)
+    layers = get_job_layers()
+    # Named by region and layers, so concurrent jobs never share the file
+    bounds = [round(value, 6) for value in shape(region_geojson["geometry"]).bounds]
+    key = zlib.crc32(repr((layers, bounds)).encode())
+    output_path = os.path.join(output_dir, f"soilgrids_{key:08x}.tif")
+    return write_soilgrids_window(region_geojson, output_path, layers=layers)
 
+@traced
 def download_weather_data(region_geojson, start_date, end_date):
     """
-    Download weather data for the given region and date range.
+    Download daily weather at the region's centroid for the given date range.
     
-    In a real implementation, this would connect to NASA POWER or NOAA CDO.
-    For the MVP, we simulate this by generating sample data.
+    Weather is stored per grid cell (see weather_service) and only days the
+    cell does not hold yet are fetched. The stored range starts
+    settings.WEATHER_ANTECEDENT_DAYS before ``start_date`` for the
+    antecedent precipitation index.
     
     Args:
         region_geojson: GeoJSON representation of the region of interest
@@ -218,36 +106,8 @@ def download_weather_data(region_geojson, start_date, end_date):
         end_date: End date for the search (ISO format string)
         
     Returns:
-        Path to downloaded weather data
+        Directory of the cell's Parquet dataset, for read_weather and
+        get_weather_features
     """
-    # Create a directory for sample data if it doesn't exist
-    os.makedirs("data/sample", exist_ok=True)
-    
-    # Convert dates from string to datetime objects
-    start_dt = datetime.fromisoformat(start_date)
-    end_dt = datetime.fromisoformat(end_date)
-    
-    # Calculate the number of days in the date range
-    days = (end_dt - start_dt).days + 1
-    
-    # Get the centroid of the region for point-based weather data
-    geom = shape(region_geojson["geometry"])
-    centroid = geom.centroid
-    
-    # Create sample weather data
-    # In a real implementation, this would be actual weather data from NASA POWER or NOAA CDO
-    dates = [start_dt + datetime.timedelta(days=i) for i in range(days)]
-    temperatures = np.random.uniform(15, 30, days)  # Temperature in Celsius
-    precipitation = np.random.uniform(0, 10, days)  # Precipitation in mm
-    solar_radiation = np.random.uniform(10, 25, days)  # Solar radiation in MJ/m²
-    
-    # Create a CSV file with the weather data
-    output_path = "data/sample/weather_sample.csv"
-    
-    with open(output_path, "w") as f:
-        f.write("date,temperature,precipitation,solar_radiation\n")
-        for i in range(days):
-            f.write(f"{dates[i].strftime('%Y-%m-%d')},{temperatures[i]:.2f},{precipitation[i]:.2f},{solar_radiation[i]:.2f}\n")
-    
-    # Return the path to the sample data
-    return output_path
+    centroid = shape(region_geojson["geometry"]).centroid
+    return update_weather_store(centroid.x, centroid.y, get_antecedent_start(start_date), end_date)
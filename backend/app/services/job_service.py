@@ -1,12 +1,19 @@
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List, Optional
-from app.models.job import Job, JobCreate, JobStatus
+from typing import Any, Dict, List, Optional, Tuple
+from app.db.pagination import finish_page, keyset_select
+from app.models.job import Job, JobBatchCreate, JobCreate, JobProfile, JobScene, JobStage, JobStatus, JOB_LIST_COLUMNS
 from app.models.region import Region, RegionCreate
-from datetime import datetime
+from app.core.config import settings
+from app.core.scratch import touch_paths
+from app.services.region_service import get_region_by_id
+from datetime import datetime, timedelta
 import json
-import geopandas as gpd
+import os
+import math
 from shapely.geometry import shape
-from geoalchemy2.shape import from_shape
+from geoalchemy2.shape import from_shape, to_shape
 
 def create_job(db: Session, job_data: JobCreate) -> Job:
     """
@@ -18,16 +25,33 @@ def create_job(db: Session, job_data: JobCreate) -> Job:
         
     Returns:
         Created job
+    
+    Raises:
+        ValueError: If the parent job or region does not exist, covers
+            another region or the parent starts after the job
     """
-    # First, create or get the region
-    region = create_region_from_geojson(db, job_data.region_geojson)
+    # First, create or get the region; incremental jobs stay on their parent's
+    # region and reruns on the region they name, so they add to its time series
+    if job_data.parent_job_id is not None:
+        region = get_parent_region(db, job_data.parent_job_id, job_data.region_geojson, job_data.start_date)
+        if job_data.region_id is not None and job_data.region_id != region.id:
+            raise ValueError(f"Job {job_data.parent_job_id} does not cover region {job_data.region_id}")
+    elif job_data.region_id is not None:
+        region = get_region_by_id(db, job_data.region_id)
+        if region is None:
+            raise ValueError(f"Region with ID {job_data.region_id} not found")
+        check_region_geometry(region, job_data.region_geojson)
+    else:
+        region = create_region_from_geojson(db, job_data.region_geojson)
     
     # Create the job
     db_job = Job(
         region_id=region.id,
         start_date=job_data.start_date,
         end_date=job_data.end_date,
-        status=JobStatus.PENDING
+        status=JobStatus.PENDING,
+        profile=job_data.profile,
+        parent_job_id=job_data.parent_job_id
     )
     
     db.add(db_job)
@@ -36,6 +60,194 @@ def create_job(db: Session, job_data: JobCreate) -> Job:
     
     return db_job
 
+def get_parent_region(db: Session, parent_job_id: int, region_geojson: Dict[str, Any], start_date: datetime) -> Region:
+    """
+    Get the region of the job an incremental job extends.
+    
+    Args:
+        db: Database session
+        parent_job_id: ID of the prior job
+        region_geojson: GeoJSON region of the new job
+        start_date: Start date of the new job
+    
+    Returns:
+        Region of the prior job
+    
+    Raises:
+        ValueError: If the prior job does not exist, covers another region
+            or starts after the new job
+    """
+    parent = get_job_by_id(db, parent_job_id)
+    if parent is None:
+        raise ValueError(f"Job with ID {parent_job_id} not found")
+    
+    # Cached scene products are only valid for the footprint they were cut to
+    if not to_shape(parent.region.geometry).equals(shape(region_geojson["geometry"])):
+        raise ValueError(f"Region does not match the region of job {parent_job_id}")
+    
+    # Incremental runs only ingest imagery after the prior job's end date
+    if start_date.date() < parent.start_date.date():
+        raise ValueError(f"Start date must not be before the start date of job {parent_job_id}")
+    
+    return parent.region
+
+def check_region_geometry(region: Region, region_geojson: Dict[str, Any]) -> None:
+    """
+    Check that a job's GeoJSON region is the geometry of an existing region.
+    
+    Args:
+        region: Existing region
+        region_geojson: GeoJSON region of the job
+    
+    Raises:
+        ValueError: If the geometries differ
+    """
+    if not to_shape(region.geometry).equals(shape(region_geojson["geometry"])):
+        raise ValueError(f"Region does not match the geometry of region {region.id}")
+
+def create_jobs_batch(db: Session, batch_data: JobBatchCreate) -> List[Job]:
+    """
+    Create one job per feature of a GeoJSON FeatureCollection in a single transaction.
+    
+    Regions and jobs are bulk-inserted and committed once instead of one
+    commit and refresh per field. A feature with a ``region_id`` property
+    reruns that existing region instead of creating a new one, so the job
+    adds to the region's time series.
+    
+    Args:
+        db: Database session
+        batch_data: Batch job data from request
+        
+    Returns:
+        Created jobs, in the same order as the input features
+    
+    Raises:
+        ValueError: If a region does not exist or does not match its feature
+    """
+    features = get_batch_features(batch_data.regions_geojson)
+    
+    # Load the named regions with one query
+    region_ids = [(feature.get("properties") or {}).get("region_id") for feature in features]
+    named_ids = {region_id for region_id in region_ids if region_id is not None}
+    existing = {region.id: region for region in db.query(Region).filter(Region.id.in_(named_ids)).all()} if named_ids else {}
+    
+    regions = []
+    new_regions = []
+    for feature, region_id in zip(features, region_ids):
+        if region_id is None:
+            region = build_region_from_geojson(feature)
+            new_regions.append(region)
+        elif region_id in existing:
+            region = existing[region_id]
+            check_region_geometry(region, feature)
+        else:
+            raise ValueError(f"Region with ID {region_id} not found")
+        regions.append(region)
+    
+    # Insert all new regions, then flush once to obtain their IDs
+    if new_regions:
+        db.add_all(new_regions)
+        db.flush()
+    
+    db_jobs = [
+        Job(
+            region_id=region.id,
+            start_date=batch_data.start_date,
+            end_date=batch_data.end_date,
+            status=JobStatus.PENDING,
+            profile=batch_data.profile
+        )
+        for region in regions
+    ]
+    db.add_all(db_jobs)
+    db.flush()
+    
+    job_ids = [job.id for job in db_jobs]
+    db.commit()
+    
+    # Reload all jobs with one query rather than one refresh per job
+    return get_jobs_by_ids(db, job_ids)
+
+def get_batch_features(regions_geojson: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Validate a batch submission and return its features.
+    
+    Args:
+        regions_geojson: GeoJSON FeatureCollection
+        
+    Returns:
+        List of GeoJSON features
+        
+    Raises:
+        ValueError: If the collection is malformed, empty or too large
+    """
+    if regions_geojson.get("type") != "FeatureCollection":
+        raise ValueError("Batch submissions must be a GeoJSON FeatureCollection")
+    
+    features = regions_geojson.get("features") or []
+    if not features:
+        raise ValueError("FeatureCollection contains no features")
+    if len(features) > settings.MAX_BATCH_FEATURES:
+        raise ValueError(f"Batch exceeds the maximum of {settings.MAX_BATCH_FEATURES} features")
+    
+    for i, feature in enumerate(features):
+        geometry = feature.get("geometry") or {}
+        if geometry.get("type") != "Polygon":
+            raise ValueError(f"Feature {i} must have a Polygon geometry")
+    
+    return features
+
+def group_features_by_scene(features: List[Dict[str, Any]], tile_size_deg: Optional[float] = None) -> List[List[int]]:
+    """
+    Group features whose footprints fall on the same satellite scenes.
+    
+    Scenes are approximated by a regular lon/lat grid of ``tile_size_deg``
+    cells. Features touching exactly the same set of cells share one ingest
+    and preprocessing run.
+    
+    Args:
+        features: List of GeoJSON features
+        tile_size_deg: Grid cell size in degrees (defaults to settings)
+        
+    Returns:
+        List of groups, each a list of feature indices
+    """
+    if tile_size_deg is None:
+        tile_size_deg = settings.SCENE_TILE_SIZE_DEG
+    
+    groups: Dict[frozenset, List[int]] = {}
+    for i, feature in enumerate(features):
+        minx, miny, maxx, maxy = shape(feature["geometry"]).bounds
+        cells = frozenset(
+            (x, y)
+            for x in range(math.floor(minx / tile_size_deg), math.floor(maxx / tile_size_deg) + 1)
+            for y in range(math.floor(miny / tile_size_deg), math.floor(maxy / tile_size_deg) + 1)
+        )
+        groups.setdefault(cells, []).append(i)
+    
+    return list(groups.values())
+
+def estimate_job_scratch_bytes(region_geojson: Dict[str, Any]) -> int:
+    """
+    Estimate the scratch space a job's intermediate files need.
+    
+    Intermediates scale with the pixels of the region's bounding box, so
+    the estimate is its area in km² times settings.SCRATCH_MB_PER_KM2, but
+    at least settings.SCRATCH_MIN_JOB_MB.
+    
+    Args:
+        region_geojson: GeoJSON feature of the job's region
+    
+    Returns:
+        Bytes to reserve
+    """
+    minx, miny, maxx, maxy = shape(region_geojson["geometry"]).bounds
+    # Degrees to km, with longitude shrinking towards the poles
+    km_per_deg = 111.32
+    area_km2 = (maxx - minx) * km_per_deg * math.cos(math.radians((miny + maxy) / 2)) * (maxy - miny) * km_per_deg
+    
+    return int(max(area_km2 * settings.SCRATCH_MB_PER_KM2, settings.SCRATCH_MIN_JOB_MB) * 2**20)
+
 def get_job_by_id(db: Session, job_id: int) -> Optional[Job]:
     """
     Get a job by ID.
@@ -49,6 +261,33 @@ def get_job_by_id(db: Session, job_id: int) -> Optional[Job]:
     """
     return db.query(Job).filter(Job.id == job_id).first()
 
+async def get_job_by_id_async(db: AsyncSession, job_id: int) -> Optional[Job]:
+    """
+    Get a job by ID without blocking the event loop.
+    
+    Args:
+        db: Async database session
+        job_id: Job ID
+        
+    Returns:
+        Job if found, None otherwise
+    """
+    result = await db.execute(select(Job).where(Job.id == job_id))
+    return result.scalar_one_or_none()
+
+def get_jobs_by_ids(db: Session, job_ids: List[int]) -> List[Job]:
+    """
+    Get several jobs by ID with a single query.
+    
+    Args:
+        db: Database session
+        job_ids: Job IDs
+        
+    Returns:
+        List of jobs ordered by ID
+    """
+    return db.query(Job).filter(Job.id.in_(job_ids)).order_by(Job.id).all()
+
 def get_jobs(db: Session, skip: int = 0, limit: int = 100, status: Optional[str] = None) -> List[Job]:
     """
     Get a list of jobs with optional filtering by status.
@@ -69,10 +308,40 @@ def get_jobs(db: Session, skip: int = 0, limit: int = 100, status: Optional[str]
     
     return query.order_by(Job.created_at.desc()).offset(skip).limit(limit).all()
 
-def update_job_status(db: Session, job_id: int, status: str, task_id: Optional[str] = None, error_message: Optional[str] = None) -> Job:
+async def get_jobs_page_async(db: AsyncSession, limit: int = 100, status: Optional[str] = None, cursor: Optional[str] = None, skip: int = 0) -> Tuple[List[Any], Optional[str]]:
+    """
+    Get a page of jobs for list views without blocking the event loop.
+    
+    Args:
+        db: Async database session
+        limit: Maximum number of records to return
+        status: Optional status filter
+        cursor: Cursor returned with the previous page (optional)
+        skip: Number of records to skip, for clients that still page by offset
+        
+    Returns:
+        Tuple of (job rows, next page cursor or None)
+    """
+    statement = select(*JOB_LIST_COLUMNS)
+    
+    if status:
+        statement = statement.where(Job.status == status)
+    
+    statement = keyset_select(statement, Job.created_at, Job.id, limit, cursor)
+    if skip:
+        statement = statement.offset(skip)
+    
+    result = await db.execute(statement)
+    return finish_page(result.all(), limit)
+
+def update_job_status(db: Session, job_id: int, status: str, task_id: Optional[str] = None, error_message: Optional[str] = None) -> Optional[Job]:
     """
     Update the status of a job.
     
+    Issues a single UPDATE ... RETURNING statement instead of a SELECT,
+    UPDATE and refresh. The returned row overwrites a copy of the job
+    already loaded in the session, so callers see the new values.
+    
     Args:
         db: Database session
         job_id: Job ID
@@ -81,25 +350,217 @@ def update_job_status(db: Session, job_id: int, status: str, task_id: Optional[s
         error_message: Optional error message
         
     Returns:
-        Updated job
+        Updated job, or None if it does not exist
     """
-    job = get_job_by_id(db, job_id)
+    values = {"status": status, "updated_at": datetime.utcnow()}
     
-    if job:
-        job.status = status
-        job.updated_at = datetime.utcnow()
+    if task_id:
+        values["task_id"] = task_id
         
-        if task_id:
-            job.task_id = task_id
-            
-        if error_message:
-            job.error_message = error_message
-        
-        db.commit()
-        db.refresh(job)
+    if error_message:
+        values["error_message"] = error_message
+    
+    job = db.execute(
+        update(Job).where(Job.id == job_id).values(**values).returning(Job),
+        # Sessions don't expire on commit, so refresh the loaded job from the returned row
+        execution_options={"populate_existing": True}
+    ).scalar_one_or_none()
+    db.commit()
     
     return job
 
+def update_jobs_status(db: Session, job_ids: List[int], status: str, task_ids: Optional[Dict[int, str]] = None, error_message: Optional[str] = None) -> List[Job]:
+    """
+    Update the status of several jobs with bulk UPDATE statements.
+    
+    Args:
+        db: Database session
+        job_ids: Job IDs
+        status: New status
+        task_ids: Optional mapping of job ID to Celery task ID
+        error_message: Optional error message
+        
+    Returns:
+        Updated jobs
+    """
+    now = datetime.utcnow()
+    
+    if task_ids:
+        # Bulk UPDATE by primary key, one parameter set per job
+        db.execute(
+            update(Job),
+            [
+                {"id": job_id, "status": status, "task_id": task_ids[job_id], "updated_at": now}
+                for job_id in job_ids
+            ]
+        )
+    else:
+        values = {"status": status, "updated_at": now}
+        if error_message:
+            values["error_message"] = error_message
+        db.query(Job).filter(Job.id.in_(job_ids)).update(values)
+    
+    db.commit()
+    
+    return get_jobs_by_ids(db, job_ids)
+
+def save_job_stages(db: Session, job_id: int, stages: List[Dict[str, Any]], task_id: Optional[str] = None) -> None:
+    """
+    Persist the stages recorded for one task of a job.
+    
+    Args:
+        db: Database session
+        job_id: Job ID
+        stages: Stage dictionaries, as returned by Span.to_dict()
+        task_id: Optional Celery task ID
+    """
+    db.add_all([JobStage(job_id=job_id, task_id=task_id, **stage) for stage in stages])
+    db.commit()
+
+async def get_job_stages_async(db: AsyncSession, job_id: int) -> List[JobStage]:
+    """
+    Get the recorded stages of a job without blocking the event loop.
+    
+    Args:
+        db: Async database session
+        job_id: Job ID
+    
+    Returns:
+        List of stages in the order they finished
+    """
+    result = await db.execute(select(JobStage).where(JobStage.job_id == job_id).order_by(JobStage.id))
+    return result.scalars().all()
+
+def save_job_profiles(db: Session, job_id: int, task_name: str, object_names: Dict[str, str], task_id: Optional[str] = None) -> None:
+    """
+    Link the uploaded profiler output of one task to its job.
+    
+    Args:
+        db: Database session
+        job_id: Job ID
+        task_name: Name of the profiled task
+        object_names: Mapping of profile kind to object name in the profiles bucket
+        task_id: Optional Celery task ID
+    """
+    db.add_all([
+        JobProfile(job_id=job_id, task_id=task_id, task_name=task_name, kind=kind, object_name=object_name)
+        for kind, object_name in object_names.items()
+    ])
+    db.commit()
+
+async def get_job_profiles_async(db: AsyncSession, job_id: int) -> List[JobProfile]:
+    """
+    Get the profiler output recorded for a job without blocking the event loop.
+    
+    Args:
+        db: Async database session
+        job_id: Job ID
+    
+    Returns:
+        List of profiles in the order they were stored
+    """
+    result = await db.execute(select(JobProfile).where(JobProfile.job_id == job_id).order_by(JobProfile.id))
+    return result.scalars().all()
+
+def save_job_scenes(db: Session, job_id: int, scenes: List[Dict[str, Any]]) -> None:
+    """
+    Record the scenes a job used and their cloud-masked products.
+    
+    Args:
+        db: Database session
+        job_id: Job ID
+        scenes: Scene dictionaries with sensor, acquired_at (ISO format
+            string), scene_path and masked_path
+    """
+    db.add_all([
+        JobScene(
+            job_id=job_id,
+            sensor=scene["sensor"],
+            acquired_at=datetime.fromisoformat(scene["acquired_at"]),
+            scene_path=scene["scene_path"],
+            masked_path=scene["masked_path"]
+        )
+        for scene in scenes
+    ])
+    db.commit()
+
+def get_job_scenes(db: Session, job_id: int) -> List[JobScene]:
+    """
+    Get the scenes recorded for a job.
+    
+    Args:
+        db: Database session
+        job_id: Job ID
+    
+    Returns:
+        List of scenes ordered by acquisition date
+    """
+    return db.query(JobScene).filter(JobScene.job_id == job_id).order_by(JobScene.acquired_at, JobScene.id).all()
+
+def plan_incremental_run(db: Session, parent_job_id: int, start_date: str, end_date: str) -> Optional[Dict[str, Any]]:
+    """
+    Work out which products of a prior job an incremental job can reuse.
+    
+    Scenes of the prior job acquired within the new date range are reused
+    as long as their cloud-masked products are still on disk; only imagery
+    acquired after the prior job's end date has to be ingested.
+    
+    Args:
+        db: Database session
+        parent_job_id: ID of the prior job
+        start_date: Start date of the new job (ISO format string)
+        end_date: End date of the new job (ISO format string)
+    
+    Returns:
+        None if nothing can be reused, otherwise a dictionary with:
+        - "scenes": reusable scene dictionaries, as taken by save_job_scenes
+        - "imagery_start_date": start of the imagery search (ISO format string)
+        - "new_imagery": whether the date range extends past the prior job
+        - "same_range": whether the date range equals the prior job's; only
+          then do its predictions hold, since the moisture model's weather
+          features are computed over the job's own range
+        - "previous_job_id": the prior job if its composites cover exactly
+          the reused scenes and can be updated in place, otherwise None
+        - "result": the prior job's result, if it has one
+    """
+    parent = get_job_by_id(db, parent_job_id)
+    if parent is None or parent.status != JobStatus.COMPLETED:
+        return None
+    
+    parent_scenes = get_job_scenes(db, parent_job_id)
+    if not parent_scenes or not all(os.path.exists(scene.masked_path) for scene in parent_scenes):
+        return None
+    
+    # Compare calendar days; stored dates may be timezone-aware
+    start = datetime.fromisoformat(start_date).date()
+    end = datetime.fromisoformat(end_date).date()
+    scenes = [scene for scene in parent_scenes if start <= scene.acquired_at.date() <= end]
+    # Only imagery after the prior job is ingested, so a range starting
+    # before the prior job has to run in full
+    if not scenes or start < parent.start_date.date():
+        return None
+    
+    imagery_start = max(start, parent.end_date.date() + timedelta(days=1))
+    # Keep the reused scenes out of the shared directory's eviction
+    touch_paths(scene.masked_path for scene in scenes)
+    
+    return {
+        "scenes": [
+            {
+                "sensor": scene.sensor,
+                "acquired_at": scene.acquired_at.isoformat(),
+                "scene_path": scene.scene_path,
+                "masked_path": scene.masked_path
+            }
+            for scene in scenes
+        ],
+        "imagery_start_date": imagery_start.isoformat(),
+        "new_imagery": imagery_start <= end,
+        "same_range": start == parent.start_date.date() and end == parent.end_date.date(),
+        "previous_job_id": parent_job_id if len(scenes) == len(parent_scenes) else None,
+        "result": parent.result
+    }
+
 def create_region_from_geojson(db: Session, geojson: dict) -> Region:
     """
     Create a region from GeoJSON.
@@ -111,8 +572,26 @@ def create_region_from_geojson(db: Session, geojson: dict) -> Region:
     Returns:
         Created region
     """
+    db_region = build_region_from_geojson(geojson)
+    
+    db.add(db_region)
+    db.commit()
+    db.refresh(db_region)
+    
+    return db_region
+
+def build_region_from_geojson(geojson: dict) -> Region:
+    """
+    Build an unsaved region from GeoJSON.
+    
+    Args:
+        geojson: GeoJSON representation of the region
+        
+    Returns:
+        Region instance, not yet added to a session
+    """
     # Extract properties if available
-    properties = geojson.get("properties", {})
+    properties = geojson.get("properties") or {}
     name = properties.get("name", "Unnamed Region")
     description = properties.get("description", None)
     
@@ -124,14 +603,8 @@ def create_region_from_geojson(db: Session, geojson: dict) -> Region:
     # spatial queries to check for similar geometries
     
     # Create the region
-    db_region = Region(
+    return Region(
         name=name,
         description=description,
         geometry=from_shape(geom, srid=4326)
     )
-    
-    db.add(db_region)
-    db.commit()
-    db.refresh(db_region)
-    
-    return db_region
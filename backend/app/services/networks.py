@@ -0,0 +1,19 @@
+import torch
+
+class SoilCNN(torch.nn.Module):
+    """
+    A simple CNN model for soil property prediction.
+    
+    This is a lightweight CNN that takes a stack of spectral bands and indices
+    as input and outputs predicted soil organic carbon (SOC).
+    """
+    def __init__(self, in_channels=7):
+        super().__init__()
+        self.conv1 = torch.nn.Conv2d(in_channels=in_channels, out_channels=16, kernel_size=3, padding=1)
+        self.relu = torch.nn.ReLU()
+        self.conv2 = torch.nn.Conv2d(in_channels=16, out_channels=1, kernel_size=3, padding=1)
+        
+    def forward(self, x):
+        x = self.relu(self.conv1(x))
+        x = self.conv2(x)
+        return x
@@ -1,52 +1,410 @@
+import copy
+import json
 import os
-import torch
+import warnings
+from datetime import datetime
+from functools import lru_cache
 import numpy as np
 import rasterio
-from datetime import datetime
 from app.core.config import settings
+from app.core.lazy import lazy_import
+from app.core.tracing import traced
+from app.services.weather_service import WEATHER_FEATURES
+
+# torch is only imported once a model is built or run, so processes that
+# never predict (the API, I/O-only workers) don't pay for it
+torch = lazy_import("torch")
+quantization = lazy_import("torch.ao.quantization")
+quantize_fx = lazy_import("torch.ao.quantization.quantize_fx")
+
+# Inference variants a model can be prepared as (see optimize_model)
+MODEL_VARIANTS = ("eager", "frozen", "int8_dynamic", "int8_static")
+
+# Input channels of the feature stack: 4 bands + 3 indices
+FEATURE_CHANNELS = ("red", "green", "blue", "nir", "ndvi", "evi", "ndmi")
+MODEL_IN_CHANNELS = len(FEATURE_CHANNELS)
+
+# The moisture model also sees the job's weather features, each broadcast
+# to a constant channel after the feature stack
+MOISTURE_FEATURE_CHANNELS = FEATURE_CHANNELS + WEATHER_FEATURES
+
+# Input channels of each model type
+MODEL_CHANNELS = {
+    "soc": FEATURE_CHANNELS,
+    "moisture": MOISTURE_FEATURE_CHANNELS
+}
+
+# Normalization used when a model has no stored statistics: reflectance
+# bands are scaled from 0-10000 to 0-1, indices are already in [-1, 1] and
+# weather features are scaled by typical seasonal magnitudes
+DEFAULT_NORMALIZATION = {
+    "channels": list(MOISTURE_FEATURE_CHANNELS),
+    "mean": [0.0] * 10,
+    "std": [10000.0] * 4 + [1.0] * 3 + [1000.0, 500.0, 50.0]
+}
+
+# Pixels of context each output pixel depends on (two 3x3 convolutions)
+MODEL_HALO = 2
 
-class SoilCNN(torch.nn.Module):
+# Percentiles reported with every prediction map
+SUMMARY_PERCENTILES = (10, 25, 50, 75, 90)
+
+def calibration_inputs(in_channels=MODEL_IN_CHANNELS, batches=4, tile_size=64, seed=0):
     """
-    A simple CNN model for soil property prediction.
+    Get deterministic inputs for INT8 calibration and the accuracy check.
+    
+    Args:
+        in_channels: Number of input channels
+        batches: Number of batches
+        tile_size: Height and width of each tile
+        seed: Random seed
     
-    This is a lightweight CNN that takes a stack of spectral bands and indices
-    as input and outputs predicted soil organic carbon (SOC).
+    Returns:
+        List of (1, in_channels, tile_size, tile_size) float32 tensors in the
+        normalized input range
     """
-    def __init__(self, in_channels=7):
-        super().__init__()
-        self.conv1 = torch.nn.Conv2d(in_channels=in_channels, out_channels=16, kernel_size=3, padding=1)
-        self.relu = torch.nn.ReLU()
-        self.conv2 = torch.nn.Conv2d(in_channels=16, out_channels=1, kernel_size=3, padding=1)
-        
-    def forward(self, x):
-        x = self.relu(self.conv1(x))
-        x = self.conv2(x)
-        return x
+    generator = torch.Generator().manual_seed(seed)
+    return [torch.rand(1, in_channels, tile_size, tile_size, generator=generator) for _ in range(batches)]
 
-def load_model(model_path, model_type="soc"):
+def check_accuracy(reference, candidate, inputs, channels_last=False):
     """
-    Load a pre-trained model for soil property prediction.
+    Compare an optimized model against the float model it was built from.
+    
+    Args:
+        reference: Float model
+        candidate: Optimized model
+        inputs: List of input tensors
+        channels_last: Feed the candidate channels-last inputs
+    
+    Returns:
+        Dictionary with the max and mean absolute output difference
+    """
+    max_error, total_error, count = 0.0, 0.0, 0
+    with torch.no_grad():
+        for x in inputs:
+            expected = reference(x)
+            if channels_last:
+                x = x.contiguous(memory_format=torch.channels_last)
+            error = (candidate(x) - expected).abs()
+            max_error = max(max_error, float(error.max()))
+            total_error += float(error.sum())
+            count += error.numel()
+    
+    return {"max_abs_error": max_error, "mean_abs_error": total_error / count}
+
+def optimize_model(model, variant, channels_last=False, inputs=None):
+    """
+    Prepare a float model for CPU inference.
+    
+    Variants:
+        eager: the float model in eval mode
+        frozen: TorchScript trace, frozen and optimized for inference
+        int8_dynamic: dynamic INT8 quantization of Linear layers, then frozen
+            (convolutions stay float, so it only helps models with Linear
+            layers)
+        int8_static: static INT8 quantization of all layers calibrated on
+            ``inputs``, then frozen
+    
+    Args:
+        model: Float model
+        variant: One of MODEL_VARIANTS
+        channels_last: Use the channels-last memory format; inputs must then
+            be converted with ``to_model_input``
+        inputs: Calibration/example inputs (optional, defaults to
+            ``calibration_inputs()``)
+    
+    Returns:
+        Optimized model
+    """
+    if variant not in MODEL_VARIANTS:
+        raise ValueError(f"Unknown model variant: {variant}")
+    
+    model = copy.deepcopy(model).eval()
+    if inputs is None:
+        inputs = calibration_inputs()
+    
+    if variant == "int8_dynamic":
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    elif variant == "int8_static":
+        qconfig_mapping = quantization.get_default_qconfig_mapping(torch.backends.quantized.engine)
+        model = quantize_fx.prepare_fx(model, qconfig_mapping, example_inputs=(inputs[0],))
+        with torch.no_grad():
+            for x in inputs:
+                model(x)
+        model = quantize_fx.convert_fx(model)
+    
+    if channels_last:
+        model = model.to(memory_format=torch.channels_last)
+    
+    if variant == "eager":
+        return model
+    
+    example = to_model_input(inputs[0], channels_last)
+    with torch.no_grad(), warnings.catch_warnings():
+        # TorchScript is deprecated in favour of torch.compile, which needs a compiler toolchain in the image
+        warnings.simplefilter("ignore", FutureWarning)
+        scripted = torch.jit.trace(model, example)
+        scripted = torch.jit.optimize_for_inference(torch.jit.freeze(scripted))
+        # The first calls run the profiling executor's optimization passes
+        for _ in range(2):
+            scripted(example)
+    
+    return scripted
+
+def to_model_input(tensor, channels_last=False):
+    """
+    Convert an NCHW input tensor to the memory format the model expects.
+    """
+    if channels_last:
+        return tensor.contiguous(memory_format=torch.channels_last)
+    return tensor
+
+def get_normalization_path(model_path):
+    """
+    Get the path of the normalization statistics stored with a model file.
+    """
+    return os.path.splitext(model_path)[0] + ".normalization.json"
+
+def save_normalization(model_path, mean, std, channels=FEATURE_CHANNELS):
+    """
+    Store per-channel normalization statistics next to a model file.
     
     Args:
         model_path: Path to the model file
-        model_type: Type of model ("soc" or "moisture")
-        
+        mean: Per-channel mean of the training inputs
+        std: Per-channel standard deviation of the training inputs
+        channels: Channel names, in feature stack order
+    
     Returns:
-        Loaded model
+        Path to the statistics file
+    """
+    if not (len(channels) == len(mean) == len(std)):
+        raise ValueError("mean and std must have one value per channel")
+    
+    path = get_normalization_path(model_path)
+    with open(path, "w") as f:
+        json.dump({"channels": list(channels), "mean": [float(m) for m in mean], "std": [float(s) for s in std]}, f, indent=2)
+    
+    return path
+
+@lru_cache(maxsize=None)
+def load_normalization(model_path, channels=FEATURE_CHANNELS):
+    """
+    Load the normalization of a model as a per-channel scale and shift.
+    
+    ``(x - mean) / std`` is precomputed as ``x * scale + shift`` so it can be
+    applied in a single pass (see normalize_features). Channels missing from
+    the stored statistics, such as the weather channels of files written
+    for the feature stack alone, use DEFAULT_NORMALIZATION.
+    
+    Args:
+        model_path: Path to the model file
+        channels: Input channels of the model (see MODEL_CHANNELS)
+    
+    Returns:
+        Tuple of (scale, shift) float32 tensors of shape (channels, 1, 1)
+    """
+    path = get_normalization_path(model_path)
+    stored = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            stats = json.load(f)
+        stored = dict(zip(stats["channels"], zip(stats["mean"], stats["std"])))
+    defaults = dict(zip(DEFAULT_NORMALIZATION["channels"], zip(DEFAULT_NORMALIZATION["mean"], DEFAULT_NORMALIZATION["std"])))
+    
+    missing = [channel for channel in channels if channel not in stored and channel not in defaults]
+    if missing:
+        raise ValueError(f"Normalization in {path} has no statistics for channels {missing}")
+    
+    mean, std = (np.asarray(values, dtype=np.float64) for values in zip(*(stored.get(channel, defaults.get(channel)) for channel in channels)))
+    scale = torch.from_numpy((1.0 / std).astype(np.float32)).view(-1, 1, 1)
+    shift = torch.from_numpy((-mean / std).astype(np.float32)).view(-1, 1, 1)
+    
+    return scale, shift
+
+def normalize_features(features, model_path, channels=FEATURE_CHANNELS):
+    """
+    Normalize a feature stack in place with a model's statistics.
+    
+    The scale and shift run as one fused multiply-add over the buffer, with
+    no temporary arrays.
+    
+    Args:
+        features: (channels, height, width) float32 array, modified in place
+        model_path: Path to the model file
+        channels: Input channels of the model (see MODEL_CHANNELS)
+    
+    Returns:
+        The same array
+    """
+    scale, shift = load_normalization(model_path, tuple(channels))
+    if features.shape[0] != scale.shape[0]:
+        raise ValueError(f"Feature stack has {features.shape[0]} channels, expected {scale.shape[0]}")
+    
+    tensor = torch.from_numpy(features)
+    torch.addcmul(shift, tensor, scale, out=tensor)
+    
+    return features
+
+def compute_normalization(feature_stack_paths):
     """
+    Compute per-channel mean and standard deviation over training feature stacks.
+    
+    Stacks are read block by block, so any number of them can be used.
+    Nodata pixels (0 in every channel) are skipped.
+    
+    Args:
+        feature_stack_paths: List of paths to feature stacks
+    
+    Returns:
+        Tuple of (mean, std) lists, one value per channel
+    """
+    count = 0
+    total = np.zeros(MODEL_IN_CHANNELS)
+    total_sq = np.zeros(MODEL_IN_CHANNELS)
+    
+    for path in feature_stack_paths:
+        with rasterio.open(path) as src:
+            for _, window in src.block_windows(1):
+                block = src.read(window=window, out_dtype=np.float64).reshape(src.count, -1)
+                block = block[:, (block != 0).any(axis=0)]
+                count += block.shape[1]
+                total += block.sum(axis=1)
+                total_sq += np.square(block).sum(axis=1)
+    
+    if count == 0:
+        raise ValueError("No valid pixels in the feature stacks")
+    
+    mean = total / count
+    std = np.sqrt(np.maximum(total_sq / count - np.square(mean), 0))
+    # Constant channels would otherwise divide by zero
+    std[std == 0] = 1.0
+    
+    return mean.tolist(), std.tolist()
+
+@lru_cache(maxsize=None)
+def _prepare_model(model_path, model_type, variant, channels_last):
+    from app.services.networks import SoilCNN
+    
     # In a real implementation, we would load the model from the provided path
     # For the MVP, we create a new model with random weights
     
+    in_channels = len(MODEL_CHANNELS[model_type])
     if model_type == "soc":
-        model = SoilCNN(in_channels=7)  # 4 bands + 3 indices
+        model = SoilCNN(in_channels=in_channels)
     else:  # moisture
-        model = SoilCNN(in_channels=7)  # 4 bands + 3 indices
+        model = SoilCNN(in_channels=in_channels)
     
     # In a real implementation, we would load the weights from the model file
     # model = torch.jit.load(model_path)
     
-    return model
+    model.eval()
+    if variant == "eager" and not channels_last:
+        return model
+    
+    inputs = calibration_inputs(in_channels=in_channels)
+    optimized = optimize_model(model, variant, channels_last=channels_last, inputs=inputs)
+    
+    # Fall back to the float model if the optimized one drifts too far
+    delta = check_accuracy(model, optimized, calibration_inputs(in_channels=in_channels, seed=1), channels_last=channels_last)
+    if delta["max_abs_error"] > settings.MODEL_MAX_ACCURACY_DELTA:
+        warnings.warn(
+            f"{model_type} model variant {variant} exceeds the accuracy delta "
+            f"({delta['max_abs_error']:.4f} > {settings.MODEL_MAX_ACCURACY_DELTA}); using the float model"
+        )
+        return model
+    
+    return optimized
+
+def get_model_variant(model_type):
+    """
+    Get the configured inference variant for a model type.
+    """
+    if model_type == "soc":
+        return settings.SOC_MODEL_VARIANT
+    return settings.MOISTURE_MODEL_VARIANT
+
+@traced
+def load_model(model_path, model_type="soc", variant=None):
+    """
+    Load a pre-trained model for soil property prediction.
+    
+    Models are prepared once per process and variant, so tracing and
+    calibration are not repeated for every prediction.
+    
+    Args:
+        model_path: Path to the model file
+        model_type: Type of model ("soc" or "moisture")
+        variant: Inference variant (optional, defaults to the model type's
+            setting; see optimize_model)
+        
+    Returns:
+        Loaded model
+    """
+    if variant is None:
+        variant = get_model_variant(model_type)
+    if variant not in MODEL_VARIANTS:
+        raise ValueError(f"Unknown model variant: {variant}")
+    
+    return _prepare_model(model_path, model_type, variant, settings.MODEL_CHANNELS_LAST)
+
+@traced
+def run_model(features, model_type, model_path):
+    """
+    Run a model over a normalized feature array.
+    
+    With ``settings.INFERENCE_MODE`` "local" the whole array goes through
+    the model in one forward pass. "batched" and "sidecar" split it into
+    tiles that are batched with tiles of other concurrent predictions
+    (see inference_service).
+    
+    Args:
+        features: Normalized (channels, height, width) float32 array
+        model_type: Type of model ("soc" or "moisture")
+        model_path: Path to the model file
+    
+    Returns:
+        (height, width) array of raw model output
+    """
+    if settings.INFERENCE_MODE == "local":
+        model = load_model(model_path, model_type=model_type)
+        
+        # Add batch dimension and convert to PyTorch tensor without copying
+        feature_tensor = to_model_input(torch.from_numpy(features).unsqueeze(0), settings.MODEL_CHANNELS_LAST)
+        
+        with torch.no_grad():
+            prediction = model(feature_tensor)
+        
+        # Remove batch and channel dimensions
+        return prediction.numpy()[0, 0]
+    
+    from app.services.inference_service import predict_tiled
+    return predict_tiled(features, model_type, model_path)
+
+def summarize_prediction(values, percentiles=SUMMARY_PERCENTILES):
+    """
+    Summary statistics of a prediction map, as stored in the region time series.
+    
+    Args:
+        values: Prediction array
+        percentiles: Percentiles to report
+    
+    Returns:
+        Dictionary with count, min, max, mean, std and a "percentiles"
+        dictionary keyed "p10", "p25", ...
+    """
+    values = np.asarray(values, dtype=np.float64).ravel()
+    pct_values = np.percentile(values, percentiles)
+    return {
+        "count": int(values.size),
+        "min": float(values.min()),
+        "max": float(values.max()),
+        "mean": float(values.mean()),
+        "std": float(values.std()),
+        "percentiles": {f"p{p:g}": float(v) for p, v in zip(percentiles, pct_values)}
+    }
 
+@traced
 def predict_soc(feature_stack_path, model_path=None):
     """
     Predict soil organic carbon (SOC) from a feature stack.
@@ -60,31 +418,19 @@ def predict_soc(feature_stack_path, model_path=None):
     """
     # Load the feature stack
     with rasterio.open(feature_stack_path) as src:
-        feature_stack = src.read()
+        # Read straight into the float32 buffer the model consumes
+        feature_stack = src.read(out_dtype=np.float32)
         profile = src.profile
     
-    # Load the model
+    # Get the model path
     if model_path is None:
         model_path = settings.SOC_MODEL_PATH
     
-    model = load_model(model_path, model_type="soc")
-    
-    # Convert the feature stack to a PyTorch tensor
-    # Normalize the data (in a real implementation, we would use the same normalization as during training)
-    feature_stack = feature_stack.astype(np.float32) / 10000.0  # Simple normalization
-    
-    # Add batch dimension
-    feature_stack = np.expand_dims(feature_stack, axis=0)
-    
-    # Convert to PyTorch tensor
-    feature_tensor = torch.from_numpy(feature_stack)
+    # Normalize in place with the statistics stored with the model
+    normalize_features(feature_stack, model_path)
     
     # Make prediction
-    with torch.no_grad():
-        prediction = model(feature_tensor)
-    
-    # Convert prediction to numpy array
-    soc_map = prediction.numpy()[0, 0]  # Remove batch and channel dimensions
+    soc_map = run_model(feature_stack, "soc", model_path)
     
     # Scale the prediction to realistic SOC values (g/kg)
     # In a real implementation, this would be based on the model's training
@@ -103,53 +449,49 @@ def predict_soc(feature_stack_path, model_path=None):
         dst.write(soc_map.astype(np.float32), 1)
     
     # Calculate statistics
-    soc_stats = {
-        "min": float(np.min(soc_map)),
-        "max": float(np.max(soc_map)),
-        "mean": float(np.mean(soc_map)),
-        "std": float(np.std(soc_map))
-    }
+    soc_stats = summarize_prediction(soc_map)
     
     return output_path, soc_stats
 
-def predict_moisture(feature_stack_path, model_path=None):
+@traced
+def predict_moisture(feature_stack_path, model_path=None, weather_features=None):
     """
-    Predict soil moisture from a feature stack.
+    Predict soil moisture from a feature stack and the job's weather.
     
     Args:
         feature_stack_path: Path to the feature stack
         model_path: Path to the pre-trained model (optional)
+        weather_features: Dictionary with WEATHER_FEATURES as returned by
+            get_weather_features (optional); without it the weather channels
+            are set to the model's training mean
         
     Returns:
         Path to the predicted moisture map
     """
     # Load the feature stack
     with rasterio.open(feature_stack_path) as src:
-        feature_stack = src.read()
+        # Read straight into the float32 buffer the model consumes, leaving
+        # room for the weather channels
+        feature_stack = np.empty((len(MOISTURE_FEATURE_CHANNELS), src.height, src.width), dtype=np.float32)
+        src.read(out=feature_stack[:src.count])
         profile = src.profile
     
-    # Load the model
+    # Broadcast each weather feature to a constant channel
+    for i, name in enumerate(WEATHER_FEATURES, start=MODEL_IN_CHANNELS):
+        feature_stack[i] = weather_features[name] if weather_features else 0.0
+    
+    # Get the model path
     if model_path is None:
         model_path = settings.MOISTURE_MODEL_PATH
     
-    model = load_model(model_path, model_type="moisture")
-    
-    # Convert the feature stack to a PyTorch tensor
-    # Normalize the data (in a real implementation, we would use the same normalization as during training)
-    feature_stack = feature_stack.astype(np.float32) / 10000.0  # Simple normalization
-    
-    # Add batch dimension
-    feature_stack = np.expand_dims(feature_stack, axis=0)
-    
-    # Convert to PyTorch tensor
-    feature_tensor = torch.from_numpy(feature_stack)
+    # Normalize in place with the statistics stored with the model
+    normalize_features(feature_stack, model_path, MOISTURE_FEATURE_CHANNELS)
+    if not weather_features:
+        # 0 after normalization is the training mean
+        feature_stack[MODEL_IN_CHANNELS:] = 0.0
     
     # Make prediction
-    with torch.no_grad():
-        prediction = model(feature_tensor)
-    
-    # Convert prediction to numpy array
-    moisture_map = prediction.numpy()[0, 0]  # Remove batch and channel dimensions
+    moisture_map = run_model(feature_stack, "moisture", model_path)
     
     # Scale the prediction to realistic moisture values (%)
     # In a real implementation, this would be based on the model's training
@@ -168,11 +510,13 @@ def predict_moisture(feature_stack_path, model_path=None):
         dst.write(moisture_map.astype(np.float32), 1)
     
     # Calculate statistics
-    moisture_stats = {
-        "min": float(np.min(moisture_map)),
-        "max": float(np.max(moisture_map)),
-        "mean": float(np.mean(moisture_map)),
-        "std": float(np.std(moisture_map))
-    }
+    moisture_stats = summarize_prediction(moisture_map)
     
     return output_path, moisture_stats
+
+def __getattr__(name):
+    # The network classes live with their torch import in app.services.networks
+    if name == "SoilCNN":
+        from app.services.networks import SoilCNN
+        return SoilCNN
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
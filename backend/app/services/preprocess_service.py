@@ -1,11 +1,93 @@
 import os
+import threading
+import warnings
+from collections import OrderedDict, namedtuple
 import numpy as np
 import rasterio
-from rasterio.mask import mask
+from affine import Affine
+from rasterio.crs import CRS
+from rasterio.errors import WindowError
+from rasterio.features import geometry_mask
+from rasterio.transform import array_bounds
+from rasterio.warp import Resampling, calculate_default_transform, reproject, transform_bounds, transform_geom
+from rasterio.warp import transform as transform_coords
+from rasterio.windows import Window, from_bounds
+from rasterio.windows import transform as window_transform
 from shapely.geometry import shape
-import cv2
 from app.core.config import settings
+from app.core.tracing import traced
 
+# Reflectance bands of the Landsat sample data (band 7 is the QA band)
+LANDSAT_REFLECTANCE_BANDS = [1, 2, 3, 4, 5, 6]
+
+# Landsat bands in the Sentinel-2 sample band order (Red, Green, Blue, NIR)
+LANDSAT_TO_SENTINEL_BANDS = [3, 2, 1, 4]
+
+# HLS bandpass adjustment from Landsat OLI to Sentinel-2 MSI as
+# (slope, offset in reflectance units), in the Sentinel-2 band order above
+LANDSAT_TO_SENTINEL_BANDPASS = [(0.9765, 0.0009), (1.0053, -0.0009), (0.9778, -0.004), (0.9983, -0.0001)]
+
+# Scale of the integer surface reflectance values
+REFLECTANCE_SCALE = 10000
+
+class TargetGrid(namedtuple("TargetGrid", ["crs", "transform", "width", "height"])):
+    """Pixel grid that every source is resampled onto before fusion"""
+    
+    __slots__ = ()
+    
+    @classmethod
+    def from_raster(cls, path):
+        with rasterio.open(path) as src:
+            return cls(src.crs, src.transform, src.width, src.height)
+    
+    @property
+    def key(self):
+        return (self.crs.to_wkt(), tuple(self.transform)[:6], self.width, self.height)
+
+# Warp plans and warp map blocks in one LRU of at most settings.WARP_CACHE_MB:
+# ("plan", source grid, target CRS) -> TargetGrid and
+# ("map", source CRS/transform, target grid, row block) -> source pixel coordinates
+_warp_cache = OrderedDict()
+_warp_cache_lock = threading.Lock()
+_warp_cache_bytes = 0
+
+# Bytes charged for an entry without arrays, such as a warp plan
+_MIN_ENTRY_BYTES = 1024
+
+def _entry_bytes(value):
+    return max(sum(item.nbytes for item in value if isinstance(item, np.ndarray)), _MIN_ENTRY_BYTES)
+
+def _cached_warp(key, compute):
+    """Get an entry of the warp cache, computing it outside the lock on a miss"""
+    global _warp_cache_bytes
+    with _warp_cache_lock:
+        if key in _warp_cache:
+            _warp_cache.move_to_end(key)
+            return _warp_cache[key]
+    
+    value = compute()
+    size = _entry_bytes(value)
+    limit = settings.WARP_CACHE_MB * 2**20
+    if size > limit:
+        return value
+    with _warp_cache_lock:
+        if key not in _warp_cache:
+            _warp_cache_bytes += size
+        _warp_cache[key] = value
+        _warp_cache.move_to_end(key)
+        while _warp_cache_bytes > limit:
+            _, evicted = _warp_cache.popitem(last=False)
+            _warp_cache_bytes -= _entry_bytes(evicted)
+    return value
+
+def clear_warp_cache():
+    """Drop every cached warp plan and warp map block"""
+    global _warp_cache_bytes
+    with _warp_cache_lock:
+        _warp_cache.clear()
+        _warp_cache_bytes = 0
+
+@traced
 def apply_cloud_mask(image_path, is_sentinel=True):
     """
     Apply cloud masking to satellite imagery.
@@ -51,7 +133,8 @@ def apply_cloud_mask(image_path, is_sentinel=True):
         
         # Apply the cloud mask to all bands
         # Set cloudy pixels to nodata value
-        for i in range(data.shape[0] - 1):  # Skip the QA band for Landsat
+        n_bands = data.shape[0] if is_sentinel else data.shape[0] - 1  # Skip the QA band for Landsat
+        for i in range(n_bands):
             data[i][cloud_mask] = 0  # Use 0 as nodata value
         
         # Create output path
@@ -65,7 +148,8 @@ def apply_cloud_mask(image_path, is_sentinel=True):
         
         return output_path
 
-def compute_indices(image_path, is_sentinel=True):
+@traced
+def compute_indices(image_path, is_sentinel=True, output_dir=None):
     """
     Compute spectral indices from satellite imagery.
     
@@ -74,6 +158,7 @@ def compute_indices(image_path, is_sentinel=True):
     Args:
         image_path: Path to the satellite image
         is_sentinel: Boolean indicating if the image is Sentinel-2 (True) or Landsat (False)
+        output_dir: Directory for the indices (optional, defaults to the image's directory)
         
     Returns:
         Dictionary with paths to the computed indices
@@ -128,7 +213,7 @@ def compute_indices(image_path, is_sentinel=True):
         ndmi[valid] = (nir[valid] - swir[valid]) / denominator[valid]
         
         # Create output directory
-        output_dir = os.path.dirname(image_path)
+        output_dir = output_dir or os.path.dirname(image_path)
         base_name = os.path.splitext(os.path.basename(image_path))[0]
         
         # Create a profile for the indices (single band)
@@ -154,46 +239,454 @@ def compute_indices(image_path, is_sentinel=True):
             "ndmi": ndmi_path
         }
 
-def reproject_and_clip(image_path, region_geojson, target_crs="EPSG:4326"):
+def get_composite_path(directory, method, job_id, sensor="sentinel2"):
+    """
+    Get the path of the temporal composite a job writes for one sensor.
+    
+    Composites are named after their job so a later incremental job can
+    find and update them.
+    """
+    prefix = "" if sensor == "sentinel2" else f"{sensor}_"
+    return os.path.join(directory, f"{prefix}composite_{method}_job_{job_id}.tif")
+
+@traced
+def create_temporal_composite(image_paths, method="median", output_path=None, red_band=1, nir_band=4, bands=None, previous_path=None):
+    """
+    Combine cloud-masked scenes of the same grid into a single composite.
+    
+    Scenes are streamed in row blocks sized so that one block of every scene
+    fits in ``settings.COMPOSITE_MEMORY_MB``; memory stays bounded however
+    many dates are in the range. Pixels equal to 0 in any band (the cloud
+    mask's nodata value) are ignored.
+    
+    A "best_pixel" composite can be updated with new scenes by passing the
+    earlier composite as ``previous_path``: it takes part as one more
+    observation, which gives the same result as compositing every scene
+    again. A median cannot be updated this way.
+    
+    Args:
+        image_paths: List of paths to cloud-masked scenes on the same grid
+        method: "median" for the per-pixel median of clear observations, or
+            "best_pixel" for the clear observation with the highest NDVI
+        output_path: Path for the composite (optional)
+        red_band: 1-based index of the red band in the composite, used by "best_pixel"
+        nir_band: 1-based index of the NIR band in the composite, used by "best_pixel"
+        bands: 1-based indexes of the bands to composite (optional, defaults
+            to all bands)
+        previous_path: Earlier "best_pixel" composite of the same grid to
+            update with ``image_paths`` (optional)
+    
+    Returns:
+        Path to the composite image
+    """
+    if method not in ("median", "best_pixel"):
+        raise ValueError(f"Unknown composite method: {method}")
+    if not image_paths:
+        raise ValueError("At least one scene is required")
+    if previous_path is not None and method != "best_pixel":
+        raise ValueError(f"A {method} composite cannot be updated incrementally")
+    
+    sources = [rasterio.open(path) for path in image_paths]
+    try:
+        first = sources[0]
+        for src in sources[1:]:
+            if (src.width, src.height, src.count, src.transform) != (first.width, first.height, first.count, first.transform):
+                raise ValueError(f"Scene {src.name} is not on the same grid as {first.name}")
+        
+        if bands is None:
+            bands = list(range(1, first.count + 1))
+        
+        # The earlier composite already holds only the composited bands
+        source_bands = [bands] * len(sources)
+        if previous_path is not None:
+            previous = rasterio.open(previous_path)
+            sources.append(previous)
+            if (previous.width, previous.height, previous.count, previous.transform) != (first.width, first.height, len(bands), first.transform):
+                raise ValueError(f"Composite {previous.name} does not match the grid and bands of {first.name}")
+            source_bands.append(list(range(1, len(bands) + 1)))
+        
+        profile = first.profile.copy()
+        profile.update(count=len(bands), dtype=rasterio.float32, nodata=0)
+        
+        if output_path is None:
+            output_dir = os.path.dirname(image_paths[0])
+            output_path = os.path.join(output_dir, f"composite_{method}.tif")
+        
+        # Rows per block so that all scenes' blocks, plus working copies, fit the budget
+        bytes_per_row = len(sources) * len(bands) * first.width * 4 * 3
+        block_rows = max(1, min(first.height, settings.COMPOSITE_MEMORY_MB * 1024 * 1024 // bytes_per_row))
+        
+        with rasterio.open(output_path, 'w', **profile) as dst:
+            for row_off in range(0, first.height, block_rows):
+                window = Window(0, row_off, first.width, min(block_rows, first.height - row_off))
+                
+                # (scenes, bands, rows, cols), with masked observations as NaN
+                stack = np.stack([
+                    src.read(indexes, window=window, out_dtype=np.float32)
+                    for src, indexes in zip(sources, source_bands)
+                ])
+                invalid = (stack == 0).any(axis=1, keepdims=True)
+                np.putmask(stack, np.broadcast_to(invalid, stack.shape), np.nan)
+                
+                with warnings.catch_warnings():
+                    # All-NaN pixels (never clear) are expected and filled below
+                    warnings.simplefilter("ignore", RuntimeWarning)
+                    if method == "median":
+                        composite = np.nanmedian(stack, axis=0)
+                    else:
+                        red = stack[:, red_band - 1]
+                        nir = stack[:, nir_band - 1]
+                        ndvi = (nir - red) / (nir + red)
+                        best = np.nanargmax(np.where(np.isnan(ndvi), -np.inf, ndvi), axis=0)
+                        composite = np.take_along_axis(stack, best[None, None], axis=0)[0]
+                
+                np.nan_to_num(composite, copy=False, nan=0.0)
+                dst.write(composite.astype(np.float32, copy=False), window=window)
+    finally:
+        for src in sources:
+            src.close()
+    
+    return output_path
+
+def get_warp_map(src_crs, src_transform, grid, row_off, n_rows):
+    """
+    Get the source pixel coordinates of the pixel centres of a row block of a target grid.
+    
+    Computing the map means projecting every target pixel, so blocks are
+    kept in the warp cache: all scenes of a Landsat path/row share one
+    source grid and reuse the same blocks, as long as they fit in
+    ``settings.WARP_CACHE_MB``. Only one block is computed at a time, so a
+    map never holds a whole grid's coordinates.
+    
+    Args:
+        src_crs: CRS of the source raster
+        src_transform: Affine transform of the source raster
+        grid: TargetGrid to resample onto
+        row_off: First grid row of the block
+        n_rows: Number of rows in the block
+    
+    Returns:
+        Tuple of (rows, cols) float32 arrays of shape (n_rows, grid.width)
+    """
+    key = ("map", src_crs.to_wkt(), tuple(src_transform)[:6], grid.key, row_off, n_rows)
+    return _cached_warp(key, lambda: _warp_map(src_crs, src_transform, grid, row_off, n_rows))
+
+def _warp_map(src_crs, src_transform, grid, row_off, n_rows):
+    block_cols, block_rows = np.meshgrid(np.arange(grid.width) + 0.5, np.arange(row_off, row_off + n_rows) + 0.5)
+    xs, ys = grid.transform * (block_cols, block_rows)
+    
+    if src_crs != grid.crs:
+        xs, ys = transform_coords(grid.crs, src_crs, xs.ravel(), ys.ravel())
+        xs = np.asarray(xs).reshape(n_rows, grid.width)
+        ys = np.asarray(ys).reshape(n_rows, grid.width)
+    
+    cols, rows = ~src_transform * (xs, ys)
+    return rows.astype(np.float32), cols.astype(np.float32)
+
+@traced
+def resample_to_grid(image_path, grid, bands=None, output_path=None, resampling="bilinear", adjustment=None):
+    """
+    Resample a raster onto a target grid.
+    
+    The grid is processed in row blocks and only the source window under
+    each block is read. Pixels equal to 0 (nodata) are never interpolated
+    into valid pixels; next to them the nearest value is used instead.
+    
+    Args:
+        image_path: Path to the source raster
+        grid: TargetGrid to resample onto
+        bands: 1-based indexes of the bands to resample (optional, defaults
+            to all bands)
+        output_path: Path for the resampled raster (optional)
+        resampling: "nearest" or "bilinear"
+        adjustment: Per-band (slope, offset) pairs applied to valid
+            resampled values (optional)
+    
+    Returns:
+        Path to the resampled raster
+    """
+    if resampling not in ("nearest", "bilinear"):
+        raise ValueError(f"Unknown resampling method: {resampling}")
+    
+    with rasterio.open(image_path) as src:
+        if bands is None:
+            bands = list(range(1, src.count + 1))
+        if adjustment is not None and len(adjustment) != len(bands):
+            raise ValueError("adjustment must have one (slope, offset) pair per band")
+        
+        profile = src.profile.copy()
+        profile.update(
+            crs=grid.crs,
+            transform=grid.transform,
+            width=grid.width,
+            height=grid.height,
+            count=len(bands),
+            dtype=rasterio.float32,
+            nodata=0
+        )
+        
+        if output_path is None:
+            output_dir = os.path.dirname(image_path)
+            base_name = os.path.basename(image_path)
+            output_path = os.path.join(output_dir, f"resampled_{base_name}")
+        
+        with rasterio.open(output_path, 'w', **profile) as dst:
+            for row_off in range(0, grid.height, settings.RASTER_BLOCK_ROWS):
+                n_rows = min(settings.RASTER_BLOCK_ROWS, grid.height - row_off)
+                window = Window(0, row_off, grid.width, n_rows)
+                out = np.zeros((len(bands), n_rows, grid.width), dtype=np.float32)
+                
+                rows, cols = get_warp_map(src.crs, src.transform, grid, row_off, n_rows)
+                inside = (rows >= 0) & (rows < src.height) & (cols >= 0) & (cols < src.width)
+                if not inside.any():
+                    dst.write(out, window=window)
+                    continue
+                
+                # Source window under this block, with a pixel of margin for bilinear
+                row_start = max(0, int(np.floor(rows[inside].min())) - 1)
+                row_stop = min(src.height, int(np.ceil(rows[inside].max())) + 1)
+                col_start = max(0, int(np.floor(cols[inside].min())) - 1)
+                col_stop = min(src.width, int(np.ceil(cols[inside].max())) + 1)
+                data = src.read(
+                    bands,
+                    window=Window(col_start, row_start, col_stop - col_start, row_stop - row_start),
+                    out_dtype=np.float32
+                )
+                height, width = data.shape[1:]
+                
+                # Nearest source pixel, in window coordinates
+                near_r = np.clip(np.floor(rows).astype(np.int64) - row_start, 0, height - 1)
+                near_c = np.clip(np.floor(cols).astype(np.int64) - col_start, 0, width - 1)
+                values = data[:, near_r, near_c]
+                
+                if resampling == "bilinear":
+                    r = rows - 0.5 - row_start
+                    c = cols - 0.5 - col_start
+                    r0 = np.floor(r).astype(np.int64)
+                    c0 = np.floor(c).astype(np.int64)
+                    fr = (r - r0).astype(np.float32)
+                    fc = (c - c0).astype(np.float32)
+                    r1 = np.clip(r0 + 1, 0, height - 1)
+                    c1 = np.clip(c0 + 1, 0, width - 1)
+                    r0 = np.clip(r0, 0, height - 1)
+                    c0 = np.clip(c0, 0, width - 1)
+                    
+                    v00, v01 = data[:, r0, c0], data[:, r0, c1]
+                    v10, v11 = data[:, r1, c0], data[:, r1, c1]
+                    bilinear = (v00 * (1 - fc) + v01 * fc) * (1 - fr) + (v10 * (1 - fc) + v11 * fc) * fr
+                    complete = ((v00 != 0) & (v01 != 0) & (v10 != 0) & (v11 != 0)).all(axis=0)
+                    values = np.where(complete, bilinear, values)
+                
+                valid = inside & (values != 0).all(axis=0)
+                if adjustment is not None:
+                    for i, (slope, offset) in enumerate(adjustment):
+                        # Keep adjusted values positive so they don't turn into nodata
+                        values[i] = np.maximum(values[i] * slope + offset, 1)
+                
+                out[:, valid] = values[:, valid]
+                dst.write(out, window=window)
+    
+    return output_path
+
+@traced
+def harmonize_landsat_to_sentinel(landsat_path, grid, output_path=None):
+    """
+    Put a Landsat raster on the Sentinel-2 grid, band order and bandpass.
+    
+    Args:
+        landsat_path: Path to a cloud-masked Landsat raster or composite
+        grid: Sentinel-2 TargetGrid
+        output_path: Path for the harmonized raster (optional)
+    
+    Returns:
+        Path to the harmonized raster, with the Sentinel-2 sample bands
+        (Red, Green, Blue, NIR)
+    """
+    if output_path is None:
+        output_dir = os.path.dirname(landsat_path)
+        base_name = os.path.basename(landsat_path)
+        output_path = os.path.join(output_dir, f"harmonized_{base_name}")
+    
+    adjustment = [(slope, offset * REFLECTANCE_SCALE) for slope, offset in LANDSAT_TO_SENTINEL_BANDPASS]
+    
+    return resample_to_grid(
+        landsat_path,
+        grid,
+        bands=LANDSAT_TO_SENTINEL_BANDS,
+        output_path=output_path,
+        resampling="bilinear",
+        adjustment=adjustment
+    )
+
+@traced
+def fuse_sources(primary_path, secondary_path, output_path=None):
+    """
+    Fill nodata pixels of one raster with a second raster on the same grid.
+    
+    A pixel is taken from the secondary raster when any band of the primary
+    is nodata (0), e.g. Sentinel-2 pixels that were cloudy on every date.
+    
+    Args:
+        primary_path: Path to the preferred raster
+        secondary_path: Path to the gap-filling raster, with the same grid
+            and band order
+        output_path: Path for the fused raster (optional)
+    
+    Returns:
+        Path to the fused raster
+    """
+    with rasterio.open(primary_path) as primary, rasterio.open(secondary_path) as secondary:
+        if (primary.width, primary.height, primary.count, primary.transform) != (secondary.width, secondary.height, secondary.count, secondary.transform):
+            raise ValueError(f"{secondary_path} is not on the same grid as {primary_path}")
+        
+        profile = primary.profile.copy()
+        profile.update(dtype=rasterio.float32, nodata=0)
+        
+        if output_path is None:
+            output_dir = os.path.dirname(primary_path)
+            base_name = os.path.basename(primary_path)
+            output_path = os.path.join(output_dir, f"fused_{base_name}")
+        
+        with rasterio.open(output_path, 'w', **profile) as dst:
+            for row_off in range(0, primary.height, settings.RASTER_BLOCK_ROWS):
+                window = Window(0, row_off, primary.width, min(settings.RASTER_BLOCK_ROWS, primary.height - row_off))
+                data = primary.read(window=window, out_dtype=np.float32)
+                gaps = (data == 0).any(axis=0)
+                if gaps.any():
+                    fill = secondary.read(window=window, out_dtype=np.float32)
+                    data[:, gaps] = fill[:, gaps]
+                dst.write(data, window=window)
+    
+    return output_path
+
+def _warp_plan(src_crs, src_transform, src_width, src_height, dst_crs):
+    transform, width, height = calculate_default_transform(
+        src_crs,
+        dst_crs,
+        src_width,
+        src_height,
+        *array_bounds(src_height, src_width, Affine(*src_transform))
+    )
+    return TargetGrid(CRS.from_user_input(dst_crs), transform, width, height)
+
+def get_warp_plan(src, target_crs):
+    """
+    Get the target grid a source raster is warped onto.
+    
+    The grid covers the whole source at its native resolution and is kept
+    in the warp cache per source grid and target CRS, so jobs over the same
+    source grid share one target grid and their outputs line up pixel for
+    pixel.
+    
+    Args:
+        src: Open rasterio dataset
+        target_crs: Target coordinate reference system
+    
+    Returns:
+        TargetGrid in the target CRS
+    """
+    key = (src.crs.to_wkt(), tuple(src.transform)[:6], src.width, src.height, CRS.from_user_input(target_crs).to_wkt())
+    return _cached_warp(("plan", *key), lambda: _warp_plan(*key))
+
+def _outer_window(window, margin=0):
+    col_off = int(np.floor(window.col_off)) - margin
+    row_off = int(np.floor(window.row_off)) - margin
+    col_stop = int(np.ceil(window.col_off + window.width)) + margin
+    row_stop = int(np.ceil(window.row_off + window.height)) + margin
+    return Window(col_off, row_off, col_stop - col_off, row_stop - row_off)
+
+@traced
+def reproject_and_clip(image_path, region_geojson, target_crs="EPSG:4326", output_path=None, resampling=Resampling.bilinear):
     """
     Reproject the image to the target CRS and clip it to the region of interest.
     
+    Only the source blocks under the region's bounding box are read; they
+    are warped with GDAL onto the cached target grid (see ``get_warp_plan``)
+    using ``settings.WARP_NUM_THREADS`` threads and at most
+    ``settings.WARP_MEMORY_MB`` of working memory. Pixels outside the region
+    are set to nodata (the source's nodata value, or 0). Source pixels are
+    only masked when the source declares a nodata value and every band
+    holds it, so an index that is exactly 0 stays a valid value.
+    
     Args:
         image_path: Path to the image
-        region_geojson: GeoJSON representation of the region of interest
+        region_geojson: GeoJSON representation of the region of interest (EPSG:4326)
         target_crs: Target coordinate reference system
+        output_path: Path for the clipped image (optional, defaults to a
+            ``clipped_`` prefixed file next to the input)
+        resampling: rasterio Resampling method
         
     Returns:
         Path to the reprojected and clipped image
     """
-    # Get the geometry from the GeoJSON
-    geom = [shape(region_geojson["geometry"])]
+    # Get the geometry in the target CRS
+    geom = transform_geom("EPSG:4326", target_crs, region_geojson["geometry"])
+    dst_bounds = shape(geom).bounds
     
     with rasterio.open(image_path) as src:
-        # Reproject and clip in one operation
-        out_image, out_transform = mask(src, geom, crop=True)
+        plan = get_warp_plan(src, target_crs)
+        nodata = src.nodata if src.nodata is not None else 0
+        
+        try:
+            # Output grid: the region's bbox snapped to the plan grid
+            dst_window = _outer_window(from_bounds(*dst_bounds, transform=plan.transform)).intersection(
+                Window(0, 0, plan.width, plan.height)
+            )
+            # Source blocks under the bbox, with a margin for the resampling kernel
+            src_bounds = transform_bounds(target_crs, src.crs, *dst_bounds, densify_pts=21)
+            src_window = _outer_window(from_bounds(*src_bounds, transform=src.transform), margin=2).intersection(
+                Window(0, 0, src.width, src.height)
+            )
+        except WindowError:
+            raise ValueError(f"Region does not overlap {image_path}")
+        
+        dst_transform = window_transform(dst_window, plan.transform)
+        destination = np.full((src.count, dst_window.height, dst_window.width), nodata, dtype=src.dtypes[0])
+        
+        reproject(
+            source=src.read(window=src_window),
+            destination=destination,
+            src_transform=window_transform(src_window, src.transform),
+            src_crs=src.crs,
+            src_nodata=src.nodata,
+            dst_transform=dst_transform,
+            dst_crs=plan.crs,
+            dst_nodata=nodata,
+            resampling=resampling,
+            num_threads=settings.WARP_NUM_THREADS,
+            warp_mem_limit=settings.WARP_MEMORY_MB,
+            # Bands such as indices hold valid zeros; only pixels that are nodata in every band are masked
+            UNIFIED_SRC_NODATA="YES"
+        )
+        
+        # Clip to the region itself, not just its bounding box
+        outside = geometry_mask([geom], out_shape=destination.shape[1:], transform=dst_transform)
+        destination[:, outside] = nodata
         
         # Update the profile
         out_profile = src.profile.copy()
         out_profile.update({
-            "height": out_image.shape[1],
-            "width": out_image.shape[2],
-            "transform": out_transform,
-            "crs": target_crs
+            "height": dst_window.height,
+            "width": dst_window.width,
+            "transform": dst_transform,
+            "crs": plan.crs,
+            "nodata": nodata
         })
         
         # Create output path
-        output_dir = os.path.dirname(image_path)
-        base_name = os.path.basename(image_path)
-        output_path = os.path.join(output_dir, f"clipped_{base_name}")
+        if output_path is None:
+            output_dir = os.path.dirname(image_path)
+            base_name = os.path.basename(image_path)
+            output_path = os.path.join(output_dir, f"clipped_{base_name}")
         
         # Write the clipped image
         with rasterio.open(output_path, 'w', **out_profile) as dst:
-            dst.write(out_image)
+            dst.write(destination)
         
         return output_path
 
-def create_feature_stack(image_paths, indices_paths, region_geojson):
+@traced
+def create_feature_stack(image_paths, indices_paths, region_geojson, output_path=None):
     """
     Create a feature stack from satellite imagery and indices.
     
@@ -201,6 +694,7 @@ def create_feature_stack(image_paths, indices_paths, region_geojson):
         image_paths: List of paths to satellite images
         indices_paths: Dictionary with paths to spectral indices
         region_geojson: GeoJSON representation of the region of interest
+        output_path: Path for the feature stack (optional)
         
     Returns:
         Path to the feature stack
@@ -239,8 +733,9 @@ def create_feature_stack(image_paths, indices_paths, region_geojson):
         feature_stack[i] = data.astype(np.float32)
     
     # Create output path
-    output_dir = os.path.dirname(image_paths[0])
-    output_path = os.path.join(output_dir, "feature_stack.tif")
+    if output_path is None:
+        output_dir = os.path.dirname(image_paths[0])
+        output_path = os.path.join(output_dir, "feature_stack.tif")
     
     # Write the feature stack
     with rasterio.open(output_path, 'w', **profile) as dst:
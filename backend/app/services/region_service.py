@@ -1,10 +1,12 @@
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List, Optional
-from app.models.region import Region, RegionCreate
+from typing import Any, Dict, List, Optional, Tuple
+from app.db.pagination import finish_page, keyset_select
+from app.models.region import Region, RegionCreate, REGION_LIST_COLUMNS
 from geoalchemy2.shape import from_shape, to_shape
 from shapely.geometry import shape
 import json
-import geopandas as gpd
 
 def create_region(db: Session, region_data: RegionCreate) -> Region:
     """
@@ -51,6 +53,54 @@ def get_region_by_id(db: Session, region_id: int) -> Optional[Region]:
     """
     return db.query(Region).filter(Region.id == region_id).first()
 
+async def get_region_response_async(db: AsyncSession, region_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Get a region and its GeoJSON without blocking the event loop.
+    
+    The geometry is serialized by PostGIS (ST_AsGeoJSON) rather than
+    decoded from WKB in Python.
+    
+    Args:
+        db: Async database session
+        region_id: Region ID
+        
+    Returns:
+        Region fields with a ``geojson`` Feature if found, None otherwise
+    """
+    result = await db.execute(
+        select(*REGION_LIST_COLUMNS, func.ST_AsGeoJSON(Region.geometry).label("geometry_json"))
+        .where(Region.id == region_id)
+    )
+    row = result.one_or_none()
+    if row is None:
+        return None
+    
+    return {
+        "id": row.id,
+        "name": row.name,
+        "description": row.description,
+        "created_at": row.created_at,
+        "geojson": {
+            "type": "Feature",
+            "geometry": json.loads(row.geometry_json),
+            "properties": {"id": row.id, "name": row.name, "description": row.description}
+        }
+    }
+
+async def region_exists_async(db: AsyncSession, region_id: int) -> bool:
+    """
+    Check whether a region exists without loading its geometry.
+    
+    Args:
+        db: Async database session
+        region_id: Region ID
+        
+    Returns:
+        True if the region exists
+    """
+    result = await db.execute(select(Region.id).where(Region.id == region_id))
+    return result.scalar_one_or_none() is not None
+
 def get_regions(db: Session, skip: int = 0, limit: int = 100) -> List[Region]:
     """
     Get a list of regions.
@@ -65,6 +115,26 @@ def get_regions(db: Session, skip: int = 0, limit: int = 100) -> List[Region]:
     """
     return db.query(Region).order_by(Region.created_at.desc()).offset(skip).limit(limit).all()
 
+async def get_regions_page_async(db: AsyncSession, limit: int = 100, cursor: Optional[str] = None, skip: int = 0) -> Tuple[List[Any], Optional[str]]:
+    """
+    Get a page of regions for list views without blocking the event loop.
+    
+    Args:
+        db: Async database session
+        limit: Maximum number of records to return
+        cursor: Cursor returned with the previous page (optional)
+        skip: Number of records to skip, for clients that still page by offset
+        
+    Returns:
+        Tuple of (region rows, next page cursor or None)
+    """
+    statement = keyset_select(select(*REGION_LIST_COLUMNS), Region.created_at, Region.id, limit, cursor)
+    if skip:
+        statement = statement.offset(skip)
+    
+    result = await db.execute(statement)
+    return finish_page(result.all(), limit)
+
 def region_to_geojson(region: Region) -> dict:
     """
     Convert a region to GeoJSON.
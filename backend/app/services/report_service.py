@@ -1,18 +1,21 @@
 import os
 import json
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.colors as colors
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
 import rasterio
-from rasterio.plot import show
 import jinja2
 import pdfkit
 from datetime import datetime
 from app.core.config import settings
+from app.core.lazy import lazy_import
+from app.core.tracing import traced
 from app.core.minio import upload_file
 
+# matplotlib is only loaded by processes that render reports
+colors = lazy_import("matplotlib.colors")
+figure = lazy_import("matplotlib.figure")
+backend_agg = lazy_import("matplotlib.backends.backend_agg")
+
+@traced
 def generate_map_image(raster_path, output_path, title, colormap='viridis', vmin=None, vmax=None):
     """
     Generate an image from a raster file.
@@ -34,8 +37,8 @@ def generate_map_image(raster_path, output_path, title, colormap='viridis', vmin
         data = src.read(1)
         
         # Create a figure
-        fig = Figure(figsize=(10, 8))
-        canvas = FigureCanvas(fig)
+        fig = figure.Figure(figsize=(10, 8))
+        canvas = backend_agg.FigureCanvasAgg(fig)
         ax = fig.add_subplot(111)
         
         # Set vmin and vmax if not provided
@@ -64,6 +67,7 @@ def generate_map_image(raster_path, output_path, title, colormap='viridis', vmin
         
         return output_path
 
+@traced
 def generate_histogram(raster_path, output_path, title, bins=30, color='blue'):
     """
     Generate a histogram from a raster file.
@@ -88,8 +92,8 @@ def generate_histogram(raster_path, output_path, title, bins=30, color='blue'):
         data = data[~np.isnan(data)]
         
         # Create a figure
-        fig = Figure(figsize=(10, 6))
-        canvas = FigureCanvas(fig)
+        fig = figure.Figure(figsize=(10, 6))
+        canvas = backend_agg.FigureCanvasAgg(fig)
         ax = fig.add_subplot(111)
         
         # Plot the histogram
@@ -108,6 +112,7 @@ def generate_histogram(raster_path, output_path, title, bins=30, color='blue'):
         
         return output_path
 
+@traced
 def generate_report(job_id, soc_path, moisture_path, soc_stats, moisture_stats, region_geojson, start_date, end_date):
     """
     Generate a PDF report for the analysis results.
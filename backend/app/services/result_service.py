@@ -1,6 +1,12 @@
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List, Optional, Dict, Any
-from app.models.result import Result, ResultCreate
+from datetime import datetime
+from typing import List, Optional, Dict, Any, Tuple
+from app.db.pagination import finish_page, keyset_select
+from app.models.job import Job
+from app.models.result import Result, ResultCreate, ResultDiff, RegionTimeseries, RESULT_LIST_COLUMNS, TIMESERIES_COLUMNS
 from app.core.config import settings
 
 def create_result(db: Session, result_data: Dict[str, Any]) -> Result:
@@ -30,7 +36,6 @@ def create_result(db: Session, result_data: Dict[str, Any]) -> Result:
     
     db.add(db_result)
     db.commit()
-    db.refresh(db_result)
     
     return db_result
 
@@ -60,6 +65,20 @@ def get_result_by_job_id(db: Session, job_id: int) -> Optional[Result]:
     """
     return db.query(Result).filter(Result.job_id == job_id).first()
 
+async def get_result_by_job_id_async(db: AsyncSession, job_id: int) -> Optional[Result]:
+    """
+    Get a result by job ID without blocking the event loop.
+    
+    Args:
+        db: Async database session
+        job_id: Job ID
+        
+    Returns:
+        Result if found, None otherwise
+    """
+    result = await db.execute(select(Result).where(Result.job_id == job_id))
+    return result.scalar_one_or_none()
+
 def get_results(db: Session, skip: int = 0, limit: int = 100) -> List[Result]:
     """
     Get a list of results.
@@ -73,3 +92,163 @@ def get_results(db: Session, skip: int = 0, limit: int = 100) -> List[Result]:
         List of results
     """
     return db.query(Result).order_by(Result.created_at.desc()).offset(skip).limit(limit).all()
+
+async def get_results_page_async(db: AsyncSession, limit: int = 100, cursor: Optional[str] = None) -> Tuple[List[Any], Optional[str]]:
+    """
+    Get a page of result summaries without blocking the event loop.
+    
+    Args:
+        db: Async database session
+        limit: Maximum number of records to return
+        cursor: Cursor returned with the previous page (optional)
+        
+    Returns:
+        Tuple of (result rows, next page cursor or None)
+    """
+    statement = keyset_select(select(*RESULT_LIST_COLUMNS), Result.created_at, Result.id, limit, cursor)
+    result = await db.execute(statement)
+    return finish_page(result.all(), limit)
+
+def record_job_timeseries(db: Session, job_id: int, stats: Dict[str, Dict[str, Any]]) -> None:
+    """
+    Add a job's summary statistics to the time series of its region.
+    
+    The point is dated by the end of the job's analysis period; a later job
+    of the same region and date replaces it.
+    
+    Args:
+        db: Database session
+        job_id: Job ID
+        stats: Mapping of layer name to the statistics returned by
+            summarize_prediction; missing statistics are stored as NULL
+    """
+    region_id, observed_at = db.execute(
+        select(Job.region_id, Job.end_date).where(Job.id == job_id)
+    ).one()
+    
+    rows = []
+    for layer, layer_stats in stats.items():
+        percentiles = layer_stats.get("percentiles") or {}
+        rows.append({
+            "region_id": region_id,
+            "job_id": job_id,
+            "layer": layer,
+            "observed_at": observed_at,
+            "count": layer_stats.get("count", 0),
+            "mean": layer_stats.get("mean"),
+            "min": layer_stats.get("min"),
+            "max": layer_stats.get("max"),
+            "std": layer_stats.get("std"),
+            "p10": percentiles.get("p10"),
+            "p25": percentiles.get("p25"),
+            "p50": percentiles.get("p50"),
+            "p75": percentiles.get("p75"),
+            "p90": percentiles.get("p90"),
+            "created_at": datetime.utcnow()
+        })
+    
+    statement = insert(RegionTimeseries).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=["region_id", "layer", "observed_at"],
+        set_={
+            column: statement.excluded[column]
+            for column in rows[0]
+            if column not in ("region_id", "layer", "observed_at")
+        }
+    )
+    db.execute(statement)
+    db.commit()
+
+async def get_region_timeseries_async(db: AsyncSession, region_id: int, layer: Optional[str] = None, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[Any]:
+    """
+    Get the time series of a region without blocking the event loop.
+    
+    Served by a range scan of the (region_id, layer, observed_at) index.
+    
+    Args:
+        db: Async database session
+        region_id: Region ID
+        layer: Optional layer filter ("soc" or "moisture")
+        start: Optional earliest date
+        end: Optional latest date
+        
+    Returns:
+        Time-series rows ordered by layer and date
+    """
+    statement = select(*TIMESERIES_COLUMNS).where(RegionTimeseries.region_id == region_id)
+    
+    if layer:
+        statement = statement.where(RegionTimeseries.layer == layer)
+    if start:
+        statement = statement.where(RegionTimeseries.observed_at >= start)
+    if end:
+        statement = statement.where(RegionTimeseries.observed_at <= end)
+    
+    result = await db.execute(statement.order_by(RegionTimeseries.layer, RegionTimeseries.observed_at))
+    return result.all()
+
+def check_diff_jobs(job_a: Job, job_b: Job) -> None:
+    """
+    Check that two jobs can be compared by a difference.
+    
+    Args:
+        job_a: Earlier job
+        job_b: Later job
+        
+    Raises:
+        ValueError: If the jobs cover different regions, or job a ends
+            after job b
+    """
+    if job_a.region_id != job_b.region_id:
+        raise ValueError(f"Jobs {job_a.id} and {job_b.id} cover different regions")
+    if job_a.end_date > job_b.end_date:
+        raise ValueError(f"job_id_a must be the earlier job, but job {job_a.id} ends after job {job_b.id}")
+
+def get_result_diff(db: Session, job_id_a: int, job_id_b: int, layer: str) -> Optional[ResultDiff]:
+    """
+    Get the cached difference of one layer between two jobs.
+    
+    Args:
+        db: Database session
+        job_id_a: Earlier job ID
+        job_id_b: Later job ID
+        layer: Result layer
+        
+    Returns:
+        Cached difference if found, None otherwise
+    """
+    return db.query(ResultDiff).filter(
+        ResultDiff.job_id_a == job_id_a,
+        ResultDiff.job_id_b == job_id_b,
+        ResultDiff.layer == layer
+    ).first()
+
+def save_result_diff(db: Session, job_id_a: int, job_id_b: int, layer: str, object_name: str, stats: Dict[str, Any]) -> ResultDiff:
+    """
+    Cache the difference of one layer between two jobs.
+    
+    If a concurrent request cached the same pair first, its record is kept.
+    
+    Args:
+        db: Database session
+        job_id_a: Earlier job ID
+        job_id_b: Later job ID
+        layer: Result layer
+        object_name: Difference COG in the results bucket
+        stats: Statistics returned by compute_raster_diff
+        
+    Returns:
+        Cached difference
+    """
+    statement = insert(ResultDiff).values(
+        job_id_a=job_id_a,
+        job_id_b=job_id_b,
+        layer=layer,
+        object_name=object_name,
+        created_at=datetime.utcnow(),
+        **stats
+    ).on_conflict_do_nothing(index_elements=["job_id_a", "job_id_b", "layer"])
+    db.execute(statement)
+    db.commit()
+    
+    return get_result_diff(db, job_id_a, job_id_b, layer)
@@ -0,0 +1,297 @@
+import math
+import os
+import uuid
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.transform import from_origin
+from shapely.geometry import shape
+from app.core.config import settings
+from app.core.minio import download_file, upload_file
+from app.core.tracing import traced
+from app.services.result_raster_service import RasterCache
+
+# Layers kept in the store: description, unit of the stored integers and
+# the factor converting them to the conventional unit
+SOILGRIDS_LAYERS = {
+    "soc": {"description": "Soil organic carbon", "unit": "g/kg", "scale": 1.0},
+    "bdod": {"description": "Bulk density of the fine earth fraction", "unit": "cg/cm3", "scale": 0.01},
+    "clay": {"description": "Clay content", "unit": "g/kg", "scale": 1.0},
+    "sand": {"description": "Sand content", "unit": "g/kg", "scale": 1.0},
+    "silt": {"description": "Silt content", "unit": "g/kg", "scale": 1.0},
+    "phh2o": {"description": "pH in water", "unit": "pH*10", "scale": 0.1}
+}
+
+def _tile_pixels(level=0):
+    return settings.SOILGRIDS_TILE_PIXELS >> level
+
+def _resolution(level=0):
+    return settings.SOILGRIDS_RESOLUTION_DEG * 2**level
+
+def get_tile_path(layer, tile_row, tile_col, store_dir=None):
+    """
+    Get the local path of a stored tile.
+    
+    Tiles are laid out as ``{layer}/{tile_row}_{tile_col}.tif`` on a global
+    grid whose origin is (-180, 90); the same relative path is the object
+    name under ``soilgrids/`` in the cache bucket.
+    """
+    return os.path.join(store_dir or settings.SOILGRIDS_STORE_DIR, layer, f"{tile_row}_{tile_col}.tif")
+
+def get_tile_bounds(tile_row, tile_col):
+    """
+    Get the bounds of a tile.
+    
+    Returns:
+        (minx, miny, maxx, maxy) in EPSG:4326
+    """
+    span = _tile_pixels() * _resolution()
+    return (-180 + tile_col * span, 90 - (tile_row + 1) * span, -180 + (tile_col + 1) * span, 90 - tile_row * span)
+
+def get_pixel_window(bbox, level=0):
+    """
+    Get the global pixel rows and columns covering a bounding box.
+    
+    Args:
+        bbox: (minx, miny, maxx, maxy) in EPSG:4326
+        level: Overview level; level n has 2**n times coarser pixels
+    
+    Returns:
+        Tuple of (row_start, row_stop, col_start, col_stop)
+    """
+    res = _resolution(level)
+    minx, miny, maxx, maxy = bbox
+    row_start = math.floor(round((90 - maxy) / res, 9))
+    row_stop = max(math.ceil(round((90 - miny) / res, 9)), row_start + 1)
+    col_start = math.floor(round((minx + 180) / res, 9))
+    col_stop = max(math.ceil(round((maxx + 180) / res, 9)), col_start + 1)
+    return row_start, row_stop, col_start, col_stop
+
+def get_window_level(bbox, max_pixels=None):
+    """
+    Get the finest level at which a bounding box fits in ``max_pixels``.
+    
+    Args:
+        bbox: (minx, miny, maxx, maxy) in EPSG:4326
+        max_pixels: Pixel budget of the window (optional, defaults to
+            settings.SOILGRIDS_MAX_WINDOW_PIXELS)
+    
+    Returns:
+        Level, at most settings.SOILGRIDS_OVERVIEW_LEVELS
+    """
+    max_pixels = max_pixels or settings.SOILGRIDS_MAX_WINDOW_PIXELS
+    for level in range(settings.SOILGRIDS_OVERVIEW_LEVELS + 1):
+        row_start, row_stop, col_start, col_stop = get_pixel_window(bbox, level)
+        if (row_stop - row_start) * (col_stop - col_start) <= max_pixels:
+            return level
+    return settings.SOILGRIDS_OVERVIEW_LEVELS
+
+def _write_tile(source_path, path, tile_row, tile_col):
+    """Copy a provider raster onto the tile grid with internal blocks and overviews"""
+    size = _tile_pixels()
+    block = settings.SOILGRIDS_BLOCK_PIXELS
+    with rasterio.open(source_path) as src:
+        # Providers write the tile's bounds at the tile resolution; resampling
+        # only absorbs a pixel of rounding in their output shape
+        data = src.read(1, out_shape=(size, size), resampling=Resampling.nearest)
+        crs = src.crs
+    
+    minx, _, _, maxy = get_tile_bounds(tile_row, tile_col)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with rasterio.Env(GDAL_TIFF_OVR_BLOCKSIZE=str(block)):
+        with rasterio.open(
+            tmp_path,
+            'w',
+            driver='GTiff',
+            height=size,
+            width=size,
+            count=1,
+            dtype=data.dtype,
+            crs=crs,
+            transform=from_origin(minx, maxy, _resolution(), _resolution()),
+            tiled=True,
+            blockxsize=block,
+            blockysize=block,
+            compress="deflate"
+        ) as dst:
+            dst.write(data, 1)
+            dst.build_overviews([2**level for level in range(1, settings.SOILGRIDS_OVERVIEW_LEVELS + 1)], Resampling.average)
+    os.replace(tmp_path, path)
+
+def ensure_tile(layer, tile_row, tile_col, provider=None):
+    """
+    Make sure a tile of a layer is in the local store.
+    
+    A missing tile is downloaded from the cache bucket shared by all
+    workers, or else fetched from the ingest provider, written with
+    overviews and uploaded to the bucket for the other workers. Once a
+    tile is local no network call is made for it again.
+    
+    Args:
+        layer: Key of SOILGRIDS_LAYERS
+        tile_row: Tile row on the global grid
+        tile_col: Tile column on the global grid
+        provider: IngestProvider to fetch from (optional, defaults to
+            get_ingest_provider())
+    
+    Returns:
+        Local path of the tile
+    """
+    path = get_tile_path(layer, tile_row, tile_col)
+    if os.path.exists(path):
+        return path
+    
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    object_name = f"soilgrids/{layer}/{os.path.basename(path)}"
+    bucket = settings.SOILGRIDS_CACHE_BUCKET
+    if bucket and download_file(bucket, object_name, path):
+        return path
+    
+    if provider is None:
+        from app.services.ingest_providers import get_ingest_provider
+        provider = get_ingest_provider()
+    # The provider writes to a path of this call's own, so concurrent
+    # workers building the same tile never remove each other's raster
+    source_path = f"{path}.{uuid.uuid4().hex}.source.tif"
+    try:
+        provider.fetch_soilgrids(get_tile_bounds(tile_row, tile_col), layer, resolution=_resolution(), output_path=source_path)
+        _write_tile(source_path, path, tile_row, tile_col)
+    finally:
+        if os.path.exists(source_path):
+            os.remove(source_path)
+    
+    if bucket:
+        upload_file(bucket, object_name, path)
+    return path
+
+def _open_tile(key):
+    path, level = key
+    if level:
+        return rasterio.open(path, overview_level=level - 1)
+    return rasterio.open(path)
+
+# Decoded tile blocks per worker process; keys are (tile path, level)
+block_cache = RasterCache(
+    max_handles=settings.SOILGRIDS_HANDLE_CACHE_SIZE,
+    max_block_bytes=settings.SOILGRIDS_BLOCK_CACHE_MB * 1024 * 1024,
+    min_tile=settings.SOILGRIDS_BLOCK_PIXELS,
+    opener=_open_tile
+)
+
+def read_layer_window(layer, bbox, level=0, provider=None):
+    """
+    Read the pixels of a layer covering a bounding box.
+    
+    Only the tile blocks intersecting the box are decoded, and decoded
+    blocks are kept in the process's block cache, so overlapping and
+    repeated reads cost an array copy.
+    
+    Args:
+        layer: Key of SOILGRIDS_LAYERS
+        bbox: (minx, miny, maxx, maxy) in EPSG:4326
+        level: Overview level; level n has 2**n times coarser pixels
+        provider: IngestProvider for tiles not stored yet (optional)
+    
+    Returns:
+        Tuple of (array, transform) of the window, snapped outwards to the
+        pixel grid of the level
+    """
+    if layer not in SOILGRIDS_LAYERS:
+        raise ValueError(f"Unknown SoilGrids layer: {layer}")
+    if not 0 <= level <= settings.SOILGRIDS_OVERVIEW_LEVELS:
+        raise ValueError(f"Level must be between 0 and {settings.SOILGRIDS_OVERVIEW_LEVELS}")
+    
+    row_start, row_stop, col_start, col_stop = get_pixel_window(bbox, level)
+    tile_size = _tile_pixels(level)
+    
+    out = None
+    for tile_row in range(row_start // tile_size, (row_stop - 1) // tile_size + 1):
+        for tile_col in range(col_start // tile_size, (col_stop - 1) // tile_size + 1):
+            key = (ensure_tile(layer, tile_row, tile_col, provider), level)
+            block_h, block_w = block_cache.get_handle(key)["tile_shape"]
+            
+            # Window of the tile inside the requested window, in tile pixels
+            top = max(row_start - tile_row * tile_size, 0)
+            bottom = min(row_stop - tile_row * tile_size, tile_size)
+            left = max(col_start - tile_col * tile_size, 0)
+            right = min(col_stop - tile_col * tile_size, tile_size)
+            
+            for block_row in range(top // block_h, (bottom - 1) // block_h + 1):
+                for block_col in range(left // block_w, (right - 1) // block_w + 1):
+                    data = block_cache.get_tile(key, 1, block_row, block_col)
+                    if out is None:
+                        out = np.empty((row_stop - row_start, col_stop - col_start), dtype=data.dtype)
+                    
+                    # Overlap of the block and the window, in tile pixels
+                    y0, y1 = max(top, block_row * block_h), min(bottom, (block_row + 1) * block_h)
+                    x0, x1 = max(left, block_col * block_w), min(right, (block_col + 1) * block_w)
+                    out[
+                        tile_row * tile_size + y0 - row_start:tile_row * tile_size + y1 - row_start,
+                        tile_col * tile_size + x0 - col_start:tile_col * tile_size + x1 - col_start
+                    ] = data[y0 - block_row * block_h:y1 - block_row * block_h, x0 - block_col * block_w:x1 - block_col * block_w]
+    
+    res = _resolution(level)
+    return out, from_origin(-180 + col_start * res, 90 - row_start * res, res, res)
+
+def get_job_layers():
+    """
+    Get the layers extracted for every job.
+    
+    Returns:
+        List of keys of SOILGRIDS_LAYERS from settings.SOILGRIDS_LAYERS
+    """
+    layers = [layer.strip() for layer in settings.SOILGRIDS_LAYERS.split(",") if layer.strip()]
+    unknown = [layer for layer in layers if layer not in SOILGRIDS_LAYERS]
+    if unknown:
+        raise ValueError(f"Unknown SoilGrids layers: {', '.join(unknown)}")
+    return layers
+
+@traced
+def write_soilgrids_window(region_geojson, output_path, layers=None, level=None, provider=None):
+    """
+    Write the SoilGrids layers covering a region as one multi-band raster.
+    
+    Bands hold the stored integers in the order of ``layers``, with each
+    band's description set to its layer and its scale and unit set so that
+    value * scale is in the conventional unit.
+    
+    Args:
+        region_geojson: GeoJSON representation of the region of interest
+        output_path: Path of the raster
+        layers: Keys of SOILGRIDS_LAYERS (optional, defaults to get_job_layers())
+        level: Overview level (optional, defaults to the finest level within
+            settings.SOILGRIDS_MAX_WINDOW_PIXELS)
+        provider: IngestProvider for tiles not stored yet (optional)
+    
+    Returns:
+        output_path
+    """
+    layers = layers or get_job_layers()
+    bbox = shape(region_geojson["geometry"]).bounds
+    level = get_window_level(bbox) if level is None else level
+    
+    windows = [read_layer_window(layer, bbox, level, provider) for layer in layers]
+    dtype = np.result_type(*(data.dtype for data, _ in windows))
+    height, width = windows[0][0].shape
+    
+    tmp_path = f"{output_path}.{uuid.uuid4().hex}.tmp"
+    with rasterio.open(
+        tmp_path,
+        'w',
+        driver='GTiff',
+        height=height,
+        width=width,
+        count=len(layers),
+        dtype=dtype,
+        crs="EPSG:4326",
+        transform=windows[0][1]
+    ) as dst:
+        for band, (layer, (data, _)) in enumerate(zip(layers, windows), start=1):
+            dst.write(data.astype(dtype, copy=False), band)
+            dst.set_band_description(band, layer)
+            dst.update_tags(band, long_name=SOILGRIDS_LAYERS[layer]["description"])
+        dst.scales = [SOILGRIDS_LAYERS[layer]["scale"] for layer in layers]
+        dst.units = [SOILGRIDS_LAYERS[layer]["unit"] for layer in layers]
+    os.replace(tmp_path, output_path)
+    
+    return output_path
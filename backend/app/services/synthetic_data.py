@@ -0,0 +1,120 @@
+import os
+import uuid
+import numpy as np
+import rasterio
+from rasterio.transform import from_bounds
+from rasterio.windows import Window
+
+# Band layout, value range and cloud band of each synthetic product
+SENSOR_BANDS = {
+    "sentinel2": {"bands": ("red", "green", "blue", "nir"), "dtype": "uint16", "low": 0, "high": 10000, "cloud_band": False},
+    "landsat": {"bands": ("blue", "green", "red", "nir", "swir1", "swir2"), "dtype": "uint16", "low": 0, "high": 10000, "cloud_band": True},
+    # SoilGrids layers in their mapped units: g/kg, cg/cm³, g/kg and pH × 10
+    "soilgrids_soc": {"bands": ("soc",), "dtype": "uint8", "low": 0, "high": 150, "cloud_band": False},
+    "soilgrids_bdod": {"bands": ("bdod",), "dtype": "uint8", "low": 80, "high": 180, "cloud_band": False},
+    "soilgrids_clay": {"bands": ("clay",), "dtype": "uint16", "low": 50, "high": 600, "cloud_band": False},
+    "soilgrids_sand": {"bands": ("sand",), "dtype": "uint16", "low": 50, "high": 800, "cloud_band": False},
+    "soilgrids_silt": {"bands": ("silt",), "dtype": "uint16", "low": 50, "high": 600, "cloud_band": False},
+    "soilgrids_phh2o": {"bands": ("phh2o",), "dtype": "uint8", "low": 40, "high": 90, "cloud_band": False}
+}
+
+# Fraction of pixels flagged as cloud in the QA band
+CLOUD_FRACTION = 0.2
+
+WEATHER_HEADER = "date,temperature,precipitation,solar_radiation"
+
+def write_synthetic_raster(path, product, bounds, width, height, seed=0, block_rows=512, crs="EPSG:4326"):
+    """
+    Write a random raster shaped like an ingest product, block by block.
+    
+    Each block is generated with one vectorized draw for all bands, so any
+    size can be written in bounded memory. The file is written under a
+    temporary name and moved into place, so concurrent readers never see
+    a partial raster.
+    
+    Args:
+        path: Output path
+        product: Key of SENSOR_BANDS
+        bounds: (minx, miny, maxx, maxy) in ``crs``
+        width: Width in pixels
+        height: Height in pixels
+        seed: Random seed; the same seed writes the same raster
+        block_rows: Rows generated per write
+        crs: CRS of ``bounds``
+    
+    Returns:
+        path
+    """
+    spec = SENSOR_BANDS[product]
+    rng = np.random.default_rng(seed)
+    count = len(spec["bands"]) + (1 if spec["cloud_band"] else 0)
+    tiled = width >= 256 and height >= 256
+    
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with rasterio.open(
+        tmp_path,
+        'w',
+        driver='GTiff',
+        height=height,
+        width=width,
+        count=count,
+        dtype=spec["dtype"],
+        crs=crs,
+        transform=from_bounds(*bounds, width, height),
+        **({"tiled": True, "blockxsize": 256, "blockysize": 256} if tiled else {})
+    ) as dst:
+        for row_off in range(0, height, block_rows):
+            rows = min(block_rows, height - row_off)
+            data = rng.integers(spec["low"], spec["high"], (count, rows, width), dtype=spec["dtype"])
+            if spec["cloud_band"]:
+                # QA band: 1 for cloud, 0 for clear
+                data[-1] = rng.random((rows, width)) < CLOUD_FRACTION
+            dst.write(data, window=Window(0, row_off, width, rows))
+    os.replace(tmp_path, path)
+    
+    return path
+
+def synthetic_weather(start_date, end_date, seed=0):
+    """
+    Generate daily weather for a date range.
+    
+    Args:
+        start_date: First day (ISO format string)
+        end_date: Last day, inclusive (ISO format string)
+        seed: Random seed
+    
+    Returns:
+        CSV text with a WEATHER_HEADER header and one row per day
+    """
+    rng = np.random.default_rng(seed)
+    dates = np.arange(np.datetime64(start_date[:10], "D"), np.datetime64(end_date[:10], "D") + 1)
+    days = len(dates)
+    
+    columns = np.column_stack([
+        dates.astype(str),
+        np.char.mod("%.2f", rng.uniform(15, 30, days)),  # Temperature in Celsius
+        np.char.mod("%.2f", rng.uniform(0, 10, days)),  # Precipitation in mm
+        np.char.mod("%.2f", rng.uniform(10, 25, days))  # Solar radiation in MJ/m²
+    ]) if days else np.empty((0, 4), dtype=str)
+    
+    rows = [",".join(row) for row in columns]
+    return "\n".join([WEATHER_HEADER, *rows]) + "\n"
+
+def write_synthetic_weather(path, start_date, end_date, seed=0):
+    """
+    Write daily weather for a date range as CSV.
+    
+    Args:
+        path: Output path
+        start_date: First day (ISO format string)
+        end_date: Last day, inclusive (ISO format string)
+        seed: Random seed
+    
+    Returns:
+        path
+    """
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(synthetic_weather(start_date, end_date, seed))
+    os.replace(tmp_path, path)
+    return path
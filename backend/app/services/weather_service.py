@@ -0,0 +1,224 @@
+import os
+import uuid
+from datetime import date, timedelta
+import numpy as np
+from app.core.config import settings
+from app.core.lazy import lazy_import
+from app.core.tracing import traced
+
+# pyarrow.dataset pulls in pandas, so the Arrow stack is only imported
+# once weather is actually read or written
+pa = lazy_import("pyarrow")
+pc = lazy_import("pyarrow.compute")
+pv = lazy_import("pyarrow.csv")
+pq = lazy_import("pyarrow.parquet")
+ds = lazy_import("pyarrow.dataset")
+
+# Daily columns kept in the store, after "date"
+WEATHER_COLUMNS = ("temperature", "precipitation", "solar_radiation")
+
+# Features derived by compute_weather_features, in moisture model channel order
+WEATHER_FEATURES = ("growing_degree_days", "cumulative_precipitation", "antecedent_precipitation_index")
+
+def get_weather_cell(lon, lat, grid_deg=None):
+    """
+    Get the weather grid cell containing a point.
+    
+    All regions in a cell share its weather, fetched at the cell centre.
+    
+    Args:
+        lon: Longitude
+        lat: Latitude
+        grid_deg: Cell size in degrees (optional, defaults to settings.WEATHER_GRID_DEG)
+    
+    Returns:
+        Tuple of (cell_id, centre_lon, centre_lat)
+    """
+    grid_deg = grid_deg or settings.WEATHER_GRID_DEG
+    row = int(np.floor((lat + 90) / grid_deg))
+    col = int(np.floor((lon + 180) / grid_deg))
+    return f"{row}_{col}", (col + 0.5) * grid_deg - 180, (row + 0.5) * grid_deg - 90
+
+def get_weather_cell_path(cell_id, store_dir=None):
+    """
+    Get the directory of a cell's partitioned Parquet dataset.
+    
+    The dataset is laid out as ``cell={cell_id}/year={YYYY}/part-*.parquet``;
+    each file holds one fetched run of consecutive days.
+    """
+    return os.path.join(store_dir or settings.WEATHER_STORE_DIR, f"cell={cell_id}")
+
+def _weather_schema():
+    return pa.schema([("date", pa.date32())] + [(column, pa.float32()) for column in WEATHER_COLUMNS])
+
+def read_weather(cell_path, start_date, end_date):
+    """
+    Read a cell's daily weather for a date range.
+    
+    Only the year partitions overlapping the range are scanned. Days stored
+    twice, e.g. by two jobs fetching the same range at once, are returned once.
+    
+    Args:
+        cell_path: Directory returned by get_weather_cell_path
+        start_date: First day (ISO format string)
+        end_date: Last day, inclusive (ISO format string)
+    
+    Returns:
+        pyarrow Table with a date column and WEATHER_COLUMNS, sorted by date
+    """
+    start = date.fromisoformat(start_date[:10])
+    end = date.fromisoformat(end_date[:10])
+    if not os.path.isdir(cell_path):
+        return _weather_schema().empty_table()
+    
+    dataset = ds.dataset(cell_path, format="parquet", partitioning="hive", schema=_weather_schema().append(pa.field("year", pa.int32())))
+    table = dataset.to_table(
+        columns=["date", *WEATHER_COLUMNS],
+        filter=(ds.field("year") >= start.year) & (ds.field("year") <= end.year)
+        & (ds.field("date") >= start) & (ds.field("date") <= end)
+    )
+    
+    table = table.sort_by("date")
+    dates = table.column("date").to_numpy()
+    _, first = np.unique(dates, return_index=True)
+    if len(first) < len(dates):
+        table = table.take(first)
+    return table
+
+def _write_partitions(cell_path, table):
+    """Write fetched days into their year partitions as new files"""
+    years = pc.year(table.column("date")).to_numpy()
+    for year in np.unique(years):
+        part = table.filter(pa.array(years == year))
+        dates = part.column("date").to_numpy()
+        directory = os.path.join(cell_path, f"year={year}")
+        os.makedirs(directory, exist_ok=True)
+        
+        first, last = (str(day).replace("-", "") for day in (dates[0], dates[-1]))
+        name = f"part-{first}-{last}-{uuid.uuid4().hex[:8]}.parquet"
+        # Dataset discovery skips dot files, so readers never see a partial file
+        tmp_path = os.path.join(directory, f".{name}.tmp")
+        pq.write_table(part, tmp_path, compression="zstd")
+        os.replace(tmp_path, os.path.join(directory, name))
+
+def _missing_runs(have, start, end):
+    """Runs of consecutive days in [start, end] absent from ``have``"""
+    wanted = np.arange(np.datetime64(start, "D"), np.datetime64(end, "D") + 1)
+    missing = np.setdiff1d(wanted, have.astype("datetime64[D]"))
+    if not len(missing):
+        return []
+    breaks = np.flatnonzero(np.diff(missing.astype(np.int64)) != 1) + 1
+    return [(str(run[0]), str(run[-1])) for run in np.split(missing, breaks)]
+
+@traced
+def update_weather_store(lon, lat, start_date, end_date, provider=None):
+    """
+    Make sure a point's weather cell holds every day of a date range.
+    
+    Only the days not stored yet are fetched, one request per run of
+    consecutive missing days, so jobs with overlapping date ranges in the
+    same cell share what earlier jobs fetched.
+    
+    Args:
+        lon: Longitude
+        lat: Latitude
+        start_date: First day (ISO format string)
+        end_date: Last day, inclusive (ISO format string)
+        provider: IngestProvider to fetch from (optional, defaults to
+            get_ingest_provider())
+    
+    Returns:
+        Directory of the cell's dataset, for read_weather
+    """
+    if provider is None:
+        from app.services.ingest_providers import get_ingest_provider
+        provider = get_ingest_provider()
+    
+    cell_id, centre_lon, centre_lat = get_weather_cell(lon, lat)
+    cell_path = get_weather_cell_path(cell_id)
+    have = read_weather(cell_path, start_date, end_date).column("date").to_numpy()
+    
+    schema = _weather_schema()
+    for run_start, run_end in _missing_runs(have, start_date[:10], end_date[:10]):
+        # A CSV of this call's own, so concurrent jobs fetching the same run
+        # never remove each other's file; dataset discovery skips dot files
+        csv_path = os.path.join(cell_path, f".weather-{run_start}-{run_end}-{uuid.uuid4().hex[:8]}.csv")
+        try:
+            provider.fetch_weather(centre_lon, centre_lat, run_start, run_end, output_path=csv_path)
+            table = pv.read_csv(csv_path, convert_options=pv.ConvertOptions(column_types=schema, include_columns=schema.names))
+        finally:
+            if os.path.exists(csv_path):
+                os.remove(csv_path)
+        if table.num_rows:
+            _write_partitions(cell_path, table.select(schema.names))
+    
+    return cell_path
+
+def compute_weather_features(table, start_date, end_date, base_temperature=None, decay=None):
+    """
+    Aggregate daily weather into features for the moisture model.
+    
+    - growing_degree_days: sum over the range of max(temperature - base, 0)
+    - cumulative_precipitation: precipitation summed over the range (mm)
+    - antecedent_precipitation_index: ``API_t = decay * API_(t-1) + P_t`` at
+      the end date, run over every day in ``table`` up to it, so days before
+      the range warm the index up
+    
+    Args:
+        table: Daily weather as returned by read_weather, without gaps
+        start_date: First day of the range (ISO format string)
+        end_date: Last day of the range, inclusive (ISO format string)
+        base_temperature: GDD base temperature in Celsius (optional,
+            defaults to settings.WEATHER_GDD_BASE_C)
+        decay: Daily decay of the antecedent index (optional, defaults to
+            settings.WEATHER_API_DECAY)
+    
+    Returns:
+        Dictionary with WEATHER_FEATURES and "days", the number of days in the range
+    """
+    from scipy.signal import lfilter
+    
+    base_temperature = settings.WEATHER_GDD_BASE_C if base_temperature is None else base_temperature
+    decay = settings.WEATHER_API_DECAY if decay is None else decay
+    
+    dates = table.column("date").to_numpy().astype("datetime64[D]")
+    temperature = table.column("temperature").to_numpy().astype(np.float64)
+    precipitation = table.column("precipitation").to_numpy().astype(np.float64)
+    
+    until_end = dates <= np.datetime64(end_date[:10], "D")
+    in_range = until_end & (dates >= np.datetime64(start_date[:10], "D"))
+    
+    # First-order recursive filter: the decayed running sum in one C loop
+    api = lfilter([1.0], [1.0, -decay], precipitation[until_end])
+    
+    return {
+        "growing_degree_days": float(np.maximum(temperature[in_range] - base_temperature, 0).sum()),
+        "cumulative_precipitation": float(precipitation[in_range].sum()),
+        "antecedent_precipitation_index": float(api[-1]) if len(api) else 0.0,
+        "days": int(in_range.sum())
+    }
+
+def get_antecedent_start(start_date):
+    """
+    Get the first day of weather needed for a range's features.
+    
+    Returns:
+        ISO date settings.WEATHER_ANTECEDENT_DAYS before ``start_date``
+    """
+    return (date.fromisoformat(start_date[:10]) - timedelta(days=settings.WEATHER_ANTECEDENT_DAYS)).isoformat()
+
+@traced
+def get_weather_features(cell_path, start_date, end_date):
+    """
+    Compute a date range's weather features from a cell's stored weather.
+    
+    Args:
+        cell_path: Directory returned by update_weather_store
+        start_date: First day of the range (ISO format string)
+        end_date: Last day of the range, inclusive (ISO format string)
+    
+    Returns:
+        Dictionary returned by compute_weather_features
+    """
+    table = read_weather(cell_path, get_antecedent_start(start_date), end_date)
+    return compute_weather_features(table, start_date, end_date)
@@ -1,20 +1,48 @@
+import os
+import tempfile
 from celery import Task
+from celery.utils.log import get_logger
+from app.core.config import settings
+from app.core.minio import upload_file
+from app.core.profiling import TaskProfiler
+from app.core.tracing import Trace
 from app.db.session import SessionLocal
 from app.models.job import Job, JobStatus
-from app.services.job_service import update_job_status
+from app.services.job_service import save_job_profiles, save_job_stages, update_job_status
+
+logger = get_logger(__name__)
 
 class BaseTask(Task):
-    """Base Celery Task with database session handling and job status updates"""
+    """
+    Base Celery Task with database session handling, job status updates and stage tracing.
+    
+    A stage shared by a batch of jobs is called with ``group_job_ids``: its
+    stages (and profiles) are recorded for every job of the group, and the
+    job status is left to the batch task that runs the group.
+    """
+    
+    def __call__(self, *args, **kwargs):
+        """Run the task as the root span of a job trace and persist its stages"""
+        job_ids = self._job_ids(kwargs)
+        # ``group_job_ids`` is consumed here, not passed to the task function
+        kwargs.pop('group_job_ids', None)
+        trace = Trace(kwargs.get('job_id'))
+        try:
+            with trace.span(self.name.rsplit('.', 1)[-1]):
+                return super().__call__(*args, **kwargs)
+        finally:
+            if job_ids:
+                self._save_stages(trace, job_ids)
     
     def on_success(self, retval, task_id, args, kwargs):
         """Handler called on task success"""
-        if 'job_id' in kwargs:
+        if 'job_id' in kwargs and not kwargs.get('group_job_ids'):
             self._update_job_status(kwargs['job_id'], JobStatus.COMPLETED)
         return super().on_success(retval, task_id, args, kwargs)
     
     def on_failure(self, exc, task_id, args, kwargs, einfo):
         """Handler called on task failure"""
-        if 'job_id' in kwargs:
+        if 'job_id' in kwargs and not kwargs.get('group_job_ids'):
             self._update_job_status(
                 kwargs['job_id'], 
                 JobStatus.FAILED, 
@@ -22,6 +50,13 @@ class BaseTask(Task):
             )
         return super().on_failure(exc, task_id, args, kwargs, einfo)
     
+    @staticmethod
+    def _job_ids(kwargs):
+        """Jobs a task call belongs to: the whole group for a shared stage, else its job"""
+        if kwargs.get('group_job_ids'):
+            return list(kwargs['group_job_ids'])
+        return [kwargs['job_id']] if kwargs.get('job_id') is not None else []
+    
     def _update_job_status(self, job_id, status, error_message=None):
         """Update job status in database"""
         db = SessionLocal()
@@ -34,3 +69,85 @@ class BaseTask(Task):
             )
         finally:
             db.close()
+    
+    def _save_stages(self, trace, job_ids):
+        """Persist the spans of a trace for each job; instrumentation never fails the task"""
+        stages = [span.to_dict() for span in trace.spans]
+        db = SessionLocal()
+        try:
+            for job_id in job_ids:
+                try:
+                    save_job_stages(
+                        db=db,
+                        job_id=job_id,
+                        stages=stages,
+                        task_id=self.request.id
+                    )
+                except Exception:
+                    db.rollback()
+                    logger.exception("Could not save stages of job %s", job_id)
+        finally:
+            db.close()
+
+class StageTask(BaseTask):
+    """
+    Pipeline stage task that can run under the CPU and memory profiler.
+    
+    Pass ``profile=True`` with the task's keyword arguments, or set
+    PROFILE_TASKS, to profile it. The output is uploaded to the profiles
+    bucket and linked to the job.
+    """
+    
+    # ``profile`` is not a parameter of the task functions, so skip the
+    # argument check against their signatures when sending
+    typing = False
+    
+    def __call__(self, *args, **kwargs):
+        """Run the task, under the profiler if requested"""
+        profile = kwargs.pop('profile', False) or settings.PROFILE_TASKS
+        if not profile:
+            return super().__call__(*args, **kwargs)
+        
+        job_ids = self._job_ids(kwargs)
+        
+        task_name = self.name.rsplit('.', 1)[-1]
+        with tempfile.TemporaryDirectory() as output_dir:
+            profiler = TaskProfiler(output_dir, task_name, frames=settings.PROFILE_TRACEMALLOC_FRAMES)
+            try:
+                with profiler:
+                    return super().__call__(*args, **kwargs)
+            finally:
+                # Failed tasks are profiled too, they are often the interesting ones
+                if job_ids and profiler.artifacts:
+                    self._save_profiles(job_ids, task_name, profiler.artifacts)
+    
+    def _save_profiles(self, job_ids, task_name, artifacts):
+        """Upload profiler output once and link it to each job; profiling never fails the task"""
+        # A shared stage's output belongs to no single job
+        prefix = f"job_{job_ids[0]}" if len(job_ids) == 1 else "batch"
+        object_names = {}
+        for kind, path in artifacts.items():
+            object_name = f"profiles/{prefix}/{self.request.id}/{os.path.basename(path)}"
+            if upload_file(bucket_name=settings.BUCKET_PROFILES, object_name=object_name, file_path=path):
+                object_names[kind] = object_name
+        
+        if not object_names:
+            logger.warning("Could not upload profiles of jobs %s", job_ids)
+            return
+        
+        db = SessionLocal()
+        try:
+            for job_id in job_ids:
+                try:
+                    save_job_profiles(
+                        db=db,
+                        job_id=job_id,
+                        task_name=task_name,
+                        object_names=object_names,
+                        task_id=self.request.id
+                    )
+                except Exception:
+                    db.rollback()
+                    logger.exception("Could not save profiles of job %s", job_id)
+        finally:
+            db.close()
@@ -1,67 +1,130 @@
 import os
 import json
-import torch
 import numpy as np
+import rasterio
+import rasterio.shutil
 from datetime import datetime
+from shapely.geometry import mapping, shape
+from shapely.ops import unary_union
+from celery.utils.log import get_logger
 from app.core.celery_app import celery_app
 from app.tasks.base import BaseTask
+from app.tasks.worker import task_ingest, task_preprocess, task_predict, task_generate_report
 from app.db.session import SessionLocal
 from app.models.job import JobStatus
-from app.services.job_service import update_job_status
-from app.services.result_service import create_result
+from app.services.job_service import (
+    estimate_job_scratch_bytes, plan_incremental_run, save_job_scenes, update_job_status, update_jobs_status
+)
+from app.services.preprocess_service import reproject_and_clip
+from app.services.predict_service import summarize_prediction
+from app.services.result_service import create_result, record_job_timeseries
+from app.services.result_raster_service import open_result_raster
 from app.core.minio import upload_file
 from app.core.config import settings
+from app.core.scratch import create_job_workspace
+
+logger = get_logger(__name__)
 
 @celery_app.task(base=BaseTask, name="app.tasks.task_full_analysis")
-def task_full_analysis(job_id, region_geojson, start_date, end_date):
+def task_full_analysis(job_id, region_geojson, start_date, end_date, profile=False, parent_job_id=None):
     """
     Main task that orchestrates the full analysis pipeline:
     1. Data ingestion
     2. Preprocessing
     3. ML prediction
     4. Report generation
+    
+    With ``parent_job_id`` the job extends a prior job of the same region:
+    only scenes acquired after the prior job's end date are ingested and
+    masked, and the prior job's composites and, when the date range is the
+    prior job's own, its predictions are reused. With ``profile`` set, every
+    stage task runs under the profiler.
+    
+    Intermediate files are written to a scratch workspace admitted against
+    the worker's scratch quota; the maps are uploaded to the results bucket
+    and the workspace is deleted when the job ends, whether it succeeded
+    or not.
     """
     db = SessionLocal()
+    workspace = None
     try:
         # Update job status to processing
         update_job_status(db=db, job_id=job_id, status=JobStatus.PROCESSING)
         
-        # Step 1: Data ingestion
-        satellite_data = task_ingest.delay(
-            job_id=job_id,
-            region_geojson=region_geojson,
-            start_date=start_date,
-            end_date=end_date
-        ).get()
+        workspace = create_job_workspace(job_id, estimate_job_scratch_bytes(region_geojson))
         
-        # Step 2: Preprocessing
-        processed_data = task_preprocess.delay(
-            job_id=job_id,
-            satellite_data=satellite_data
-        ).get()
+        reuse = None
+        if parent_job_id is not None:
+            reuse = plan_incremental_run(db=db, parent_job_id=parent_job_id, start_date=start_date, end_date=end_date)
+            if reuse is None:
+                logger.warning("Job %s: products of job %s cannot be reused, running the full analysis", job_id, parent_job_id)
         
-        # Step 3: ML prediction
-        prediction_results = task_predict.delay(
-            job_id=job_id,
-            processed_data=processed_data
-        ).get()
+        prediction_results = None
+        # The moisture model's weather features cover the job's own range,
+        # so the prior maps only hold for exactly the prior job's range
+        if reuse and reuse["same_range"] and reuse["previous_job_id"]:
+            prediction_results = get_reusable_predictions(reuse["result"], workspace.path)
+        
+        if prediction_results is not None:
+            # Same scenes and weather as the prior job: its composites and maps still hold
+            scenes = reuse["scenes"]
+        else:
+            # Step 1: Data ingestion
+            satellite_data = run_stage(
+                task_ingest,
+                workspace,
+                job_id=job_id,
+                region_geojson=region_geojson,
+                start_date=start_date,
+                end_date=end_date,
+                imagery_start_date=reuse["imagery_start_date"] if reuse else None,
+                workspace_dir=workspace.path,
+                profile=profile
+            )
+            
+            # Step 2: Preprocessing
+            processed_data = run_stage(
+                task_preprocess,
+                workspace,
+                job_id=job_id,
+                satellite_data=satellite_data,
+                reuse={"scenes": reuse["scenes"], "previous_job_id": reuse["previous_job_id"]} if reuse else None,
+                workspace_dir=workspace.path,
+                profile=profile
+            )
+            scenes = processed_data["scenes"]
+            
+            # Step 3: ML prediction
+            prediction_results = run_stage(
+                task_predict,
+                workspace,
+                job_id=job_id,
+                processed_data=processed_data,
+                profile=profile
+            )
         
         # Step 4: Report generation
-        report_path = task_generate_report.delay(
+        report_path = run_stage(
+            task_generate_report,
+            workspace,
             job_id=job_id,
             prediction_results=prediction_results,
             region_geojson=region_geojson,
             start_date=start_date,
-            end_date=end_date
-        ).get()
+            end_date=end_date,
+            profile=profile
+        )
+        
+        # The maps outlive the workspace in the results bucket
+        map_objects = upload_result_maps(job_id, prediction_results)
         
         # Create result record
         create_result(
             db=db,
             result_data={
                 "job_id": job_id,
-                "soc_map_path": prediction_results["soc_map_path"],
-                "moisture_map_path": prediction_results["moisture_map_path"],
+                "soc_map_path": map_objects["soc_map_path"],
+                "moisture_map_path": map_objects["moisture_map_path"],
                 "report_path": report_path,
                 "soc_min": prediction_results["soc_stats"]["min"],
                 "soc_max": prediction_results["soc_stats"]["max"],
@@ -71,6 +134,14 @@ def task_full_analysis(job_id, region_geojson, start_date, end_date):
                 "moisture_mean": prediction_results["moisture_stats"]["mean"]
             }
         )
+        record_job_timeseries(
+            db=db,
+            job_id=job_id,
+            stats={"soc": prediction_results["soc_stats"], "moisture": prediction_results["moisture_stats"]}
+        )
+        
+        # Keep the masked scenes on record for the next incremental run
+        save_job_scenes(db=db, job_id=job_id, scenes=scenes)
         
         return {"status": "success", "job_id": job_id}
     
@@ -84,4 +155,220 @@ def task_full_analysis(job_id, region_geojson, start_date, end_date):
         )
         raise
     finally:
+        if workspace is not None:
+            release_workspace(workspace)
+        db.close()
+
+def run_stage(task, workspace, **kwargs):
+    """
+    Run a stage task on this worker's host and wait for its result.
+    
+    Stage tasks read and write the job's workspace, which only exists in
+    the container that created it, so they go to that host's own queue.
+    """
+    return task.apply_async(kwargs=kwargs, queue=workspace.queue).get()
+
+def upload_result_maps(job_id, prediction_results):
+    """
+    Upload a job's prediction maps to the results bucket.
+    
+    Returns:
+        Dictionary with the object names of the SOC and moisture maps
+    
+    Raises:
+        RuntimeError: If a map could not be uploaded
+    """
+    map_objects = {}
+    for layer in ("soc", "moisture"):
+        object_name = f"job_{job_id}/{layer}_map.tif"
+        if not upload_file(settings.BUCKET_RESULTS, object_name, prediction_results[f"{layer}_map_path"]):
+            raise RuntimeError(f"Failed to upload the {layer} map of job {job_id}")
+        map_objects[f"{layer}_map_path"] = object_name
+    return map_objects
+
+def release_workspace(workspace):
+    """Delete a job's scratch workspace and log what it used"""
+    used = workspace.cleanup()
+    logger.info(
+        "Released scratch workspace %s: %.1f MiB used of %.1f MiB reserved",
+        workspace.path, used / 2**20, workspace.reserved_bytes / 2**20
+    )
+
+def get_reusable_predictions(result, workspace_dir):
+    """
+    Get the prediction results of a prior job in the form task_predict returns them.
+    
+    The prior job's maps are copied into the workspace, so the report and
+    upload steps treat them like freshly predicted maps.
+    
+    Args:
+        result: Result of the prior job
+        workspace_dir: Scratch directory of the current job
+    
+    Returns:
+        Dictionary with the map paths and statistics, or None if the prior
+        job has no result or its maps can no longer be read
+    """
+    if result is None or not (result.soc_map_path and result.moisture_map_path):
+        return None
+    
+    # The Result row only keeps min/max/mean; the time series needs the full summary
+    paths = {}
+    stats = {}
+    for layer, path in (("soc", result.soc_map_path), ("moisture", result.moisture_map_path)):
+        paths[layer] = os.path.join(workspace_dir, f"{layer}_map.tif")
+        try:
+            with open_result_raster(path) as src:
+                rasterio.shutil.copy(src, paths[layer], driver="GTiff")
+                stats[layer] = summarize_prediction(src.read(1))
+        except (rasterio.errors.RasterioIOError, FileNotFoundError):
+            logger.warning("Map %s of the prior job can no longer be read", path)
+            return None
+    
+    return {
+        "soc_map_path": paths["soc"],
+        "moisture_map_path": paths["moisture"],
+        "soc_stats": stats["soc"],
+        "moisture_stats": stats["moisture"]
+    }
+
+@celery_app.task(base=BaseTask, name="app.tasks.task_batch_analysis")
+def task_batch_analysis(job_ids, regions_geojson, start_date, end_date, profile=False):
+    """
+    Run the analysis pipeline for a group of jobs sharing the same scenes.
+    
+    Ingest and preprocessing run once over the union of all regions; the
+    feature stack is then clipped to each job's region for prediction and
+    reporting. With ``profile`` set, every stage task runs under the profiler.
+    
+    The group shares one scratch workspace, sized for the union of its
+    regions and deleted once every job is done.
+    """
+    db = SessionLocal()
+    workspace = None
+    try:
+        update_jobs_status(db=db, job_ids=job_ids, status=JobStatus.PROCESSING)
+        
+        # Shared ingest over the union of the group's footprints
+        union_geojson = {
+            "type": "Feature",
+            "geometry": mapping(unary_union([shape(region["geometry"]) for region in regions_geojson])),
+            "properties": {"name": f"Batch of {len(job_ids)} regions"}
+        }
+        
+        workspace = create_job_workspace(job_ids[0], estimate_job_scratch_bytes(union_geojson))
+        
+        # The shared stages belong to the whole group: their stages and
+        # profiles are recorded for every job, and the group's status is
+        # set here. The first job only names their composites.
+        satellite_data = run_stage(
+            task_ingest,
+            workspace,
+            job_id=job_ids[0],
+            group_job_ids=job_ids,
+            region_geojson=union_geojson,
+            start_date=start_date,
+            end_date=end_date,
+            workspace_dir=workspace.path,
+            profile=profile
+        )
+        
+        # Shared preprocessing
+        processed_data = run_stage(
+            task_preprocess,
+            workspace,
+            job_id=job_ids[0],
+            group_job_ids=job_ids,
+            satellite_data=satellite_data,
+            workspace_dir=workspace.path,
+            profile=profile
+        )
+        
+        failed = []
+        for job_id, region_geojson in zip(job_ids, regions_geojson):
+            try:
+                # Clip the shared feature stack to this job's region, in a
+                # directory of its own so the jobs' predictions stay apart
+                job_dir = os.path.join(workspace.path, f"job_{job_id}")
+                os.makedirs(job_dir, exist_ok=True)
+                job_processed_data = dict(processed_data)
+                job_processed_data["feature_stack_path"] = reproject_and_clip(
+                    processed_data["feature_stack_path"],
+                    region_geojson,
+                    target_crs=settings.PROCESSING_CRS,
+                    output_path=os.path.join(job_dir, "feature_stack.tif")
+                )
+                
+                prediction_results = run_stage(
+                    task_predict,
+                    workspace,
+                    job_id=job_id,
+                    processed_data=job_processed_data,
+                    profile=profile
+                )
+                
+                report_path = run_stage(
+                    task_generate_report,
+                    workspace,
+                    job_id=job_id,
+                    prediction_results=prediction_results,
+                    region_geojson=region_geojson,
+                    start_date=start_date,
+                    end_date=end_date,
+                    profile=profile
+                )
+                
+                map_objects = upload_result_maps(job_id, prediction_results)
+                
+                create_result(
+                    db=db,
+                    result_data={
+                        "job_id": job_id,
+                        "soc_map_path": map_objects["soc_map_path"],
+                        "moisture_map_path": map_objects["moisture_map_path"],
+                        "report_path": report_path,
+                        "soc_min": prediction_results["soc_stats"]["min"],
+                        "soc_max": prediction_results["soc_stats"]["max"],
+                        "soc_mean": prediction_results["soc_stats"]["mean"],
+                        "moisture_min": prediction_results["moisture_stats"]["min"],
+                        "moisture_max": prediction_results["moisture_stats"]["max"],
+                        "moisture_mean": prediction_results["moisture_stats"]["mean"]
+                    }
+                )
+                
+                record_job_timeseries(
+                    db=db,
+                    job_id=job_id,
+                    stats={"soc": prediction_results["soc_stats"], "moisture": prediction_results["moisture_stats"]}
+                )
+            except Exception as e:
+                # A single bad field must not fail the whole group
+                db.rollback()
+                update_job_status(
+                    db=db,
+                    job_id=job_id,
+                    status=JobStatus.FAILED,
+                    error_message=str(e)
+                )
+                failed.append(job_id)
+        
+        succeeded = [job_id for job_id in job_ids if job_id not in failed]
+        if succeeded:
+            update_jobs_status(db=db, job_ids=succeeded, status=JobStatus.COMPLETED)
+        
+        return {"status": "success", "job_ids": succeeded, "failed_job_ids": failed}
+    
+    except Exception as e:
+        # Shared stages failed, so every job in the group failed
+        db.rollback()
+        update_jobs_status(
+            db=db,
+            job_ids=job_ids,
+            status=JobStatus.FAILED,
+            error_message=str(e)
+        )
+        raise
+    finally:
+        if workspace is not None:
+            release_workspace(workspace)
         db.close()
@@ -1,9 +1,24 @@
+import os
+import shutil
+from datetime import datetime
 from celery import Celery
+from celery.signals import celeryd_after_setup, worker_init, worker_process_init, worker_process_shutdown
+from celery.utils.log import get_logger
+from prometheus_client import CollectorRegistry, REGISTRY, multiprocess, start_http_server
 from app.core.config import settings
-from app.tasks.base import BaseTask
-from app.services.ingest_service import download_sentinel_data, download_landsat_data, download_soilgrids_data, download_weather_data
-from app.services.preprocess_service import apply_cloud_mask, compute_indices, reproject_and_clip, create_feature_stack
+from app.core.cpu import apply_torch_threads, get_thread_plan, get_thread_settings, pin_thread_env
+from app.core.scratch import get_host_queue, prune_scene_cache, touch_paths
+from app.db.session import reset_engine
+from app.tasks.base import StageTask
+from app.services.ingest_service import (
+    download_sentinel_data, download_landsat_data, download_soilgrids_data, download_weather_data, get_acquisition_date
+)
+from app.services.preprocess_service import (
+    apply_cloud_mask, compute_indices, reproject_and_clip, create_feature_stack, create_temporal_composite,
+    fuse_sources, get_composite_path, harmonize_landsat_to_sentinel, TargetGrid, LANDSAT_REFLECTANCE_BANDS
+)
 from app.services.predict_service import predict_soc, predict_moisture
+from app.services.weather_service import get_weather_features
 from app.services.report_service import generate_report
 
 # Initialize Celery
@@ -17,8 +32,72 @@ celery_app.conf.task_routes = {
     "app.tasks.worker.*": {"queue": "main-queue"}
 }
 
-@celery_app.task(base=BaseTask, name="app.tasks.worker.task_ingest")
-def task_ingest(job_id, region_geojson, start_date, end_date):
+if settings.WORKER_CONCURRENCY:
+    celery_app.conf.worker_concurrency = settings.WORKER_CONCURRENCY
+
+logger = get_logger(__name__)
+
+# CPU split between worker processes, decided in the parent before forking
+thread_plan = None
+
+@worker_init.connect
+def init_worker(sender=None, **kwargs):
+    """Partition CPUs between the worker's child processes"""
+    global thread_plan
+    thread_plan = get_thread_plan(concurrency=getattr(sender, "concurrency", None))
+    pin_thread_env(thread_plan["intra_op_threads"])
+    logger.info(
+        "Worker thread plan: %(concurrency)s processes on %(cpus)s CPUs, "
+        "%(intra_op_threads)s intra-op / %(inter_op_threads)s inter-op threads each",
+        thread_plan
+    )
+    
+    if settings.WORKER_METRICS_PORT:
+        start_metrics_server(settings.WORKER_METRICS_PORT)
+
+@celeryd_after_setup.connect
+def consume_host_queue(sender, instance, **kwargs):
+    """Also consume this host's queue, which receives the stage tasks of jobs whose workspace is here"""
+    instance.app.amqp.queues.select_add(get_host_queue())
+    logger.info("Consuming stage tasks from %s", get_host_queue())
+
+def start_metrics_server(port):
+    """
+    Serve the stage metrics of all worker processes from the parent process.
+    
+    Child processes only share their metrics when PROMETHEUS_MULTIPROC_DIR
+    is set; without it only the parent's own metrics are served.
+    """
+    registry = REGISTRY
+    multiproc_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if multiproc_dir:
+        # Files left by a previous run would be added to this run's counters
+        os.makedirs(multiproc_dir, exist_ok=True)
+        for name in os.listdir(multiproc_dir):
+            if name.endswith(".db"):
+                os.remove(os.path.join(multiproc_dir, name))
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    
+    start_http_server(port, registry=registry)
+    logger.info("Serving worker metrics on port %s", port)
+
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    """Drop database connections inherited from the parent worker process and apply the thread plan"""
+    reset_engine()
+    
+    effective = apply_torch_threads(thread_plan or get_thread_plan())
+    logger.info("Worker process %(pid)s: %(intra_op_threads)s intra-op / %(inter_op_threads)s inter-op threads", effective)
+
+@worker_process_shutdown.connect
+def shutdown_worker_process(pid=None, **kwargs):
+    """Drop the live gauges of a worker process that exits"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid or os.getpid())
+
+@celery_app.task(base=StageTask, name="app.tasks.worker.task_ingest")
+def task_ingest(job_id, region_geojson, start_date, end_date, imagery_start_date=None, workspace_dir=None):
     """
     Task to ingest satellite imagery and ancillary data.
     
@@ -27,86 +106,202 @@ def task_ingest(job_id, region_geojson, start_date, end_date):
         region_geojson: GeoJSON representation of the region of interest
         start_date: Start date for the search (ISO format string)
         end_date: End date for the search (ISO format string)
+        imagery_start_date: Start date for the imagery search when earlier
+            scenes are reused from a prior job (optional, ISO format string);
+            no imagery is downloaded if it is after ``end_date``
+        workspace_dir: Job scratch directory for the SoilGrids extract
+            (optional)
         
     Returns:
         Dictionary with paths to downloaded data
     """
-    # Download Sentinel-2 data
-    sentinel_paths = download_sentinel_data(region_geojson, start_date, end_date)
-    
-    # Download Landsat data
-    landsat_paths = download_landsat_data(region_geojson, start_date, end_date)
+    imagery_start_date = imagery_start_date or start_date
+    sentinel_paths = []
+    landsat_paths = []
+    if datetime.fromisoformat(imagery_start_date).date() <= datetime.fromisoformat(end_date).date():
+        # Download Sentinel-2 data
+        sentinel_paths = download_sentinel_data(region_geojson, imagery_start_date, end_date)
+        
+        # Download Landsat data
+        landsat_paths = download_landsat_data(region_geojson, imagery_start_date, end_date)
+        
+        # Scenes reused from the shared directory must survive its eviction
+        touch_paths(sentinel_paths + landsat_paths)
     
-    # Download SoilGrids data
-    soilgrids_path = download_soilgrids_data(region_geojson)
+    # Read the region's SoilGrids window from the tile store
+    soilgrids_path = download_soilgrids_data(region_geojson, output_dir=workspace_dir)
     
-    # Download weather data
+    # Download weather data and aggregate it into the moisture model's features
     weather_path = download_weather_data(region_geojson, start_date, end_date)
+    weather_features = get_weather_features(weather_path, start_date, end_date)
     
     return {
         "sentinel_paths": sentinel_paths,
         "landsat_paths": landsat_paths,
         "soilgrids_path": soilgrids_path,
-        "weather_path": weather_path
+        "weather_path": weather_path,
+        "weather_features": weather_features,
+        "region_geojson": region_geojson
     }
 
-@celery_app.task(base=BaseTask, name="app.tasks.worker.task_preprocess")
-def task_preprocess(job_id, satellite_data):
+@celery_app.task(base=StageTask, name="app.tasks.worker.task_preprocess")
+def task_preprocess(job_id, satellite_data, reuse=None, workspace_dir=None):
     """
     Task to preprocess satellite imagery.
     
+    Cloud-masked scenes and composites stay next to the ingested scenes,
+    where later incremental runs find them; everything derived from the
+    composites is written to ``workspace_dir``.
+    
     Args:
         job_id: Job ID
         satellite_data: Dictionary with paths to satellite data
+        reuse: Products of a prior job to build on, as returned by
+            plan_incremental_run (optional). Its cloud-masked scenes are
+            composited with the new ones instead of being masked again.
+        workspace_dir: Job scratch directory (optional, defaults to the
+            composite's directory)
         
     Returns:
         Dictionary with paths to preprocessed data
     """
-    # Apply cloud masking to Sentinel-2 data
-    masked_sentinel_paths = []
-    for path in satellite_data["sentinel_paths"]:
-        masked_path = apply_cloud_mask(path, is_sentinel=True)
-        masked_sentinel_paths.append(masked_path)
-    
-    # Apply cloud masking to Landsat data
-    masked_landsat_paths = []
-    for path in satellite_data["landsat_paths"]:
-        masked_path = apply_cloud_mask(path, is_sentinel=False)
-        masked_landsat_paths.append(masked_path)
-    
-    # Compute indices for Sentinel-2 data
-    sentinel_indices = {}
-    for path in masked_sentinel_paths:
-        indices = compute_indices(path, is_sentinel=True)
-        sentinel_indices[path] = indices
-    
-    # Compute indices for Landsat data
-    landsat_indices = {}
-    for path in masked_landsat_paths:
-        indices = compute_indices(path, is_sentinel=False)
-        landsat_indices[path] = indices
-    
-    # Create a feature stack
-    # For simplicity, we'll use the first Sentinel-2 image and its indices
-    sentinel_path = masked_sentinel_paths[0]
-    indices_paths = sentinel_indices[sentinel_path]
-    
-    # Create a feature stack
+    reuse = reuse or {"scenes": [], "previous_job_id": None}
+    
+    def workspace_path(name):
+        return os.path.join(workspace_dir, name) if workspace_dir else None
+    
+    # Apply cloud masking to the newly ingested scenes only
+    scenes = list(reuse["scenes"])
+    new_masked = {"sentinel2": [], "landsat": []}
+    for sensor, paths in (("sentinel2", satellite_data["sentinel_paths"]), ("landsat", satellite_data["landsat_paths"])):
+        for path in paths:
+            masked_path = apply_cloud_mask(path, is_sentinel=sensor == "sentinel2")
+            new_masked[sensor].append(masked_path)
+            scenes.append({
+                "sensor": sensor,
+                "acquired_at": get_acquisition_date(path).isoformat(),
+                "scene_path": path,
+                "masked_path": masked_path
+            })
+    
+    masked_sentinel_paths = [scene["masked_path"] for scene in scenes if scene["sensor"] == "sentinel2"]
+    masked_landsat_paths = [scene["masked_path"] for scene in scenes if scene["sensor"] == "landsat"]
+    
+    # Combine all cloud-masked Sentinel-2 scenes in the date range
+    composite_path = update_composite(
+        job_id,
+        masked_sentinel_paths,
+        new_masked["sentinel2"],
+        reuse["previous_job_id"]
+    )
+    
+    # The Sentinel-2 composite defines the grid shared by all sources
+    grid = TargetGrid.from_raster(composite_path)
+    
+    # Fill pixels that were cloudy on every Sentinel-2 date with Landsat,
+    # composited once and resampled onto the Sentinel-2 grid
+    fused_path = composite_path
+    harmonized_landsat_path = None
+    cached_paths = [composite_path]
+    if masked_landsat_paths:
+        landsat_composite_path = update_composite(
+            job_id,
+            masked_landsat_paths,
+            new_masked["landsat"],
+            reuse["previous_job_id"],
+            sensor="landsat",
+            red_band=3,
+            nir_band=4,
+            bands=LANDSAT_REFLECTANCE_BANDS
+        )
+        cached_paths.append(landsat_composite_path)
+        harmonized_landsat_path = harmonize_landsat_to_sentinel(
+            landsat_composite_path,
+            grid,
+            output_path=workspace_path("harmonized_landsat.tif")
+        )
+        fused_path = fuse_sources(composite_path, harmonized_landsat_path, output_path=workspace_path("fused.tif"))
+    
+    # Compute indices for the fused composite
+    indices = compute_indices(fused_path, is_sentinel=True, output_dir=workspace_dir)
+    
+    # Create a feature stack from the fused composite and its indices
     feature_stack_path = create_feature_stack(
-        [sentinel_path],
-        indices_paths,
-        satellite_data["region_geojson"]
+        [fused_path],
+        indices,
+        satellite_data["region_geojson"],
+        output_path=workspace_path("feature_stack.tif")
+    )
+    
+    # Warp the feature stack to the processing CRS and clip it to the region
+    feature_stack_path = reproject_and_clip(
+        feature_stack_path,
+        satellite_data["region_geojson"],
+        target_crs=settings.PROCESSING_CRS,
+        output_path=workspace_path("feature_stack_clipped.tif")
     )
     
+    # Mark this job's scenes and composites as used, then evict the least
+    # recently used files of the shared scene directory beyond its quota
+    touch_paths(cached_paths + [path for scene in scenes for path in (scene["scene_path"], scene["masked_path"])])
+    prune_scene_cache()
+    
     return {
         "feature_stack_path": feature_stack_path,
+        "composite_path": composite_path,
+        "fused_path": fused_path,
+        "harmonized_landsat_path": harmonized_landsat_path,
         "masked_sentinel_paths": masked_sentinel_paths,
         "masked_landsat_paths": masked_landsat_paths,
-        "sentinel_indices": sentinel_indices,
-        "landsat_indices": landsat_indices
+        "indices": indices,
+        "scenes": scenes,
+        "weather_features": satellite_data.get("weather_features")
     }
 
-@celery_app.task(base=BaseTask, name="app.tasks.worker.task_predict")
+def update_composite(job_id, masked_paths, new_masked_paths, previous_job_id=None, sensor="sentinel2", **kwargs):
+    """
+    Build a job's temporal composite for one sensor.
+    
+    A "best_pixel" composite of the prior job is updated with the new scenes
+    only; otherwise every masked scene is composited again, which is still
+    far cheaper than ingesting and masking them.
+    
+    Args:
+        job_id: Job ID
+        masked_paths: All cloud-masked scenes of the job's date range
+        new_masked_paths: Scenes among them that the prior job did not use
+        previous_job_id: Prior job whose composite covers exactly the other
+            scenes (optional)
+        sensor: "sentinel2" or "landsat"
+        **kwargs: Band arguments passed to create_temporal_composite
+    
+    Returns:
+        Path to the composite image
+    """
+    method = settings.COMPOSITE_METHOD
+    directory = os.path.dirname(masked_paths[0]) if masked_paths else None
+    
+    previous_path = None
+    if previous_job_id is not None and method == "best_pixel" and directory:
+        previous_path = get_composite_path(directory, method, previous_job_id, sensor)
+        if not os.path.exists(previous_path):
+            previous_path = None
+    
+    output_path = get_composite_path(directory, method, job_id, sensor) if directory else None
+    if previous_path and not new_masked_paths:
+        # Nothing new for this sensor; keep a copy under this job for the next run
+        shutil.copyfile(previous_path, output_path)
+        return output_path
+    
+    return create_temporal_composite(
+        new_masked_paths if previous_path else masked_paths,
+        method=method,
+        output_path=output_path,
+        previous_path=previous_path,
+        **kwargs
+    )
+
+@celery_app.task(base=StageTask, name="app.tasks.worker.task_predict")
 def task_predict(job_id, processed_data):
     """
     Task to predict soil properties.
@@ -122,16 +317,20 @@ def task_predict(job_id, processed_data):
     soc_path, soc_stats = predict_soc(processed_data["feature_stack_path"])
     
     # Predict moisture
-    moisture_path, moisture_stats = predict_moisture(processed_data["feature_stack_path"])
+    moisture_path, moisture_stats = predict_moisture(
+        processed_data["feature_stack_path"],
+        weather_features=processed_data.get("weather_features")
+    )
     
     return {
         "soc_map_path": soc_path,
         "moisture_map_path": moisture_path,
         "soc_stats": soc_stats,
-        "moisture_stats": moisture_stats
+        "moisture_stats": moisture_stats,
+        "threads": get_thread_settings()
     }
 
-@celery_app.task(base=BaseTask, name="app.tasks.worker.task_generate_report")
+@celery_app.task(base=StageTask, name="app.tasks.worker.task_generate_report")
 def task_generate_report(job_id, prediction_results, region_geojson, start_date, end_date):
     """
     Task to generate a report.
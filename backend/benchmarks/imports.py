@@ -0,0 +1,136 @@
+"""
+Measure import time and memory of the API and worker entry points.
+
+Every import runs in a fresh interpreter with ``-X importtime``, so results
+reflect a cold process start. Run from the backend directory:
+
+    python -m benchmarks.imports --repeat 5
+    python -m benchmarks.imports --modules app.services.predict_service --top 20
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+# Process entry points and what their import must not pull in
+ENTRY_POINTS = {
+    "app.main": ("torch", "matplotlib", "geopandas", "pandas", "cv2"),
+    "app.tasks.worker": ("torch", "matplotlib", "geopandas", "pandas", "cv2"),
+    "app.tasks.tasks": ("torch", "matplotlib", "geopandas", "pandas", "cv2"),
+}
+
+# Scientific stacks reported for every import
+HEAVY_MODULES = ("torch", "matplotlib", "geopandas", "pandas", "cv2", "rasterio", "numpy")
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+from app.core.resources import read_rss
+json.dump({{"seconds": seconds, "rss_bytes": read_rss(), "modules": sorted(sys.modules)}}, sys.stdout)
+"""
+
+def parse_importtime(output):
+    """
+    Parse ``-X importtime`` output.
+    
+    Returns:
+        List of (module, self_microseconds, cumulative_microseconds, depth)
+    """
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return entries
+
+def measure_import(module, top=10):
+    """
+    Import a module in a fresh interpreter.
+    
+    Args:
+        module: Module to import
+        top: Number of packages to report by self time
+    
+    Returns:
+        Dictionary with the import time, RSS after import, heavy modules
+        loaded and the packages that took the most time
+    """
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE.format(module=module)],
+        cwd=backend_dir,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    probe = json.loads(completed.stdout)
+    
+    # Self time summed per top-level package
+    packages = defaultdict(int)
+    for name, self_us, _, _ in parse_importtime(completed.stderr):
+        packages[name.split(".")[0]] += self_us
+    slowest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    
+    loaded = set(probe["modules"])
+    return {
+        "module": module,
+        "seconds": probe["seconds"],
+        "rss_bytes": probe["rss_bytes"],
+        "heavy_modules": [name for name in HEAVY_MODULES if name in loaded],
+        "unexpected_modules": [name for name in ENTRY_POINTS.get(module, ()) if name in loaded],
+        "slowest_packages": [{"package": name, "seconds": us / 1e6} for name, us in slowest]
+    }
+
+def run(modules, repeat=3, top=10):
+    """
+    Measure each module ``repeat`` times and keep the median run.
+    
+    Returns:
+        List of measure_import results
+    """
+    results = []
+    for module in modules:
+        runs = sorted((measure_import(module, top) for _ in range(repeat)), key=lambda result: result["seconds"])
+        result = runs[len(runs) // 2]
+        result["runs"] = [run["seconds"] for run in runs]
+        results.append(result)
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold import time of the API and worker")
+    parser.add_argument("--modules", nargs="+", default=list(ENTRY_POINTS), help="Modules to import")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10, help="Slowest packages to report")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args(argv)
+    
+    results = run(args.modules, args.repeat, args.top)
+    for result in results:
+        print(
+            f"{result['module']:<32}{result['seconds']:7.2f} s  {result['rss_bytes'] / 2**20:6.0f} MiB  "
+            f"heavy: {', '.join(result['heavy_modules']) or '-'}",
+            file=sys.stderr
+        )
+    
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    
+    # Non-zero exit when an entry point pulls in a stack it should load lazily
+    if any(result["unexpected_modules"] for result in results):
+        for result in results:
+            if result["unexpected_modules"]:
+                print(f"{result['module']} imports {', '.join(result['unexpected_modules'])} at load", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmark model inference variants on CPU.
+
+Run from the backend directory:
+
+    python -m benchmarks.inference --batch-size 8 --tile-size 256 --output inference.json
+"""
+import argparse
+import json
+import sys
+import time
+
+import torch
+
+from app.services.predict_service import (
+    MODEL_IN_CHANNELS, MODEL_VARIANTS, SoilCNN, calibration_inputs, check_accuracy, optimize_model, to_model_input
+)
+
+def time_model(model, x, iterations, warmup=3):
+    """
+    Time forward passes of a model.
+    
+    Args:
+        model: Model to run
+        x: Input batch
+        iterations: Number of timed forward passes
+        warmup: Number of untimed forward passes
+    
+    Returns:
+        Median seconds per forward pass
+    """
+    timings = []
+    with torch.no_grad():
+        for _ in range(warmup):
+            model(x)
+        for _ in range(iterations):
+            start = time.perf_counter()
+            model(x)
+            timings.append(time.perf_counter() - start)
+    
+    timings.sort()
+    return timings[len(timings) // 2]
+
+def benchmark_variants(variants=MODEL_VARIANTS, batch_size=8, tile_size=256, iterations=20, channels_last_options=(False, True)):
+    """
+    Measure throughput and accuracy of each inference variant.
+    
+    Args:
+        variants: Variants to benchmark
+        batch_size: Tiles per forward pass
+        tile_size: Height and width of each tile
+        iterations: Timed forward passes per variant
+        channels_last_options: Memory formats to benchmark
+    
+    Returns:
+        List of result dictionaries, one per variant and memory format
+    """
+    model = SoilCNN(in_channels=MODEL_IN_CHANNELS).eval()
+    batch = torch.rand(batch_size, MODEL_IN_CHANNELS, tile_size, tile_size, generator=torch.Generator().manual_seed(0))
+    
+    results = []
+    baseline = None
+    for variant in variants:
+        for channels_last in channels_last_options:
+            optimized = optimize_model(model, variant, channels_last=channels_last)
+            seconds = time_model(optimized, to_model_input(batch, channels_last), iterations)
+            if baseline is None:
+                baseline = seconds
+            
+            results.append({
+                "variant": variant,
+                "channels_last": channels_last,
+                "latency_ms": seconds * 1000,
+                "tiles_per_second": batch_size / seconds,
+                "speedup": baseline / seconds,
+                **check_accuracy(model, optimized, calibration_inputs(seed=1), channels_last=channels_last)
+            })
+    
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark model inference variants")
+    parser.add_argument("--variants", nargs="+", default=list(MODEL_VARIANTS), choices=MODEL_VARIANTS)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--tile-size", type=int, default=256)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--threads", type=int, help="torch intra-op threads (default: torch's choice)")
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args(argv)
+    
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    
+    report = {
+        "torch_version": torch.__version__,
+        "quantized_engine": torch.backends.quantized.engine,
+        "num_threads": torch.get_num_threads(),
+        "batch_size": args.batch_size,
+        "tile_size": args.tile_size,
+        "results": benchmark_variants(args.variants, args.batch_size, args.tile_size, args.iterations)
+    }
+    
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Benchmark ingest through StacProvider against the local STAC stand-in at
+several latencies and throughputs.
+
+Each case starts a fresh stand-in and downloads Sentinel-2, Landsat,
+SoilGrids and weather for one region into an empty directory, so the
+numbers include every search and range request. Run from the backend
+directory:
+
+    python -m benchmarks.ingest --latency-ms 0 50 200 --throughput-mbps 0 100 20
+    python -m benchmarks.ingest --region-deg 0.5 --tile-pixels 4096 --days 90 --concurrency 1 8
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from app.services.ingest_providers import StacProvider
+from benchmarks.stac_server import start_server
+
+def run_case(latency_ms, throughput_mbps, concurrency=4, region_deg=0.2, days=30, tile_pixels=2048, origin=(10.9, 45.9)):
+    """
+    Download one region's imagery and ancillary data.
+    
+    Args:
+        latency_ms: Stand-in delay before every response
+        throughput_mbps: Stand-in response rate (0 = unlimited)
+        concurrency: Scenes fetched at once
+        region_deg: Width and height of the region in degrees
+        days: Length of the date range
+        tile_pixels: Width and height of the stand-in's assets
+        origin: (lon, lat) of the region's south-west corner
+    
+    Returns:
+        Dictionary with wall time, requests, bytes transferred and scenes written
+    """
+    minx, miny = origin
+    bbox = (minx, miny, minx + region_deg, miny + region_deg)
+    end_date = date(2023, 6, 30)
+    start_date = (end_date - timedelta(days=days - 1)).isoformat()
+    
+    with tempfile.TemporaryDirectory() as tmpdir:
+        server_dir = os.path.join(tmpdir, "server")
+        os.makedirs(server_dir)
+        server = start_server(server_dir, latency_ms=latency_ms, throughput_mbps=throughput_mbps, tile_pixels=tile_pixels)
+        try:
+            # Generate the assets up front so only transfer time is measured
+            warmup = StacProvider(server.url, os.path.join(tmpdir, "warmup"))
+            for product in ("sentinel2", "landsat"):
+                for item in warmup.search(product, bbox, start_date, end_date.isoformat()):
+                    server.asset_path(item.id)
+            for x, y in server.tiles(bbox):
+                server.asset_path(f"soilgrids_soc_{x}_{y}")
+            server.requests, server.bytes_sent = 0, 0
+            
+            provider = StacProvider(server.url, os.path.join(tmpdir, "ingest"), max_concurrency=concurrency)
+            start = time.perf_counter()
+            scenes = []
+            for product in ("sentinel2", "landsat"):
+                scenes += provider.fetch_scenes(provider.search(product, bbox, start_date, end_date.isoformat()), bbox)
+            provider.fetch_soilgrids(bbox)
+            provider.fetch_weather(minx + region_deg / 2, miny + region_deg / 2, start_date, end_date.isoformat())
+            seconds = time.perf_counter() - start
+            
+            asset_bytes = sum(os.path.getsize(os.path.join(server_dir, name)) for name in os.listdir(server_dir) if not name.startswith("soilgrids"))
+        finally:
+            server.shutdown()
+            server.server_close()
+    
+    return {
+        "latency_ms": latency_ms,
+        "throughput_mbps": throughput_mbps,
+        "concurrency": concurrency,
+        "seconds": seconds,
+        "requests": server.requests,
+        "bytes_transferred": server.bytes_sent,
+        "imagery_asset_bytes": asset_bytes,
+        "scenes": len(scenes)
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark STAC ingest against the local stand-in")
+    parser.add_argument("--latency-ms", nargs="+", type=float, default=[0, 50, 200])
+    parser.add_argument("--throughput-mbps", nargs="+", type=float, default=[0, 100, 20], help="0 = unlimited")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4], help="Scenes fetched at once")
+    parser.add_argument("--region-deg", type=float, default=0.2)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--tile-pixels", type=int, default=2048)
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args(argv)
+    
+    results = []
+    for latency_ms in args.latency_ms:
+        for throughput_mbps in args.throughput_mbps:
+            for concurrency in args.concurrency:
+                result = run_case(latency_ms, throughput_mbps, concurrency, args.region_deg, args.days, args.tile_pixels)
+                results.append(result)
+                print(
+                    f"latency {latency_ms:6.0f} ms  throughput {throughput_mbps or float('inf'):6.0f} Mbit/s  "
+                    f"concurrency {concurrency:2d}  {result['seconds']:7.2f} s  {result['requests']:5d} requests  "
+                    f"{result['bytes_transferred'] / 2**20:7.1f} of {result['imagery_asset_bytes'] / 2**20:.1f} MiB",
+                    file=sys.stderr
+                )
+    
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,426 @@
+"""
+Benchmark the preprocessing, prediction and report services on synthetic
+scenes of several sizes.
+
+Every case runs in a fresh process so peak RSS and caches are its own.
+Wall time, CPU time, peak RSS, bytes read/written and output size are
+saved as JSON; pass an earlier result file to --compare to flag
+regressions. Run from the backend directory:
+
+    python -m benchmarks.pipeline --sizes 256 1024 4096
+    python -m benchmarks.pipeline --sizes 10000 --cases compute_indices predict_soc
+    python -m benchmarks.pipeline --compare benchmarks/results/pipeline-20240101-120000.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+
+from app.core.resources import ResourceMeter
+from benchmarks.synthetic import region_geojson, write_landsat_scene, write_sentinel_scene
+
+DEFAULT_SIZES = (256, 1024, 4096)
+
+# Sentinel-2 and Landsat scenes in the synthetic date range
+SENTINEL_SCENES = 3
+LANDSAT_SCENES = 2
+
+# Metric CRS the clip case warps into (UTM zone of the synthetic scenes)
+CLIP_CRS = "EPSG:32632"
+
+class SkipCase(Exception):
+    """Raised by a case whose requirements are not available"""
+
+def _link(path, workdir):
+    # Services write next to their inputs, so each case works on links in its own directory
+    target = os.path.join(workdir, os.path.basename(path))
+    os.symlink(os.path.abspath(path), target)
+    return target
+
+def _directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            full = os.path.join(root, name)
+            if not os.path.islink(full):
+                total += os.path.getsize(full)
+    return total
+
+def prepare_inputs(size, directory):
+    """
+    Write synthetic scenes and the intermediate products cases start from.
+    
+    Args:
+        size: Scene width and height in pixels
+        directory: Directory for the inputs
+    
+    Returns:
+        Dictionary of input paths
+    """
+    from app.services.predict_service import predict_soc
+    from app.services.preprocess_service import (
+        LANDSAT_REFLECTANCE_BANDS, apply_cloud_mask, compute_indices, create_feature_stack, create_temporal_composite
+    )
+    
+    sentinel = [write_sentinel_scene(os.path.join(directory, f"sentinel_{i}.tif"), size, seed=i) for i in range(SENTINEL_SCENES)]
+    landsat = [write_landsat_scene(os.path.join(directory, f"landsat_{i}.tif"), size, seed=100 + i) for i in range(LANDSAT_SCENES)]
+    masked_sentinel = [apply_cloud_mask(path, is_sentinel=True) for path in sentinel]
+    masked_landsat = [apply_cloud_mask(path, is_sentinel=False) for path in landsat]
+    
+    composite = create_temporal_composite(masked_sentinel, output_path=os.path.join(directory, "composite.tif"))
+    landsat_composite = create_temporal_composite(
+        masked_landsat,
+        output_path=os.path.join(directory, "landsat_composite.tif"),
+        red_band=3,
+        nir_band=4,
+        bands=LANDSAT_REFLECTANCE_BANDS
+    )
+    indices = compute_indices(composite, is_sentinel=True)
+    region = region_geojson(size)
+    feature_stack = create_feature_stack([composite], indices, region)
+    soc_map, soc_stats = predict_soc(feature_stack)
+    
+    return {
+        "size": size,
+        "sentinel": sentinel,
+        "landsat": landsat,
+        "masked_sentinel": masked_sentinel,
+        "masked_landsat": masked_landsat,
+        "composite": composite,
+        "landsat_composite": landsat_composite,
+        "indices": indices,
+        "feature_stack": feature_stack,
+        "soc_map": soc_map,
+        "soc_stats": soc_stats,
+        "region": region
+    }
+
+def case_apply_cloud_mask(inputs, workdir):
+    from app.services.preprocess_service import apply_cloud_mask
+    path = _link(inputs["sentinel"][0], workdir)
+    return lambda: apply_cloud_mask(path, is_sentinel=True), 1
+
+def case_create_temporal_composite(inputs, workdir):
+    from app.services.preprocess_service import create_temporal_composite
+    paths = [_link(path, workdir) for path in inputs["masked_sentinel"]]
+    return lambda: create_temporal_composite(paths), len(paths)
+
+def case_harmonize_and_fuse(inputs, workdir):
+    from app.services.preprocess_service import TargetGrid, fuse_sources, harmonize_landsat_to_sentinel
+    composite = _link(inputs["composite"], workdir)
+    landsat = _link(inputs["landsat_composite"], workdir)
+    
+    def run():
+        harmonized = harmonize_landsat_to_sentinel(landsat, TargetGrid.from_raster(composite))
+        return fuse_sources(composite, harmonized)
+    
+    return run, 2
+
+def case_compute_indices(inputs, workdir):
+    from app.services.preprocess_service import compute_indices
+    path = _link(inputs["composite"], workdir)
+    return lambda: compute_indices(path, is_sentinel=True), 1
+
+def case_create_feature_stack(inputs, workdir):
+    from app.services.preprocess_service import create_feature_stack
+    composite = _link(inputs["composite"], workdir)
+    indices = {name: _link(path, workdir) for name, path in inputs["indices"].items()}
+    return lambda: create_feature_stack([composite], indices, inputs["region"]), 1
+
+def case_reproject_and_clip(inputs, workdir):
+    from app.services.preprocess_service import reproject_and_clip
+    path = _link(inputs["feature_stack"], workdir)
+    return lambda: reproject_and_clip(path, inputs["region"], target_crs=CLIP_CRS), 1
+
+def case_predict_soc(inputs, workdir):
+    from app.services.predict_service import predict_soc
+    path = _link(inputs["feature_stack"], workdir)
+    return lambda: predict_soc(path), 1
+
+def case_generate_map_image(inputs, workdir):
+    from app.services.report_service import generate_map_image
+    path = _link(inputs["soc_map"], workdir)
+    stats = inputs["soc_stats"]
+    return lambda: generate_map_image(path, os.path.join(workdir, "soc_map.png"), "SOC", vmin=stats["min"], vmax=stats["max"]), 1
+
+def case_generate_histogram(inputs, workdir):
+    from app.services.report_service import generate_histogram
+    path = _link(inputs["soc_map"], workdir)
+    return lambda: generate_histogram(path, os.path.join(workdir, "soc_histogram.png"), "SOC"), 1
+
+def case_generate_report(inputs, workdir):
+    if shutil.which("wkhtmltopdf") is None:
+        raise SkipCase("wkhtmltopdf is not installed")
+    
+    from app.services.report_service import generate_report
+    path = _link(inputs["soc_map"], workdir)
+    stats = inputs["soc_stats"]
+    job_id = f"benchmark_{inputs['size']}"
+    return lambda: generate_report(job_id, path, path, stats, stats, inputs["region"], "2024-01-01", "2024-03-31"), 1
+
+def case_pipeline(inputs, workdir):
+    from app.services.predict_service import predict_moisture, predict_soc
+    from app.services.preprocess_service import (
+        LANDSAT_REFLECTANCE_BANDS, TargetGrid, apply_cloud_mask, compute_indices, create_feature_stack,
+        create_temporal_composite, fuse_sources, harmonize_landsat_to_sentinel, reproject_and_clip
+    )
+    from app.services.report_service import generate_histogram, generate_map_image
+    
+    sentinel = [_link(path, workdir) for path in inputs["sentinel"]]
+    landsat = [_link(path, workdir) for path in inputs["landsat"]]
+    region = inputs["region"]
+    
+    def run():
+        # Same steps as task_preprocess, task_predict and the raster part of task_generate_report
+        masked_sentinel = [apply_cloud_mask(path, is_sentinel=True) for path in sentinel]
+        masked_landsat = [apply_cloud_mask(path, is_sentinel=False) for path in landsat]
+        composite = create_temporal_composite(masked_sentinel)
+        landsat_composite = create_temporal_composite(
+            masked_landsat,
+            output_path=os.path.join(workdir, "landsat_composite.tif"),
+            red_band=3,
+            nir_band=4,
+            bands=LANDSAT_REFLECTANCE_BANDS
+        )
+        harmonized = harmonize_landsat_to_sentinel(landsat_composite, TargetGrid.from_raster(composite))
+        fused = fuse_sources(composite, harmonized)
+        indices = compute_indices(fused, is_sentinel=True)
+        feature_stack = reproject_and_clip(create_feature_stack([fused], indices, region), region)
+        
+        for name, predict in (("soc", predict_soc), ("moisture", predict_moisture)):
+            map_path, stats = predict(feature_stack)
+            generate_map_image(map_path, os.path.join(workdir, f"{name}_map.png"), name, vmin=stats["min"], vmax=stats["max"])
+            generate_histogram(map_path, os.path.join(workdir, f"{name}_histogram.png"), name)
+    
+    return run, len(sentinel) + len(landsat)
+
+CASES = {
+    "apply_cloud_mask": case_apply_cloud_mask,
+    "create_temporal_composite": case_create_temporal_composite,
+    "harmonize_and_fuse": case_harmonize_and_fuse,
+    "compute_indices": case_compute_indices,
+    "create_feature_stack": case_create_feature_stack,
+    "reproject_and_clip": case_reproject_and_clip,
+    "predict_soc": case_predict_soc,
+    "generate_map_image": case_generate_map_image,
+    "generate_histogram": case_generate_histogram,
+    "generate_report": case_generate_report,
+    "pipeline": case_pipeline,
+}
+
+def _run_case_in_child(name, inputs, workdir, connection):
+    try:
+        run, scenes = CASES[name](inputs, workdir)
+        with ResourceMeter() as meter:
+            run()
+        result = dict(meter.usage)
+        result["output_bytes"] = _directory_size(workdir)
+        result["pixels"] = inputs["size"] * inputs["size"] * scenes
+        connection.send(("ok", result))
+    except SkipCase as e:
+        connection.send(("skipped", str(e)))
+    except Exception as e:
+        connection.send(("error", f"{type(e).__name__}: {e}"))
+    finally:
+        connection.close()
+
+def run_case(name, inputs, workdir):
+    """
+    Run one case in a fresh process.
+    
+    Args:
+        name: Case name (key of CASES)
+        inputs: Dictionary returned by prepare_inputs
+        workdir: Empty directory for the case's outputs
+    
+    Returns:
+        Tuple of (status, result): status is "ok", "skipped" or "error";
+        result is the measurement dictionary or a message
+    """
+    # spawn rather than fork: the parent has already run torch's thread pools
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_run_case_in_child, args=(name, inputs, workdir, sender))
+    process.start()
+    sender.close()
+    try:
+        status, result = receiver.recv()
+    except EOFError:
+        # The child died without reporting, e.g. killed by the OOM killer
+        status, result = "error", None
+    process.join()
+    if result is None:
+        result = f"process exited with code {process.exitcode}"
+    
+    return status, result
+
+def run_suite(sizes=DEFAULT_SIZES, cases=None, repeat=1, keep=None):
+    """
+    Run benchmark cases at each size.
+    
+    Args:
+        sizes: Scene sizes in pixels
+        cases: Case names (optional, defaults to all)
+        repeat: Runs per case; wall and CPU time are the median, peak RSS the maximum
+        keep: Directory to keep inputs and outputs in (optional, a temporary
+            directory is removed afterwards by default)
+    
+    Returns:
+        List of result dictionaries
+    """
+    cases = cases or list(CASES)
+    results = []
+    root = keep or tempfile.mkdtemp(prefix="agricarbonx-bench-")
+    
+    try:
+        for size in sizes:
+            input_dir = os.path.join(root, f"inputs_{size}")
+            os.makedirs(input_dir, exist_ok=True)
+            inputs = prepare_inputs(size, input_dir)
+            
+            for name in cases:
+                runs = []
+                entry = {"case": name, "size": size, "status": "ok"}
+                for i in range(repeat):
+                    workdir = os.path.join(root, f"{name}_{size}_{i}")
+                    os.makedirs(workdir)
+                    status, result = run_case(name, inputs, workdir)
+                    if status != "ok":
+                        entry.update(status=status, message=result)
+                        break
+                    runs.append(result)
+                    if not keep:
+                        shutil.rmtree(workdir, ignore_errors=True)
+                
+                if runs and entry["status"] == "ok":
+                    entry.update(runs[0])
+                    entry["wall_seconds"] = statistics.median(run["wall_seconds"] for run in runs)
+                    entry["cpu_seconds"] = statistics.median(run["cpu_seconds"] for run in runs)
+                    entry["peak_rss_bytes"] = max(run["peak_rss_bytes"] for run in runs)
+                    entry["megapixels_per_second"] = entry["pixels"] / 1e6 / entry["wall_seconds"]
+                    entry["repeat"] = len(runs)
+                
+                results.append(entry)
+                _print_entry(entry)
+            
+            if not keep:
+                shutil.rmtree(input_dir, ignore_errors=True)
+    finally:
+        if not keep:
+            shutil.rmtree(root, ignore_errors=True)
+    
+    return results
+
+def compare(results, baseline, threshold=0.2):
+    """
+    Find cases that got slower or used more memory than in a baseline run.
+    
+    Args:
+        results: Results of the current run
+        baseline: Results of an earlier run
+        threshold: Relative increase that counts as a regression
+    
+    Returns:
+        List of regression dictionaries
+    """
+    previous = {(entry["case"], entry["size"]): entry for entry in baseline if entry.get("status") == "ok"}
+    regressions = []
+    
+    for entry in results:
+        before = previous.get((entry["case"], entry["size"]))
+        if entry.get("status") != "ok" or before is None:
+            continue
+        for metric in ("wall_seconds", "peak_rss_bytes", "bytes_written"):
+            if before[metric] > 0 and (entry[metric] - before[metric]) / before[metric] > threshold:
+                regressions.append({
+                    "case": entry["case"],
+                    "size": entry["size"],
+                    "metric": metric,
+                    "baseline": before[metric],
+                    "current": entry[metric],
+                    "change": (entry[metric] - before[metric]) / before[metric]
+                })
+    
+    return regressions
+
+def _print_entry(entry):
+    if entry["status"] != "ok":
+        print(f"{entry['case']:<28}{entry['size']:>7}  {entry['status']}: {entry['message']}", file=sys.stderr)
+        return
+    print(
+        f"{entry['case']:<28}{entry['size']:>7}  {entry['wall_seconds']:8.2f} s  "
+        f"{entry['peak_rss_bytes'] / 2**20:8.0f} MiB  {entry['bytes_written'] / 2**20:8.0f} MiB written",
+        file=sys.stderr
+    )
+
+def _environment():
+    import numpy
+    import rasterio
+    import torch
+    
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    
+    return {
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": numpy.__version__,
+        "rasterio": rasterio.__version__,
+        "gdal": rasterio.__gdal_version__,
+        "torch": torch.__version__
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the processing pipeline on synthetic rasters")
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(DEFAULT_SIZES), help="Scene sizes in pixels")
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), help="Cases to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/pipeline-<timestamp>.json)")
+    parser.add_argument("--compare", help="Earlier result file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative increase reported as a regression")
+    parser.add_argument("--keep", help="Keep inputs and outputs in this directory")
+    args = parser.parse_args(argv)
+    
+    started = datetime.now(timezone.utc)
+    results = run_suite(args.sizes, args.cases, args.repeat, args.keep)
+    report = {
+        "suite": "pipeline",
+        "created_at": started.isoformat(),
+        "environment": _environment(),
+        "results": results
+    }
+    
+    if args.compare:
+        with open(args.compare) as f:
+            report["regressions"] = compare(results, json.load(f)["results"], args.threshold)
+        for regression in report["regressions"]:
+            print(
+                f"REGRESSION {regression['case']} {regression['size']} {regression['metric']}: "
+                f"{regression['baseline']:.4g} -> {regression['current']:.4g} ({regression['change']:+.0%})",
+                file=sys.stderr
+            )
+    
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "results", f"pipeline-{started.strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(output)
+    
+    if report.get("regressions"):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Benchmark SoilGrids extraction through the tile store.
+
+Reads the same region's layers three times against the local STAC
+stand-in: cold (tiles fetched from the stand-in), warm (tiles on local
+disk, empty block cache) and hot (blocks in the process's block cache),
+and compares them with reading the region straight from the stand-in as
+ingest did before the store. Run from the backend directory:
+
+    python -m benchmarks.soilgrids --latency-ms 0 50 --region-deg 0.1 0.5
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+from app.core.config import settings
+from app.services.ingest_providers import StacProvider
+from app.services.soilgrids_service import block_cache, write_soilgrids_window
+from benchmarks.stac_server import start_server
+
+LAYERS = ["soc", "bdod", "clay"]
+
+def _timed(server, func):
+    requests = server.requests
+    start = time.perf_counter()
+    func()
+    return {"seconds": time.perf_counter() - start, "requests": server.requests - requests}
+
+def run_case(latency_ms, region_deg=0.2, tile_pixels=1024, origin=(10.9, 45.9)):
+    """
+    Extract one region's SoilGrids layers cold, warm and hot.
+    
+    Args:
+        latency_ms: Stand-in delay before every response
+        region_deg: Width and height of the region in degrees
+        tile_pixels: Width and height of the stand-in's assets
+        origin: (lon, lat) of the region's south-west corner
+    
+    Returns:
+        Dictionary with the seconds and requests of each read
+    """
+    minx, miny = origin
+    bbox = (minx, miny, minx + region_deg, miny + region_deg)
+    region = {
+        "type": "Feature",
+        "geometry": {
+            "type": "Polygon",
+            "coordinates": [[[minx, miny], [minx, bbox[3]], [bbox[2], bbox[3]], [bbox[2], miny], [minx, miny]]]
+        }
+    }
+    
+    with tempfile.TemporaryDirectory() as tmpdir:
+        server_dir = os.path.join(tmpdir, "server")
+        os.makedirs(server_dir)
+        server = start_server(server_dir, latency_ms=latency_ms, tile_pixels=tile_pixels)
+        try:
+            # Generate the assets up front so only transfer time is measured
+            for layer in LAYERS:
+                for x, y in server.tiles((bbox[0] - 1.2, bbox[1] - 1.2, bbox[2] + 1.2, bbox[3] + 1.2)):
+                    server.asset_path(f"soilgrids_{layer}_{x}_{y}")
+            
+            provider = StacProvider(server.url, os.path.join(tmpdir, "ingest"))
+            output_path = os.path.join(tmpdir, "soilgrids.tif")
+            
+            def direct():
+                for layer in LAYERS:
+                    provider.fetch_soilgrids(bbox, layer)
+            
+            def store():
+                write_soilgrids_window(region, output_path, layers=LAYERS, provider=provider)
+            
+            with patch.object(settings, "SOILGRIDS_STORE_DIR", os.path.join(tmpdir, "store")), \
+                    patch.object(settings, "SOILGRIDS_CACHE_BUCKET", ""):
+                result = {"direct": _timed(server, direct), "cold": _timed(server, store)}
+                block_cache.clear()
+                result["warm"] = _timed(server, store)
+                result["hot"] = _timed(server, store)
+        finally:
+            server.shutdown()
+            server.server_close()
+    
+    return {"latency_ms": latency_ms, "region_deg": region_deg, **result}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark SoilGrids extraction through the tile store")
+    parser.add_argument("--latency-ms", nargs="+", type=float, default=[0, 50])
+    parser.add_argument("--region-deg", nargs="+", type=float, default=[0.1, 0.5])
+    parser.add_argument("--tile-pixels", type=int, default=1024)
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    args = parser.parse_args(argv)
+    
+    results = []
+    for latency_ms in args.latency_ms:
+        for region_deg in args.region_deg:
+            result = run_case(latency_ms, region_deg, args.tile_pixels)
+            results.append(result)
+            print(
+                f"latency {latency_ms:4.0f} ms  region {region_deg:4.2f}°  "
+                + "  ".join(f"{read} {result[read]['seconds']:6.3f} s / {result[read]['requests']:3d} req" for read in ("direct", "cold", "warm", "hot")),
+                file=sys.stderr
+            )
+    
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+Local stand-in for a STAC API and its asset storage.
+
+Serves ``POST /search``, range-readable GeoTIFF assets under ``/data/`` and
+daily weather CSV under ``/weather``, with configurable latency and
+throughput, so StacProvider can be exercised and benchmarked without
+network access. Assets are synthetic tiles generated on first request.
+
+Run from the backend directory and point the workers at it:
+
+    python -m benchmarks.stac_server --port 8900 --latency-ms 50 --throughput-mbps 20
+    INGEST_PROVIDER=stac STAC_API_URL=http://localhost:8900 celery -A app.tasks.worker worker
+"""
+import argparse
+import json
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+import zlib
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from app.services.ingest_providers import COLLECTIONS, SCENE_DATE_FORMAT
+from app.services.synthetic_data import synthetic_weather, write_synthetic_raster
+
+PRODUCTS = {collection: product for product, collection in COLLECTIONS.items()}
+
+# Scene dates are multiples of the revisit interval from this day, so
+# overlapping searches return the same items
+REVISIT_ANCHOR = date(2000, 1, 1)
+
+CHUNK_BYTES = 64 * 1024
+
+class StacStandInServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server holding the stand-in configuration.
+    
+    Args:
+        address: (host, port); port 0 picks a free port
+        data_dir: Directory for generated assets
+        tile_size_deg: Width and height of each item's footprint in degrees
+        tile_pixels: Width and height of each item's asset in pixels
+        revisit_days: Days between items per product
+        latency_ms: Delay before every response
+        throughput_mbps: Response body rate in megabits per second (0 = unlimited)
+    """
+    
+    daemon_threads = True
+    
+    def __init__(self, address, data_dir, tile_size_deg=1.0, tile_pixels=1024, revisit_days=None, latency_ms=0, throughput_mbps=0):
+        super().__init__(address, StacStandInHandler)
+        self.data_dir = data_dir
+        self.tile_size_deg = tile_size_deg
+        self.tile_pixels = tile_pixels
+        self.revisit_days = revisit_days or {"sentinel2": 5, "landsat": 16}
+        self.latency = latency_ms / 1000
+        self.bytes_per_second = throughput_mbps * 1e6 / 8
+        self.bytes_sent = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+    
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    def tiles(self, bbox):
+        """Yield the (x, y) indices of the tiles intersecting ``bbox``"""
+        size = self.tile_size_deg
+        minx, miny, maxx, maxy = bbox
+        for x in range(math.floor(minx / size), math.ceil(maxx / size)):
+            for y in range(math.floor(miny / size), math.ceil(maxy / size)):
+                yield x, y
+    
+    def tile_bounds(self, x, y):
+        size = self.tile_size_deg
+        return x * size, y * size, (x + 1) * size, (y + 1) * size
+    
+    def dates(self, product, start, end):
+        """Yield the acquisition dates of a product from ``start`` to ``end`` inclusive"""
+        revisit = self.revisit_days[product]
+        day = start + timedelta(days=-(start - REVISIT_ANCHOR).days % revisit)
+        while day <= end:
+            yield day
+            day += timedelta(days=revisit)
+    
+    def asset_path(self, item_id):
+        """
+        Generate an item's asset on first use.
+        
+        Returns:
+            Path to the asset, or None if ``item_id`` is not a valid item
+        """
+        match = re.fullmatch(r"(sentinel2|landsat|soilgrids_[a-z0-9]+)_(-?\d+)_(-?\d+)(?:_(\d{8}))?", item_id)
+        if match is None or match.group(1) not in COLLECTIONS or match.group(1).startswith("soilgrids") != (match.group(4) is None):
+            return None
+        product, x, y = match.group(1), int(match.group(2)), int(match.group(3))
+        
+        path = os.path.join(self.data_dir, f"{item_id}.tif")
+        with self._lock:
+            if not os.path.exists(path):
+                write_synthetic_raster(path, product, self.tile_bounds(x, y), self.tile_pixels, self.tile_pixels, seed=zlib.crc32(item_id.encode()))
+        return path
+    
+    def send(self, wfile, content):
+        """Write a response body at the configured throughput"""
+        for offset in range(0, len(content), CHUNK_BYTES):
+            chunk = content[offset:offset + CHUNK_BYTES]
+            if self.bytes_per_second:
+                time.sleep(len(chunk) / self.bytes_per_second)
+            wfile.write(chunk)
+        with self._lock:
+            self.bytes_sent += len(content)
+
+class StacStandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def _begin(self):
+        with self.server._lock:
+            self.server.requests += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+    
+    def _respond(self, status, content, content_type, headers=None, body=True):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if body:
+            self.server.send(self.wfile, content)
+    
+    def _json(self, status, payload):
+        self._respond(status, json.dumps(payload).encode(), "application/geo+json")
+    
+    def do_POST(self):
+        self._begin()
+        if urlsplit(self.path).path != "/search":
+            return self._json(404, {"detail": "Not found"})
+        length = int(self.headers.get("Content-Length", 0))
+        self._json(200, self._search(json.loads(self.rfile.read(length) or b"{}")))
+    
+    def do_GET(self):
+        self._serve(body=True)
+    
+    def do_HEAD(self):
+        self._serve(body=False)
+    
+    def _serve(self, body):
+        self._begin()
+        url = urlsplit(self.path)
+        if url.path == "/weather":
+            query = {name: values[0] for name, values in parse_qs(url.query).items()}
+            content = synthetic_weather(query["start"], query["end"], seed=zlib.crc32(f"{query['lon']},{query['lat']}".encode())).encode()
+            return self._respond(200, content, "text/csv", body=body)
+        
+        match = re.fullmatch(r"/data/[\w-]+/([\w-]+)\.tif", url.path)
+        path = self.server.asset_path(match.group(1)) if match else None
+        if path is None:
+            return self._json(404, {"detail": "Not found"})
+        size = os.path.getsize(path)
+        
+        byte_range = re.fullmatch(r"bytes=(\d*)-(\d*)", self.headers.get("Range", "").split(",")[0].strip())
+        if byte_range is None:
+            with open(path, "rb") as f:
+                return self._respond(200, f.read(), "image/tiff", {"Accept-Ranges": "bytes"}, body)
+        first, last = byte_range.groups()
+        if first:
+            first, last = int(first), min(int(last) if last else size - 1, size - 1)
+        else:
+            first, last = max(size - int(last), 0), size - 1
+        if first > last:
+            return self._respond(416, b"", "image/tiff", {"Content-Range": f"bytes */{size}"}, body)
+        with open(path, "rb") as f:
+            f.seek(first)
+            content = f.read(last + 1 - first)
+        self._respond(206, content, "image/tiff", {"Accept-Ranges": "bytes", "Content-Range": f"bytes {first}-{last}/{size}"}, body)
+    
+    def _search(self, request):
+        bbox = request.get("bbox", (-180, -90, 180, 90))
+        limit = int(request.get("limit", 100))
+        offset = int(request.get("token", 0))
+        start, end = REVISIT_ANCHOR, date.today()
+        if request.get("datetime"):
+            start_text, end_text = (request["datetime"].split("/") + [""])[:2]
+            if start_text not in ("", ".."):
+                start = max(datetime.fromisoformat(start_text[:10]).date(), REVISIT_ANCHOR)
+            end = datetime.fromisoformat(end_text[:10]).date() if end_text not in ("", "..") else start
+        base_url = f"http://{self.headers.get('Host', '%s:%s' % self.server.server_address[:2])}"
+        
+        features = []
+        for collection in request.get("collections", list(PRODUCTS)):
+            product = PRODUCTS.get(collection)
+            if product is None:
+                continue
+            if product.startswith("soilgrids"):
+                items = [(f"{product}_{x}_{y}", (x, y), None) for x, y in self.server.tiles(bbox)]
+            else:
+                items = [
+                    (f"{product}_{x}_{y}_{day.strftime(SCENE_DATE_FORMAT)}", (x, y), day)
+                    for day in self.server.dates(product, start, end)
+                    for x, y in self.server.tiles(bbox)
+                ]
+            for item_id, (x, y), day in items:
+                features.append({
+                    "type": "Feature",
+                    "stac_version": "1.0.0",
+                    "id": item_id,
+                    "collection": collection,
+                    "bbox": list(self.server.tile_bounds(x, y)),
+                    "geometry": None,
+                    "properties": {"datetime": f"{(day or REVISIT_ANCHOR).isoformat()}T10:30:00Z"},
+                    "assets": {"data": {"href": f"{base_url}/data/{collection}/{item_id}.tif", "type": "image/tiff"}}
+                })
+        
+        page = {"type": "FeatureCollection", "features": features[offset:offset + limit], "links": []}
+        if offset + limit < len(features):
+            page["links"].append({
+                "rel": "next",
+                "href": f"{base_url}/search",
+                "method": "POST",
+                "body": {**request, "token": offset + limit}
+            })
+        return page
+
+def start_server(data_dir, port=0, host="127.0.0.1", **config):
+    """
+    Start the stand-in on a background thread.
+    
+    Args:
+        data_dir: Directory for generated assets
+        port: Port to listen on (0 = any free port)
+        host: Interface to listen on
+        **config: StacStandInServer options
+    
+    Returns:
+        Running StacStandInServer; call ``shutdown()`` and ``server_close()`` to stop it
+    """
+    server = StacStandInServer((host, port), data_dir, **config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a local STAC API stand-in with synthetic assets")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--data-dir", help="Directory for generated assets (default: a temporary directory)")
+    parser.add_argument("--tile-size-deg", type=float, default=1.0, help="Footprint of each item in degrees")
+    parser.add_argument("--tile-pixels", type=int, default=1024, help="Width and height of each asset in pixels")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Delay before every response")
+    parser.add_argument("--throughput-mbps", type=float, default=0, help="Response body rate (0 = unlimited)")
+    args = parser.parse_args(argv)
+    
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="stac-stand-in-")
+    os.makedirs(data_dir, exist_ok=True)
+    server = StacStandInServer(
+        (args.host, args.port), data_dir, tile_size_deg=args.tile_size_deg, tile_pixels=args.tile_pixels,
+        latency_ms=args.latency_ms, throughput_mbps=args.throughput_mbps
+    )
+    print(f"Serving STAC stand-in on {server.url} with assets in {data_dir}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
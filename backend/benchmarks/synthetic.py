@@ -0,0 +1,87 @@
+"""
+Synthetic GeoTIFFs shaped like the ingest outputs, at any size.
+"""
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from rasterio.windows import Window
+
+# Roughly 10 m pixels in degrees, like Sentinel-2
+PIXEL_SIZE_DEG = 0.0001
+ORIGIN = (10.0, 46.0)
+
+def scene_bounds(size):
+    """
+    Get the (minx, miny, maxx, maxy) bounds of a synthetic scene.
+    """
+    west, north = ORIGIN
+    return west, north - size * PIXEL_SIZE_DEG, west + size * PIXEL_SIZE_DEG, north
+
+def region_geojson(size, inset=0.1):
+    """
+    Get a GeoJSON Feature covering the scene minus an ``inset`` fraction on each side.
+    """
+    minx, miny, maxx, maxy = scene_bounds(size)
+    dx, dy = (maxx - minx) * inset, (maxy - miny) * inset
+    minx, miny, maxx, maxy = minx + dx, miny + dy, maxx - dx, maxy - dy
+    return {
+        "type": "Feature",
+        "properties": {"name": f"Benchmark {size}x{size}"},
+        "geometry": {
+            "type": "Polygon",
+            "coordinates": [[[minx, miny], [minx, maxy], [maxx, maxy], [maxx, miny], [minx, miny]]]
+        }
+    }
+
+def write_scene(path, size, bands, seed=0, cloud_band=False, block_rows=512):
+    """
+    Write a uint16 reflectance scene block by block.
+    
+    Args:
+        path: Output path
+        size: Width and height in pixels
+        bands: Number of reflectance bands
+        seed: Random seed
+        cloud_band: Append a Landsat-style QA band (1 = cloud, ~20% of pixels)
+        block_rows: Rows generated per write, bounding memory at any size
+    
+    Returns:
+        path
+    """
+    rng = np.random.default_rng(seed)
+    count = bands + (1 if cloud_band else 0)
+    
+    with rasterio.open(
+        path,
+        'w',
+        driver='GTiff',
+        height=size,
+        width=size,
+        count=count,
+        dtype=np.uint16,
+        crs='EPSG:4326',
+        transform=from_origin(ORIGIN[0], ORIGIN[1], PIXEL_SIZE_DEG, PIXEL_SIZE_DEG),
+        tiled=True,
+        blockxsize=256,
+        blockysize=256
+    ) as dst:
+        for row_off in range(0, size, block_rows):
+            rows = min(block_rows, size - row_off)
+            data = rng.integers(1, 10000, (count, rows, size), dtype=np.uint16)
+            if cloud_band:
+                data[-1] = rng.random((rows, size)) > 0.8
+            dst.write(data, window=Window(0, row_off, size, rows))
+    
+    return path
+
+def write_sentinel_scene(path, size, seed=0):
+    """
+    Write a scene like download_sentinel_data: Red, Green, Blue, NIR.
+    """
+    return write_scene(path, size, bands=4, seed=seed)
+
+def write_landsat_scene(path, size, seed=0):
+    """
+    Write a scene like download_landsat_data: Blue, Green, Red, NIR, SWIR1, SWIR2, QA.
+    """
+    return write_scene(path, size, bands=6, seed=seed, cloud_band=True)
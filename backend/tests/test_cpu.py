@@ -0,0 +1,56 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import torch
+
+# Add the parent directory to the path so we can import the app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.cpu import THREAD_ENV_VARS, apply_torch_threads, available_cpus, get_thread_plan, pin_thread_env
+
+class TestCpu(unittest.TestCase):
+
+    @patch('app.core.cpu.settings')
+    def test_get_thread_plan(self, mock_settings):
+        mock_settings.WORKER_CONCURRENCY = 0
+        mock_settings.TORCH_NUM_THREADS = 0
+        mock_settings.TORCH_INTEROP_THREADS = 1
+        
+        # Cores are split evenly between worker processes
+        plan = get_thread_plan(concurrency=4, cpus=16)
+        self.assertEqual(plan["intra_op_threads"], 4)
+        self.assertEqual(plan["inter_op_threads"], 1)
+        
+        # Never less than one thread, one process per CPU by default
+        self.assertEqual(get_thread_plan(concurrency=32, cpus=16)["intra_op_threads"], 1)
+        self.assertEqual(get_thread_plan(cpus=16)["concurrency"], 16)
+        
+        # Explicit settings win
+        mock_settings.WORKER_CONCURRENCY = 2
+        self.assertEqual(get_thread_plan(cpus=16)["intra_op_threads"], 8)
+        mock_settings.TORCH_NUM_THREADS = 3
+        self.assertEqual(get_thread_plan(concurrency=4, cpus=16)["intra_op_threads"], 3)
+    
+    def test_apply_thread_plan(self):
+        self.assertGreaterEqual(available_cpus(), 1)
+        
+        saved_env = {name: os.environ.get(name) for name in THREAD_ENV_VARS}
+        saved_threads = torch.get_num_threads()
+        try:
+            pin_thread_env(2)
+            effective = apply_torch_threads({"intra_op_threads": 2, "inter_op_threads": 1})
+            
+            self.assertEqual(effective["intra_op_threads"], 2)
+            self.assertEqual(effective["OMP_NUM_THREADS"], "2")
+            self.assertEqual(effective["pid"], os.getpid())
+        finally:
+            torch.set_num_threads(saved_threads)
+            for name, value in saved_env.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+
+if __name__ == '__main__':
+    unittest.main()
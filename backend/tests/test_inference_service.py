@@ -0,0 +1,111 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import sys
+import os
+import threading
+import numpy as np
+import torch
+
+# Add the parent directory to the path so we can import the app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services.inference_service import InferenceClient, MicroBatcher, predict_tiled, serve, split_tiles, stitch_tiles
+from app.services.predict_service import SoilCNN
+
+class FirstChannel(torch.nn.Module):
+    """Returns the first input channel, so stitched output equals the input band"""
+    
+    def forward(self, x):
+        return x[:, :1]
+
+class TestInferenceService(unittest.TestCase):
+
+    def test_split_and_stitch_tiles(self):
+        features = np.random.rand(7, 45, 30).astype(np.float32)
+        
+        tiles, origins = split_tiles(features, tile_size=16, halo=2)
+        self.assertEqual(tiles.shape, (6, 7, 20, 20))
+        
+        stitched = stitch_tiles([tile[0] for tile in tiles], origins, (45, 30), tile_size=16, halo=2)
+        np.testing.assert_array_equal(stitched, features[0])
+    
+    @patch('app.services.inference_service.settings')
+    def test_micro_batcher_batches_concurrent_requests(self, mock_settings):
+        mock_settings.MODEL_CHANNELS_LAST = False
+        mock_settings.INFERENCE_TILE_SIZE = 8
+        
+        loads = []
+        def loader(model_path, model_type):
+            loads.append(model_type)
+            return FirstChannel()
+        
+        batcher = MicroBatcher(max_batch_size=64, max_latency_ms=200, model_loader=loader)
+        stacks = [np.random.rand(7, 20, 20).astype(np.float32) for _ in range(4)]
+        results = [None] * len(stacks)
+        
+        def run(i):
+            results[i] = predict_tiled(stacks[i], "soc", "model.pt", backend=batcher)
+        
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(len(stacks))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        batcher.close()
+        
+        for features, result in zip(stacks, results):
+            np.testing.assert_array_equal(result, features[0])
+        # 4 stacks x 9 tiles, loaded once and run in fewer passes than tiles
+        self.assertEqual(batcher.tiles, 36)
+        self.assertLess(batcher.batches, 36)
+        self.assertEqual(loads, ["soc"])
+    
+    @patch('app.services.inference_service.settings')
+    def test_predict_tiled_matches_whole_array(self, mock_settings):
+        mock_settings.MODEL_CHANNELS_LAST = False
+        mock_settings.INFERENCE_TILE_SIZE = 16
+        
+        model = SoilCNN(in_channels=7).eval()
+        batcher = MicroBatcher(max_batch_size=8, max_latency_ms=1, model_loader=lambda path, model_type: model)
+        features = np.random.rand(7, 40, 40).astype(np.float32)
+        
+        tiled = predict_tiled(features, "soc", "model.pt", backend=batcher)
+        batcher.close()
+        with torch.no_grad():
+            whole = model(torch.from_numpy(features[np.newaxis])).numpy()[0, 0]
+        
+        # Identical away from the array border, where tiles see zero context
+        np.testing.assert_allclose(tiled[2:-2, 2:-2], whole[2:-2, 2:-2], rtol=1e-5, atol=1e-5)
+    
+    def test_sidecar(self):
+        batcher = MicroBatcher(max_batch_size=8, max_latency_ms=1, model_loader=lambda path, model_type: FirstChannel())
+        listening = threading.Event()
+        bound = []
+        
+        def on_listen(address):
+            bound.append(address)
+            listening.set()
+        
+        threading.Thread(
+            target=serve,
+            kwargs={"address": ("127.0.0.1", 0), "authkey": "test", "batcher": batcher, "on_listen": on_listen},
+            daemon=True
+        ).start()
+        self.assertTrue(listening.wait(5))
+        
+        client = InferenceClient(address=bound[0], authkey="test")
+        tiles = np.random.rand(3, 7, 12, 12).astype(np.float32)
+        outputs = client.predict("moisture", "model.pt", tiles)
+        
+        np.testing.assert_array_equal(outputs, tiles[:, 0])
+    
+    @patch('app.services.inference_service.settings')
+    def test_sidecar_requires_authkey(self, mock_settings):
+        mock_settings.INFERENCE_AUTHKEY = ""
+        with self.assertRaises(RuntimeError):
+            InferenceClient(address=("127.0.0.1", 0))
+        with self.assertRaises(RuntimeError):
+            serve(address=("127.0.0.1", 0), batcher=MagicMock())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import tempfile
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from rasterio.warp import transform_bounds
+
+# Add the parent directory to the path so we can import the app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services.ingest_providers import SceneItem, StacProvider, SyntheticProvider
+from app.services.ingest_service import download_landsat_data, get_acquisition_date
+from benchmarks.stac_server import start_server
+
+REGION = {
+    "type": "Feature",
+    "properties": {},
+    "geometry": {
+        "type": "Polygon",
+        "coordinates": [[[10.8, 45.9], [10.8, 46.1], [11.2, 46.1], [11.2, 45.9], [10.8, 45.9]]]
+    }
+}
+BBOX = (10.8, 45.9, 11.2, 46.1)
+
+class TestIngestService(unittest.TestCase):
+
+    def test_synthetic_provider(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            provider = SyntheticProvider(tmpdir, raster_size=300, revisit_days={"landsat": 16})
+            with patch('app.services.ingest_service.get_ingest_provider', return_value=provider):
+                paths = download_landsat_data(REGION, "2023-01-01", "2023-02-02")
+                
+                # One scene per revisit, dated in the file name
+                self.assertEqual([get_acquisition_date(path).day for path in paths], [1, 17, 2])
+                with rasterio.open(paths[0]) as src:
+                    self.assertEqual((src.count, src.width, src.height), (7, 300, 300))
+                    self.assertEqual(tuple(round(value, 6) for value in src.bounds), BBOX)
+                    qa = src.read(7)
+                self.assertTrue(set(qa.ravel()) <= {0, 1})
+                self.assertAlmostEqual(qa.mean(), 0.2, delta=0.02)
+                
+                # Existing scenes are reused instead of regenerated
+                modified = os.path.getmtime(paths[0])
+                self.assertEqual(download_landsat_data(REGION, "2023-01-01", "2023-02-02"), paths)
+                self.assertEqual(os.path.getmtime(paths[0]), modified)
+            
+            with open(provider.fetch_weather(11.0, 46.0, "2023-01-30", "2023-02-02")) as f:
+                lines = f.read().splitlines()
+        
+        self.assertEqual(lines[0], "date,temperature,precipitation,solar_radiation")
+        self.assertEqual([line.split(",")[0] for line in lines[1:]], ["2023-01-30", "2023-01-31", "2023-02-01", "2023-02-02"])
+    
+    def test_stac_provider(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            server_dir = os.path.join(tmpdir, "server")
+            os.makedirs(server_dir)
+            server = start_server(server_dir, tile_pixels=512, revisit_days={"sentinel2": 5, "landsat": 16})
+            try:
+                provider = StacProvider(server.url, os.path.join(tmpdir, "ingest"), page_size=3)
+                
+                # The region spans four 1° tiles; the search pages through all of them
+                items = provider.search("sentinel2", BBOX, "2023-01-01", "2023-01-10")
+                self.assertEqual(len(items), 8)
+                
+                paths = provider.fetch_scenes(items, BBOX)
+                self.assertEqual([get_acquisition_date(path).day for path in paths], [5, 10])
+                with rasterio.open(paths[0]) as src:
+                    self.assertEqual(src.count, 4)
+                    self.assertEqual((src.width, src.height), (205, 102))
+                    self.assertAlmostEqual(src.bounds.left, 10.8, places=2)
+                    self.assertAlmostEqual(src.bounds.top, 46.1, places=2)
+                
+                # Only the windows covering the region were transferred
+                asset_bytes = sum(os.path.getsize(os.path.join(server_dir, name)) for name in os.listdir(server_dir))
+                self.assertLess(server.bytes_sent, asset_bytes / 2)
+                
+                with rasterio.open(provider.fetch_soilgrids(BBOX)) as src:
+                    self.assertEqual(src.dtypes[0], "uint8")
+                with open(provider.fetch_weather(11.0, 46.0, "2023-01-01", "2023-01-03")) as f:
+                    self.assertEqual(len(f.read().splitlines()), 4)
+            finally:
+                server.shutdown()
+                server.server_close()
+    
+    def test_stac_provider_mixed_crs(self):
+        real_open = rasterio.open
+        
+        def open_local(path, *args, **kwargs):
+            return real_open(path.replace("/vsicurl/", ""), *args, **kwargs)
+        
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # Same-date tiles either side of the UTM 32/33 boundary at 12°E
+            items = []
+            for value, epsg, (west, east) in ((1, 32632, (11.8, 12.0)), (2, 32633, (12.0, 12.2))):
+                left, bottom, right, top = transform_bounds("EPSG:4326", f"EPSG:{epsg}", west, 45.9, east, 46.1)
+                width, height = int((right - left) // 100), int((top - bottom) // 100)
+                href = os.path.join(tmpdir, f"tile_{epsg}.tif")
+                with real_open(
+                    href, 'w', driver='GTiff', height=height, width=width, count=1, dtype='uint8',
+                    crs=f"EPSG:{epsg}", transform=from_origin(left, top, 100, 100), nodata=0
+                ) as dst:
+                    dst.write(np.full((1, height, width), value, dtype=np.uint8))
+                items.append(SceneItem(f"tile_{epsg}", "sentinel2", None, (west, 45.9, east, 46.1), href))
+            
+            provider = StacProvider("http://stac.invalid", os.path.join(tmpdir, "ingest"))
+            bbox = (11.9, 45.95, 12.1, 46.05)
+            with patch('app.services.ingest_providers.rasterio.open', side_effect=open_local):
+                path = provider._read_window(items, bbox, os.path.join(tmpdir, "scene.tif"))
+            
+            with real_open(path) as src:
+                # Mosaicked in the first item's CRS over the box, not over degrees read as metres
+                self.assertEqual(src.crs.to_epsg(), 32632)
+                expected = transform_bounds("EPSG:4326", "EPSG:32632", *bbox, densify_pts=21)
+                np.testing.assert_allclose(tuple(src.bounds), expected, atol=100)
+                data = src.read(1)
+            # Both tiles contribute, the second warped from zone 33
+            self.assertTrue((data[:, :10] == 1).all())
+            self.assertTrue((data[:, -10:] == 2).all())
+            
+            with self.assertRaises(ValueError):
+                with patch('app.services.ingest_providers.rasterio.open', side_effect=open_local):
+                    provider._read_window(items, bbox, os.path.join(tmpdir, "soil.tif"), resolution=0.01)
+
+if __name__ == '__main__':
+    unittest.main()
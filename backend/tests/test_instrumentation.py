@@ -0,0 +1,87 @@
+import unittest
+import sys
+import os
+
+# Add the parent directory to the path so we can import the app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine, text
+
+from app.core.config import settings
+from app.core.instrumentation import MetricsMiddleware, instrument_engine, timed_minio_call
+
+engine = create_engine("sqlite://")
+instrument_engine(engine)
+
+@timed_minio_call(operation="test_upload")
+def upload():
+    return True
+
+def make_app(server_timing):
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware, server_timing=server_timing)
+    
+    @app.get("/items/{item_id}")
+    def get_item(item_id: int):
+        with engine.connect() as connection:
+            value = connection.execute(text("SELECT :value"), {"value": item_id}).scalar()
+        upload()
+        return {"value": value}
+    
+    return app
+
+def sample(name, labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+class TestInstrumentation(unittest.TestCase):
+
+    def test_request_metrics(self):
+        client = TestClient(make_app(server_timing=False))
+        route_labels = {'method': 'GET', 'route': '/items/{item_id}', 'status_code': '200'}
+        queries = {'process_type': settings.PROCESS_TYPE, 'operation': 'SELECT'}
+        before = sample('agricarbonx_http_request_duration_seconds_count', route_labels)
+        before_queries = sample('agricarbonx_db_queries_total', queries)
+        before_uploads = sample('agricarbonx_minio_call_seconds_count', {'operation': 'test_upload', 'status': 'ok'})
+        
+        response = client.get("/items/3")
+        client.get("/items/4")
+        client.get("/no/such/path")
+        
+        self.assertEqual(response.json(), {"value": 3})
+        self.assertNotIn("server-timing", response.headers)
+        # Labelled by route template, not by concrete path
+        self.assertEqual(sample('agricarbonx_http_request_duration_seconds_count', route_labels), before + 2)
+        self.assertGreater(sample('agricarbonx_http_request_duration_seconds_count', {'method': 'GET', 'route': 'unmatched', 'status_code': '404'}), 0)
+        self.assertEqual(sample('agricarbonx_db_queries_total', queries), before_queries + 2)
+        self.assertEqual(sample('agricarbonx_minio_call_seconds_count', {'operation': 'test_upload', 'status': 'ok'}), before_uploads + 2)
+        self.assertGreater(sample('agricarbonx_http_request_db_seconds_sum', {'method': 'GET', 'route': '/items/{item_id}'}), 0)
+        self.assertEqual(sample('agricarbonx_http_requests_in_progress', {'method': 'GET'}), 0)
+    
+    def test_server_timing_header(self):
+        client = TestClient(make_app(server_timing=True))
+        
+        header = client.get("/items/5").headers["server-timing"]
+        
+        entries = {entry.split(";")[0]: entry for entry in header.split(", ")}
+        self.assertEqual(set(entries), {"db", "minio", "app"})
+        self.assertIn('desc="1 calls"', entries["db"])
+    
+    def test_pool_checked_out_gauge(self):
+        from app.db import session
+        
+        labels = {"process_type": settings.PROCESS_TYPE}
+        before = sample("agricarbonx_db_pool_checked_out", labels)
+        
+        # The gauge follows checkouts and checkins, so multiprocess mode can sum it
+        session._on_checkout(None, None, None)
+        session._on_checkout(None, None, None)
+        self.assertEqual(sample("agricarbonx_db_pool_checked_out", labels), before + 2)
+        session._on_checkin(None, None)
+        session._on_checkin(None, None)
+        self.assertEqual(sample("agricarbonx_db_pool_checked_out", labels), before)
+
+if __name__ == '__main__':
+    unittest.main()
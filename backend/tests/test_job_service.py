@@ -1,16 +1,32 @@
+import asyncio
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, AsyncMock, MagicMock
 import sys
 import os
 from datetime import datetime
+from types import SimpleNamespace
 
 # Add the parent directory to the path so we can import the app modules
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from app.services.job_service import create_job, get_job_by_id, get_jobs, update_job_status, create_region_from_geojson
+from app.services.job_service import (
+    create_job, create_jobs_batch, get_batch_features, get_job_by_id, get_jobs, get_jobs_page_async,
+    group_features_by_scene, plan_incremental_run, save_job_stages, update_job_status, update_jobs_status,
+    create_region_from_geojson
+)
+
+def make_feature(minx, miny, size=0.01):
+    return {
+        "type": "Feature",
+        "geometry": {
+            "type": "Polygon",
+            "coordinates": [[[minx, miny], [minx, miny + size], [minx + size, miny + size], [minx + size, miny], [minx, miny]]]
+        },
+        "properties": {}
+    }
 
 class TestJobService(unittest.TestCase):
-    
+
     @patch('app.services.job_service.create_region_from_geojson')
     def test_create_job(self, mock_create_region):
         # Setup mocks
@@ -30,6 +46,8 @@ class TestJobService(unittest.TestCase):
         }
         job_data.start_date = "2023-01-01T00:00:00"
         job_data.end_date = "2023-01-31T00:00:00"
+        job_data.region_id = None
+        job_data.parent_job_id = None
         
         # Call the function
         result = create_job(mock_db, job_data)
@@ -41,6 +59,56 @@ class TestJobService(unittest.TestCase):
         mock_db.commit.assert_called_once()
         mock_db.refresh.assert_called_once()
     
+    @patch('app.services.job_service.get_jobs_by_ids')
+    @patch('app.services.job_service.from_shape')
+    def test_create_jobs_batch(self, mock_from_shape, mock_get_jobs_by_ids):
+        # Setup mocks
+        mock_db = MagicMock()
+        mock_from_shape.return_value = 'GEOMETRY_WKB'
+        mock_jobs = [MagicMock(), MagicMock(), MagicMock()]
+        mock_get_jobs_by_ids.return_value = mock_jobs
+        
+        # Mock batch data
+        batch_data = MagicMock()
+        batch_data.regions_geojson = {
+            "type": "FeatureCollection",
+            "features": [make_feature(0, 0), make_feature(0.1, 0.1), make_feature(5, 5)]
+        }
+        batch_data.start_date = "2023-01-01T00:00:00"
+        batch_data.end_date = "2023-01-31T00:00:00"
+        
+        # Call the function
+        result = create_jobs_batch(mock_db, batch_data)
+        
+        # Assertions: regions and jobs are added in bulk and committed once
+        self.assertEqual(result, mock_jobs)
+        self.assertEqual(mock_db.add_all.call_count, 2)
+        self.assertEqual(len(mock_db.add_all.call_args_list[0][0][0]), 3)
+        self.assertEqual(len(mock_db.add_all.call_args_list[1][0][0]), 3)
+        mock_db.commit.assert_called_once()
+        mock_db.refresh.assert_not_called()
+        mock_get_jobs_by_ids.assert_called_once()
+    
+    def test_get_batch_features_validation(self):
+        with self.assertRaises(ValueError):
+            get_batch_features({"type": "Feature"})
+        with self.assertRaises(ValueError):
+            get_batch_features({"type": "FeatureCollection", "features": []})
+        with self.assertRaises(ValueError):
+            get_batch_features({
+                "type": "FeatureCollection",
+                "features": [{"type": "Feature", "geometry": {"type": "Point", "coordinates": [0, 0]}}]
+            })
+    
+    def test_group_features_by_scene(self):
+        features = [make_feature(0.1, 0.1), make_feature(5.2, 5.2), make_feature(0.5, 0.5), make_feature(0.95, 0.5, size=0.1)]
+        
+        # Call the function
+        groups = group_features_by_scene(features, tile_size_deg=1.0)
+        
+        # Features in the same cell share a group; the one crossing a cell edge does not
+        self.assertEqual(groups, [[0, 2], [1], [3]])
+    
     def test_get_job_by_id(self):
         # Setup mocks
         mock_db = MagicMock()
@@ -113,27 +181,236 @@ class TestJobService(unittest.TestCase):
         mock_offset.limit.assert_called_once_with(100)
         mock_limit.all.assert_called_once()
     
-    @patch('app.services.job_service.get_job_by_id')
+    def test_get_jobs_page_async(self):
+        # Setup mocks
+        mock_db = MagicMock()
+        rows = [SimpleNamespace(id=i, created_at=datetime(2023, 1, i)) for i in (3, 2, 1)]
+        mock_result = MagicMock()
+        mock_result.all.return_value = rows
+        mock_db.execute = AsyncMock(return_value=mock_result)
+        
+        # Call the function
+        page, next_cursor = asyncio.run(get_jobs_page_async(mock_db, limit=2, status='completed'))
+        
+        # Assertions: a single SELECT with the look-ahead row and status filter
+        self.assertEqual(page, rows[:2])
+        self.assertIsNotNone(next_cursor)
+        mock_db.execute.assert_awaited_once()
+        sql = str(mock_db.execute.call_args[0][0])
+        self.assertIn('ORDER BY jobs.created_at DESC, jobs.id DESC', sql)
+        self.assertIn('jobs.status =', sql)
+        self.assertNotIn('OFFSET', sql)
+        
+        # Passing the cursor back adds a keyset filter
+        mock_result.all.return_value = rows[2:]
+        page, next_cursor = asyncio.run(get_jobs_page_async(mock_db, limit=2, cursor=next_cursor))
+        self.assertEqual(page, rows[2:])
+        self.assertIsNone(next_cursor)
+        self.assertIn('(jobs.created_at, jobs.id) <', str(mock_db.execute.call_args[0][0]))
+        
+        with self.assertRaises(ValueError):
+            asyncio.run(get_jobs_page_async(mock_db, cursor='not-a-cursor'))
+    
     @patch('app.services.job_service.datetime')
-    def test_update_job_status(self, mock_datetime, mock_get_job):
+    def test_update_job_status(self, mock_datetime):
         # Setup mocks
         mock_db = MagicMock()
         mock_job = MagicMock()
-        mock_get_job.return_value = mock_job
+        mock_db.execute.return_value.scalar_one_or_none.return_value = mock_job
         mock_now = datetime(2023, 1, 1, 12, 0, 0)
         mock_datetime.utcnow.return_value = mock_now
         
         # Call the function
         result = update_job_status(mock_db, 1, 'completed', task_id='task123', error_message=None)
         
-        # Assertions
+        # Assertions: a single UPDATE ... RETURNING, no SELECT or refresh
         self.assertEqual(result, mock_job)
-        mock_get_job.assert_called_once_with(mock_db, 1)
-        self.assertEqual(mock_job.status, 'completed')
-        self.assertEqual(mock_job.updated_at, mock_now)
-        self.assertEqual(mock_job.task_id, 'task123')
+        mock_db.execute.assert_called_once()
+        mock_db.query.assert_not_called()
+        mock_db.commit.assert_called_once()
+        mock_db.refresh.assert_not_called()
+        statement = mock_db.execute.call_args[0][0]
+        params = statement.compile().params
+        self.assertEqual(params['status'], 'completed')
+        self.assertEqual(params['task_id'], 'task123')
+        self.assertEqual(params['updated_at'], mock_now)
+    
+    def test_update_job_status_refreshes_loaded_job(self):
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        from app.models.job import Job
+        
+        engine = create_engine("sqlite://")
+        Job.__table__.create(engine)
+        db = sessionmaker(bind=engine, expire_on_commit=False)()
+        self.addCleanup(db.close)
+        jobs = [Job(start_date=datetime(2023, 1, 1), end_date=datetime(2023, 2, 1)) for _ in range(2)]
+        db.add_all(jobs)
+        db.commit()
+        
+        # The job is already loaded in the session, as in create_job
+        job = update_job_status(db, jobs[0].id, 'queued', task_id='task123')
+        self.assertIs(job, jobs[0])
+        self.assertEqual((job.status, job.task_id), ('queued', 'task123'))
+        
+        updated = update_jobs_status(db, [job.id for job in jobs], 'failed', error_message='ingest failed')
+        self.assertEqual([(job.status, job.error_message) for job in updated], [('failed', 'ingest failed')] * 2)
+    
+    def test_save_job_stages(self):
+        # Setup mocks
+        mock_db = MagicMock()
+        stage = {
+            "name": "compute_indices", "parent": "task_preprocess", "status": "ok",
+            "started_at": datetime(2023, 1, 1), "wall_seconds": 1.5, "cpu_seconds": 1.2,
+            "peak_rss_bytes": 2**30, "bytes_read": 100, "bytes_written": 200, "pixels": 10000
+        }
+        
+        # Call the function
+        save_job_stages(mock_db, 1, [stage, dict(stage, name="task_preprocess", parent=None)], task_id='task123')
+        
+        # Assertions: all stages are added and committed at once
+        stages = mock_db.add_all.call_args[0][0]
+        self.assertEqual([s.name for s in stages], ["compute_indices", "task_preprocess"])
+        self.assertTrue(all(s.job_id == 1 and s.task_id == 'task123' for s in stages))
+        self.assertEqual(stages[0].peak_rss_bytes, 2**30)
         mock_db.commit.assert_called_once()
-        mock_db.refresh.assert_called_once_with(mock_job)
+    
+    @patch('app.services.job_service.create_region_from_geojson')
+    @patch('app.services.job_service.get_job_by_id')
+    def test_create_job_with_parent(self, mock_get_job_by_id, mock_create_region):
+        from geoalchemy2.shape import from_shape
+        from shapely.geometry import shape
+        
+        mock_db = MagicMock()
+        feature = make_feature(10, 50)
+        parent = MagicMock()
+        parent.region.id = 7
+        parent.region.geometry = from_shape(shape(feature["geometry"]), srid=4326)
+        parent.start_date = datetime(2023, 1, 1)
+        mock_get_job_by_id.return_value = parent
+        
+        job_data = MagicMock(region_geojson=feature, region_id=None, parent_job_id=3, start_date=datetime(2023, 1, 1, 12))
+        
+        # The incremental job stays on its parent's region
+        job = create_job(mock_db, job_data)
+        self.assertEqual(job.region_id, 7)
+        self.assertEqual(job.parent_job_id, 3)
+        mock_create_region.assert_not_called()
+        
+        # Imagery before the prior job's start date would never be ingested
+        job_data.start_date = datetime(2022, 12, 31)
+        with self.assertRaises(ValueError):
+            create_job(mock_db, job_data)
+        
+        # Cached products of another footprint cannot be reused
+        job_data.start_date = datetime(2023, 1, 1)
+        job_data.region_geojson = make_feature(11, 50)
+        with self.assertRaises(ValueError):
+            create_job(mock_db, job_data)
+        
+        mock_get_job_by_id.return_value = None
+        with self.assertRaises(ValueError):
+            create_job(mock_db, job_data)
+    
+    @patch('app.services.job_service.create_region_from_geojson')
+    @patch('app.services.job_service.get_region_by_id')
+    def test_create_job_with_region(self, mock_get_region_by_id, mock_create_region):
+        from geoalchemy2.shape import from_shape
+        from shapely.geometry import shape
+        
+        mock_db = MagicMock()
+        feature = make_feature(10, 50)
+        region = MagicMock(id=7, geometry=from_shape(shape(feature["geometry"]), srid=4326))
+        mock_get_region_by_id.return_value = region
+        job_data = MagicMock(region_geojson=feature, region_id=7, parent_job_id=None, start_date=datetime(2024, 1, 1))
+        
+        # A rerun lands on the existing region and its time series
+        job = create_job(mock_db, job_data)
+        self.assertEqual(job.region_id, 7)
+        mock_create_region.assert_not_called()
+        
+        # The region's geometry must match the job's
+        job_data.region_geojson = make_feature(11, 50)
+        with self.assertRaises(ValueError):
+            create_job(mock_db, job_data)
+        
+        mock_get_region_by_id.return_value = None
+        with self.assertRaises(ValueError):
+            create_job(mock_db, job_data)
+    
+    @patch('app.services.job_service.get_jobs_by_ids')
+    def test_create_jobs_batch_with_regions(self, mock_get_jobs_by_ids):
+        from geoalchemy2.shape import from_shape
+        from shapely.geometry import shape
+        
+        mock_db = MagicMock()
+        rerun = make_feature(0, 0)
+        rerun["properties"] = {"region_id": 7}
+        region = MagicMock(id=7, geometry=from_shape(shape(rerun["geometry"]), srid=4326))
+        mock_db.query.return_value.filter.return_value.all.return_value = [region]
+        batch_data = MagicMock()
+        batch_data.regions_geojson = {"type": "FeatureCollection", "features": [rerun, make_feature(5, 5)]}
+        
+        create_jobs_batch(mock_db, batch_data)
+        
+        # Only the new field gets a region; both jobs are added
+        new_regions, jobs = [call[0][0] for call in mock_db.add_all.call_args_list]
+        self.assertEqual(len(new_regions), 1)
+        self.assertEqual(jobs[0].region_id, 7)
+        
+        # Unknown regions are rejected
+        mock_db.query.return_value.filter.return_value.all.return_value = []
+        with self.assertRaises(ValueError):
+            create_jobs_batch(mock_db, batch_data)
+    
+    @patch('app.services.job_service.os.path.exists')
+    @patch('app.services.job_service.get_job_scenes')
+    @patch('app.services.job_service.get_job_by_id')
+    def test_plan_incremental_run(self, mock_get_job_by_id, mock_get_job_scenes, mock_exists):
+        mock_db = MagicMock()
+        parent = SimpleNamespace(status="completed", start_date=datetime(2023, 1, 1), end_date=datetime(2023, 1, 31), result="RESULT")
+        mock_get_job_by_id.return_value = parent
+        mock_get_job_scenes.return_value = [
+            SimpleNamespace(sensor="sentinel2", acquired_at=datetime(2023, 1, day), scene_path=f"s_{day}.tif", masked_path=f"masked_s_{day}.tif")
+            for day in (5, 20)
+        ]
+        mock_exists.return_value = True
+        
+        # Extended end date: every prior scene is reused, only February is ingested
+        plan = plan_incremental_run(mock_db, 3, "2023-01-01T00:00:00", "2023-02-28T00:00:00")
+        self.assertEqual([scene["masked_path"] for scene in plan["scenes"]], ["masked_s_5.tif", "masked_s_20.tif"])
+        self.assertEqual(plan["imagery_start_date"], "2023-02-01")
+        self.assertTrue(plan["new_imagery"])
+        self.assertFalse(plan["same_range"])
+        self.assertEqual(plan["previous_job_id"], 3)
+        self.assertEqual(plan["result"], "RESULT")
+        
+        # A rerun of the prior range can reuse its predictions
+        plan = plan_incremental_run(mock_db, 3, "2023-01-01T00:00:00", "2023-01-31T00:00:00")
+        self.assertFalse(plan["new_imagery"])
+        self.assertTrue(plan["same_range"])
+        
+        # An earlier end date keeps every scene but changes the weather window
+        plan = plan_incremental_run(mock_db, 3, "2023-01-01T00:00:00", "2023-01-25T00:00:00")
+        self.assertFalse(plan["new_imagery"])
+        self.assertEqual(plan["previous_job_id"], 3)
+        self.assertFalse(plan["same_range"])
+        
+        # A later start date drops a scene, so the prior composite no longer applies
+        plan = plan_incremental_run(mock_db, 3, "2023-01-10T00:00:00", "2023-01-31T00:00:00")
+        self.assertEqual(len(plan["scenes"]), 1)
+        self.assertFalse(plan["new_imagery"])
+        self.assertIsNone(plan["previous_job_id"])
+        
+        # A range starting before the prior job runs in full
+        self.assertIsNone(plan_incremental_run(mock_db, 3, "2022-12-15T00:00:00", "2023-01-31T00:00:00"))
+        
+        # Masked products cleaned up, or prior job not completed
+        mock_exists.return_value = False
+        self.assertIsNone(plan_incremental_run(mock_db, 3, "2023-01-01T00:00:00", "2023-02-28T00:00:00"))
+        mock_exists.return_value = True
+        parent.status = "failed"
+        self.assertIsNone(plan_incremental_run(mock_db, 3, "2023-01-01T00:00:00", "2023-02-28T00:00:00"))
     
     @patch('app.services.job_service.from_shape')
     def test_create_region_from_geojson(self, mock_from_shape):
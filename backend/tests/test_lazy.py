@@ -0,0 +1,30 @@
+import unittest
+import sys
+import os
+
+# Add the parent directory to the path so we can import the app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.lazy import lazy_import
+from benchmarks.imports import ENTRY_POINTS, measure_import
+
+class TestLazyImports(unittest.TestCase):
+
+    def test_lazy_import(self):
+        module = lazy_import("json.decoder")
+        self.assertIn("not loaded", repr(module))
+        
+        self.assertEqual(module.JSONDecoder().decode("[1]"), [1])
+        self.assertIn("(loaded)", repr(module))
+        
+        with self.assertRaises(ModuleNotFoundError):
+            lazy_import("no_such_module_anywhere").value
+    
+    def test_entry_points_skip_heavy_stacks(self):
+        # The API and the worker must not load torch, matplotlib etc. at boot
+        for module in ENTRY_POINTS:
+            with self.subTest(module=module):
+                self.assertEqual(measure_import(module)["unexpected_modules"], [])
+
+if __name__ == '__main__':
+    unittest.main()
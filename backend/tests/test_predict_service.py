@@ -2,13 +2,20 @@ import unittest
 from unittest.mock import patch, MagicMock
 import sys
 import os
+import tempfile
 import torch
 import numpy as np
+import rasterio
+from rasterio.transform import from_bounds
 
 # Add the parent directory to the path so we can import the app modules
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from app.services.predict_service import load_model, predict_soc, predict_moisture, SoilCNN
+from app.services.predict_service import (
+    load_model, predict_soc, predict_moisture, SoilCNN, MODEL_CHANNELS, MODEL_VARIANTS, _prepare_model,
+    calibration_inputs, check_accuracy, optimize_model, to_model_input,
+    compute_normalization, load_normalization, normalize_features, save_normalization, summarize_prediction
+)
 
 class TestPredictService(unittest.TestCase):
     
@@ -42,10 +49,10 @@ class TestPredictService(unittest.TestCase):
         self.assertIsInstance(soc_model, SoilCNN)
         self.assertEqual(soc_model.conv1.in_channels, 7)
         
-        # Test loading moisture model
+        # Test loading moisture model, which also takes the weather features
         moisture_model = load_model('dummy_path', model_type='moisture')
         self.assertIsInstance(moisture_model, SoilCNN)
-        self.assertEqual(moisture_model.conv1.in_channels, 7)
+        self.assertEqual(moisture_model.conv1.in_channels, 10)
     
     @patch('app.services.predict_service.rasterio.open')
     @patch('app.services.predict_service.load_model')
@@ -102,6 +109,101 @@ class TestPredictService(unittest.TestCase):
         self.assertIn('std', stats)
         mock_rasterio_open.assert_called_once_with('feature_stack.tif')
         mock_load_model.assert_called_once()
+    
+    def test_optimize_model_variants(self):
+        model = SoilCNN(in_channels=7).eval()
+        inputs = calibration_inputs(batches=2, tile_size=16)
+        
+        for variant in MODEL_VARIANTS:
+            for channels_last in (False, True):
+                optimized = optimize_model(model, variant, channels_last=channels_last, inputs=inputs)
+                with torch.no_grad():
+                    output = optimized(to_model_input(inputs[0], channels_last))
+                self.assertEqual(output.shape, (1, 1, 16, 16))
+                
+                delta = check_accuracy(model, optimized, inputs, channels_last=channels_last)
+                if variant == "int8_static":
+                    self.assertLess(delta["max_abs_error"], 0.05)
+                else:
+                    self.assertAlmostEqual(delta["max_abs_error"], 0.0, places=5)
+        
+        with self.assertRaises(ValueError):
+            optimize_model(model, "fp16")
+    
+    @patch('app.services.predict_service.settings')
+    def test_load_model_variant(self, mock_settings):
+        mock_settings.MODEL_CHANNELS_LAST = False
+        mock_settings.MODEL_MAX_ACCURACY_DELTA = 0.05
+        mock_settings.SOC_MODEL_VARIANT = "frozen"
+        _prepare_model.cache_clear()
+        
+        # Prepared once per process and reused
+        model = load_model('dummy_path', model_type='soc')
+        self.assertIsInstance(model, torch.jit.ScriptModule)
+        self.assertIs(load_model('dummy_path', model_type='soc'), model)
+        
+        # Variants that drift too far fall back to the float model
+        mock_settings.MODEL_MAX_ACCURACY_DELTA = -1
+        with self.assertWarns(UserWarning):
+            fallback = load_model('dummy_path', model_type='soc', variant='int8_static')
+        self.assertIsInstance(fallback, SoilCNN)
+        _prepare_model.cache_clear()
+        
+        with self.assertRaises(ValueError):
+            load_model('dummy_path', model_type='soc', variant='fp16')
+    
+    def test_summarize_prediction(self):
+        stats = summarize_prediction(np.arange(101, dtype=np.float32).reshape(1, 101))
+        
+        self.assertEqual(stats["count"], 101)
+        self.assertEqual((stats["min"], stats["max"], stats["mean"]), (0.0, 100.0, 50.0))
+        self.assertEqual(stats["percentiles"], {"p10": 10.0, "p25": 25.0, "p50": 50.0, "p75": 75.0, "p90": 90.0})
+    
+    def test_normalize_features_default(self):
+        load_normalization.cache_clear()
+        features = np.full((7, 4, 4), 5000, dtype=np.float32)
+        features[4:] = -0.5  # Indices are already in [-1, 1]
+        
+        result = normalize_features(features, '/nonexistent/model.pt')
+        
+        # Normalized in place, bands scaled to 0-1 and indices left as they are
+        self.assertIs(result, features)
+        np.testing.assert_allclose(features[:, 0, 0], [0.5] * 4 + [-0.5] * 3)
+    
+    def test_stored_normalization(self):
+        load_normalization.cache_clear()
+        
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # Training feature stack with a nodata pixel
+            data = np.stack([np.full((8, 8), value, dtype=np.float32) for value in range(1, 8)])
+            data[:, :4] *= 3
+            data[:, 0, 0] = 0
+            stack_path = os.path.join(tmpdir, 'feature_stack.tif')
+            with rasterio.open(
+                stack_path, 'w', driver='GTiff', height=8, width=8, count=7,
+                dtype='float32', crs='EPSG:4326', transform=from_bounds(0, 0, 1, 1, 8, 8)
+            ) as dst:
+                dst.write(data)
+            
+            mean, std = compute_normalization([stack_path])
+            model_path = os.path.join(tmpdir, 'model.pt')
+            save_normalization(model_path, mean, std)
+            
+            features = data.copy()
+            normalize_features(features, model_path)
+            # The moisture model's weather channels fall back to the defaults
+            scale, shift = load_normalization(model_path, MODEL_CHANNELS["moisture"])
+            load_normalization.cache_clear()
+        
+        np.testing.assert_allclose(scale[7:, 0, 0].numpy(), [1 / 1000, 1 / 500, 1 / 50])
+        np.testing.assert_allclose(shift[:7, 0, 0].numpy(), -np.asarray(mean) / np.asarray(std), rtol=1e-6)
+        
+        valid = (data != 0).any(axis=0)
+        np.testing.assert_allclose(features[:, valid].mean(axis=1), 0, atol=1e-5)
+        np.testing.assert_allclose(features[:, valid].std(axis=1), 1, atol=1e-4)
+        
+        with self.assertRaises(ValueError):
+            save_normalization('model.pt', [0.0], [1.0, 2.0])
 
 if __name__ == '__main__':
     unittest.main()
@@ -2,14 +2,29 @@ import unittest
 from unittest.mock import patch, MagicMock
 import sys
 import os
+import tempfile
+import numpy as np
+import rasterio
+from rasterio.transform import from_bounds
 
 # Add the parent directory to the path so we can import the app modules
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from app.services.preprocess_service import apply_cloud_mask, compute_indices, reproject_and_clip, create_feature_stack
+from app.services import preprocess_service
+from app.services.preprocess_service import (
+    apply_cloud_mask, compute_indices, reproject_and_clip, create_feature_stack, create_temporal_composite,
+    fuse_sources, get_warp_map, harmonize_landsat_to_sentinel, resample_to_grid, TargetGrid
+)
+
+def write_scene(path, data, bounds=(0, 0, 1, 1)):
+    with rasterio.open(
+        path, 'w', driver='GTiff', height=data.shape[1], width=data.shape[2], count=data.shape[0],
+        dtype=data.dtype, crs='EPSG:4326', transform=from_bounds(*bounds, data.shape[2], data.shape[1])
+    ) as dst:
+        dst.write(data)
 
 class TestPreprocessService(unittest.TestCase):
-    
+
     @patch('app.services.preprocess_service.rasterio.open')
     def test_apply_cloud_mask_sentinel(self, mock_rasterio_open):
         # Setup mock for rasterio.open context manager
@@ -26,7 +41,7 @@ class TestPreprocessService(unittest.TestCase):
         self.assertIsNotNone(result)
         mock_rasterio_open.assert_called_once_with('test_image.tif')
         mock_src.read.assert_called_once()
-        
+    
     @patch('app.services.preprocess_service.rasterio.open')
     def test_apply_cloud_mask_landsat(self, mock_rasterio_open):
         # Setup mock for rasterio.open context manager
@@ -62,35 +77,79 @@ class TestPreprocessService(unittest.TestCase):
         self.assertIn('evi', result)
         self.assertIn('ndmi', result)
         mock_rasterio_open.assert_called_once_with('test_image.tif')
+    
+    def test_reproject_and_clip(self):
+        region_geojson = {
+            "type": "Feature",
+            "geometry": {
+                "type": "Polygon",
+                "coordinates": [[[0.2, 0.2], [0.2, 0.6], [0.6, 0.2], [0.2, 0.2]]]
+            }
+        }
         
-    @patch('app.services.preprocess_service.mask')
-    @patch('app.services.preprocess_service.rasterio.open')
-    def test_reproject_and_clip(self, mock_rasterio_open, mock_mask):
-        # Setup mocks
-        mock_src = MagicMock()
-        mock_src.__enter__.return_value = mock_src
-        mock_src.profile = {'count': 4, 'dtype': 'uint16'}
-        mock_rasterio_open.return_value = mock_src
-        
-        mock_mask.return_value = (MagicMock(), MagicMock())  # (out_image, out_transform)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            image_path = os.path.join(tmpdir, 'image.tif')
+            write_scene(image_path, np.full((2, 100, 100), 500, dtype=np.uint16))
+            
+            result = reproject_and_clip(image_path, region_geojson, target_crs='EPSG:3857')
+            again = reproject_and_clip(image_path, region_geojson, target_crs='EPSG:3857', output_path=os.path.join(tmpdir, 'again.tif'))
+            
+            with rasterio.open(result) as src:
+                clipped = src.read()
+                crs, bounds, transform = src.crs, src.bounds, src.transform
+            with rasterio.open(again) as src:
+                # The second job reuses the cached warp plan and lands on the same grid
+                self.assertEqual(src.transform, transform)
         
-        # Mock GeoJSON
+        self.assertEqual(result, os.path.join(tmpdir, 'clipped_image.tif'))
+        self.assertEqual(crs.to_epsg(), 3857)
+        # Output covers the region's bbox only (~0.4 degrees is ~44.5 km)
+        self.assertAlmostEqual((bounds.right - bounds.left) / 1000, 44.5, delta=2)
+        # Inside the triangle is data, the opposite corner of the bbox is nodata
+        self.assertEqual(clipped[0, -2, 1], 500)
+        self.assertEqual(clipped[0, 1, -2], 0)
+    
+    def test_reproject_and_clip_keeps_zero_values(self):
         region_geojson = {
             "type": "Feature",
             "geometry": {
                 "type": "Polygon",
-                "coordinates": [[[0, 0], [0, 1], [1, 1], [1, 0], [0, 0]]]
+                "coordinates": [[[0.2, 0.2], [0.2, 0.6], [0.6, 0.6], [0.6, 0.2], [0.2, 0.2]]]
             }
         }
         
-        # Call the function
-        result = reproject_and_clip('test_image.tif', region_geojson)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # A single index band without a nodata value, alternating between 0 and 1000
+            index = np.zeros((1, 100, 100), dtype=np.float32)
+            index[:, :, ::2] = 1000
+            image_path = os.path.join(tmpdir, 'image.tif')
+            write_scene(image_path, index)
+            
+            with rasterio.open(reproject_and_clip(image_path, region_geojson, target_crs='EPSG:3857')) as src:
+                clipped = src.read(1)
         
-        # Assertions
-        self.assertIsNotNone(result)
-        mock_rasterio_open.assert_called_once_with('test_image.tif')
-        mock_mask.assert_called_once()
+        # Zeros are interpolated like any other value instead of being
+        # masked as nodata
+        interior = clipped[2:-2, 2:-2]
+        self.assertFalse((interior == 0).any())
+        self.assertAlmostEqual(interior.mean(), 500, delta=50)
+    
+    def test_reproject_and_clip_outside_image(self):
+        region_geojson = {
+            "type": "Feature",
+            "geometry": {
+                "type": "Polygon",
+                "coordinates": [[[5, 5], [5, 6], [6, 6], [6, 5], [5, 5]]]
+            }
+        }
         
+        with tempfile.TemporaryDirectory() as tmpdir:
+            image_path = os.path.join(tmpdir, 'image.tif')
+            write_scene(image_path, np.full((1, 10, 10), 500, dtype=np.uint16))
+            
+            with self.assertRaises(ValueError):
+                reproject_and_clip(image_path, region_geojson)
+    
     @patch('app.services.preprocess_service.rasterio.open')
     def test_create_feature_stack(self, mock_rasterio_open):
         # Setup mock for rasterio.open context manager
@@ -122,6 +181,151 @@ class TestPreprocessService(unittest.TestCase):
         self.assertIsNotNone(result)
         # Should open each file (1 image + 3 indices = 4 calls)
         self.assertEqual(mock_rasterio_open.call_count, 4)
+    
+    @patch('app.services.preprocess_service.settings')
+    def test_create_temporal_composite(self, mock_settings):
+        mock_settings.COMPOSITE_MEMORY_MB = 0  # Force one-row blocks
+        
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # Three 4-band scenes with constant values 100, 200, 900
+            paths = []
+            for i, value in enumerate([100, 200, 900]):
+                data = np.full((4, 6, 5), value, dtype=np.uint16)
+                if i == 2:
+                    data[:, 0, 0] = 0  # Cloud-masked pixel in the last scene
+                if i == 0:
+                    data[3, 1, 1] = 1000  # Greener pixel in the first scene
+                path = os.path.join(tmpdir, f'scene_{i}.tif')
+                write_scene(path, data)
+                paths.append(path)
+            
+            median_path = create_temporal_composite(paths, method='median', output_path=os.path.join(tmpdir, 'median.tif'))
+            best_path = create_temporal_composite(paths, method='best_pixel', output_path=os.path.join(tmpdir, 'best.tif'))
+            
+            with rasterio.open(median_path) as src:
+                median = src.read()
+            with rasterio.open(best_path) as src:
+                best = src.read()
+        
+        # Median over clear observations only
+        self.assertEqual(median[0, 2, 2], 200)
+        self.assertEqual(median[0, 0, 0], 150)
+        # Best pixel takes the observation with the highest NDVI
+        self.assertEqual(best[3, 1, 1], 1000)
+        self.assertEqual(best[0, 1, 1], 100)
+    
+    def test_update_best_pixel_composite(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            rng = np.random.default_rng(0)
+            paths = []
+            for i in range(3):
+                data = rng.integers(1, 10000, (4, 6, 5), dtype=np.uint16)
+                data[:, i, :] = 0  # A different cloud-masked row on each date
+                path = os.path.join(tmpdir, f'scene_{i}.tif')
+                write_scene(path, data)
+                paths.append(path)
+            
+            full_path = create_temporal_composite(paths, method='best_pixel', output_path=os.path.join(tmpdir, 'full.tif'))
+            previous_path = create_temporal_composite(paths[:2], method='best_pixel', output_path=os.path.join(tmpdir, 'previous.tif'))
+            updated_path = create_temporal_composite(
+                paths[2:], method='best_pixel', output_path=os.path.join(tmpdir, 'updated.tif'), previous_path=previous_path
+            )
+            
+            with rasterio.open(full_path) as src:
+                full = src.read()
+            with rasterio.open(updated_path) as src:
+                updated = src.read()
+            
+            with self.assertRaises(ValueError):
+                create_temporal_composite(paths[2:], method='median', previous_path=previous_path)
+        
+        # Folding new dates into the earlier composite matches compositing every date
+        np.testing.assert_array_equal(updated, full)
+    
+    def test_create_temporal_composite_rejects_bad_input(self):
+        with self.assertRaises(ValueError):
+            create_temporal_composite([], method='median')
+        with self.assertRaises(ValueError):
+            create_temporal_composite(['a.tif'], method='mean')
+    
+    def test_resample_to_grid(self):
+        preprocess_service.clear_warp_cache()
+        
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # 2x3 source covering the left three columns of a 4x4 target grid
+            source = np.array([[[100, 200, 0], [300, 400, 0]]], dtype=np.uint16)
+            source_path = os.path.join(tmpdir, 'source.tif')
+            write_scene(source_path, source, bounds=(0, 0, 0.75, 1))
+            
+            target_path = os.path.join(tmpdir, 'target.tif')
+            write_scene(target_path, np.ones((1, 4, 4), dtype=np.uint16))
+            grid = TargetGrid.from_raster(target_path)
+            
+            nearest_path = resample_to_grid(source_path, grid, output_path=os.path.join(tmpdir, 'nearest.tif'), resampling='nearest')
+            bilinear_path = resample_to_grid(source_path, grid, output_path=os.path.join(tmpdir, 'bilinear.tif'))
+            
+            with rasterio.open(nearest_path) as src:
+                nearest = src.read(1)
+                self.assertEqual(src.transform, grid.transform)
+            with rasterio.open(bilinear_path) as src:
+                bilinear = src.read(1)
+        
+        np.testing.assert_array_equal(nearest[:, :3], [[100, 200, 0], [100, 200, 0], [300, 400, 0], [300, 400, 0]])
+        # Pixels outside the source footprint are nodata
+        self.assertFalse(nearest[:, 3].any())
+        # Interior pixels are interpolated, pixels next to nodata fall back to nearest
+        self.assertAlmostEqual(bilinear[1, 0], 150, places=3)
+        self.assertEqual(bilinear[1, 1], 200)
+        # Both calls shared one warp map
+        self.assertEqual(len(preprocess_service._warp_cache), 1)
+        self.assertIs(get_warp_map(grid.crs, from_bounds(0, 0, 0.75, 1, 3, 2), grid, 0, 4), next(iter(preprocess_service._warp_cache.values())))
+    
+    @patch('app.services.preprocess_service.settings')
+    def test_warp_cache_is_bounded_by_bytes(self, mock_settings):
+        preprocess_service.clear_warp_cache()
+        # Two 16-row blocks of a 64-pixel wide grid (2 x 4 KiB each) fit, a third does not
+        mock_settings.RASTER_BLOCK_ROWS = 16
+        mock_settings.WARP_CACHE_MB = 20 * 2**10 / 2**20
+        
+        with tempfile.TemporaryDirectory() as tmpdir:
+            source_path = os.path.join(tmpdir, 'source.tif')
+            write_scene(source_path, np.full((1, 32, 32), 100, dtype=np.uint16))
+            target_path = os.path.join(tmpdir, 'target.tif')
+            write_scene(target_path, np.ones((1, 64, 64), dtype=np.uint16))
+            grid = TargetGrid.from_raster(target_path)
+            
+            with rasterio.open(resample_to_grid(source_path, grid, output_path=os.path.join(tmpdir, 'resampled.tif'))) as src:
+                resampled = src.read(1)
+        
+        # Every block was resampled, but only the most recent blocks are kept
+        self.assertTrue((resampled == 100).all())
+        self.assertEqual([key[-2] for key in preprocess_service._warp_cache], [32, 48])
+        self.assertEqual(preprocess_service._warp_cache_bytes, 2 * 2 * 16 * 64 * 4)
+        preprocess_service.clear_warp_cache()
+    
+    def test_harmonize_and_fuse_sources(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # Landsat order: Blue, Green, Red, NIR, SWIR1, SWIR2
+            landsat = np.stack([np.full((2, 2), value, dtype=np.uint16) for value in [1000, 2000, 3000, 4000, 5000, 6000]])
+            landsat_path = os.path.join(tmpdir, 'landsat.tif')
+            write_scene(landsat_path, landsat)
+            
+            # Sentinel order: Red, Green, Blue, NIR, with one pixel cloudy on every date
+            sentinel = np.full((4, 4, 4), 500, dtype=np.uint16)
+            sentinel[:, 0, 0] = 0
+            sentinel_path = os.path.join(tmpdir, 'sentinel.tif')
+            write_scene(sentinel_path, sentinel)
+            
+            grid = TargetGrid.from_raster(sentinel_path)
+            harmonized_path = harmonize_landsat_to_sentinel(landsat_path, grid)
+            fused_path = fuse_sources(sentinel_path, harmonized_path)
+            
+            with rasterio.open(fused_path) as src:
+                fused = src.read()
+        
+        # The gap is filled with bandpass-adjusted Landsat Red, Green, Blue, NIR
+        np.testing.assert_allclose(fused[:, 0, 0], [3000 * 0.9765 + 9, 2000 * 1.0053 - 9, 1000 * 0.9778 - 40, 4000 * 0.9983 - 1], rtol=1e-5)
+        self.assertTrue((fused[:, 1:, :] == 500).all())
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import tempfile
+import numpy as np
+
+# Add the parent directory to the path so we can import the app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.profiling import TaskProfiler
+
+def allocate_and_sum(megabytes):
+    data = np.ones(megabytes * 2**20, dtype=np.uint8)
+    return int(data.sum())
+
+def run_stage(job_id):
+    return allocate_and_sum(8)
+
+class TestProfiling(unittest.TestCase):
+
+    def test_task_profiler(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with TaskProfiler(tmpdir, 'task_predict', top=10) as profiler:
+                allocate_and_sum(8)
+            
+            self.assertEqual(set(profiler.artifacts), {"cpu", "cpu_summary", "memory"})
+            self.assertTrue(all(os.path.exists(path) for path in profiler.artifacts.values()))
+            self.assertEqual(os.path.basename(profiler.artifacts["cpu"]), 'task_predict.pstats')
+            
+            with open(profiler.artifacts["cpu_summary"]) as f:
+                self.assertIn('allocate_and_sum', f.read())
+            with open(profiler.artifacts["memory"]) as f:
+                peak_line = f.readline()
+        
+        # The 8 MiB array was traced even though it was freed before the end
+        self.assertGreaterEqual(float(peak_line.split()[2]), 8)
+    
+    @patch('app.tasks.base.save_job_stages')
+    @patch('app.tasks.base.save_job_profiles')
+    @patch('app.tasks.base.upload_file')
+    @patch('app.tasks.base.SessionLocal')
+    def test_stage_task_profile_flag(self, mock_session_local, mock_upload_file, mock_save_job_profiles, mock_save_job_stages):
+        from celery import Celery
+        from app.tasks.base import StageTask
+        
+        mock_upload_file.return_value = True
+        task = Celery("test").task(base=StageTask, name="app.tasks.worker.task_example", shared=False)(run_stage)
+        
+        # Not profiled unless asked
+        self.assertEqual(task(job_id=4), 8 * 2**20)
+        mock_upload_file.assert_not_called()
+        
+        # The flag is consumed by the task class, not passed to the task function
+        self.assertEqual(task(job_id=4, profile=True), 8 * 2**20)
+        
+        self.assertEqual(mock_upload_file.call_count, 3)
+        kwargs = mock_save_job_profiles.call_args.kwargs
+        self.assertEqual(kwargs["job_id"], 4)
+        self.assertEqual(kwargs["task_name"], "task_example")
+        self.assertEqual(set(kwargs["object_names"]), {"cpu", "cpu_summary", "memory"})
+        self.assertTrue(kwargs["object_names"]["cpu"].startswith("profiles/job_4/"))
+
+if __name__ == '__main__':
+    unittest.main()
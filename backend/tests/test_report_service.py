@@ -11,8 +11,8 @@ from app.services.report_service import generate_map_image, generate_histogram,
 class TestReportService(unittest.TestCase):
     
     @patch('app.services.report_service.rasterio.open')
-    @patch('app.services.report_service.FigureCanvas')
-    @patch('app.services.report_service.Figure')
+    @patch('app.services.report_service.backend_agg.FigureCanvasAgg')
+    @patch('app.services.report_service.figure.Figure')
     def test_generate_map_image(self, mock_figure, mock_canvas, mock_rasterio_open):
         # Setup mocks
         mock_src = MagicMock()
@@ -33,8 +33,8 @@ class TestReportService(unittest.TestCase):
         mock_fig_instance.savefig.assert_called_once()
 
     @patch('app.services.report_service.rasterio.open')
-    @patch('app.services.report_service.FigureCanvas')
-    @patch('app.services.report_service.Figure')
+    @patch('app.services.report_service.backend_agg.FigureCanvasAgg')
+    @patch('app.services.report_service.figure.Figure')
     def test_generate_histogram(self, mock_figure, mock_canvas, mock_rasterio_open):
         # Setup mocks
         mock_src = MagicMock()
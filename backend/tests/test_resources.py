@@ -0,0 +1,34 @@
+import unittest
+import sys
+import os
+import tempfile
+import numpy as np
+
+# Add the parent directory to the path so we can import the app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.resources import ResourceMeter, read_peak_rss, read_rss
+
+class TestResources(unittest.TestCase):
+
+    def test_resource_meter(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with ResourceMeter() as meter:
+                data = np.ones(20 * 2**20, dtype=np.uint8)  # 20 MiB
+                with open(os.path.join(tmpdir, 'out.bin'), 'wb') as f:
+                    f.write(data.tobytes())
+                del data
+        
+        usage = meter.usage
+        self.assertGreater(usage["wall_seconds"], 0)
+        self.assertGreaterEqual(usage["cpu_seconds"], 0)
+        self.assertGreaterEqual(usage["peak_rss_bytes"], read_rss())
+        if os.path.exists('/proc/self/io'):
+            self.assertGreaterEqual(usage["bytes_written"], 20 * 2**20)
+        if meter.rss_reset:
+            # The peak covers the array even though it was freed
+            self.assertGreaterEqual(usage["peak_rss_bytes"], 20 * 2**20)
+        self.assertGreaterEqual(read_peak_rss(), read_rss())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,230 @@
+import unittest
+from unittest.mock import patch, MagicMock
+import sys
+import os
+import tempfile
+import numpy as np
+import rasterio
+from rasterio.transform import from_bounds
+
+# Add the parent directory to the path so we can import the app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services.result_raster_service import (
+    RasterCache, compute_raster_diff, compute_zonal_stats, get_result_layer_paths, get_zonal_stats, sample_result_layers
+)
+
+def make_zone(minx, miny, maxx, maxy, name):
+    return {
+        "type": "Feature",
+        "geometry": {
+            "type": "Polygon",
+            "coordinates": [[[minx, miny], [minx, maxy], [maxx, maxy], [maxx, miny], [minx, miny]]]
+        },
+        "properties": {"name": name}
+    }
+
+class TestResultRasterService(unittest.TestCase):
+
+    def setUp(self):
+        # 100x100 raster over [0, 1] x [0, 1] whose value is the column index
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.raster_path = os.path.join(self.tmpdir.name, 'soc.tif')
+        data = np.tile(np.arange(100, dtype=np.float32), (100, 1))
+        with rasterio.open(
+            self.raster_path, 'w', driver='GTiff', height=100, width=100, count=1,
+            dtype=np.float32, crs='EPSG:4326', transform=from_bounds(0, 0, 1, 1, 100, 100)
+        ) as dst:
+            dst.write(data, 1)
+    
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    
+    @patch('app.services.result_raster_service.settings')
+    def test_compute_zonal_stats(self, mock_settings):
+        mock_settings.ZONAL_MAX_FEATURES = 10
+        mock_settings.RASTER_BLOCK_ROWS = 16  # Force several strips
+        
+        zones = {
+            "type": "FeatureCollection",
+            "features": [
+                make_zone(0.0, 0.0, 0.1, 1.0, "west"),   # columns 0-9
+                make_zone(0.5, 0.5, 0.6, 0.6, "middle"), # columns 50-59
+                make_zone(2.0, 2.0, 3.0, 3.0, "outside")
+            ]
+        }
+        
+        with rasterio.open(self.raster_path) as src:
+            stats = compute_zonal_stats(src, zones, percentiles=[50])
+        
+        self.assertEqual(len(stats), 3)
+        self.assertEqual(stats[0]["properties"], {"name": "west"})
+        self.assertEqual(stats[0]["count"], 1000)
+        self.assertAlmostEqual(stats[0]["mean"], 4.5)
+        self.assertEqual(stats[0]["min"], 0)
+        self.assertEqual(stats[0]["max"], 9)
+        self.assertEqual(stats[1]["count"], 100)
+        self.assertAlmostEqual(stats[1]["percentiles"]["p50"], 54.5)
+        self.assertEqual(stats[2]["count"], 0)
+        self.assertIsNone(stats[2]["mean"])
+    
+    @patch('app.services.result_raster_service.settings')
+    def test_compute_zonal_stats_overlapping_zones(self, mock_settings):
+        mock_settings.ZONAL_MAX_FEATURES = 10
+        mock_settings.RASTER_BLOCK_ROWS = 16
+        
+        zones = {
+            "type": "FeatureCollection",
+            "features": [
+                make_zone(0.5, 0.5, 0.6, 0.6, "management zone"),  # columns 50-59, inside the field
+                make_zone(0.0, 0.0, 1.0, 1.0, "field"),
+                make_zone(0.0, 0.0, 0.5, 1.0, "west half"),         # columns 0-49, shares an edge with the zone
+                make_zone(0.6, 0.0, 1.0, 1.0, "east part")          # columns 60-99
+            ]
+        }
+        
+        with rasterio.open(self.raster_path) as src:
+            stats = compute_zonal_stats(src, zones, percentiles=[50])
+        
+        # Pixels inside several zones count towards each of them
+        self.assertEqual(stats[0]["count"], 100)
+        self.assertAlmostEqual(stats[0]["mean"], 54.5)
+        self.assertEqual(stats[1]["count"], 10000)
+        self.assertAlmostEqual(stats[1]["mean"], 49.5)
+        self.assertEqual(stats[2]["count"], 5000)
+        self.assertEqual(stats[2]["max"], 49)
+        self.assertEqual(stats[3]["count"], 4000)
+        self.assertEqual(stats[3]["min"], 60)
+    
+    def test_compute_zonal_stats_validation(self):
+        with rasterio.open(self.raster_path) as src:
+            with self.assertRaises(ValueError):
+                compute_zonal_stats(src, {"type": "FeatureCollection", "features": []})
+            with self.assertRaises(ValueError):
+                compute_zonal_stats(src, {"type": "FeatureCollection", "features": [{"type": "Feature", "properties": {}}]})
+    
+    def test_get_result_layer_paths(self):
+        result = MagicMock()
+        result.soc_map_path = 'soc.tif'
+        result.moisture_map_path = None
+        
+        self.assertEqual(get_result_layer_paths(result, ['soc']), {'soc': 'soc.tif'})
+        with self.assertRaises(ValueError):
+            get_result_layer_paths(result, ['moisture'])
+        with self.assertRaises(ValueError):
+            get_result_layer_paths(result, ['clay'])
+    
+    def test_get_zonal_stats(self):
+        result = MagicMock()
+        result.soc_map_path = self.raster_path
+        zones = {"type": "FeatureCollection", "features": [make_zone(0.0, 0.0, 0.1, 1.0, "west")]}
+        
+        # Call the function
+        stats = get_zonal_stats(result, zones, layers=['soc'], percentiles=[10, 90])
+        
+        # Assertions
+        self.assertEqual(len(stats), 1)
+        self.assertEqual(stats[0]["index"], 0)
+        self.assertIn('soc', stats[0]["layers"])
+        self.assertEqual(set(stats[0]["layers"]["soc"]["percentiles"]), {'p10', 'p90'})
+    
+    def test_raster_cache_sample(self):
+        cache = RasterCache(max_handles=1, max_block_bytes=1024 * 1024, min_tile=32)
+        
+        # Pixel centres of columns 5 and 73, a point outside, and a repeat
+        values = cache.sample(self.raster_path, [0.055, 0.735, 1.5, 0.055], [0.5, 0.05, 0.5, 0.95])
+        
+        self.assertEqual(values[0], 5)
+        self.assertEqual(values[1], 73)
+        self.assertTrue(np.isnan(values[2]))
+        self.assertEqual(values[3], 5)
+        
+        # Sampling again is served from cached tiles without reading the file
+        with patch.object(cache, '_open') as mock_open:
+            cache.sample(self.raster_path, [0.055], [0.5])
+            mock_open.assert_not_called()
+    
+    def test_raster_cache_evicts_handles(self):
+        cache = RasterCache(max_handles=1, max_block_bytes=1024 * 1024)
+        other_path = os.path.join(self.tmpdir.name, 'copy.tif')
+        with rasterio.open(self.raster_path) as src, rasterio.open(other_path, 'w', **src.profile) as dst:
+            dst.write(src.read())
+        
+        first = cache.get_handle(self.raster_path)
+        cache.get_handle(other_path)
+        
+        # The least recently used dataset is closed once the cache is full
+        self.assertTrue(first["src"].closed)
+        self.assertEqual(cache.sample(self.raster_path, [0.055], [0.5])[0], 5)
+    
+    def test_raster_cache_reopens_expired_handles(self):
+        cache = RasterCache(max_handles=2, max_block_bytes=1024 * 1024, max_age=60)
+        first = cache.get_handle(self.raster_path)
+        self.assertIs(cache.get_handle(self.raster_path), first)
+        
+        # Past max_age the handle is closed and the raster opened again
+        with patch('app.services.result_raster_service.time.monotonic', return_value=first["opened_at"] + 61):
+            second = cache.get_handle(self.raster_path)
+        self.assertIsNot(second, first)
+        self.assertTrue(first["src"].closed)
+        self.assertEqual(cache.sample(self.raster_path, [0.055], [0.5])[0], 5)
+    
+    @patch('app.services.result_raster_service.settings')
+    def test_compute_raster_diff(self, mock_settings):
+        mock_settings.RASTER_BLOCK_ROWS = 16  # Force several strips
+        
+        # Later result: column index + 2 over the western half only, at half the resolution
+        later_path = os.path.join(self.tmpdir.name, 'later.tif')
+        data = np.tile(np.arange(0, 50, 2, dtype=np.float32) + 2.5, (50, 1))  # Column centres of the finer grid, + 2
+        data[0, :] = -1  # Nodata row
+        with rasterio.open(
+            later_path, 'w', driver='GTiff', height=50, width=25, count=1, dtype=np.float32,
+            crs='EPSG:4326', transform=from_bounds(0, 0, 0.5, 1, 25, 50), nodata=-1
+        ) as dst:
+            dst.write(data, 1)
+        
+        output_path = os.path.join(self.tmpdir.name, 'diff.tif')
+        with rasterio.open(self.raster_path) as src_a, rasterio.open(later_path) as src_b:
+            stats = compute_raster_diff(src_a, src_b, output_path)
+        
+        with rasterio.open(output_path) as src:
+            self.assertEqual(src.driver, 'GTiff')
+            self.assertEqual(src.profile['tiled'], True)
+            self.assertEqual((src.width, src.height), (100, 100))  # Grid of the earlier result
+            delta = src.read(1)
+        
+        # Only the overlap outside the nodata row is compared
+        self.assertTrue(np.isnan(delta[:, 60]).all())
+        self.assertTrue(np.isnan(delta[0:2, 10]).all())
+        self.assertEqual(stats["count"], np.isfinite(delta).sum())
+        self.assertEqual(delta[50, 20], 2)
+        self.assertEqual(stats["increased"] + stats["decreased"], np.count_nonzero(np.isfinite(delta) & (delta != 0)))
+        self.assertAlmostEqual(stats["mean"], float(np.nanmean(delta)), places=4)
+        
+        # Rasters that do not overlap cannot be compared
+        far_path = os.path.join(self.tmpdir.name, 'far.tif')
+        with rasterio.open(
+            far_path, 'w', driver='GTiff', height=10, width=10, count=1, dtype=np.float32,
+            crs='EPSG:4326', transform=from_bounds(5, 5, 6, 6, 10, 10)
+        ) as dst:
+            dst.write(np.zeros((10, 10), dtype=np.float32), 1)
+        with rasterio.open(self.raster_path) as src_a, rasterio.open(far_path) as src_b:
+            with self.assertRaises(ValueError):
+                compute_raster_diff(src_a, src_b, os.path.join(self.tmpdir.name, 'far_diff.tif'))
+    
+    @patch('app.services.result_raster_service.raster_cache')
+    def test_sample_result_layers(self, mock_cache):
+        mock_cache.sample.return_value = np.array([1.5, np.nan])
+        result = MagicMock()
+        result.soc_map_path = 'soc.tif'
+        
+        # Call the function
+        values = sample_result_layers(result, [[0.1, 0.1], [5, 5]], layers=['soc'])
+        
+        # Assertions
+        self.assertEqual(values, {'soc': [1.5, None]})
+        with self.assertRaises(ValueError):
+            sample_result_layers(result, [], layers=['soc'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+import sys
+import os
+from datetime import datetime
+from types import SimpleNamespace
+
+# Add the parent directory to the path so we can import the app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy.dialects import postgresql
+
+from app.services.result_service import check_diff_jobs, get_region_timeseries_async, record_job_timeseries
+
+class TestResultService(unittest.TestCase):
+
+    def test_record_job_timeseries(self):
+        # Setup mocks
+        mock_db = MagicMock()
+        mock_db.execute.return_value.one.return_value = (7, datetime(2023, 6, 30))
+        stats = {
+            "soc": {"count": 100, "min": 1.0, "max": 9.0, "mean": 5.0, "std": 2.0, "percentiles": {"p10": 2.0, "p50": 5.0, "p90": 8.0}},
+            "moisture": {"min": 10.0, "max": 30.0, "mean": 20.0}
+        }
+        
+        # Call the function
+        record_job_timeseries(mock_db, 3, stats)
+        
+        # One upsert for both layers, keyed by region, layer and date
+        statement = mock_db.execute.call_args_list[1][0][0]
+        sql = str(statement.compile(dialect=postgresql.dialect()))
+        self.assertIn("ON CONFLICT (region_id, layer, observed_at) DO UPDATE", sql)
+        
+        params = statement.compile(dialect=postgresql.dialect()).params
+        self.assertEqual(params["region_id_m0"], 7)
+        self.assertEqual(params["layer_m0"], "soc")
+        self.assertEqual(params["p50_m0"], 5.0)
+        self.assertEqual(params["observed_at_m1"], datetime(2023, 6, 30))
+        self.assertIsNone(params["p50_m1"])
+        mock_db.commit.assert_called_once()
+    
+    def test_get_region_timeseries_async(self):
+        # Setup mocks
+        mock_db = MagicMock()
+        mock_result = MagicMock()
+        mock_result.all.return_value = ["POINT"]
+        mock_db.execute = AsyncMock(return_value=mock_result)
+        
+        # Call the function
+        points = asyncio.run(get_region_timeseries_async(mock_db, 7, layer="soc", start=datetime(2020, 1, 1)))
+        
+        # Assertions
+        self.assertEqual(points, ["POINT"])
+        sql = str(mock_db.execute.call_args[0][0])
+        self.assertIn("region_timeseries.layer = ", sql)
+        self.assertIn("region_timeseries.observed_at >= ", sql)
+        self.assertIn("ORDER BY region_timeseries.layer, region_timeseries.observed_at", sql)
+    
+    def test_check_diff_jobs(self):
+        earlier = SimpleNamespace(id=1, region_id=7, end_date=datetime(2023, 6, 30))
+        later = SimpleNamespace(id=2, region_id=7, end_date=datetime(2024, 6, 30))
+        check_diff_jobs(earlier, later)
+        
+        # The difference is b - a, so a must not end after b
+        with self.assertRaises(ValueError):
+            check_diff_jobs(later, earlier)
+        # Only runs over the same region are compared
+        with self.assertRaises(ValueError):
+            check_diff_jobs(earlier, SimpleNamespace(id=3, region_id=8, end_date=datetime(2024, 6, 30)))
+
+if __name__ == '__main__':
+    unittest.main()
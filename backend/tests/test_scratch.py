@@ -0,0 +1,118 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import json
+import tempfile
+import time
+
+# Add the parent directory to the path so we can import the app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.scratch import ScratchArea, ScratchQuotaExceeded, create_job_workspace, prune_scene_cache, touch_paths
+from app.services.job_service import estimate_job_scratch_bytes
+
+MB = 2**20
+
+class TestScratch(unittest.TestCase):
+
+    def test_quota_admission(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            area = ScratchArea(tmpdir, 100 * MB)
+            first = area.try_acquire(1, 60 * MB)
+            self.assertIsNotNone(first)
+            
+            # Reservations count before anything is written
+            self.assertIsNone(area.try_acquire(2, 60 * MB))
+            with self.assertRaises(ScratchQuotaExceeded):
+                area.acquire(2, 60 * MB, timeout=0)
+            with self.assertRaises(ScratchQuotaExceeded):
+                area.acquire(3, 200 * MB)
+            
+            # Cleanup deletes the intermediates and frees the reservation
+            with open(first.file("feature_stack.tif"), "wb") as f:
+                f.write(os.urandom(MB))
+            self.assertGreaterEqual(first.cleanup(), MB)
+            self.assertFalse(os.path.exists(first.path))
+            
+            with area.acquire(2, 60 * MB, timeout=0) as second:
+                usage = area.usage()
+                self.assertEqual(usage["reserved_bytes"], 60 * MB)
+                self.assertEqual([workspace["job_id"] for workspace in usage["workspaces"]], [2])
+            self.assertEqual(area.usage()["workspaces"], [])
+    
+    def test_reap_stale_workspaces(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            area = ScratchArea(tmpdir, 100 * MB)
+            stale = area.try_acquire(1, 80 * MB)
+            remote = area.try_acquire(3, 10 * MB)
+            
+            # Pretend the owning worker processes died without cleaning up,
+            # one of them in another container sharing the root
+            for workspace, host in ((stale, None), (remote, "other-container")):
+                reservation_path = workspace.file(".reservation")
+                with open(reservation_path) as f:
+                    reservation = json.load(f)
+                reservation["pid"] = 2**22 + 1
+                reservation["host"] = host or reservation["host"]
+                with open(reservation_path, "w") as f:
+                    json.dump(reservation, f)
+            
+            self.assertIsNotNone(area.try_acquire(2, 80 * MB))
+            self.assertFalse(os.path.exists(stale.path))
+            # Its PID cannot be checked from here
+            self.assertTrue(os.path.exists(remote.path))
+    
+    def test_create_job_workspace(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpfs_dir = os.path.join(tmpdir, "tmpfs")
+            disk_dir = os.path.join(tmpdir, "disk")
+            with patch('app.core.scratch.settings.SCRATCH_TMPFS_DIR', tmpfs_dir), \
+                    patch('app.core.scratch.settings.SCRATCH_DIR', disk_dir), \
+                    patch('app.core.scratch.settings.SCRATCH_TMPFS_QUOTA_MB', 100), \
+                    patch('app.core.scratch.settings.SCRATCH_TMPFS_MAX_JOB_MB', 64):
+                small = create_job_workspace(1, 64 * MB)
+                large = create_job_workspace(2, 65 * MB)
+                # tmpfs is full, so the next small job goes to disk
+                overflow = create_job_workspace(3, 64 * MB)
+            
+            self.assertEqual(small.area.name, "tmpfs")
+            self.assertEqual(large.area.name, "disk")
+            self.assertEqual(overflow.area.name, "disk")
+    
+    def test_estimate_job_scratch_bytes(self):
+        region = {
+            "type": "Feature",
+            "geometry": {"type": "Polygon", "coordinates": [[[10.0, 60.0], [10.1, 60.0], [10.1, 60.1], [10.0, 60.1], [10.0, 60.0]]]}
+        }
+        with patch('app.services.job_service.settings.SCRATCH_MB_PER_KM2', 2.0), \
+                patch('app.services.job_service.settings.SCRATCH_MIN_JOB_MB', 10):
+            # About 5.6 km x 11.1 km at 60°N
+            self.assertAlmostEqual(estimate_job_scratch_bytes(region) / MB, 124, delta=2)
+            
+            region["geometry"]["coordinates"] = [[[10.0, 60.0], [10.001, 60.0], [10.001, 60.001], [10.0, 60.0]]]
+            self.assertEqual(estimate_job_scratch_bytes(region), 10 * MB)
+    
+    def test_prune_scene_cache(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            now = time.time()
+            paths = {}
+            for name, days_unused in (("old.tif", 40), ("a.tif", 3), ("b.tif", 2), ("c.tif", 1), ("running.tif", 0)):
+                paths[name] = os.path.join(tmpdir, name)
+                with open(paths[name], "wb") as f:
+                    f.write(os.urandom(MB))
+                os.utime(paths[name], (now - days_unused * 86400, now - days_unused * 86400))
+            # Files being written are never evicted
+            with open(os.path.join(tmpdir, "partial.tif.tmp"), "wb") as f:
+                f.write(os.urandom(MB))
+            
+            # A job reusing a.tif makes it the most recently used
+            touch_paths([paths["a.tif"], os.path.join(tmpdir, "missing.tif")])
+            
+            # Unused for too long, then least recently used beyond the quota
+            deleted = prune_scene_cache(tmpdir, quota_bytes=2 * MB, max_age_seconds=30 * 86400, min_age_seconds=3600)
+            self.assertEqual(deleted, [paths["old.tif"], paths["b.tif"], paths["c.tif"]])
+            self.assertEqual(sorted(os.listdir(tmpdir)), ["a.tif", "partial.tif.tmp", "running.tif"])
+
+if __name__ == '__main__':
+    unittest.main()
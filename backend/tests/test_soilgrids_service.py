@@ -0,0 +1,108 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import shutil
+import tempfile
+import numpy as np
+import rasterio
+
+# Add the parent directory to the path so we can import the app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services.ingest_providers import SyntheticProvider
+from app.services.ingest_service import download_soilgrids_data
+from app.services.soilgrids_service import ensure_tile, get_pixel_window, get_tile_path, get_window_level, read_layer_window
+
+REGION = {
+    "type": "Feature",
+    "properties": {},
+    "geometry": {
+        "type": "Polygon",
+        "coordinates": [[[10.8, 45.9], [10.8, 46.1], [11.2, 46.1], [11.2, 45.9], [10.8, 45.9]]]
+    }
+}
+BBOX = (10.8, 45.9, 11.2, 46.1)
+
+class TestSoilgridsService(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.provider = SyntheticProvider(os.path.join(self.tmpdir, "ingest"))
+        patchers = [
+            patch('app.services.soilgrids_service.settings.SOILGRIDS_STORE_DIR', os.path.join(self.tmpdir, "store")),
+            patch('app.services.soilgrids_service.settings.SOILGRIDS_CACHE_BUCKET', "")
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+    
+    def test_read_layer_window(self):
+        with patch.object(self.provider, 'fetch_soilgrids', wraps=self.provider.fetch_soilgrids) as fetch_soilgrids:
+            data, transform = read_layer_window("soc", BBOX, provider=self.provider)
+            # Stored tiles are read again without fetching
+            again, _ = read_layer_window("soc", BBOX, provider=self.provider)
+            self.assertEqual(fetch_soilgrids.call_count, 1)
+        
+        # 0.4° x 0.2° at 0.00225° pixels, snapped outwards
+        self.assertEqual(data.shape, (89, 178))
+        self.assertAlmostEqual(transform.c, 10.8, places=6)
+        np.testing.assert_array_equal(data, again)
+        
+        # The window is the matching part of the stored tile
+        row_start, _, col_start, _ = get_pixel_window(BBOX)
+        tile_row, tile_col = row_start // 512, col_start // 512
+        with rasterio.open(get_tile_path("soc", tile_row, tile_col)) as src:
+            self.assertEqual(src.overviews(1), [2, 4])
+            self.assertEqual(src.block_shapes, [(128, 128)])
+            tile = src.read(1)
+        top, left = row_start - tile_row * 512, col_start - tile_col * 512
+        np.testing.assert_array_equal(data, tile[top:top + 89, left:left + 178])
+        
+        # Overview levels halve the window
+        self.assertEqual(read_layer_window("soc", BBOX, level=2, provider=self.provider)[0].shape, (23, 45))
+        self.assertEqual(get_window_level(BBOX, max_pixels=89 * 178 - 1), 1)
+    
+    @patch('app.services.soilgrids_service.upload_file')
+    @patch('app.services.soilgrids_service.download_file')
+    def test_ensure_tile_cache_bucket(self, mock_download_file, mock_upload_file):
+        mock_download_file.return_value = False
+        with patch('app.services.soilgrids_service.settings.SOILGRIDS_CACHE_BUCKET', "cache"):
+            path = ensure_tile("clay", 38, 165, provider=self.provider)
+            mock_upload_file.assert_called_once_with("cache", "soilgrids/clay/38_165.tif", path)
+            
+            # A tile in the bucket is downloaded instead of fetched
+            def download(bucket, object_name, file_path):
+                shutil.copyfile(path, file_path)
+                return True
+            mock_download_file.side_effect = download
+            with patch.object(self.provider, 'fetch_soilgrids') as fetch_soilgrids:
+                ensure_tile("clay", 38, 166, provider=self.provider)
+                fetch_soilgrids.assert_not_called()
+            
+            # Local tiles make no network call
+            mock_download_file.reset_mock()
+            ensure_tile("clay", 38, 165, provider=self.provider)
+            mock_download_file.assert_not_called()
+        
+        # The provider's rasters are replaced by the tiles, and nothing is
+        # written to the directory shared by all jobs
+        self.assertEqual(sorted(os.listdir(os.path.join(self.tmpdir, "store", "clay"))), ["38_165.tif", "38_166.tif"])
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir, "ingest")))
+    
+    def test_download_soilgrids_data(self):
+        with patch('app.services.ingest_providers._provider', self.provider), \
+                patch('app.services.soilgrids_service.settings.SOILGRIDS_LAYERS', "soc,bdod,clay"):
+            path = download_soilgrids_data(REGION, output_dir=os.path.join(self.tmpdir, "job"))
+        
+        with rasterio.open(path) as src:
+            self.assertEqual((src.count, src.width, src.height), (3, 178, 89))
+            self.assertEqual(src.descriptions, ("soc", "bdod", "clay"))
+            self.assertEqual(src.scales, (1.0, 0.01, 1.0))
+            self.assertEqual(src.dtypes[0], "uint16")
+            bdod = src.read(2)
+        self.assertTrue(80 <= bdod.min() and bdod.max() < 180)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import tempfile
+import numpy as np
+import rasterio
+from rasterio.transform import from_bounds
+
+# Add the parent directory to the path so we can import the app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from prometheus_client import REGISTRY
+from app.core.tracing import Trace, count_pixels, current_span, traced
+
+@traced
+def write_raster(path, size):
+    with rasterio.open(
+        path, 'w', driver='GTiff', height=size, width=size, count=1, dtype='uint8',
+        crs='EPSG:4326', transform=from_bounds(0, 0, 1, 1, size, size)
+    ) as dst:
+        dst.write(np.ones((1, size, size), dtype=np.uint8))
+    return path, {"mean": 1.0}
+
+@traced(name="allocate")
+def allocate(megabytes):
+    data = np.ones(megabytes * 2**20, dtype=np.uint8)
+    return int(data.sum())
+
+@traced
+def outer():
+    return allocate(32)
+
+@traced
+def fail():
+    raise RuntimeError("boom")
+
+def run_job_task(job_id):
+    return allocate(1)
+
+def run_batch_task(job_ids):
+    return "done"
+
+class TestTracing(unittest.TestCase):
+
+    def test_traced_outside_trace(self):
+        # No job trace: the function runs as is and nothing is recorded
+        self.assertIsNone(current_span())
+        self.assertEqual(allocate(1), 2**20)
+    
+    def test_trace_records_nested_spans(self):
+        trace = Trace(job_id=7)
+        before = REGISTRY.get_sample_value('agricarbonx_stage_runs_total', {'stage': 'allocate', 'status': 'ok'}) or 0
+        
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with trace.span("task_predict"):
+                outer()
+                write_raster(os.path.join(tmpdir, 'map.tif'), 20)
+                with self.assertRaises(RuntimeError):
+                    fail()
+        
+        stages = {span.name: span.to_dict() for span in trace.spans}
+        self.assertEqual([span.name for span in trace.spans], ["allocate", "outer", "write_raster", "fail", "task_predict"])
+        self.assertEqual(stages["allocate"]["parent"], "outer")
+        self.assertEqual(stages["outer"]["parent"], "task_predict")
+        self.assertIsNone(stages["task_predict"]["parent"])
+        self.assertEqual(stages["fail"]["status"], "error")
+        self.assertEqual(stages["task_predict"]["status"], "ok")
+        
+        # Pixels of the raster in the (path, stats) return value
+        self.assertEqual(stages["write_raster"]["pixels"], 400)
+        self.assertGreater(stages["write_raster"]["bytes_written"], 0)
+        
+        # The child's peak is carried over to its parents
+        self.assertGreaterEqual(stages["outer"]["peak_rss_bytes"], stages["allocate"]["peak_rss_bytes"])
+        self.assertGreaterEqual(stages["task_predict"]["peak_rss_bytes"], stages["allocate"]["peak_rss_bytes"])
+        self.assertGreaterEqual(stages["task_predict"]["wall_seconds"], stages["outer"]["wall_seconds"])
+        
+        after = REGISTRY.get_sample_value('agricarbonx_stage_runs_total', {'stage': 'allocate', 'status': 'ok'})
+        self.assertEqual(after, before + 1)
+        self.assertIsNone(current_span())
+    
+    def test_count_pixels(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'a.tif')
+            write_raster(path, 10)
+            
+            self.assertEqual(count_pixels(path), 100)
+            self.assertEqual(count_pixels({"ndvi": path, "evi": path}), 200)
+            self.assertEqual(count_pixels([path, os.path.join(tmpdir, 'missing.tif'), 'report.pdf', 3]), 100)
+            self.assertEqual(count_pixels(None), 0)
+
+class TestBaseTask(unittest.TestCase):
+    
+    def make_task(self, run):
+        from celery import Celery
+        from app.tasks.base import BaseTask
+        
+        return Celery("test").task(base=BaseTask, name="app.tasks.worker.task_example", shared=False)(run)
+    
+    @patch('app.tasks.base.save_job_stages')
+    @patch('app.tasks.base.SessionLocal')
+    def test_task_stages_are_saved(self, mock_session_local, mock_save_job_stages):
+        task = self.make_task(run_job_task)
+        
+        self.assertEqual(task(job_id=3), 2**20)
+        
+        kwargs = mock_save_job_stages.call_args.kwargs
+        self.assertEqual(kwargs["job_id"], 3)
+        self.assertEqual([stage["name"] for stage in kwargs["stages"]], ["allocate", "task_example"])
+        mock_session_local.return_value.close.assert_called_once()
+    
+    @patch('app.tasks.base.save_job_stages')
+    @patch('app.tasks.base.SessionLocal')
+    def test_failed_save_does_not_fail_task(self, mock_session_local, mock_save_job_stages):
+        task = self.make_task(run_job_task)
+        mock_save_job_stages.side_effect = RuntimeError("database down")
+        
+        self.assertEqual(task(job_id=3), 2**20)
+        mock_session_local.return_value.rollback.assert_called_once()
+    
+    @patch('app.tasks.base.update_job_status')
+    @patch('app.tasks.base.save_job_stages')
+    @patch('app.tasks.base.SessionLocal')
+    def test_group_stages_are_saved_for_every_job(self, mock_session_local, mock_save_job_stages, mock_update_job_status):
+        task = self.make_task(run_job_task)
+        
+        # The group is consumed by the task class, not passed to the task function
+        self.assertEqual(task(job_id=3, group_job_ids=[3, 5]), 2**20)
+        
+        self.assertEqual([call.kwargs["job_id"] for call in mock_save_job_stages.call_args_list], [3, 5])
+        self.assertEqual(mock_save_job_stages.call_args_list[0].kwargs["stages"], mock_save_job_stages.call_args_list[1].kwargs["stages"])
+        
+        # The batch task sets the group's status, not the shared stage
+        task.on_success(2**20, "task-id", (), {"job_id": 3, "group_job_ids": [3, 5]})
+        task.on_failure(RuntimeError("ingest failed"), "task-id", (), {"job_id": 3, "group_job_ids": [3, 5]}, None)
+        mock_update_job_status.assert_not_called()
+        task.on_success(2**20, "task-id", (), {"job_id": 3})
+        mock_update_job_status.assert_called_once()
+    
+    @patch('app.tasks.base.save_job_stages')
+    def test_task_without_job_is_not_saved(self, mock_save_job_stages):
+        task = self.make_task(run_batch_task)
+        
+        self.assertEqual(task(job_ids=[1, 2]), "done")
+        mock_save_job_stages.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import tempfile
+import numpy as np
+import pyarrow as pa
+
+# Add the parent directory to the path so we can import the app modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services.ingest_providers import SyntheticProvider
+from app.services.weather_service import compute_weather_features, get_weather_cell, read_weather, update_weather_store
+
+class TestWeatherService(unittest.TestCase):
+
+    def test_get_weather_cell(self):
+        cell_id, lon, lat = get_weather_cell(11.1, 45.9, grid_deg=0.5)
+        
+        self.assertEqual(cell_id, "271_382")
+        self.assertEqual((lon, lat), (11.25, 45.75))
+        # Points in the same cell share it
+        self.assertEqual(get_weather_cell(11.4, 45.6, grid_deg=0.5)[0], cell_id)
+    
+    def test_update_weather_store(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            provider = SyntheticProvider(os.path.join(tmpdir, "ingest"))
+            with patch('app.services.weather_service.settings.WEATHER_STORE_DIR', os.path.join(tmpdir, "weather")), \
+                    patch.object(provider, 'fetch_weather', wraps=provider.fetch_weather) as fetch_weather:
+                cell_path = update_weather_store(11.1, 45.9, "2022-12-20", "2023-01-10", provider=provider)
+                
+                # An overlapping range only fetches the days not stored yet
+                update_weather_store(11.3, 45.8, "2023-01-01", "2023-01-20", provider=provider)
+                self.assertEqual(
+                    [call.args[2:] for call in fetch_weather.call_args_list],
+                    [("2022-12-20", "2023-01-10"), ("2023-01-11", "2023-01-20")]
+                )
+                
+                # Nothing is fetched for a range already covered
+                update_weather_store(11.1, 45.9, "2022-12-25", "2023-01-15", provider=provider)
+                self.assertEqual(fetch_weather.call_count, 2)
+                
+                table = read_weather(cell_path, "2022-12-30", "2023-01-12")
+            
+            # Partitioned by year, with the provider's CSVs removed and
+            # nothing written to the directory shared by all jobs
+            self.assertEqual(sorted(os.listdir(cell_path)), ["year=2022", "year=2023"])
+            self.assertFalse(os.path.exists(os.path.join(tmpdir, "ingest")))
+        
+        dates = table.column("date").to_numpy().astype(str)
+        self.assertEqual((dates[0], dates[-1], len(dates)), ("2022-12-30", "2023-01-12", 14))
+    
+    def test_compute_weather_features(self):
+        table = pa.table({
+            "date": pa.array(np.arange(np.datetime64("2023-01-01"), np.datetime64("2023-01-06")), pa.date32()),
+            "temperature": pa.array([20.0, 5.0, 12.0, 15.0, 30.0], pa.float32()),
+            "precipitation": pa.array([10.0, 0.0, 2.0, 0.0, 4.0], pa.float32()),
+            "solar_radiation": pa.array([15.0] * 5, pa.float32())
+        })
+        
+        features = compute_weather_features(table, "2023-01-02", "2023-01-04", base_temperature=10, decay=0.5)
+        
+        self.assertEqual(features["days"], 3)
+        self.assertAlmostEqual(features["growing_degree_days"], 0 + 2 + 5)
+        self.assertAlmostEqual(features["cumulative_precipitation"], 2.0)
+        # Day before the range warms the index up: ((10 * 0.5 + 0) * 0.5 + 2) * 0.5 + 0
+        self.assertAlmostEqual(features["antecedent_precipitation_index"], 2.25)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -37,6 +37,8 @@ psql -v ON_ERROR_STOP=1 --username "$POSTGRES_USER" --dbname "$POSTGRES_DB" <<-E
         end_date TIMESTAMP WITH TIME ZONE NOT NULL,
         task_id VARCHAR(255),
         error_message TEXT,
+        profile BOOLEAN NOT NULL DEFAULT FALSE,
+        parent_job_id INTEGER REFERENCES jobs(id),
         created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
         updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
     );
@@ -59,11 +61,97 @@ psql -v ON_ERROR_STOP=1 --username "$POSTGRES_USER" --dbname "$POSTGRES_DB" <<-E
         updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
     );
     
+    CREATE TABLE IF NOT EXISTS job_stages (
+        id SERIAL PRIMARY KEY,
+        job_id INTEGER NOT NULL REFERENCES jobs(id),
+        task_id VARCHAR(255),
+        name VARCHAR(255) NOT NULL,
+        parent VARCHAR(255),
+        status VARCHAR(50) NOT NULL,
+        started_at TIMESTAMP WITH TIME ZONE NOT NULL,
+        wall_seconds FLOAT NOT NULL,
+        cpu_seconds FLOAT NOT NULL,
+        peak_rss_bytes BIGINT NOT NULL,
+        bytes_read BIGINT NOT NULL,
+        bytes_written BIGINT NOT NULL,
+        pixels BIGINT NOT NULL
+    );
+    
+    CREATE TABLE IF NOT EXISTS job_profiles (
+        id SERIAL PRIMARY KEY,
+        job_id INTEGER NOT NULL REFERENCES jobs(id),
+        task_id VARCHAR(255),
+        task_name VARCHAR(255) NOT NULL,
+        kind VARCHAR(50) NOT NULL,
+        object_name VARCHAR(255) NOT NULL,
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    );
+    
+    CREATE TABLE IF NOT EXISTS job_scenes (
+        id SERIAL PRIMARY KEY,
+        job_id INTEGER NOT NULL REFERENCES jobs(id),
+        sensor VARCHAR(50) NOT NULL,
+        acquired_at TIMESTAMP WITH TIME ZONE NOT NULL,
+        scene_path VARCHAR(255) NOT NULL,
+        masked_path VARCHAR(255) NOT NULL,
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    );
+    
+    CREATE TABLE IF NOT EXISTS region_timeseries (
+        id SERIAL PRIMARY KEY,
+        region_id INTEGER NOT NULL REFERENCES regions(id),
+        job_id INTEGER NOT NULL REFERENCES jobs(id),
+        layer VARCHAR(50) NOT NULL,
+        observed_at TIMESTAMP WITH TIME ZONE NOT NULL,
+        count INTEGER NOT NULL,
+        mean FLOAT,
+        min FLOAT,
+        max FLOAT,
+        std FLOAT,
+        p10 FLOAT,
+        p25 FLOAT,
+        p50 FLOAT,
+        p75 FLOAT,
+        p90 FLOAT,
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    );
+    
+    CREATE TABLE IF NOT EXISTS result_diffs (
+        id SERIAL PRIMARY KEY,
+        job_id_a INTEGER NOT NULL REFERENCES jobs(id),
+        job_id_b INTEGER NOT NULL REFERENCES jobs(id),
+        layer VARCHAR(50) NOT NULL,
+        object_name VARCHAR(255) NOT NULL,
+        count INTEGER NOT NULL,
+        mean FLOAT,
+        min FLOAT,
+        max FLOAT,
+        std FLOAT,
+        increased INTEGER NOT NULL,
+        decreased INTEGER NOT NULL,
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    );
+    
     -- Create indexes
     CREATE INDEX IF NOT EXISTS idx_regions_geom ON regions USING GIST(geom);
     CREATE INDEX IF NOT EXISTS idx_jobs_region_id ON jobs(region_id);
     CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status);
     CREATE INDEX IF NOT EXISTS idx_results_job_id ON results(job_id);
+    CREATE INDEX IF NOT EXISTS idx_job_stages_job_id ON job_stages(job_id);
+    CREATE INDEX IF NOT EXISTS idx_job_profiles_job_id ON job_profiles(job_id);
+    CREATE INDEX IF NOT EXISTS idx_job_scenes_job_id ON job_scenes(job_id);
+    
+    -- Keyset pagination indexes for list views
+    CREATE INDEX IF NOT EXISTS ix_jobs_created_at_id ON jobs(created_at, id);
+    CREATE INDEX IF NOT EXISTS ix_jobs_status_created_at_id ON jobs(status, created_at, id);
+    CREATE INDEX IF NOT EXISTS ix_regions_created_at_id ON regions(created_at, id);
+    CREATE INDEX IF NOT EXISTS ix_results_created_at_id ON results(created_at, id);
+    
+    -- Time-series range scans, one point per region, layer and date
+    CREATE UNIQUE INDEX IF NOT EXISTS ux_region_timeseries_region_layer_observed_at ON region_timeseries(region_id, layer, observed_at);
+    
+    -- Difference cache lookups by job pair
+    CREATE UNIQUE INDEX IF NOT EXISTS ux_result_diffs_jobs_layer ON result_diffs(job_id_a, job_id_b, layer);
 EOSQL
 
 echo "Database schema and tables have been created."